@@ -0,0 +1,148 @@
+from collections import namedtuple
+import numpy as np
+
+# The checks, in the order they are reported:
+#   zero_area: a box without width or height,
+#   inverted: xmin > xmax or ymin > ymax (how boxes with a negative area arise),
+#   out_of_bounds: (part of) the box lies outside the image,
+#   unknown_category: the tag_category is not in the registry of the catalog (or not in the given categories),
+#   duplicate: the same tag_category and coordinates as an earlier box of the image (boxes with an area),
+#   overlap: an IoU of at least iou_threshold with an earlier box of the same tag_category in the image.
+CHECKS = ('zero_area', 'inverted', 'out_of_bounds', 'unknown_category', 'duplicate', 'overlap')
+# How a check is fixed: inverted boxes get their corners swapped, out_of_bounds boxes are clipped to the image and
+# the boxes of the other checks are removed (the first of duplicate and overlapping boxes is kept).
+REPAIRED = ('inverted', 'out_of_bounds')
+
+
+class LintOptions(namedtuple('LintOptions', ['iou_threshold', 'fix', 'skip', 'categories'])):
+    """
+    How the tags are checked (see CHECKS):
+        iou_threshold: boxes of the same tag_category in an image overlapping at least this much are near-duplicates,
+        fix: the checks to fix in the catalog (see REPAIRED),
+        skip: the checks of which the boxes are left out of an export (if they have not been fixed),
+        categories: (Optional) the tag_categories that are allowed (e.g. those of a label map), default the
+        tag_categories of the catalog.
+    Example: LintOptions(fix=('inverted', 'out_of_bounds', 'duplicate'))
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, iou_threshold=0.9, fix=(), skip=('zero_area', 'inverted', 'unknown_category', 'duplicate'),
+                categories=None):
+        unknown = [check for check in tuple(fix) + tuple(skip) if check not in CHECKS]
+        if len(unknown) > 0:
+            raise ValueError('Unknown check: {0} (choose from {1})'.format(', '.join(unknown), ', '.join(CHECKS)))
+        if not 0 < iou_threshold <= 1:
+            raise ValueError('iou_threshold should be larger than 0 and at most 1')
+        return super().__new__(cls, iou_threshold, tuple(fix), tuple(skip), categories)
+
+
+def ordered(boxes):
+    """Returns the boxes (N x 4) with their corners swapped where needed, so xmin <= xmax and ymin <= ymax."""
+    return np.concatenate([np.minimum(boxes[:, :2], boxes[:, 2:]), np.maximum(boxes[:, :2], boxes[:, 2:])], axis=1)
+
+
+def iou(boxes1, boxes2):
+    """Returns the intersection over union of the boxes in boxes1 and boxes2 (both N x 4, row by row)."""
+    width = np.minimum(boxes1[:, 2], boxes2[:, 2]) - np.maximum(boxes1[:, 0], boxes2[:, 0])
+    height = np.minimum(boxes1[:, 3], boxes2[:, 3]) - np.maximum(boxes1[:, 1], boxes2[:, 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    union = ((boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1]) +
+             (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1]) - intersection)
+    return np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+
+
+def overlapping_pairs(groups, boxes, iou_threshold):
+    """
+    This function finds the pairs of boxes in the same group (e.g. image and tag_category) with an IoU of at least
+    iou_threshold. The boxes are compared in batches: first every box with the next box of its group, then with the
+    box after that, and so on, so only boxes of the same group are compared and every step is a single numpy
+    operation.
+    :param groups: group of every box, sorted (boxes of a group are next to each other).
+    :param boxes: N x 4 array of (ordered) boxes.
+    :return: (first, second) arrays of the indexes of the pairs, first < second.
+    """
+    firsts, seconds = [], []
+    candidates = np.arange(len(groups) - 1)
+    offset = 1
+    while len(candidates) > 0:
+        candidates = candidates[groups[candidates + offset] == groups[candidates]]  # (groups are contiguous)
+        close = iou(boxes[candidates], boxes[candidates + offset]) >= iou_threshold
+        firsts.append(candidates[close])
+        seconds.append(candidates[close] + offset)
+        offset += 1
+        candidates = candidates[candidates + offset < len(groups)]
+    if len(firsts) == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def lint_boxes(box_arrays, known_category_ids, iou_threshold=0.9):
+    """
+    This function checks all boxes at once (see CHECKS).
+    :param box_arrays: dataset_statistics.BoxArrays.
+    :param known_category_ids: array of the category_id's that are allowed.
+    :return: dictionary {check: boolean array, True for the boxes that fail the check}.
+    """
+    boxes, image_index = box_arrays.boxes, box_arrays.image_index
+    widths, heights = boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]
+    box_order = ordered(boxes)
+    image_sizes = box_arrays.image_sizes[image_index]
+    problems = {'zero_area': (widths == 0) | (heights == 0), 'inverted': (widths < 0) | (heights < 0),
+                'out_of_bounds': (box_order[:, :2] < 0).any(axis=1) | (box_order[:, 2:] > image_sizes).any(axis=1),
+                'unknown_category': ~np.isin(box_arrays.category_ids, known_category_ids)}
+    # Duplicates and overlaps: pairs of boxes with an area of the same image and tag_category (sorted stable, so the
+    # first box of an image comes first), the later box of a pair is flagged:
+    candidates = np.flatnonzero(~problems['zero_area'])
+    categories = box_arrays.category_ids[candidates]
+    groups = image_index[candidates] * (categories.max(initial=0) + 1) + categories
+    order = np.argsort(groups, kind='stable')
+    candidates, groups = candidates[order], groups[order]
+    firsts, seconds = overlapping_pairs(groups, box_order[candidates], iou_threshold)
+    firsts, seconds = candidates[firsts], candidates[seconds]
+    identical = (boxes[firsts] == boxes[seconds]).all(axis=1)
+    problems['duplicate'] = np.zeros(len(boxes), bool)
+    problems['duplicate'][seconds[identical]] = True
+    problems['overlap'] = np.zeros(len(boxes), bool)
+    problems['overlap'][seconds[~identical]] = True
+    problems['overlap'] &= ~problems['duplicate']
+
+    return {check: problems[check] for check in CHECKS}
+
+
+def repair_boxes(box_arrays, fix):
+    """
+    This function fixes the inverted and out_of_bounds boxes (if they are in fix): the corners are swapped and the
+    boxes clipped to their image.
+    :return: N x 4 array of the repaired boxes.
+    """
+    boxes = box_arrays.boxes
+    if 'inverted' in fix:
+        boxes = ordered(boxes)
+    if 'out_of_bounds' in fix:
+        image_sizes = box_arrays.image_sizes[box_arrays.image_index]
+        boxes = np.concatenate([np.clip(boxes[:, :2], 0, image_sizes), np.clip(boxes[:, 2:], 0, image_sizes)], axis=1)
+    return boxes
+
+
+def format_lint_report(report, max_problems=50):
+    """Returns the report of ImageCatalog.lint_tags as text (printed in headless mode and shown in the GUI)."""
+    lines = ['Checked {0} tags of {1} images.'.format(report['boxes'], report['images'])]
+    for check in CHECKS:
+        line = '    {0}: {1}'.format(check, report['issues'][check])
+        if report['fixed'].get(check, 0) > 0:
+            line += ' ({0} fixed)'.format(report['fixed'][check])
+        lines.append(line)
+    if report['removed'] > 0:
+        lines.append('Removed {0} tags.'.format(report['removed']))
+    if report['skipped'] > 0:
+        lines.append('{0} tags are left out of exports.'.format(report['skipped']))
+    problems = report['problems']
+    if len(problems) > 0:
+        lines += ['', 'Remaining problems:']
+        for file_name, tag_category, coordinates, checks in problems[:max_problems]:
+            lines.append('    {0}: {1} {2} ({3})'.format(file_name, tag_category, list(coordinates), ', '.join(checks)))
+        if len(problems) > max_problems:
+            lines.append('    ... and {0} more'.format(len(problems) - max_problems))
+
+    return '\n'.join(lines)
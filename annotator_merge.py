@@ -0,0 +1,243 @@
+import os
+import re
+from collections import namedtuple
+import numpy as np
+
+from annotation_lint import iou, ordered, overlapping_pairs
+
+# How the boxes of several annotators are merged. The boxes of an image are matched between the annotators (boxes of
+# the same tag_category with an IoU of at least iou_threshold), every group of matched boxes is an object:
+#   union: every object is kept (at the mean box of its annotators),
+#   consensus: the objects that at least min_agreement annotators of the image have tagged are kept,
+#   prefer: the objects of the preferred annotator are kept (at its box), objects it did not tag are left out of the
+#   images it has annotated and kept (as in union) in the other images.
+RULES = ('union', 'consensus', 'prefer')
+MAX_ANNOTATORS = 63  # (the annotators of an object are kept as the bits of an int64)
+# A tag as save_progress writes it: ('tag_category', [xmin, ymin, xmax, ymax])
+TAG_PATTERN = re.compile(r"\('([^'\\]*)', \[([^\]]*)\]\)")
+
+
+class MergeOptions(namedtuple('MergeOptions', ['rule', 'iou_threshold', 'prefer', 'min_agreement'])):
+    """
+    How the savefiles of several annotators are merged (see RULES):
+        rule: 'union', 'consensus' or 'prefer',
+        iou_threshold: boxes of different annotators overlapping at least this much are the same object,
+        prefer: the preferred annotator for the prefer rule (its name, see annotator_names, or its savefile),
+        min_agreement: (Optional) number of annotators that should agree for the consensus rule, default a majority
+        of the annotators of the image.
+    Example: MergeOptions('consensus', iou_threshold=0.6)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, rule='union', iou_threshold=0.5, prefer=None, min_agreement=None):
+        if rule not in RULES:
+            raise ValueError('Unknown rule: {0} (choose from {1})'.format(rule, ', '.join(RULES)))
+        if rule == 'prefer' and prefer is None:
+            raise ValueError('The prefer rule needs the preferred annotator')
+        if not 0 < iou_threshold <= 1:
+            raise ValueError('iou_threshold should be larger than 0 and at most 1')
+        if min_agreement is not None and min_agreement < 1:
+            raise ValueError('min_agreement should be at least 1')
+        return super().__new__(cls, rule, iou_threshold, prefer, min_agreement)
+
+
+def split_tags(text):
+    """
+    This function reads the tags of an image in a savefile without evaluating the text (which takes most of the time
+    of reading large savefiles). Text that is not written the way save_progress writes it (e.g. tag_categories with
+    quotes) is evaluated instead.
+    :param text: the tags of an image in a savefile, e.g. "[('car', [10, 10, 30, 30])]".
+    :return: (list of tag_categories, list of the coordinates of the tags as tuples of floats)
+    """
+    tags = TAG_PATTERN.findall(text)
+    if len(tags) == text.count('(') and '"' not in text and '\\' not in text:
+        return ([tag_category for tag_category, _ in tags],
+                [tuple(map(float, coordinates.split(','))) for _, coordinates in tags])
+    tags = eval(text)
+    return [tag_category for tag_category, _ in tags], [tuple(map(float, coordinates)) for _, coordinates in tags]
+
+
+def annotator_names(savefile_locations):
+    """
+    This function names the annotators after their savefiles: the name of the savefile without extension, or if
+    several savefiles have the same name (e.g. alice/project.csv and bob/project.csv) the path of the savefile
+    relative to the folder they have in common (alice/project and bob/project).
+    :param savefile_locations: list of paths to savefiles.
+    :return: list of unique names, one per savefile.
+    """
+    locations = [os.path.abspath(location) for location in savefile_locations]
+    if len(set(locations)) < len(locations):
+        raise ValueError('The savefile of an annotator is given more than once')
+    names = [os.path.splitext(os.path.basename(location))[0] for location in locations]
+    if len(set(names)) == len(names):
+        return names
+    common = os.path.commonpath([os.path.dirname(location) for location in locations])
+    names = [os.path.relpath(location, common).replace(os.sep, '/') for location in locations]
+    stems = [os.path.splitext(name)[0] for name in names]
+    return stems if len(set(stems)) == len(stems) else names  # (e.g. project.csv and project.txt in one folder)
+
+
+def preferred_annotator(annotators, savefile_locations, prefer):
+    """
+    This function returns the index of the preferred annotator of the prefer rule.
+    :param annotators: the names of the annotators (see annotator_names).
+    :param prefer: the name of the annotator, or the path of its savefile.
+    """
+    locations = [os.path.abspath(location) for location in savefile_locations]
+    if os.path.abspath(prefer) in locations:
+        return locations.index(os.path.abspath(prefer))
+    if prefer in annotators:
+        return annotators.index(prefer)
+    stem = os.path.splitext(os.path.basename(prefer))[0]
+    if annotators.count(stem) == 1:
+        return annotators.index(stem)
+    raise ValueError('Unknown annotator: {0} (choose from {1})'.format(prefer, ', '.join(annotators)))
+
+
+def greedy_matching(firsts, seconds, scores):
+    """
+    This function matches pairs one to one, highest score first (every first and every second is used at most once).
+    Instead of going through the pairs one by one, all pairs that are the best pair of both their first and their
+    second are accepted at once, which gives the same matching in a few numpy steps.
+    :param firsts: array of the (non-negative) first index of every pair.
+    :param seconds: array of the (non-negative) second index of every pair.
+    :param scores: array of the score of every pair.
+    :return: array of the indexes of the matched pairs.
+    """
+    rank = np.empty(len(scores), np.int64)
+    rank[np.argsort(-scores, kind='stable')] = np.arange(len(scores))
+    pairs = np.arange(len(scores))
+    matched = []
+    while len(pairs) > 0:
+        first, second, pair_rank = firsts[pairs], seconds[pairs], rank[pairs]
+        best_first = np.full(first.max() + 1, len(scores))
+        np.minimum.at(best_first, first, pair_rank)
+        best_second = np.full(second.max() + 1, len(scores))
+        np.minimum.at(best_second, second, pair_rank)
+        best = (best_first[first] == pair_rank) & (best_second[second] == pair_rank)
+        matched.append(pairs[best])
+        used_first = np.zeros(len(best_first), bool)
+        used_first[first[best]] = True
+        used_second = np.zeros(len(best_second), bool)
+        used_second[second[best]] = True
+        pairs = pairs[~used_first[first] & ~used_second[second]]
+    if len(matched) == 0:
+        return np.zeros(0, np.int64)
+    return np.concatenate(matched)
+
+
+def match_boxes(groups1, boxes1, groups2, boxes2, iou_threshold):
+    """
+    This function matches the boxes of two sets one to one within their groups (e.g. image and tag_category): pairs
+    with an IoU of at least iou_threshold are matched greedily, highest IoU first.
+    :param groups1: group of every box of the first set.
+    :param boxes1: N x 4 array of the (ordered) boxes of the first set.
+    :return: (indexes in the first set, indexes in the second set) of the matched boxes.
+    """
+    groups = np.concatenate([groups1, groups2])
+    boxes = np.concatenate([boxes1, boxes2])
+    order = np.argsort(groups, kind='stable')  # (the boxes of the first set come first in their group)
+    firsts, seconds = overlapping_pairs(groups[order], boxes[order], iou_threshold)
+    firsts, seconds = order[firsts], order[seconds]
+    cross = (firsts < len(groups1)) & (seconds >= len(groups1))  # only pairs of a box of both sets
+    firsts, seconds = firsts[cross], seconds[cross]
+    matched = greedy_matching(firsts, seconds - len(groups1), iou(boxes[firsts], boxes[seconds]))
+    return firsts[matched], seconds[matched] - len(groups1)
+
+
+def cluster_boxes(image_index, annotators, category_ids, boxes, num_annotators, iou_threshold):
+    """
+    This function groups the boxes of all annotators into objects: the boxes of the first annotator are the first
+    objects, the boxes of every next annotator are matched to the objects (at the mean box of their annotators so
+    far) and the boxes that are not matched become new objects.
+    :param image_index: image of every box.
+    :param annotators: annotator (0 .. num_annotators - 1) of every box.
+    :param boxes: N x 4 array of the (ordered) boxes.
+    :return: (object of every box, number of objects)
+    """
+    groups = image_index * (category_ids.max(initial=0) + 1) + category_ids
+    objects = np.full(len(boxes), -1, np.int64)
+    object_groups, object_sums, object_counts = np.zeros(0, groups.dtype), np.zeros((0, 4)), np.zeros(0)
+    for annotator in range(num_annotators):
+        members = np.flatnonzero(annotators == annotator)
+        matched_objects, matched = match_boxes(object_groups, object_sums / object_counts[:, None], groups[members],
+                                               boxes[members], iou_threshold)
+        objects[members[matched]] = matched_objects
+        np.add.at(object_sums, matched_objects, boxes[members[matched]])
+        object_counts[matched_objects] += 1
+        new = members[objects[members] == -1]
+        objects[new] = np.arange(len(object_groups), len(object_groups) + len(new))
+        object_groups = np.concatenate([object_groups, groups[new]])
+        object_sums = np.concatenate([object_sums, boxes[new]])
+        object_counts = np.concatenate([object_counts, np.ones(len(new))])
+    return objects, len(object_groups)
+
+
+def resolve(image_index, annotators, category_ids, boxes, presence, options, preferred=0):
+    """
+    This function merges the boxes of all annotators by the rule of options (see RULES).
+    :param image_index: image of every box.
+    :param annotators: annotator of every box.
+    :param boxes: N x 4 array of the boxes.
+    :param presence: images x annotators boolean array, True for the images in the savefile of the annotator.
+    :param options: MergeOptions.
+    :param preferred: the preferred annotator (for the prefer rule).
+    :return: dictionary with (per object) the image, the category_id, the box, the annotators (bits), whether it is
+    kept and whether the annotators disagree.
+    """
+    num_annotators = presence.shape[1]
+    boxes = ordered(boxes.astype(np.float64).reshape(-1, 4))
+    # The preferred annotator goes first, so its boxes are the objects the others are matched to:
+    turn = (annotators - preferred) % num_annotators
+    objects, num_objects = cluster_boxes(image_index, turn, category_ids, boxes, num_annotators,
+                                         options.iou_threshold)
+    first = np.full(num_objects, len(boxes))
+    np.minimum.at(first, objects, np.arange(len(boxes)))
+    object_images, object_categories = image_index[first], category_ids[first]
+    counts = np.bincount(objects, minlength=num_objects)
+    mean_boxes = np.zeros((num_objects, 4))
+    np.add.at(mean_boxes, objects, boxes)
+    mean_boxes /= counts[:, None]
+    bits = np.zeros(num_objects, np.int64)
+    np.bitwise_or.at(bits, objects, np.left_shift(1, annotators.astype(np.int64)))
+    image_annotators = presence.sum(axis=1)[object_images]
+    disagree = counts < image_annotators
+    if options.rule == 'union':
+        kept, merged_boxes = np.ones(num_objects, bool), mean_boxes
+    elif options.rule == 'consensus':
+        needed = options.min_agreement if options.min_agreement is not None else image_annotators // 2 + 1
+        kept, merged_boxes = counts >= needed, mean_boxes
+    else:
+        preferred_boxes = np.full(num_objects, -1)
+        preferred_boxes[objects[annotators == preferred]] = np.flatnonzero(annotators == preferred)
+        has_preferred = preferred_boxes >= 0
+        kept = has_preferred | ~presence[object_images, preferred]
+        merged_boxes = np.where(has_preferred[:, None], boxes[preferred_boxes], mean_boxes)
+    if np.array_equal(boxes, np.round(boxes)):  # whole pixels stay whole pixels
+        merged_boxes = np.round(merged_boxes).astype(np.int64)
+
+    return {'images': object_images, 'category_ids': object_categories, 'boxes': merged_boxes, 'annotators': bits,
+            'kept': kept, 'disagree': disagree}
+
+
+def format_merge_report(report, max_disagreements=50):
+    """Returns the report of ImageCatalog.merge_annotators as text."""
+    lines = ['Merged {0} tags of {1} images of {2} annotators ({3}) into {4} objects by {5}.'.format(
+        report['boxes'], report['images'], len(report['annotators']), ', '.join(report['annotators']),
+        report['objects'], report['rule'])]
+    lines.append('    agreed: {0}'.format(report['objects'] - report['disagreements']))
+    lines.append('    disagreed: {0} ({1} images to review)'.format(report['disagreements'], report['review_images']))
+    lines.append('Added {0} images and {1} tags, left out {2} objects, skipped {3} tags of missing images.'.format(
+        report['images_added'], report['tags_added'], report['objects_dropped'], report['tags_skipped']))
+    review = report['review']
+    if len(review) > 0:
+        lines += ['', 'Disagreements:']
+        for file_name, tag_category, coordinates, annotators, kept in review[:max_disagreements]:
+            lines.append('    {0}: {1} {2} tagged by {3} ({4})'.format(file_name, tag_category, list(coordinates),
+                                                                       ', '.join(annotators),
+                                                                       'kept' if kept else 'left out'))
+        if len(review) > max_disagreements:
+            lines.append('    ... and {0} more'.format(len(review) - max_disagreements))
+
+    return '\n'.join(lines)
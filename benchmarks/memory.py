@@ -0,0 +1,77 @@
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Picture tools modules:
+from image_catalog import ImageCatalog
+
+# Memory targets of the catalog (Python heap measured with tracemalloc, 64 bit CPython): an image without tags (its
+# Image, Tags and date objects, file name and the catalog's dictionary and set entries) and every bounding box tag
+# (its Tag, coordinates tuple and tag_dict entry).
+TARGET_BYTES_PER_IMAGE = 600
+TARGET_BYTES_PER_BOX = 300
+
+
+def measure(num_images, boxes_per_image=3, images_per_folder=1000, tag_categories=('car', 'person', 'sign'),
+            seed=0):
+    """
+    This function fills a catalog with num_images images (without image files, their size is given) and then adds
+    boxes_per_image random tags to every image, and measures the memory allocated for both with tracemalloc.
+    :return: dictionary with the bytes per image and bytes per box.
+    """
+    random_generator = random.Random(seed)
+    catalog = ImageCatalog()
+    start_date = datetime(2020, 1, 1)
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for i in range(num_images):
+            catalog.add_image('/data/images/folder_{0}'.format(i // images_per_folder), 'synthetic_{0:07d}.jpg'.format(i),
+                              start_date + timedelta(minutes=i), (4000, 3000))
+        images_done = tracemalloc.get_traced_memory()[0]
+        boxes = 0
+        for image_id in range(num_images):
+            tags = []
+            for _ in range(boxes_per_image):
+                xmin, ymin = random_generator.randrange(3000), random_generator.randrange(2000)
+                tags.append((random_generator.choice(tag_categories),
+                             [xmin, ymin, xmin + random_generator.randint(1, 999), ymin + random_generator.randint(1, 999)]))
+            boxes += catalog.images[image_id].tags.add_tags(tags)
+        boxes_done = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    return {'images': num_images, 'boxes': boxes, 'bytes_per_image': (images_done - start) / num_images,
+            'bytes_per_box': (boxes_done - images_done) / max(boxes, 1)}
+
+
+def main(argv=None):
+    """
+    Checks the memory use of the catalog against TARGET_BYTES_PER_IMAGE and TARGET_BYTES_PER_BOX, for example:
+        python -m benchmarks.memory --images 1000000
+    """
+    parser = argparse.ArgumentParser(description='Measure the memory use per image and per tag of the catalog.')
+    parser.add_argument('--images', type=int, default=1000000, help='number of images (default: 1000000)')
+    parser.add_argument('--boxes', type=int, default=3, help='number of tags per image (default: 3)')
+    parser.add_argument('--output', help='json file to write the results to')
+    args = parser.parse_args(argv)
+
+    results = measure(args.images, args.boxes)
+    results.update({'target_bytes_per_image': TARGET_BYTES_PER_IMAGE, 'target_bytes_per_box': TARGET_BYTES_PER_BOX})
+    print('{0} images: {1:.0f} bytes per image (target {2})'.format(results['images'], results['bytes_per_image'],
+                                                                   TARGET_BYTES_PER_IMAGE))
+    print('{0} boxes: {1:.0f} bytes per box (target {2})'.format(results['boxes'], results['bytes_per_box'],
+                                                                TARGET_BYTES_PER_BOX))
+    if args.output is not None:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+    return 0 if results['bytes_per_image'] <= TARGET_BYTES_PER_IMAGE and \
+        results['bytes_per_box'] <= TARGET_BYTES_PER_BOX else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
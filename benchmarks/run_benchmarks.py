@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import PIL
+
+# Picture tools modules:
+from controller import Controller
+from benchmarks.synthetic import SyntheticDataset
+
+ZOOM_LEVELS = {0: 1, 1: 1.5, 2: 2, 3: 3, 4: 4, 5: 5}  # same zoom factors as view.Application.show_image
+CANVAS_SIZE = (1280, 720)
+
+
+class Benchmarks:
+    """
+    Times the hot paths of picture tools on a synthetic dataset. Every benchmark is repeated and the min, median and
+    mean durations (in seconds) are reported, together with the number of items (images or tags) processed.
+    Run it from the picture tools folder, for example:
+        python -m benchmarks.run_benchmarks --images 1000 --resolutions 1920x1080 4000x3000 --output results.json
+    """
+
+    def __init__(self, work_folder, dataset, repeats=3, scale_images=20):
+        self.work_folder = work_folder
+        self.dataset = dataset
+        self.repeats = repeats
+        self.scale_images = scale_images
+        self.savefile_location = work_folder + '/savefile.csv'
+        self.results = {}
+
+    @staticmethod
+    def time_function(function, setup=None, repeats=3):
+        """
+        This function calls setup() (untimed) and then function(setup_result) (timed) repeats times.
+        :return: list of durations in seconds.
+        """
+        durations = []
+        for _ in range(repeats):
+            argument = setup() if setup is not None else None
+            start = time.perf_counter()
+            function(argument)
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    def record(self, name, durations, items):
+        self.results[name] = {'repeats': len(durations), 'min': min(durations),
+                              'median': statistics.median(durations), 'mean': statistics.mean(durations),
+                              'items': items}
+        print('{0:45s} {1:10.4f} s (median of {2}, {3} items)'.format(name, self.results[name]['median'],
+                                                                       len(durations), items))
+
+    def loaded_controller(self):
+        controller = Controller()
+        controller.load_savefile(self.savefile_location)
+        controller.retrieve_images_present_in_catalog(sort_images='file_name')
+        return controller
+
+    def run(self):
+        self.bench_open_folder()
+        self.bench_load_savefile()
+        self.bench_save_progress()
+        self.bench_export_tags()
+        self.bench_export_tagged_images()
+        self.bench_scale_image()
+        self.bench_extract_entries_for_tag_category()
+        self.bench_dataset_statistics()
+        self.bench_merge_annotators()
+        self.bench_import_many_boxes()
+
+        return self.results
+
+    def bench_open_folder(self):
+        def run(controller):
+            controller.open_folder(self.dataset.folder)
+            controller.close_all_images()
+        self.record('open_folder', self.time_function(run, Controller, self.repeats), self.dataset.num_images)
+
+    def bench_load_savefile(self):
+        def run(controller):
+            controller.load_savefile(self.savefile_location)
+            controller.close_all_images()
+        self.record('load_savefile', self.time_function(run, Controller, self.repeats), self.dataset.num_images)
+
+    def bench_save_progress(self):
+        controller = self.loaded_controller()
+        durations = self.time_function(lambda _: controller.save_progress(self.work_folder + '/saved.csv', []),
+                                       repeats=self.repeats)
+        self.record('save_progress', durations, len(controller.catalog.images))
+        controller.close_all_images()
+
+    def bench_export_tags(self):
+        controller = self.loaded_controller()
+        exports = [('csv', self.work_folder + '/exported_tags.csv', {})]
+        durations = self.time_function(lambda _: controller.export_annotations(exports), repeats=self.repeats)
+        self.record('export_tags', durations, self.number_of_tags(controller))
+        controller.close_all_images()
+
+    def bench_export_tagged_images(self):
+        controller = self.loaded_controller()
+        export_folder = self.work_folder + '/exported_images'
+
+        def setup():
+            if os.path.exists(export_folder):
+                shutil.rmtree(export_folder)
+        durations = self.time_function(lambda _: controller.catalog.export_tagged_images(export_folder), setup,
+                                       self.repeats)
+        self.record('export_tagged_images', durations, len(controller.catalog.images))
+        controller.close_all_images()
+
+    def bench_scale_image(self):
+        controller = self.loaded_controller()
+        image_names = controller.retrieve_images_present_in_catalog(sort_images='file_name')[:self.scale_images]
+        # Warm-up (untimed): the first call decodes the full image, which is then kept by Image.IMG, so otherwise
+        # only zoom level 0 would include the decoding:
+        for image_name in image_names:
+            controller.scale_image(image_name, CANVAS_SIZE)
+        for zoomcycle, zoom_factor in ZOOM_LEVELS.items():
+            resolution = (int(CANVAS_SIZE[0] * zoom_factor), int(CANVAS_SIZE[1] * zoom_factor))
+
+            def run(_):
+                for image_name in image_names:
+                    controller.scale_image(image_name, resolution)
+            self.record('scale_image_zoom_{0}'.format(zoomcycle), self.time_function(run, repeats=self.repeats),
+                        len(image_names))
+        controller.close_all_images()
+
+    def bench_extract_entries_for_tag_category(self):
+        controller = self.loaded_controller()
+        tag_category = self.dataset.tag_categories[0]
+        durations = self.time_function(lambda _: controller.extract_entries_for_tag_category(tag_category),
+                                       repeats=self.repeats)
+        self.record('extract_entries_for_tag_category', durations, self.number_of_tags(controller))
+        controller.close_all_images()
+
+    def bench_dataset_statistics(self):
+        controller = self.loaded_controller()
+        durations = self.time_function(lambda _: controller.dataset_statistics(), repeats=self.repeats)
+        self.record('dataset_statistics', durations, self.number_of_tags(controller))
+        controller.close_all_images()
+
+    def bench_merge_annotators(self):
+        # The savefile merged as if three annotators tagged the same images:
+        savefile_locations = []
+        for annotator in ('annotator1', 'annotator2', 'annotator3'):
+            savefile_locations.append('{0}/{1}.csv'.format(self.work_folder, annotator))
+            shutil.copy(self.savefile_location, savefile_locations[-1])
+
+        def run(controller):
+            controller.merge_annotators(savefile_locations)
+            controller.close_all_images()
+        self.record('merge_annotators', self.time_function(run, Controller, self.repeats), 3 * self.dataset.num_images)
+
+    def bench_import_many_boxes(self, boxes=20000):
+        # A csv tag file with many boxes on a single image (one box per record):
+        controller = self.loaded_controller()
+        image = controller.catalog.images[0]
+        tag_file = self.work_folder + '/many_boxes.csv'
+        with open(tag_file, 'w') as handle:
+            for i in range(boxes):
+                handle.write('{0},{1},{2},bench,{3},{4},{5},{6}\n'.format(image.file_name, image.size[0], image.size[1],
+                                                                        i % 1000, i // 1000, i % 1000 + 10,
+                                                                        i // 1000 + 10))
+
+        def setup():
+            image.tags.tag_dict.clear()
+            image.tags.changed()
+        durations = self.time_function(lambda _: controller.import_annotations('csv', tag_file), setup, self.repeats)
+        self.record('import_many_boxes_per_image', durations, boxes)
+        controller.close_all_images()
+
+    @staticmethod
+    def number_of_tags(controller):
+        images = controller.catalog.images
+        return sum(len(images[image_id].tags.tag_dict) for image_id in images)
+
+
+def git_revision():
+    """Returns the current git commit of picture tools (or None if it cannot be determined)."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the picture tools benchmarks on a synthetic dataset.')
+    parser.add_argument('--images', type=int, default=200, help='number of synthetic images (default: 200)')
+    parser.add_argument('--resolutions', nargs='+', type=parse_resolution, default=[(1920, 1080)],
+                        help='image resolutions as WIDTHxHEIGHT (default: 1920x1080)')
+    parser.add_argument('--boxes', nargs=2, type=int, default=[0, 5], metavar=('MIN', 'MAX'),
+                        help='minimum and maximum number of tags per image (default: 0 5)')
+    parser.add_argument('--repeats', type=int, default=3, help='repeats per benchmark (default: 3)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-folder', help='folder for the dataset and outputs (default: a temporary folder)')
+    parser.add_argument('--output', default='benchmark_results.json', help='json file to write the results to')
+    args = parser.parse_args(argv)
+
+    work_folder = args.work_folder if args.work_folder is not None else tempfile.mkdtemp(prefix='picture_tools_')
+    work_folder = os.path.abspath(work_folder)
+    try:
+        dataset = SyntheticDataset(work_folder + '/images', args.images, args.resolutions, tuple(args.boxes),
+                                   seed=args.seed)
+        dataset.generate_images()
+        benchmarks = Benchmarks(work_folder, dataset, args.repeats)
+        number_of_tags = dataset.write_savefile(benchmarks.savefile_location)
+        results = benchmarks.run()
+    finally:
+        if args.work_folder is None:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+    report = {'metadata': {'date': datetime.now().isoformat(), 'git_revision': git_revision(),
+                           'python': sys.version, 'platform': platform.platform(), 'pillow': PIL.__version__},
+              'parameters': {'images': args.images, 'resolutions': args.resolutions, 'boxes': args.boxes,
+                             'tags': number_of_tags, 'repeats': args.repeats, 'seed': args.seed},
+              'results': results}
+    with open(args.output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    print('Results written to {0}'.format(args.output))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
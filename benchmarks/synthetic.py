@@ -0,0 +1,93 @@
+import os
+import random
+from datetime import datetime, timedelta
+from PIL import Image as PilImage
+from PIL import ExifTags, ImageDraw
+
+
+class SyntheticDataset:
+    """
+    Generates a reproducible synthetic image folder to benchmark picture tools with: num_images images with
+    resolutions picked from a list, an EXIF DateTimeOriginal per image and a savefile with random bounding box tags.
+    The same seed always produces the same dataset.
+    """
+
+    def __init__(self, folder, num_images=100, resolutions=((1920, 1080),), boxes_per_image=(0, 5),
+                 tag_categories=('car', 'person', 'sign'), start_date=datetime(2020, 1, 1), seed=0):
+        """
+        :param folder: Absolute path of the folder to write the images to (created if it does not exist).
+        :param num_images: number of images to generate.
+        :param resolutions: list of (width, height) tuples, images are assigned one of them at random.
+        :param boxes_per_image: (minimum, maximum) number of tags per image in the savefile.
+        :param tag_categories: tag_categories to use for the tags.
+        :param start_date: date of the first image, every next image is taken a minute later.
+        :param seed: random seed.
+        """
+        self.folder = folder
+        self.num_images = num_images
+        self.resolutions = [tuple(resolution) for resolution in resolutions]
+        self.boxes_per_image = boxes_per_image
+        self.tag_categories = list(tag_categories)
+        self.start_date = start_date
+        self.seed = seed
+        self.images = []  # list of (file_name, (width, height), date_string)
+
+    def generate_images(self):
+        """
+        This function writes the images. Each image gets a few random colored rectangles (so the jpeg encoder has
+        something to do) and an EXIF DateTimeOriginal.
+        :return: list of (file_name, size, date_string)
+        """
+        random_generator = random.Random(self.seed)
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self.images = []
+        for i in range(self.num_images):
+            size = random_generator.choice(self.resolutions)
+            date_string = (self.start_date + timedelta(minutes=i)).strftime('%Y:%m:%d %H:%M:%S')
+            file_name = 'synthetic_{0:07d}.jpg'.format(i)
+            image = PilImage.new('RGB', size, tuple(random_generator.randrange(256) for _ in range(3)))
+            draw = ImageDraw.Draw(image)
+            for _ in range(8):
+                x0, y0 = random_generator.randrange(size[0]), random_generator.randrange(size[1])
+                x1, y1 = random_generator.randrange(x0, size[0] + 1), random_generator.randrange(y0, size[1] + 1)
+                draw.rectangle([x0, y0, x1, y1], fill=tuple(random_generator.randrange(256) for _ in range(3)))
+            exif = PilImage.Exif()
+            exif.get_ifd(ExifTags.IFD.Exif)[ExifTags.Base.DateTimeOriginal] = date_string
+            image.save(self.folder + '/' + file_name, quality=90, exif=exif)
+            self.images.append((file_name, size, date_string))
+
+        return self.images
+
+    def random_tags(self, random_generator, size):
+        """Returns a list of random (tag_category, [xmin, ymin, xmax, ymax]) tags for an image of size."""
+        tags = []
+        for _ in range(random_generator.randint(self.boxes_per_image[0], self.boxes_per_image[1])):
+            width = random_generator.randint(1, max(1, size[0] // 4))
+            height = random_generator.randint(1, max(1, size[1] // 4))
+            xmin = random_generator.randrange(size[0] - width + 1)
+            ymin = random_generator.randrange(size[1] - height + 1)
+            tags.append((random_generator.choice(self.tag_categories), [xmin, ymin, xmin + width, ymin + height]))
+        return tags
+
+    def write_savefile(self, savefile_location):
+        """
+        This function writes a picture tools savefile (and _settings.csv) for the generated images containing
+        random tags, so loading, exporting and tag operations can be benchmarked without manual tagging.
+        :param savefile_location: Absolute path to the savefile.
+        :return: total number of tags written.
+        """
+        random_generator = random.Random(self.seed + 1)
+        number_of_tags = 0
+        with open(savefile_location, 'w') as savefile:
+            savefile.write('Image;Path;Date_time;Tags\n')
+            for file_name, size, date_string in self.images:
+                tags = self.random_tags(random_generator, size)
+                number_of_tags += len(tags)
+                savefile.write('{0};{1};{2};{3}\n'.format(file_name, self.folder, date_string, tags))
+        settings_location = '.'.join(savefile_location.split('.')[:-1]) + '_settings.csv'
+        with open(settings_location, 'w') as settings:
+            for tag_category in self.tag_categories:
+                settings.write('TagCategory;{0};{1}\n'.format(tag_category, '#ff0000'))
+
+        return number_of_tags
@@ -0,0 +1,528 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Picture tools modules (no tkinter is imported in headless mode):
+from annotation_lint import CHECKS, LintOptions, format_lint_report
+from annotator_merge import RULES, MergeOptions, format_merge_report
+from controller import Controller
+from dataset_statistics import format_report
+from decoded_cache import DecodedCache
+from exporters import EXPORTERS
+from folder_watch import FolderWatcher
+from tfrecord import LabelMap
+from tiling import ChipOptions
+from transcode import IMAGE_FORMATS, TranscodeOptions
+
+
+class ProgressPrinter:
+    """Prints progress of long running catalog operations to stdout, at most every interval seconds."""
+
+    def __init__(self, description, interval=0.5, stream=sys.stdout):
+        self.description = description
+        self.interval = interval
+        self.stream = stream
+        self.last_print = 0
+        self.done = 0
+
+    def __call__(self, done, total):
+        self.done = done
+        now = time.monotonic()
+        if now - self.last_print >= self.interval or done == total:
+            self.last_print = now
+            if total is None:
+                self.stream.write('{0}: {1}\n'.format(self.description, done))
+            else:
+                self.stream.write('{0}: {1}/{2}\n'.format(self.description, done, total))
+            self.stream.flush()
+
+
+class BatchMode:
+    """
+    Runs picture tools without the Tk GUI. It drives the Controller directly, so it can be used on headless machines
+    (e.g. in a nightly pipeline) to ingest folders, print statistics, merge savefiles and export tags.
+    """
+
+    def __init__(self, stream=sys.stdout):
+        self.controller = Controller()
+        self.stream = stream
+        self.settings = {'taglinewidth': 3, 'selected_image': None, 'min_tagsize': 0, 'sorting_method': 'file_name'}
+
+    def write(self, text):
+        self.stream.write(text + '\n')
+        self.stream.flush()
+
+    def load(self, savefile_location, search_roots=None):
+        """Loads a savefile (if it exists) and remembers its settings so they are kept when saving again."""
+        if self.controller.catalog.file_access.file_exists(savefile_location):
+            selected_image, taglinewidth, _, min_tagsize, sorting_method = self.controller.load_savefile(
+                savefile_location, ProgressPrinter('Loading {0}'.format(savefile_location), stream=self.stream),
+                search_roots)
+            self.settings.update({'taglinewidth': taglinewidth, 'selected_image': selected_image,
+                                  'min_tagsize': min_tagsize, 'sorting_method': sorting_method})
+            missing = len(self.controller.catalog.missing_images)
+            if missing > 0:
+                self.write('{0} images of {1} were not found (see relink).'.format(missing, savefile_location))
+
+    def save(self, savefile_location):
+        """Saves the catalog to savefile_location (in the same format as the GUI does)."""
+        settings = ['taglinewidth;{0}\n'.format(self.settings['taglinewidth']),
+                    'selected_image;{0}\n'.format(self.settings['selected_image']),
+                    'savefile_location;{0}\n'.format(savefile_location),
+                    'min_tagsize;{0}\n'.format(self.settings['min_tagsize']),
+                    'sorting_method;{0}\n'.format(self.settings['sorting_method'])]
+        self.controller.save_progress(savefile_location, settings)
+        self.write('Saved {0} images to {1}'.format(len(self.controller.catalog.images), savefile_location))
+
+    def ingest(self, args):
+        """Adds the images in one or more folders to a (new or existing) savefile."""
+        self.load(args.savefile)
+        if args.start is not None and args.end is not None:
+            self.controller.catalog.set_date_range(args.start, args.end)
+        for folder in args.folders:
+            summary = self.controller.open_folder(os.path.abspath(folder),
+                                                  ProgressPrinter('Importing {0}'.format(folder), stream=self.stream),
+                                                  args.recursive, args.include, args.exclude, args.workers)
+            self.write_import_summary(folder, summary)
+        self.save(args.savefile)
+
+        return 0
+
+    def rescan(self, args):
+        """
+        Rescans the folders imported into a savefile and adds new, reloads changed and removes deleted images. With
+        --watch it keeps watching the folders and saves the savefile after every change (stop with Ctrl+C).
+        """
+        self.load(args.savefile)
+        summary = self.controller.rescan(full=args.full)
+        self.write_rescan_summary(summary)
+        self.save(args.savefile)
+        if args.watch:
+            watcher = FolderWatcher(self.controller.catalog.import_roots, poll_interval=args.interval)
+            self.write('Watching {0} folders ({1}), stop with Ctrl+C.'.format(len(watcher.roots), watcher.start()))
+            try:
+                while True:
+                    time.sleep(0.5)
+                    changes = watcher.poll_changes()
+                    if changes is not None:
+                        summary = self.controller.rescan(changed_folders=changes or None)
+                        if summary['added'] + summary['changed'] + summary['removed'] > 0:
+                            self.write_rescan_summary(summary)
+                            self.save(args.savefile)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                watcher.stop()
+
+        return 0
+
+    def write_import_summary(self, folder, summary, max_skipped=20):
+        self.write('Added {0} images from {1}.'.format(summary['added'], folder))
+        if len(summary['skipped']) > 0:
+            self.write('Skipped {0} images with the file name of an image from another folder:'.format(
+                len(summary['skipped'])))
+            for relative_path in summary['skipped'][:max_skipped]:
+                self.write('    {0}'.format(relative_path))
+            if len(summary['skipped']) > max_skipped:
+                self.write('    ... and {0} more'.format(len(summary['skipped']) - max_skipped))
+
+    def write_rescan_summary(self, summary):
+        self.write('Added {0}, changed {1} and removed {2} images ({3} folders listed, {4} unchanged).'.format(
+            summary['added'], summary['changed'], summary['removed'], summary['folders_listed'],
+            summary['folders_skipped']))
+
+    def stats(self, args):
+        """
+        Prints the statistics of the tags: the number of (tagged) images and tags per tag_category, boxes per image, box
+        size and aspect ratio distributions, co-occurrence of the tag_categories and suggested anchor boxes. With --json
+        the full statistics (including all percentiles) are also written to a json file.
+        """
+        self.load(args.savefile)
+        report = self.controller.dataset_statistics(image_filter(args), args.anchors, args.anchor_input_size)
+        self.write(format_report(report))
+        if args.json is not None:
+            with open(args.json, 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.write('Wrote the statistics to {0}'.format(args.json))
+
+        return 0
+
+    def merge(self, args):
+        """
+        Merges several savefiles into one output savefile. With --rule the savefiles are those of several annotators
+        of the same images: their boxes are matched and merged by the rule, and the boxes the annotators disagree on
+        are printed (and written to --review).
+        """
+        if args.rule is None:
+            summary = self.controller.merge_savefiles(args.savefiles, ProgressPrinter('Merging', stream=self.stream))
+            self.write('Added {0} images and {1} tags, skipped {2} tags of missing images.'.format(
+                summary['images_added'], summary['tags_added'], summary['tags_skipped']))
+            self.save(args.output)
+            return 0
+        try:
+            options = MergeOptions(args.rule, args.iou_threshold, args.prefer, args.min_agreement)
+            report = self.controller.merge_annotators(args.savefiles, options,
+                                                      ProgressPrinter('Merging', stream=self.stream))
+        except ValueError as error:
+            self.write(str(error))
+            return 2
+        self.write(format_merge_report(report, args.max_disagreements))
+        if args.review is not None:
+            lines = ['Image;Tag_category;Coordinates;Annotators;Kept\n']
+            for file_name, tag_category, coordinates, annotators, kept in report['review']:
+                lines.append('{0};{1};{2};{3};{4}\n'.format(file_name, tag_category, list(coordinates),
+                                                            ','.join(annotators), kept))
+            self.controller.catalog.file_access.write_to_csv(args.review, lines)
+            self.write('Wrote {0} disagreements to {1}'.format(len(report['review']), args.review))
+        self.save(args.output)
+
+        return 0
+
+    def export(self, args):
+        """Exports the tags of a savefile to one or more annotation formats (and optionally the tagged images)."""
+        self.load(args.savefile)
+        if not os.path.exists(args.output):
+            os.makedirs(args.output)
+        min_tagsize = args.min_tagsize if args.min_tagsize is not None else int(self.settings['min_tagsize'])
+        exports = []
+        for export_format in args.formats:
+            options = {'workers': args.workers}
+            if export_format == 'tfrecord':
+                if args.label_map is None:
+                    self.write('The tfrecord format requires --label-map.')
+                    return 2
+                options.update({'label_map_location': args.label_map, 'num_shards': args.shards})
+            elif export_format == 'coco' and args.label_map is not None:
+                options['label_map_location'] = args.label_map
+            elif export_format == 'crops':
+                options.update({'padding': args.crop_padding, 'square': args.crop_square,
+                                'min_side': args.crop_min_side, 'crop_size': args.crop_size,
+                                'quality': args.quality})
+            exports.append((export_format, args.output + '/' + EXPORTERS[export_format].default_name, options))
+        transcode, chips = None, None
+        if args.chip_size is not None:
+            chips = ChipOptions(args.chip_size, args.chip_overlap, args.chip_min_visible, not args.keep_empty_chips,
+                                args.image_format or 'jpeg', args.quality)
+        elif args.max_side is not None or args.scale is not None or args.image_format is not None:
+            transcode = TranscodeOptions(args.max_side, args.scale, args.image_format, args.quality)
+        lint = None if args.no_lint else LintOptions(args.iou_threshold, args.fix_tags or ())
+        summary = self.controller.export_annotations(exports, min_tagsize,
+                                                     ProgressPrinter('Exporting', stream=self.stream),
+                                                     image_filter(args), transcode, args.output + '/images',
+                                                     args.workers, chips, args.decoded_cache, lint)
+        if lint is not None:
+            self.write(format_lint_report(summary.pop('lint'), args.max_problems))
+        for export_format in summary:
+            self.write('{0}: {1}'.format(export_format, ', '.join('{0} {1}'.format(value, key) for key, value in
+                                                                   summary[export_format].items())))
+        if chips is not None:
+            self.write('Wrote image chips to {0}'.format(args.output + '/images'))
+        elif transcode is not None:
+            self.write('Wrote resized tagged images to {0}'.format(args.output + '/images'))
+        elif args.images:
+            self.controller.catalog.export_tagged_images(args.output + '/images', lint=lint,
+                                                         tag_categories=args.image_categories)
+            self.write('Exported tagged images to {0}'.format(args.output + '/images'))
+        if args.fix_tags and not args.no_lint:
+            self.save(args.savefile)
+
+        return 0
+
+    def lint(self, args):
+        """
+        Checks the tags of a savefile for boxes without area, inverted corners, boxes outside their image, unknown
+        tag_categories and (near-)duplicates, and prints the boxes that fail a check. With --fix the given checks are
+        fixed and the savefile is saved. Returns 1 if boxes still fail a check.
+        """
+        self.load(args.savefile)
+        categories = list(LabelMap(args.label_map).ids) if args.label_map is not None else None
+        report = self.controller.lint_tags(image_filter(args), LintOptions(args.iou_threshold, args.fix or (),
+                                                                           categories=categories))
+        self.write(format_lint_report(report, args.max_problems))
+        if report['removed'] + sum(report['fixed'].values()) > 0:
+            self.save(args.savefile)
+
+        return 1 if len(report['problems']) > 0 else 0
+
+    def fingerprint(self, args):
+        """Computes the content fingerprints of the images of a savefile, so moved images can be relinked later."""
+        self.load(args.savefile)
+        computed = self.controller.compute_fingerprints(args.workers, ProgressPrinter('Hashing', stream=self.stream))
+        self.write('Computed {0} fingerprints.'.format(computed))
+        self.save(args.savefile)
+
+        return 0
+
+    def relink(self, args):
+        """Loads a savefile, searching the images that have been moved or renamed in the given folders."""
+        self.load(args.savefile, [os.path.abspath(folder) for folder in args.folders] or None)
+        self.save(args.savefile)
+
+        return 0
+
+    def duplicates(self, args):
+        """
+        Prints the clusters of near-duplicate images (perceptual hashes within --max-distance bits, the hashes that are
+        missing are computed). With --copy-tags the tags of the first tagged image of a cluster are copied to the
+        untagged images of the same size in it. The savefile is only saved if hashes were computed or tags copied (or
+        with --save).
+        """
+        self.load(args.savefile)
+        images = self.controller.catalog.images
+        clusters, computed = self.controller.find_near_duplicates(args.max_distance, image_filter(args), args.workers,
+                                                                  ProgressPrinter('Hashing', stream=self.stream))
+        copied = 0
+        for number, cluster in enumerate(clusters, 1):
+            self.write('Cluster {0} ({1} images):'.format(number, len(cluster)))
+            for image_id in cluster:
+                self.write('  ' + images[image_id].file_location + '/' + images[image_id].file_name)
+            if args.copy_tags:
+                tagged = [image_id for image_id in cluster if len(images[image_id].tags.tag_dict) > 0]
+                if len(tagged) > 0:
+                    copied += self.controller.catalog.copy_tags(tagged[0], [image_id for image_id in cluster
+                                                                            if image_id not in tagged])
+        self.write('{0} images in {1} clusters of near-duplicates.'.format(sum(len(i) for i in clusters),
+                                                                          len(clusters)))
+        if args.copy_tags:
+            self.write('Copied {0} tags.'.format(copied))
+        if computed > 0 or copied > 0 or args.save:
+            self.save(args.savefile)
+
+        return 0
+
+    def quality(self, args):
+        """
+        Computes the quality scores (sharpness, exposure, entropy) of the images that have not been analysed yet and
+        prints the images with the lowest scores.
+        """
+        self.load(args.savefile)
+        analysed = self.controller.compute_quality(args.workers, ProgressPrinter('Analysing', stream=self.stream))
+        self.write('Analysed {0} images.'.format(analysed))
+        images = self.controller.catalog.images
+        scored = sorted((images[image_id].quality.score, image_id) for image_id in images
+                        if images[image_id].quality is not None)
+        for score, image_id in scored[:int(round(len(scored) * args.worst))]:
+            quality = images[image_id].quality
+            self.write('{0:.3f} {1}/{2} (sharpness {3:.0f}, over {4:.0%}, under {5:.0%}, entropy {6:.1f})'.format(
+                score, images[image_id].file_location, images[image_id].file_name, quality.sharpness,
+                quality.overexposed, quality.underexposed, quality.entropy))
+        self.save(args.savefile)
+
+        return 0
+
+    def query(self, args):
+        """Prints the absolute paths of the images matching the filter options (one per line, sorted on date)."""
+        self.load(args.savefile)
+        images = self.controller.catalog.images
+        for image_id in self.controller.query_images(image_filter(args)):
+            self.write(images[image_id].file_location + '/' + images[image_id].file_name)
+
+        return 0
+
+    def cache(self, args):
+        """
+        Decodes the images matching the filter options into a decoded image cache, which is read by the GUI
+        (main.py --display-cache), the exports (export --decoded-cache) and training data loaders.
+        """
+        self.load(args.savefile)
+        images = self.controller.catalog.images
+        paths = [images[image_id].file_location + '/' + images[image_id].file_name
+                 for image_id in self.controller.query_images(image_filter(args))]
+        max_bytes = int(args.max_size * 2 ** 20) if args.max_size is not None else None
+        cache = DecodedCache(args.cache, max_bytes)
+        added = cache.fill(paths, args.min_size, args.workers, ProgressPrinter('Caching', stream=self.stream))
+        self.write('Added {0} of {1} images to {2}.'.format(added, len(paths), args.cache))
+
+        return 0
+
+
+def add_filter_arguments(parser):
+    """Adds the options to select images (see ImageCatalog.query) to a sub-command."""
+    tagged = parser.add_mutually_exclusive_group()
+    tagged.add_argument('--tagged', action='store_const', const=True, dest='tagged', help='only images with tags')
+    tagged.add_argument('--untagged', action='store_const', const=False, dest='tagged', help='only images without tags')
+    parser.add_argument('--categories', nargs='+', help='only images with tags of one of these tag categories')
+    parser.add_argument('--without-categories', nargs='+', help='only images without tags of these tag categories')
+    parser.add_argument('--taken-after', help='only images taken on or after this date (yyyy:mm:dd)')
+    parser.add_argument('--taken-before', help='only images taken on or before this date (yyyy:mm:dd)')
+    parser.add_argument('--box-smaller-than', type=int, help='only images with a tag smaller than this area (pixels)')
+    parser.add_argument('--box-larger-than', type=int, help='only images with a tag larger than this area (pixels)')
+    parser.add_argument('--min-quality', type=float, help='only images with a quality score of at least this (0-1, '
+                                                          'images that have not been analysed are kept)')
+    parser.add_argument('--exclude-worst-quality', type=float,
+                        help='leave out this fraction of the analysed images with the lowest quality (e.g. 0.1)')
+
+
+def image_filter(args):
+    """Returns the query criteria given on the command line as a dictionary (empty: all images)."""
+    criteria = {'tagged': args.tagged, 'categories': args.categories, 'exclude_categories': args.without_categories,
+                'start': args.taken_after, 'end': args.taken_before, 'box_smaller_than': args.box_smaller_than,
+                'box_larger_than': args.box_larger_than, 'min_quality': args.min_quality,
+                'exclude_worst_quality': args.exclude_worst_quality}
+    return {key: value for key, value in criteria.items() if value is not None}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog='picture_tools', description='Picture tools batch mode (without GUI).')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    ingest = subparsers.add_parser('ingest', help='import image folders into a savefile')
+    ingest.add_argument('savefile', help='savefile (.csv) to create or extend')
+    ingest.add_argument('folders', nargs='+', help='folders to import images from')
+    ingest.add_argument('--start', help='only import images taken on or after this date (yyyy:mm:dd)')
+    ingest.add_argument('--end', help='only import images taken on or before this date (yyyy:mm:dd)')
+    ingest.add_argument('--recursive', action='store_true', help='also import the images in sub-folders')
+    ingest.add_argument('--include', nargs='+', help='only import images matching one of these glob patterns')
+    ingest.add_argument('--exclude', nargs='+', help='skip images and sub-folders matching these glob patterns')
+    ingest.add_argument('--workers', type=int, help='number of worker processes reading the images (default: number '
+                                                    'of cpus)')
+
+    rescan = subparsers.add_parser('rescan', help='add new and remove deleted images of the imported folders')
+    rescan.add_argument('savefile')
+    rescan.add_argument('--full', action='store_true', help='also check unchanged folders for overwritten images')
+    rescan.add_argument('--watch', action='store_true', help='keep watching the folders (inotify or polling)')
+    rescan.add_argument('--interval', type=float, default=5.0, help='polling interval in seconds (default: 5)')
+
+    stats = subparsers.add_parser('stats', help='print statistics of the tags of a savefile (box sizes, anchors)')
+    stats.add_argument('savefile')
+    stats.add_argument('--anchors', type=int, default=9, help='number of anchor boxes to suggest (default: 9, 0: none)')
+    stats.add_argument('--anchor-input-size', type=int,
+                       help='compute the anchors for the images resized to fit in a square of this size (default: '
+                            'the box sizes in the original images)')
+    stats.add_argument('--json', help='also write the statistics to this json file')
+    add_filter_arguments(stats)
+
+    merge = subparsers.add_parser('merge', help='merge savefiles into a single savefile')
+    merge.add_argument('output', help='savefile (.csv) to write')
+    merge.add_argument('savefiles', nargs='+', help='savefiles to merge')
+    merge.add_argument('--rule', choices=RULES,
+                       help='merge the savefiles of several annotators of the same images: match their boxes and keep '
+                            'every box (union), the boxes most annotators agree on (consensus) or the boxes of one '
+                            'annotator (prefer) (default: add all tags)')
+    merge.add_argument('--iou-threshold', type=float, default=0.5,
+                       help='boxes of different annotators overlapping at least this much are the same object '
+                            '(default: 0.5)')
+    merge.add_argument('--prefer', help='the preferred annotator for the prefer rule (its savefile or its name in the '
+                                        'report)')
+    merge.add_argument('--min-agreement', type=int,
+                       help='number of annotators that should agree for the consensus rule (default: a majority of '
+                            'the annotators of the image)')
+    merge.add_argument('--review', help='write the boxes the annotators disagree on to this csv file')
+    merge.add_argument('--max-disagreements', type=int, default=50,
+                       help='number of disagreements to print (default: 50)')
+
+    export = subparsers.add_parser('export', help='export the tags of a savefile')
+    export.add_argument('savefile')
+    export.add_argument('output', help='folder to export to')
+    export.add_argument('--formats', nargs='+', default=['csv'], choices=sorted(EXPORTERS),
+                        help='annotation formats to write in a single pass (default: csv)')
+    export.add_argument('--label-map', help='.pbtxt label map (required for tfrecord)')
+    export.add_argument('--shards', type=int, default=10, help='number of TFRecord shards (default: 10)')
+    export.add_argument('--min-tagsize', type=int, help='minimum tag area (default: the value in the savefile)')
+    export.add_argument('--workers', type=int, help='number of worker processes (default: number of cpus)')
+    export.add_argument('--images', action='store_true', help='also copy the tagged images to <output>/images')
+    export.add_argument('--image-categories', nargs='+',
+                        help='with --images: only copy the images with tags of these tag categories (independent of '
+                             '--categories, which selects the images of the annotations; default: all)')
+    export.add_argument('--max-side', type=int, help='write the tagged images to <output>/images with their longest '
+                                                      'side reduced to this number of pixels (boxes are rescaled)')
+    export.add_argument('--scale', type=float, help='write the tagged images to <output>/images scaled by this factor')
+    export.add_argument('--image-format', choices=sorted(IMAGE_FORMATS),
+                        help='write the tagged images (or chips) to <output>/images in this format')
+    export.add_argument('--quality', type=int, default=90, help='JPEG / WebP quality of resized images, chips and '
+                                                                'crops (default: 90)')
+    export.add_argument('--chip-size', type=int,
+                        help='cut the images into chips of this size written to <output>/images (large uncompressed '
+                             'TIFF files are read region by region), the annotations refer to the chips')
+    export.add_argument('--chip-overlap', type=int, default=128,
+                        help='number of pixels neighbouring chips overlap (default: 128)')
+    export.add_argument('--chip-min-visible', type=float, default=0.5,
+                        help='keep a box on a chip if at least this fraction of it is on the chip (default: 0.5)')
+    export.add_argument('--keep-empty-chips', action='store_true', help='also write chips without boxes')
+    export.add_argument('--decoded-cache', help='read the images from this decoded image cache (see cache) when '
+                                                'resizing, chipping or cropping')
+    export.add_argument('--crop-padding', type=float, default=0.0,
+                        help='crops format: fraction of the box size added on every side (default: 0)')
+    export.add_argument('--crop-square', action='store_true', help='crops format: write square crops')
+    export.add_argument('--crop-min-side', type=int, default=0,
+                        help='crops format: skip boxes with a side smaller than this number of pixels')
+    export.add_argument('--crop-size', type=int, help='crops format: resize the longest side of the crops to this')
+    export.add_argument('--fix-tags', nargs='+', choices=CHECKS,
+                        help='fix these problems of the tags before exporting (see lint) and save the savefile')
+    export.add_argument('--iou-threshold', type=float, default=0.9,
+                        help='boxes of the same tag category overlapping at least this much are near-duplicates '
+                             '(default: 0.9)')
+    export.add_argument('--max-problems', type=int, default=50, help='number of problems of the tags to print')
+    export.add_argument('--no-lint', action='store_true', help='do not check the tags before exporting')
+    add_filter_arguments(export)
+
+    lint = subparsers.add_parser('lint', help='check the tags of a savefile for degenerate, out-of-bounds and '
+                                              'duplicate boxes')
+    lint.add_argument('savefile')
+    lint.add_argument('--fix', nargs='+', choices=CHECKS,
+                      help='fix these problems (inverted: swap the corners, out_of_bounds: clip to the image, others: '
+                           'remove the box) and save the savefile')
+    lint.add_argument('--iou-threshold', type=float, default=0.9,
+                      help='boxes of the same tag category overlapping at least this much are near-duplicates '
+                           '(default: 0.9)')
+    lint.add_argument('--label-map', help='.pbtxt label map with the allowed tag categories (default: the tag '
+                                          'categories of the savefile)')
+    lint.add_argument('--max-problems', type=int, default=50, help='number of problems to print (default: 50)')
+    add_filter_arguments(lint)
+
+    fingerprint = subparsers.add_parser('fingerprint', help='compute content fingerprints of the images of a savefile, '
+                                                            'used to find them again after they have been moved')
+    fingerprint.add_argument('savefile')
+    fingerprint.add_argument('--workers', type=int, help='number of worker processes (default: number of cpus)')
+
+    relink = subparsers.add_parser('relink', help='find moved or renamed images of a savefile by their fingerprint')
+    relink.add_argument('savefile')
+    relink.add_argument('folders', nargs='*', help='folders to search (default: the imported folders and the folders '
+                                                   'the images were in)')
+
+    duplicates = subparsers.add_parser('duplicates', help='list clusters of near-duplicate images (perceptual hash)')
+    duplicates.add_argument('savefile')
+    duplicates.add_argument('--max-distance', type=int, default=6,
+                            help='maximum number of bits (of 64) the hashes of near-duplicates differ (default: 6)')
+    duplicates.add_argument('--copy-tags', action='store_true',
+                            help='copy the tags of the first tagged image of a cluster to its untagged images')
+    duplicates.add_argument('--workers', type=int, help='number of worker processes (default: number of cpus)')
+    duplicates.add_argument('--save', action='store_true',
+                            help='save the savefile also if no hashes were computed and no tags copied')
+    add_filter_arguments(duplicates)
+
+    quality = subparsers.add_parser('quality', help='compute image quality scores (blur, exposure) of a savefile')
+    quality.add_argument('savefile')
+    quality.add_argument('--worst', type=float, default=0.1,
+                         help='print this fraction of the images with the lowest quality (default: 0.1)')
+    quality.add_argument('--workers', type=int, help='number of worker processes (default: number of cpus)')
+
+    query = subparsers.add_parser('query', help='list the images of a savefile matching the filter options')
+    query.add_argument('savefile')
+    add_filter_arguments(query)
+
+    cache = subparsers.add_parser('cache', help='decode the images of a savefile into a decoded image cache')
+    cache.add_argument('savefile')
+    cache.add_argument('cache', help='cache folder')
+    cache.add_argument('--min-size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                       help='cache the images at 1/2, 1/4 or 1/8 of their size if that is at least WIDTH x HEIGHT '
+                            '(default: full size)')
+    cache.add_argument('--max-size', type=float, help='maximum size of the cache in MB')
+    cache.add_argument('--workers', type=int, help='number of worker processes (default: number of cpus)')
+    add_filter_arguments(cache)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(sys.argv[1:] if argv is None else argv)
+    batch_mode = BatchMode()
+
+    return getattr(batch_mode, args.command)(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
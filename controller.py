@@ -1,53 +1,153 @@
 from natsort import natsorted
 import operator
 import math
-from PIL import Image, ImageTk
+from PIL import Image
 
 # Picture tools modules:
+from annotation_lint import LintOptions
+from annotator_merge import MergeOptions
 from image_catalog import ImageCatalog
 from grid import Grid
+from instrumentation import instrument
 
 
 class Controller:
 
     image_dict = {}  # keep track of the link between image_file_name (key) and image_id (value).
+    decoded_cache = None  # (Optional) DecodedCache the shown images are read from (main.py --display-cache)
 
     def __init__(self):
         self.catalog = ImageCatalog()
+        self.image_dict = {}
         self.grid = Grid()
 
-    def open_folder(self, folder_location):
+    def open_folder(self, folder_location, progress=None, recursive=False, include=None, exclude=None, workers=1):
         """
         This function sends a command to the image_catalog to import the images present in [folder_location].
         :param folder_location: Absolute path to folder location to import images from.
+        :param progress: (Optional) function called as progress(done, total).
+        :param recursive: True to also import the images in sub-folders.
+        :param include: (Optional) list of glob patterns, only images matching one of them are imported.
+        :param exclude: (Optional) list of glob patterns for images (and sub-folders) to skip.
+        :param workers: number of worker processes reading the image files (1: in this thread, None: number of cpu's).
+        :return: dictionary with the number of images added and the files skipped because an image with the same
+        file_name is in the catalog already.
+        """
+        with instrument.span('controller.open_folder'):
+            return self.catalog.open_folder(folder_location, progress, recursive, include, exclude, workers)
+
+    def rescan(self, progress=None, full=False, changed_folders=None):
+        """
+        This function rescans the imported folders and adds new, reloads changed and removes deleted images.
+        :return: dictionary with the number of images added, changed and removed and folders listed and skipped.
         """
-        self.catalog.open_folder(folder_location)
+        with instrument.span('controller.rescan'):
+            return self.catalog.rescan(progress, full, changed_folders)
+
+    def retrieve_new_images(self, since_image_id=0):
+        """
+        This function retrieves the image_file_names of the images added to the catalog since since_image_id (in the
+        order they were added) and adds them to the dictionary linking image_file_names to image_id's, so they can be
+        shown while an import is still running.
+        :param since_image_id: the image_id returned by the previous call (0 for all images).
+        :return: list of image_file_names and the image_id to pass to the next call.
+        """
+        added, next_image_id = self.catalog.images_added_since(since_image_id)
+        for image_id, image in added:
+            self.image_dict[image.file_name] = image_id
+
+        return [image.file_name for image_id, image in added], next_image_id
 
-    def retrieve_images_present_in_catalog(self, sort_images='date_taken'):
+    def retrieve_images_present_in_catalog(self, sort_images='date_taken', image_filter=None):
         """
         This function retrieves the image_file_names of the images present in the image_catalog. It returns a sorted
         list. Default sorting is on the date the image was taken.
         This function also (re-)creates a dictionary linking image_file_names to image_id's.
-        :param sort_images: on what the images should be sorted ('date_taken' or 'image_file_name').
+        :param sort_images: on what the images should be sorted ('date_taken', 'quality' (lowest quality score first,
+        images that have not been analysed last) or 'image_file_name').
+        :param image_filter: (Optional) dictionary with query criteria (see ImageCatalog.query), only the matching
+        images are returned.
         :return: sorted image name list.
         """
         # Get images from image catalog:
-        image_list = [(image_id, self.catalog.images[image_id].file_name, self.catalog.images[image_id].date_taken) for
-                      image_id in self.catalog.images]
+        snapshot = self.catalog.snapshot()
         # (re-)create a dictionary linking image_id's to image_file_names:
         self.image_dict = {}
-        for entry in image_list:
-            self.image_dict[entry[1]] = entry[0]
+        for image_id, image in snapshot:
+            self.image_dict[image.file_name] = image_id
+        if image_filter:
+            images = dict(snapshot)
+            image_list = [(image_id, images[image_id].file_name) for image_id in self.query_images(image_filter)
+                          if image_id in images]
+            if sort_images == 'date_taken':  # query results are sorted on date already
+                return [i[1] for i in image_list]
+            if sort_images == 'quality':
+                return [i[1] for i in sorted(image_list, key=lambda i: self.quality_key(images[i[0]]))]
+            return natsorted(i[1] for i in image_list)
+        image_list = [(image_id, image.file_name, image.date_taken) for image_id, image in snapshot]
         # Sort:
         if sort_images == 'date_taken':
             image_list.sort(key=operator.itemgetter(2))  # sort on date
             image_list = [i[1] for i in image_list]
+        elif sort_images == 'quality':
+            images = dict(snapshot)
+            image_list.sort(key=lambda i: self.quality_key(images[i[0]]))
+            image_list = [i[1] for i in image_list]
         else:
             image_list = [i[1] for i in image_list]
             image_list = natsorted(image_list)
 
         return image_list
 
+    @staticmethod
+    def quality_key(image):
+        """Sort key of an image on its quality score: lowest first, images that have not been analysed last."""
+        return (0, image.quality.score) if image.quality is not None else (1, 0)
+
+    def compute_quality(self, workers=None, progress=None):
+        """
+        Computes the quality scores (sharpness, exposure, entropy) of the images that have not been analysed yet, used
+        to sort the images on quality and to leave out the worst ones. Returns the number of images analysed.
+        """
+        with instrument.span('controller.compute_quality'):
+            return self.catalog.compute_quality(workers=workers, progress=progress)
+
+    def dataset_statistics(self, image_filter=None, anchors=9, anchor_input_size=None, progress=None):
+        """
+        Computes the statistics of the tags (box sizes and aspect ratios per tag_category, boxes per image,
+        co-occurrence and suggested anchors) of the images matching image_filter, see ImageCatalog.dataset_statistics.
+        :param image_filter: (Optional) dictionary with query criteria, default all images.
+        :param progress: (Optional) function called as progress(done, total) when the statistics are done.
+        """
+        with instrument.span('controller.dataset_statistics'):
+            image_ids = self.query_images(image_filter) if image_filter else None
+            report = self.catalog.dataset_statistics(image_ids, anchors, anchor_input_size)
+        if progress is not None:
+            progress(1, 1)
+        return report
+
+    def lint_tags(self, image_filter=None, options=LintOptions(), progress=None):
+        """
+        Checks the tags of the images matching image_filter for degenerate, out-of-bounds, unknown and duplicate boxes
+        and fixes the checks in options.fix, see ImageCatalog.lint_tags.
+        :param image_filter: (Optional) dictionary with query criteria, default all images.
+        :param progress: (Optional) function called as progress(done, total) when the checks are done.
+        """
+        with instrument.span('controller.lint_tags'):
+            image_ids = self.query_images(image_filter) if image_filter else None
+            report = self.catalog.lint_tags(image_ids, options)
+        if progress is not None:
+            progress(1, 1)
+        return report
+
+    def query_images(self, image_filter):
+        """
+        This function selects the images matching image_filter using the catalog indexes.
+        :param image_filter: dictionary with query criteria, e.g. {'categories': ['cat'], 'start': '2019:01:01'}.
+        :return: list of image_id's sorted on the date taken.
+        """
+        return self.catalog.query(**image_filter)
+
     def retrieve_image_object(self, image_file_name):
         """Returns the image_object for a given image_file_name"""
         image_id = self.image_dict[image_file_name]
@@ -62,11 +162,14 @@ class Controller:
         :param resolution: The resolution to resize the image to.
         :return: PIL image object.
         """
+        from PIL import ImageTk  # imported here so the controller can be used without tkinter (headless mode)
         pil_image = None
         if image_file_name in self.image_dict:
-            pil_image = self.scale_image(image_file_name, resolution)
-            pil_image = ImageTk.PhotoImage(pil_image)
-            
+            with instrument.span('controller.retrieve_image'):
+                pil_image = self.scale_image(image_file_name, resolution)
+                with instrument.span('photoimage'):
+                    pil_image = ImageTk.PhotoImage(pil_image)
+
         return pil_image
 
     def retrieve_tags(self, image_file_name):
@@ -83,10 +186,7 @@ class Controller:
 
     def retrieve_tag_categories(self):
         """This function extracts all tag_categories present in the catalog and returns them as a list."""
-        tag_dict = self.catalog.tag_categories.tag_categories
-        category_list = [key for key, value in tag_dict.items()]
-
-        return category_list
+        return list(self.catalog.tag_categories)
 
     def close_all_images(self):
         """Closes all images in the image catalog"""
@@ -98,7 +198,7 @@ class Controller:
         :param tag_category: The tag_category.
         :return: The color (HEX).
         """
-        return self.catalog.tag_categories.tag_categories[tag_category]
+        return self.catalog.tag_categories.color(tag_category)
 
     def retrieve_image_date_taken(self, image_file_name):
         """
@@ -122,24 +222,28 @@ class Controller:
         """
         This function sends a command to add a tag_category.
         """
-        self.catalog.tag_categories.add_tag_category(tag_category, color)
+        with self.catalog.lock:
+            self.catalog.tag_categories.add_tag_category(tag_category, color)
 
     def remove_tag_category(self, tag_category):
         """
         This function sends a command to remove a tag_category.
         """
-        self.catalog.tag_categories.remove_tag_category(tag_category)
+        with self.catalog.lock:
+            self.catalog.tag_categories.remove_tag_category(tag_category)
 
     def extract_entries_for_tag_category(self, tag_category, delete=False, replace=False, replace_category=None):
         """Extracts number of times a tag of tag_category occurs and deletes tags if delete=True."""
-        if delete:
-            self.catalog.extract_entries_for_tag_category(tag_category, True)
-        elif replace:
-            count = self.catalog.extract_entries_for_tag_category(tag_category, False, True, replace_category)
-            return count
-        else:
-            count = self.catalog.extract_entries_for_tag_category(tag_category, delete)
-            return count
+        instrument.count('controller.extract_entries_for_tag_category')
+        with self.catalog.lock:
+            if delete:
+                self.catalog.extract_entries_for_tag_category(tag_category, True)
+            elif replace:
+                count = self.catalog.extract_entries_for_tag_category(tag_category, False, True, replace_category)
+                return count
+            else:
+                count = self.catalog.extract_entries_for_tag_category(tag_category, delete)
+                return count
 
     def add_tag(self, image_file_name, tag_category, coordinates=None):
         """
@@ -150,7 +254,8 @@ class Controller:
         """
         if image_file_name in self.image_dict:
             image_id = self.image_dict[image_file_name]
-            self.catalog.images[image_id].tags.add_tag(tag_category, coordinates)
+            with self.catalog.lock:
+                self.catalog.images[image_id].tags.add_tag(tag_category, coordinates)
 
     def remove_tag(self, image_file_name, tag_id):
         """
@@ -160,7 +265,8 @@ class Controller:
         """
         if image_file_name in self.image_dict:
             image_id = self.image_dict[image_file_name]
-            self.catalog.images[image_id].tags.remove_tag(tag_id)
+            with self.catalog.lock:
+                self.catalog.images[image_id].tags.remove_tag(tag_id)
 
     def modify_tag(self, image_file_name, tag_id, new_tag_category):
         """
@@ -171,7 +277,8 @@ class Controller:
         """
         if image_file_name in self.image_dict:
             image_id = self.image_dict[image_file_name]
-            self.catalog.images[image_id].tags.modify_tag(tag_id, new_tag_category)
+            with self.catalog.lock:
+                self.catalog.images[image_id].tags.modify_tag(tag_id, new_tag_category)
 
     def scale_image(self, image_file_name, resolution):
         """
@@ -180,30 +287,38 @@ class Controller:
         :param resolution: resolution tuple, example: (1920, 1080)
         :return: resized PIL image instance
         """
-        ratio, pil_image = self.calculate_ratio(image_file_name, resolution)
-        if ratio is not None and pil_image is not None:
-            resized_width = math.floor(ratio * pil_image.size[0])
-            resized_height = math.floor(ratio * pil_image.size[1])
-
-            if ratio < 1:  # downsizing, use ANTIALIAS
-                pil_image = pil_image.resize((resized_width, resized_height), Image.LANCZOS)
-            else:  # increasing size:
-                pil_image = pil_image.resize((resized_width, resized_height), Image.BICUBIC)
+        ratio, image_object = self.calculate_ratio(image_file_name, resolution)
+        if ratio is not None and image_object is not None:
+            resized_width = math.floor(ratio * image_object.size[0])
+            resized_height = math.floor(ratio * image_object.size[1])
+
+            with instrument.span('decode'):
+                if self.decoded_cache is not None and image_object.edits is None:
+                    pil_image = self.decoded_cache.image(image_object.file_location + '/' + image_object.file_name,
+                                                         (resized_width, resized_height))
+                else:
+                    # the decoded image, with the recorded edits (rotations, crops) applied:
+                    pil_image = image_object.preview((resized_width, resized_height))
+            with instrument.span('resize'):
+                if ratio < 1:  # downsizing, use ANTIALIAS
+                    pil_image = pil_image.resize((resized_width, resized_height), Image.LANCZOS)
+                else:  # increasing size:
+                    pil_image = pil_image.resize((resized_width, resized_height), Image.BICUBIC)
 
             return pil_image
 
     def calculate_ratio(self, image_file_name, resolution):
         """
         Takes an PIL image as input and returns the ratio which should be used to resize the image while keeping its
-        ratio.
+        ratio. The size of the image includes the recorded edits (rotations, crops).
         :param image_file_name: image_file_name
         :param resolution: resolution tuple, example: (1920, 1080)
-        :return: ratio
+        :return: ratio and the image object (its size is used to convert between canvas and image coordinates)
         """
         ratio, pil_image = None, None
         if image_file_name in self.image_dict:
             image_id = self.image_dict[image_file_name]
-            pil_image = self.catalog.images[image_id].IMG
+            pil_image = self.catalog.images[image_id]
             width, height = pil_image.size
             goal_width, goal_height = resolution[0], resolution[1]
             ratio_width = goal_width / width
@@ -212,6 +327,31 @@ class Controller:
 
         return ratio, pil_image
 
+    def rotate_images(self, image_file_names, direction):
+        """
+        This function rotates images 90 degrees ('left' or 'right') together with their tags. The rotations are only
+        recorded, they are written to the files (losslessly where possible) when the project is saved or exported.
+        :param image_file_names: list of image_file_names.
+        """
+        with self.catalog.lock:
+            for image_file_name in image_file_names:
+                if image_file_name in self.image_dict:
+                    self.catalog.images[self.image_dict[image_file_name]].rotate(direction)
+
+    def crop_image(self, image_file_name, coordinates):
+        """
+        This function crops an image to coordinates [xmin, ymin, xmax, ymax], tags outside of it are removed. The crop
+        is written to the file when the project is saved or exported.
+        """
+        if image_file_name in self.image_dict:
+            with self.catalog.lock:
+                self.catalog.images[self.image_dict[image_file_name]].crop(coordinates)
+
+    def save_image_edits(self, progress=None):
+        """This function writes the recorded rotations and crops to the image files, returns the number of images."""
+        with instrument.span('controller.save_image_edits'):
+            return self.catalog.apply_edits(progress=progress)
+
     def canvas_coords_to_image_coords(self, canvas_coords, canvas_grid_size, pil_image, ratio, image_size):
         """
         This function calls the grid method to calculate image coordinates from canvas coordinates.
@@ -228,17 +368,48 @@ class Controller:
         """
         Saves progress to file.
         """
-        self.catalog.save_progress(save_location, settings)
+        with instrument.span('controller.save_progress'):
+            self.catalog.save_progress(save_location, settings)
 
-    def load_savefile(self, savefile_location):
+    def load_savefile(self, savefile_location, progress=None, search_roots=None):
         """
-        Loads progress from savefile.
+        Loads progress from savefile. Images that have been moved or renamed are searched for in search_roots (see
+        ImageCatalog.relink_images).
         """
-        selected_image, taglinewidth, savefile_location, min_tagsize, sorting_method = \
-            self.catalog.load_savefile(savefile_location)
+        with instrument.span('controller.load_savefile'):
+            selected_image, taglinewidth, savefile_location, min_tagsize, sorting_method = \
+                self.catalog.load_savefile(savefile_location, progress, search_roots)
 
         return selected_image, taglinewidth, savefile_location, min_tagsize, sorting_method
 
+    def compute_fingerprints(self, workers=None, progress=None):
+        """
+        Computes the content fingerprints of the images, so they can be found again after they have been moved or
+        renamed. Returns the number of fingerprints computed.
+        """
+        with instrument.span('controller.compute_fingerprints'):
+            return self.catalog.compute_fingerprints(workers=workers, progress=progress)
+
+    def relink_images(self, search_roots=None, workers=None, progress=None):
+        """
+        Searches the images of the savefile that were not found when it was loaded in search_roots, by their content.
+        :return: dictionary with the number of images relinked and still missing.
+        """
+        with instrument.span('controller.relink_images'):
+            return self.catalog.relink_images(search_roots, workers, progress)
+
+    def find_near_duplicates(self, max_distance=6, image_filter=None, workers=None, progress=None):
+        """
+        Computes the perceptual hashes the images do not have yet and returns the clusters of near-duplicates (lists of
+        image_id's), see ImageCatalog.near_duplicates.
+        :param image_filter: (Optional) dictionary with query criteria, only the matching images are considered.
+        :return: (list of clusters, number of hashes computed)
+        """
+        with instrument.span('controller.find_near_duplicates'):
+            image_ids = self.query_images(image_filter) if image_filter else None
+            computed = self.catalog.compute_perceptual_hashes(image_ids, workers, progress)
+            return self.catalog.near_duplicates(max_distance, image_ids), computed
+
     def write_to_csv(self, filename, data):
         """Writes data to a csv file."""
         self.catalog.file_access.write_to_csv(filename, data)
@@ -249,16 +420,85 @@ class Controller:
 
         return data
 
-    def export_tagged_images(self, save_location, tag_categories=None):
+    def iter_csv(self, filename, delimiter):
+        """Reads data from a csv line by line (generator of lists)."""
+        return self.catalog.file_access.iter_csv(filename, delimiter)
+
+    def export_tagged_images(self, save_location, tag_categories=None, progress=None, transcode=None,
+                             lint=LintOptions()):
         """
         This function export all images with tags to a save_location and renames them. If save_location already
         contains images, it will continue numbering from where it was. Images without tags are not exported.
+        With transcode options (TranscodeOptions), the images are written resized / re-encoded.
+        :param lint: LintOptions, the tags are checked before the export (None: no checks).
+        :return: dictionary with the number of images exported, and the report of the checks under 'lint'.
+        """
+        with instrument.span('controller.export_tagged_images'):
+            return self.catalog.export_tagged_images(save_location, tag_categories=tag_categories, rename=True,
+                                                     progress=progress, transcode=transcode, lint=lint)
+
+    def export_annotations(self, exports, min_tagsize=0, progress=None, image_filter=None, transcode=None,
+                           images_location=None, workers=None, chips=None, decoded_cache=None, lint=LintOptions()):
         """
-        self.catalog.export_tagged_images(save_location, tag_categories=tag_categories, rename=True)
+        This function exports the tags to one or more annotation formats (csv, coco, voc, tfrecord) in one pass.
+        :param exports: list of (format, save_location, options) tuples.
+        :param image_filter: (Optional) dictionary with query criteria, only the matching images are exported.
+        :param transcode: (Optional) TranscodeOptions, the tagged images are written resized to images_location.
+        :param chips: (Optional) ChipOptions, the images are cut into chips written to images_location.
+        :param decoded_cache: (Optional) folder of a DecodedCache to read the images from.
+        :param lint: LintOptions of the checks run before the export (None: no checks).
+        :return: dictionary {format: summary dictionary}, and the report of the checks under 'lint'.
+        """
+        with instrument.span('controller.export_annotations'):
+            image_ids = self.query_images(image_filter) if image_filter else None
+            return self.catalog.export_annotations(exports, min_tagsize, progress, image_ids, transcode,
+                                                   images_location, workers, chips, decoded_cache, lint)
+
+    def import_annotations(self, import_format, location, image_folder=None, progress=None):
+        """
+        This function imports annotations (csv, coco, voc or tfrecord) into the catalog.
+        :return: dictionary with the number of images added, tags added and tags skipped.
+        """
+        with instrument.span('controller.import_annotations'):
+            return self.catalog.import_annotations(import_format, location, image_folder, progress)
+
+    def merge_savefiles(self, savefile_locations, progress=None):
+        """
+        This function merges the images and tags of savefiles into the catalog.
+        :return: dictionary with the number of images added, tags added and tags skipped.
+        """
+        with instrument.span('controller.merge_savefiles'):
+            return self.catalog.merge_savefiles(savefile_locations, progress)
+
+    def merge_annotators(self, savefile_locations, options=MergeOptions(), progress=None):
+        """
+        This function merges the savefiles of several annotators of the same images by matching their boxes.
+        :param options: MergeOptions (the rule to merge the boxes by).
+        :return: dictionary with the numbers of objects, disagreements, images and tags added, and the disagreements to
+        review.
+        """
+        with instrument.span('controller.merge_annotators'):
+            return self.catalog.merge_annotators(savefile_locations, options, progress)
+
+    def export_tfrecord(self, save_location, label_map_location, num_shards=10, min_tagsize=0, image_filter=None,
+                        lint=LintOptions()):
+        """
+        This function exports the tagged images and their bounding boxes to sharded TFRecord files.
+        :param image_filter: (Optional) dictionary with query criteria, only the matching images are exported.
+        :return: (number of boxes written, number of boxes skipped)
+        """
+        with instrument.span('controller.export_tfrecord'):
+            image_ids = self.query_images(image_filter) if image_filter else None
+            return self.catalog.export_tfrecord(save_location, label_map_location, num_shards, min_tagsize,
+                                                image_ids=image_ids, lint=lint)
 
     def rename_tag_category(self, tag_category, new_tag_category):
-        """Renames tag_category to new_tag_category"""
-        self.catalog.tag_categories.rename_tag_category(tag_category, new_tag_category)
+        """
+        Renames tag_category to new_tag_category (its tags are merged into new_tag_category if that exists already).
+        :return: number of tags of tag_category.
+        """
+        with self.catalog.lock:
+            return self.catalog.rename_tag_category(tag_category, new_tag_category)
 
     def change_tag_category_color(self, tag_category, color):
         """Modifies the color of a tag_category"""
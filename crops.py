@@ -0,0 +1,148 @@
+import csv
+import math
+import os
+from PIL import Image as PilImage
+
+# Picture tools modules:
+from data_access import FileAccess
+from decoded_cache import cached_image
+from parallel import BoundedPool
+
+
+def crop_region(box, image_size, padding=0.0, square=False):
+    """
+    This function calculates the part of an image to cut out for a bounding box.
+    :param box: [xmin, ymin, xmax, ymax]
+    :param image_size: (width, height) of the image.
+    :param padding: fraction of the box width / height added on every side (e.g. 0.1).
+    :param square: True to extend the shorter side of the region to the longer one (moved inside the image where
+    possible).
+    :return: [xmin, ymin, xmax, ymax] in whole pixels, within the image.
+    """
+    width, height = box[2] - box[0], box[3] - box[1]
+    region = [box[0] - width * padding, box[1] - height * padding, box[2] + width * padding,
+              box[3] + height * padding]
+    if square:
+        side = max(region[2] - region[0], region[3] - region[1])
+        for low, high, limit in ((0, 2, image_size[0]), (1, 3, image_size[1])):
+            center = (region[low] + region[high]) / 2
+            start = min(max(center - side / 2, 0), max(limit - side, 0))  # shift inside the image if possible
+            region[low], region[high] = start, start + side
+    return [max(0, math.floor(region[0])), max(0, math.floor(region[1])), min(image_size[0], math.ceil(region[2])),
+            min(image_size[1], math.ceil(region[3]))]
+
+
+def folder_name(tag_category):
+    """Returns a folder name for a tag_category (path separators replaced)."""
+    return tag_category.replace('/', '_').replace('\\', '_')
+
+
+def extract_crops(task):
+    """
+    This function cuts all crops of one image, which is opened and decoded only once. When the crops are resized to
+    crop_size, a JPEG file is decoded at the smallest reduced scale (1/2, 1/4, 1/8) that still leaves every crop at
+    least crop_size. Images in the decoded image cache (see decoded_cache) are not decoded at all. It runs in the
+    worker processes.
+    :param task: tuple (source, width, height, crops, save_location, crop_size, quality, cache_location) where crops
+    is a list of (tag_category, file_name, region).
+    :return: list of manifest rows.
+    """
+    source, width, height, crops, save_location, crop_size, quality, cache_location = task
+    rows = []
+    size = None  # size the image is needed at, None for the full size
+    if crop_size is not None:
+        longest = min(max(region[2] - region[0], region[3] - region[1]) for _, _, region in crops)
+        scale = min(1.0, crop_size / max(longest, 1))
+        size = (math.ceil(width * scale), math.ceil(height * scale))
+    pil_image = cached_image(cache_location, source, size)
+    if pil_image is None:
+        pil_image = PilImage.open(source)
+        if size is not None:
+            pil_image.draft(pil_image.mode, size)
+    with pil_image:
+        if pil_image.mode not in ('RGB', 'L'):
+            pil_image = pil_image.convert('RGB')
+        scale_x, scale_y = pil_image.size[0] / width, pil_image.size[1] / height
+        for tag_category, file_name, region in crops:
+            crop = pil_image.crop((round(region[0] * scale_x), round(region[1] * scale_y),
+                                   round(region[2] * scale_x), round(region[3] * scale_y)))
+            if crop_size is not None:
+                factor = crop_size / max(crop.size)
+                crop = crop.resize((max(1, round(crop.size[0] * factor)), max(1, round(crop.size[1] * factor))),
+                                   PilImage.LANCZOS)
+            crop.save(save_location + '/' + folder_name(tag_category) + '/' + file_name, quality=quality)
+            rows.append([folder_name(tag_category) + '/' + file_name, tag_category, source] + list(region))
+    return rows
+
+
+class CropExport:
+    """
+    Writes every bounding box as a separate image into a folder per tag_category (e.g. for training a classifier),
+    together with a manifest.csv (crop,class,source,xmin,ymin,xmax,ymax; the region cut out of the source image).
+    The crops of an image are cut in one go on a process pool, with a bounded number of images in flight. A crop is
+    named after its image, the number of the image in the export and the number of the box in the image (e.g.
+    IMG_0001_12_0.jpg), so the crops of images with the same stem (IMG_0001.jpg, IMG_0001.png) do not overwrite
+    each other.
+    """
+
+    header = ['crop', 'class', 'source', 'xmin', 'ymin', 'xmax', 'ymax']
+
+    def __init__(self, save_location, padding=0.0, square=False, min_side=0, crop_size=None, quality=95,
+                 workers=None, cache_location=None):
+        """
+        :param save_location: folder to write the crops to (does not need to exist).
+        :param padding: fraction of the box width / height added on every side.
+        :param square: True for square crops.
+        :param min_side: boxes with a width or height smaller than this (pixels) are skipped (the min_tagsize of the
+        export already skips boxes with a small area).
+        :param crop_size: (Optional) the longest side of the crops is resized to this (e.g. 224).
+        :param quality: JPEG quality.
+        :param workers: number of worker processes (default: number of cpu's).
+        :param cache_location: (Optional) folder of a DecodedCache to read the images from.
+        """
+        if not os.path.exists(save_location):
+            os.makedirs(save_location)
+        self.save_location = save_location
+        self.padding, self.square, self.min_side = padding, square, min_side
+        self.crop_size, self.quality, self.cache_location = crop_size, quality, cache_location
+        self.folders = set()
+        self.manifest = FileAccess.open_csv(save_location + '/manifest.csv')
+        self.manifest_writer = csv.writer(self.manifest, lineterminator='\n')  # (quotes sources with a comma)
+        self.manifest_writer.writerow(self.header)
+        self.pool = BoundedPool(workers)
+        self.images_written, self.crops_written, self.crops_skipped = 0, 0, 0
+
+    def write_image(self, file_path, file_name, width, height, boxes):
+        """
+        This function queues the crops of one image.
+        :param boxes: list of (tag_category, [xmin, ymin, xmax, ymax])
+        :return: number of crops queued.
+        """
+        crops = []
+        stem = '.'.join(file_name.split('.')[:-1]) or file_name
+        for index, (tag_category, coordinates) in enumerate(boxes):
+            if min(coordinates[2] - coordinates[0], coordinates[3] - coordinates[1]) < max(self.min_side, 1):
+                self.crops_skipped += 1
+                continue
+            region = crop_region(coordinates, (width, height), self.padding, self.square)
+            if tag_category not in self.folders:
+                self.folders.add(tag_category)
+                FileAccess.create_folder(self.save_location + '/' + folder_name(tag_category))
+            crops.append((tag_category, '{0}_{1}_{2}.jpg'.format(stem, self.images_written, index), region))
+        if len(crops) > 0:
+            self.images_written += 1
+            self.crops_written += len(crops)
+            task = (file_path + '/' + file_name, width, height, crops, self.save_location, self.crop_size,
+                    self.quality, self.cache_location)
+            for rows in self.pool.submit(extract_crops, task):
+                self.manifest_writer.writerows(rows)
+        return len(crops)
+
+    def close(self):
+        """Waits for the remaining crops and closes the manifest."""
+        try:
+            for rows in self.pool.drain():
+                self.manifest_writer.writerows(rows)
+        finally:
+            self.pool.close()
+            self.manifest.close()
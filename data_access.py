@@ -1,10 +1,16 @@
 import os
+from fnmatch import fnmatchcase
 from shutil import copyfile, move
 
+# Picture tools modules:
+from edits import write_edited_file
+from instrumentation import instrument
+
 
 class ImageAccess:
 
-    file_extensions = ['JPG', 'jpg', 'jpeg', 'tiff', 'tif', 'png', 'PNG']
+    file_extensions = ['JPG', 'jpg', 'jpeg', 'tiff', 'tif', 'png', 'PNG', 'webp']
+    extension_set = frozenset(extension.lower() for extension in file_extensions)  # compared case-insensitively
 
     def __init__(self):
         pass
@@ -16,28 +22,170 @@ class ImageAccess:
         :param folder_location: The location of the folder to import images from.
         :return: list of image files present in that folder
         """
-        files = []
-        if folder_location is not None and folder_location != '':
-            files = [f for f in os.listdir(folder_location) if os.path.isfile(os.path.join(folder_location, f)) and
-                     f.split('.')[-1] in self.file_extensions]
+        return [file_name for batch in self.scan_images(folder_location, recursive=False) for file_name in batch]
+
+    def is_image_file(self, file_name):
+        """Checks (case-insensitively) whether the extension of file_name is one of the image file_extensions."""
+        return file_name.rsplit('.', 1)[-1].lower() in self.extension_set
+
+    def scan_images(self, folder_location, recursive=True, include=None, exclude=None, batch_size=500):
+        """
+        This function walks through a folder (and its sub-folders if recursive=True) with os.scandir and yields the
+        image files in batches while walking, so the first images can be used before a large tree has been walked
+        completely. Directory entries are checked with the file type cached by scandir, so no stat is needed per file
+        on most file systems. Symbolic links to folders are not followed.
+        Include and exclude patterns (glob, e.g. '*.jpg' or 'thumbnails') are matched case-insensitively against the
+        file (or folder) name and against the path relative to folder_location. Excluded folders are skipped entirely.
+        :param folder_location: The location of the folder to import images from.
+        :param recursive: True to include the images in sub-folders.
+        :param include: (Optional) list of patterns, only files matching one of them are yielded.
+        :param exclude: (Optional) list of patterns, files and folders matching one of them are skipped.
+        :param batch_size: (maximum) number of files per batch.
+        :return: generator of lists of file paths relative to folder_location ('sub_folder/image.jpg').
+        """
+        if folder_location is None or folder_location == '':
+            return
+        batch = []
+        folders = ['']  # relative paths of the folders still to be walked
+        while folders:
+            relative_folder = folders.pop()
+            for is_folder, relative_path, entry in self.iter_folder(folder_location, relative_folder, recursive,
+                                                                    include, exclude):
+                if is_folder:
+                    folders.append(relative_path)
+                else:
+                    batch.append(relative_path)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def scan_folder(self, folder_location, relative_folder='', recursive=True, include=None, exclude=None):
+        """
+        This function lists a single folder of an imported folder tree, including the size and modification time of
+        every image file (used for incremental rescans).
+        :param folder_location: The location of the imported (root) folder.
+        :param relative_folder: path of the folder to list relative to folder_location ('' or ending with '/').
+        :param recursive: True to return the sub-folders.
+        :param include: (Optional) list of patterns, see scan_images.
+        :param exclude: (Optional) list of patterns, see scan_images.
+        :return: dictionary {file_name: (size, modification time in ns)} and a list of relative sub-folder paths.
+        """
+        files, folders = {}, []
+        for is_folder, relative_path, entry in self.iter_folder(folder_location, relative_folder, recursive, include,
+                                                                exclude):
+            if is_folder:
+                folders.append(relative_path)
+            else:
+                try:
+                    stat = entry.stat()
+                except OSError:  # removed while listing
+                    continue
+                files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+        return files, folders
+
+    def iter_folder(self, folder_location, relative_folder, recursive, include, exclude):
+        """
+        This function lists a single folder with os.scandir and yields (True, relative_path + '/', entry) for every
+        sub-folder that should be walked (if recursive) and (False, relative_path, entry) for every image file that
+        passes the include / exclude patterns. Folders that cannot be read are skipped.
+        """
+        include = [pattern.lower() for pattern in include or []]
+        exclude = [pattern.lower() for pattern in exclude or []]
 
-        return files
+        def matches(patterns, name, relative_path):
+            name, relative_path = name.lower(), relative_path.lower()
+            return any(fnmatchcase(name, pattern) or fnmatchcase(relative_path, pattern) for pattern in patterns)
+        try:
+            entries = os.scandir(os.path.join(folder_location, relative_folder))
+        except OSError:  # folder removed or not readable
+            return
+        with entries:
+            for entry in entries:
+                relative_path = relative_folder + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not matches(exclude, entry.name, relative_path):
+                            yield True, relative_path + '/', entry
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if not self.is_image_file(entry.name) or matches(exclude, entry.name, relative_path):
+                    continue
+                if len(include) > 0 and not matches(include, entry.name, relative_path):
+                    continue
+                yield False, relative_path, entry
 
     @staticmethod
     def save_image(image, location=None):
         """
         This function saves an image object to disk. If location is given, it writes a new file in that location.
-        Otherwise, it will overwrite the original file.
+        Otherwise, it will overwrite the original file. Images with edits (rotations, crops) are written from their
+        file with the edits applied, losslessly where possible (see edits.write_edited_file).
         :param image: Image object.
         :param location: (Optional) file location to save the file to.
-        :return: Returns the return value of IMG.save (only used for unit-test)
+        :return: Returns the return value of IMG.save (only used for unit-test), or the (dx, dy) offset of the crop in
+        the written image for edited images.
         """
         if location is None:
             location = image.file_location + '/' + image.file_name
+        if image.edits is not None:
+            return write_edited_file(image.file_location + '/' + image.file_name, location, image.edits)
 
         return image.IMG.save(location)
 
 
+class CsvWriter:
+    """
+    Buffered, context-managed writer for csv files. Lines are collected and written in batches of batch_size lines;
+    the file is flushed and closed when the writer is closed (or the with-block is left), so appended data never
+    depends on garbage collection.
+    Example:
+        with FileAccess.open_csv('/data/tags.csv', 'a') as writer:
+            writer.write_lines(lines)
+    """
+
+    def __init__(self, filename, mode='w', batch_size=1000):
+        self.handle = open(filename, mode, buffering=1024 * 1024)
+        self.batch_size = batch_size
+        self.lines = []
+
+    def write(self, line):
+        """Adds a single line (including the newline character) to the file."""
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        """Adds several lines (each including the newline character) to the file."""
+        self.lines.extend(lines)
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the collected lines to the file."""
+        with instrument.span('csv_write'):
+            self.handle.writelines(self.lines)
+            self.handle.flush()
+        instrument.count('csv_lines_written', len(self.lines))
+        self.lines = []
+
+    def close(self):
+        if not self.handle.closed:
+            self.flush()
+            self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 class FileAccess:
 
     def __init__(self):
@@ -56,20 +204,57 @@ class FileAccess:
             "image1, 234, 1920, 1080\n"
         ]
         :param filename: The absolute path to the file to be written.
-        :param data: The data to be written as a list of strings, where each string represents a single line in the csv.
-        The data list can contain an header as the first string.
-        :param mode: mode to write the csv ('w' or 'r'), default = 'w'
+        :param data: The data to be written as a list (or any iterable) of strings, where each string represents a
+        single line in the csv. The data list can contain an header as the first string.
+        :param mode: mode to write the csv ('w' or 'a'), default = 'w'
         :return: A csv-file written to disk.
         """
-        csv = open(filename, mode)
-        for line in data:
-            csv.write(line)
+        with CsvWriter(filename, mode) as writer:
+            for line in data:
+                writer.write(line)
+
+    @staticmethod
+    def append_to_csv(filename, data):
+        """
+        This function appends a batch of lines (strings including the newline character) to a csv file and closes
+        it again.
+        :param filename: The absolute path to the file to append to.
+        :param data: iterable of strings.
+        """
+        FileAccess.write_to_csv(filename, data, 'a')
+
+    @staticmethod
+    def open_csv(filename, mode='w', batch_size=1000):
+        """
+        This function opens a csv file for (buffered) writing, use it as a context manager to make sure the file is
+        flushed and closed.
+        :param filename: The absolute path to the file to be written.
+        :param mode: 'w' or 'a'
+        :param batch_size: number of lines that are collected before they are written.
+        :return: CsvWriter
+        """
+        return CsvWriter(filename, mode, batch_size)
+
+    @staticmethod
+    def iter_csv(filename, delimiter):
+        """
+        This function reads a csv file with a certain delimiter line by line and yields a list per line, so large
+        files do not have to be loaded into memory at once. Fields are not unquoted (the files written by picture
+        tools do not use quoting). If the file does not exist, nothing is yielded.
+        :param filename: The absolute path to the file to be opened.
+        :param delimiter: The delimiter used as a string (example: ',' or ';').
+        :return: generator of lists.
+        """
+        if os.path.exists(filename):
+            with open(filename, 'r', buffering=1024 * 1024) as csv:
+                for line in csv:
+                    yield line.rstrip().split(delimiter)
 
     @staticmethod
     def read_csv(filename, delimiter):
         """
         This function imports a csv file with a certain delimiter to a list of lists, where each list contains a
-        single line.
+        single line. Use iter_csv to process large files line by line instead.
         Example:
         Input:      filename, size, width, height
                     image1, 343, 1920, 1080
@@ -84,14 +269,7 @@ class FileAccess:
         :param delimiter: The delimiter used as a string (example: ',' or ';').
         :return: A list of lists.
         """
-        data = []
-        if os.path.exists(filename):
-            csv = open(filename, 'r')
-            for line in csv:
-                line = line.rstrip()
-                split_line = line.split(delimiter)
-                data.append(split_line)
-        return data
+        return list(FileAccess.iter_csv(filename, delimiter))
 
     @staticmethod
     def delete_file_from_disk(filename):
@@ -122,7 +300,8 @@ class FileAccess:
         :return: None, the file has been copied.
         """
         if os.path.exists(origin_path):
-            copyfile(origin_path, goal_path)
+            with instrument.span('file_copy'):
+                copyfile(origin_path, goal_path)
 
     @staticmethod
     def move_file(origin_path, goal_path):
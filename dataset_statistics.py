@@ -0,0 +1,211 @@
+from collections import namedtuple
+from itertools import chain
+from operator import attrgetter
+import numpy as np
+
+PERCENTILES = (5, 25, 50, 75, 95)
+SIZE_BUCKETS = (('small', 32 ** 2), ('medium', 96 ** 2), ('large', np.inf))  # COCO object sizes (area in pixels)
+ANCHOR_SAMPLE = 10000  # number of boxes the anchors are fitted on (the mean IoU is computed over all boxes)
+COOCCURRENCE_BLOCK = 2 ** 22  # number of cells of the image x category matrix computed at once
+
+# The boxes of a catalog as arrays (one row per box), see collect_boxes:
+BoxArrays = namedtuple('BoxArrays', ['image_index', 'tag_ids', 'category_ids', 'boxes', 'image_sizes'])
+
+
+def collect_boxes(images):
+    """
+    This function copies the tags of images into numpy arrays, so the statistics can be computed without looping
+    through the Tag objects again. The attributes are read with map and attrgetter, which is several times faster
+    than generator expressions for millions of tags.
+    :param images: list of Image objects.
+    :return: BoxArrays with image_index (index in images of the image of every box), tag_ids, category_ids, boxes
+    (N x 4 xmin, ymin, xmax, ymax) and image_sizes (len(images) x 2 width, height).
+    """
+    tag_dicts = list(map(attrgetter('tags.tag_dict'), images))
+    counts = np.fromiter(map(len, tag_dicts), np.int64, len(images))
+    tags = list(chain.from_iterable(map(dict.values, tag_dicts)))
+    tag_ids = np.fromiter(chain.from_iterable(map(dict.keys, tag_dicts)), np.int64, len(tags))
+    category_ids = np.fromiter(map(attrgetter('category.category_id'), tags), np.int64, len(tags))
+    boxes = np.fromiter(chain.from_iterable(map(attrgetter('coordinates'), tags)), np.float64, 4 * len(tags))
+    image_sizes = np.fromiter(chain.from_iterable(map(attrgetter('size'), images)), np.float64,
+                              2 * len(images))
+    return BoxArrays(np.repeat(np.arange(len(images)), counts), tag_ids, category_ids, boxes.reshape(-1, 4),
+                     image_sizes.reshape(-1, 2))
+
+
+def describe(values):
+    """
+    Returns the count, mean, min, percentiles (p5 ... p95, interpolated linearly as numpy.percentile does) and max of
+    an array as a dictionary. The values are sorted, which is several times faster than numpy.percentile for large
+    arrays.
+    """
+    if len(values) == 0:
+        return {'count': 0}
+    values = np.sort(values)
+    positions = np.array(PERCENTILES) / 100 * (len(values) - 1)
+    low = np.floor(positions).astype(np.int64)
+    high = np.minimum(low + 1, len(values) - 1)
+    percentiles = values[low] + (values[high] - values[low]) * (positions - low)
+    description = {'count': int(len(values)), 'mean': float(values.mean()), 'min': float(values[0])}
+    description.update(('p{0}'.format(q), float(value)) for q, value in zip(PERCENTILES, percentiles))
+    description['max'] = float(values[-1])
+    return description
+
+
+def box_statistics(widths, heights):
+    """Returns the width, height, area and aspect ratio (width / height) distributions and COCO size buckets."""
+    areas = widths * heights
+    valid = heights > 0
+    buckets = np.searchsorted([limit for _, limit in SIZE_BUCKETS], areas, side='right')
+    bucket_counts = np.bincount(buckets, minlength=len(SIZE_BUCKETS) + 1)
+    return {'boxes': int(len(widths)), 'width': describe(widths), 'height': describe(heights),
+            'area': describe(areas), 'aspect_ratio': describe(widths[valid] / heights[valid]),
+            'sizes': {name: int(count) for (name, _), count in zip(SIZE_BUCKETS, bucket_counts)}}
+
+
+def cooccurrence_matrix(image_index, categories, num_images, num_categories):
+    """
+    This function counts the images in which every pair of categories occurs together, as the product of the (binary)
+    image x category matrix with itself, computed in blocks of images to bound the memory used.
+    :param image_index: image of every box (index), sorted (as in BoxArrays).
+    :param categories: category of every box (index 0 ... num_categories - 1).
+    :return: num_categories x num_categories array, the diagonal is the number of images with the category.
+    """
+    matrix = np.zeros((num_categories, num_categories), np.int64)
+    block = max(1, min(2 ** 16, COOCCURRENCE_BLOCK // max(num_categories, 1)))  # exact in float32 (< 2 ** 24)
+    for start in range(0, num_images, block):
+        low, high = np.searchsorted(image_index, [start, start + block])
+        if low == high:
+            continue
+        incidence = np.zeros((block, num_categories), np.float32)
+        incidence[image_index[low:high] - start, categories[low:high]] = 1  # (several boxes of a category count once)
+        matrix += (incidence.T @ incidence).astype(np.int64)
+    return matrix
+
+
+def anchor_iou(sizes, anchors):
+    """Returns the IoU of boxes (N x 2 width, height) and anchors (K x 2) placed on the same center (N x K)."""
+    intersection = (np.minimum(sizes[:, None, 0], anchors[None, :, 0]) *
+                    np.minimum(sizes[:, None, 1], anchors[None, :, 1]))
+    union = (sizes[:, 0] * sizes[:, 1])[:, None] + (anchors[:, 0] * anchors[:, 1])[None, :] - intersection
+    return intersection / union
+
+
+def kmeans_anchors(sizes, k=9, iterations=30, sample=ANCHOR_SAMPLE, seed=0):
+    """
+    This function suggests k anchor boxes for a detector with k-means clustering of the box sizes, using 1 - IoU as
+    distance (so large boxes do not dominate, as with the euclidean distance) and the median as cluster center. The
+    clusters are initialised at the quantiles of the box areas, so the result does not depend on chance, and fitted on
+    a random sample of at most sample boxes.
+    :param sizes: N x 2 array of box widths and heights.
+    :return: (K x 2 array of anchors sorted on area, mean IoU of the boxes with their best anchor, estimated on at most
+    10 x sample boxes).
+    """
+    sizes = sizes[(sizes[:, 0] > 0) & (sizes[:, 1] > 0)]
+    if len(sizes) == 0:
+        return np.zeros((0, 2)), 0.0
+    if len(sizes) > 10 * sample:
+        sizes = sizes[np.random.default_rng(seed).choice(len(sizes), 10 * sample, replace=False)]
+    fit = sizes[np.random.default_rng(seed).permutation(len(sizes))[:sample]]
+    fit = fit[np.argsort(fit[:, 0] * fit[:, 1], kind='stable')]
+    k = min(k, len(np.unique(fit[:, 0] + 1j * fit[:, 1])))  # (number of different sizes)
+    anchors = fit[((np.arange(k) + 0.5) * len(fit) / k).astype(np.int64)]
+    assignment = None
+    for _ in range(iterations):
+        new_assignment = anchor_iou(fit, anchors).argmax(axis=1)
+        if assignment is not None and np.array_equal(assignment, new_assignment):
+            break
+        assignment = new_assignment
+        for cluster in range(k):
+            members = fit[assignment == cluster]
+            if len(members) > 0:  # an empty cluster keeps its anchor
+                anchors[cluster] = np.median(members, axis=0)
+    anchors = anchors[np.argsort(anchors[:, 0] * anchors[:, 1], kind='stable')]
+    return anchors, float(anchor_iou(sizes, anchors).max(axis=1).mean())
+
+
+def compute_statistics(box_arrays, category_names, anchors=9, anchor_input_size=None):
+    """
+    This function computes the statistics of a dataset with numpy: the box size and aspect ratio distributions (of all
+    boxes and per category), boxes per image, category co-occurrence and a k-means anchor suggestion.
+    :param box_arrays: BoxArrays (see collect_boxes).
+    :param category_names: function returning the name of a category_id.
+    :param anchors: number of anchors to suggest (0: no anchors).
+    :param anchor_input_size: (Optional) the anchors are computed for the images resized to fit in a square of this
+    size (the input of the detector), default the box sizes in the original images.
+    :return: dictionary (json serializable).
+    """
+    image_index, category_ids, boxes, image_sizes = (box_arrays.image_index, box_arrays.category_ids,
+                                                     box_arrays.boxes, box_arrays.image_sizes)
+    num_images = len(image_sizes)
+    widths, heights = boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]
+    boxes_per_image = np.bincount(image_index, minlength=num_images)
+    histogram = np.bincount(boxes_per_image)
+    report = {'images': num_images, 'tagged_images': int(np.count_nonzero(boxes_per_image)), 'boxes': len(boxes),
+              'boxes_per_image': {'mean': float(boxes_per_image.mean()) if num_images > 0 else 0.0,
+                                  'max': int(boxes_per_image.max(initial=0)),
+                                  'histogram': {int(count): int(images) for count, images in enumerate(histogram)
+                                                if images > 0}},
+              'all': box_statistics(widths, heights), 'categories': {}, 'cooccurrence': {}}
+    # Per category, on the boxes sorted on category:
+    present = np.flatnonzero(np.bincount(category_ids))
+    dense = np.zeros(category_ids.max(initial=-1) + 1, np.int64)
+    dense[present] = np.arange(len(present))
+    dense = dense[category_ids]  # category of every box as index in present
+    names = [category_names(int(category_id)) for category_id in present]
+    order = np.argsort(dense, kind='stable')
+    bounds = np.searchsorted(dense[order], np.arange(len(present) + 1))
+    cooccurrence = cooccurrence_matrix(image_index, dense, num_images, len(present))
+    for number, name in enumerate(names):
+        selection = order[bounds[number]:bounds[number + 1]]
+        report['categories'][name] = box_statistics(widths[selection], heights[selection])
+        report['categories'][name]['images'] = int(cooccurrence[number, number])
+        report['cooccurrence'][name] = {other: int(cooccurrence[number, column])
+                                        for column, other in enumerate(names) if column != number and
+                                        cooccurrence[number, column] > 0}
+    if anchors > 0:
+        sizes = np.stack([widths, heights], axis=1)
+        if anchor_input_size is not None and len(sizes) > 0:
+            sizes *= (anchor_input_size / image_sizes.max(axis=1))[image_index][:, None]
+        anchor_boxes, mean_iou = kmeans_anchors(sizes, anchors)
+        report['anchors'] = [[round(float(width), 1), round(float(height), 1)] for width, height in anchor_boxes]
+        report['anchor_mean_iou'] = mean_iou
+        report['anchor_input_size'] = anchor_input_size
+
+    return report
+
+
+def format_report(report):
+    """Returns the statistics of compute_statistics as text (printed in headless mode and shown in the GUI)."""
+    lines = ['Images: {0}'.format(report['images']), 'Tagged images: {0}'.format(report['tagged_images']),
+             'Untagged images: {0}'.format(report['images'] - report['tagged_images']),
+             'Tags: {0}'.format(report['boxes'])]
+    for name in sorted(report['categories']):
+        lines.append('    {0}: {1}'.format(name, report['categories'][name]['boxes']))
+    per_image = report['boxes_per_image']
+    lines += ['', 'Boxes per image: mean {0:.2f}, max {1}'.format(per_image['mean'], per_image['max'])]
+    lines += ['    {0:>4d} boxes: {1} images'.format(count, images) for count, images in per_image['histogram'].items()]
+    lines += ['', '{0:24s} {1:>8s} {2:>7s} {3:>8s} {4:>8s} {5:>8s} {6:>7s} {7:>7s} {8:>7s} {9:>7s}'.format(
+        'category', 'boxes', 'images', 'width', 'height', 'sqrt(a)', 'aspect', 'small', 'medium', 'large')]
+    for name, statistics in [('(all)', report['all'])] + sorted(report['categories'].items()):
+        if statistics['boxes'] == 0:
+            continue
+        lines.append('{0:24s} {1:8d} {2:>7} {3:8.1f} {4:8.1f} {5:8.1f} {6:7.2f} {7:7d} {8:7d} {9:7d}'.format(
+            name[:24], statistics['boxes'], statistics.get('images', report['tagged_images']),
+            statistics['width']['p50'], statistics['height']['p50'], max(statistics['area']['p50'], 0) ** 0.5,
+            statistics['aspect_ratio'].get('p50', float('nan')), statistics['sizes']['small'],
+            statistics['sizes']['medium'], statistics['sizes']['large']))
+    lines.append('(medians of the width, height, square root of the area and aspect ratio in pixels)')
+    if any(report['cooccurrence'].values()):
+        lines += ['', 'Images in which categories occur together:']
+        for name in sorted(report['cooccurrence']):
+            others = sorted(report['cooccurrence'][name].items(), key=lambda item: (-item[1], item[0]))
+            if len(others) > 0:
+                lines.append('    {0}: {1}'.format(name, ', '.join('{0} {1}'.format(*item) for item in others)))
+    if 'anchors' in report:
+        lines += ['', 'Suggested anchors (width x height{0}), mean IoU {1:.3f}:'.format(
+            '' if report['anchor_input_size'] is None else ' at input size {0}'.format(report['anchor_input_size']),
+            report['anchor_mean_iou'])]
+        lines.append('    ' + ', '.join('{0:.0f}x{1:.0f}'.format(*anchor) for anchor in report['anchors']))
+
+    return '\n'.join(lines)
@@ -0,0 +1,260 @@
+import json
+import math
+import os
+import threading
+import numpy as np
+from PIL import Image as PilImage
+
+# Picture tools modules:
+from parallel import BoundedPool
+
+# Images are cached at 1/1, 1/2, 1/4 or 1/8 of their size (the scales JPEG files can be decoded at directly):
+REDUCTIONS = (8, 4, 2, 1)
+readers = {}  # read-only DecodedCache per cache folder, used by cached_image
+
+
+class DecodedCache:
+    """
+    An opt-in cache of decoded, downsampled images as RGB arrays in a memory mapped file, so images that are shown,
+    cropped, chipped or trained on repeatedly are decoded only once. The pixels are appended to a single file
+    (data.bin) and an index (index.jsonl) records for every image file (absolute path, modification time and size)
+    and reduction the offset and size of its array. Reading an image returns a read-only numpy view into the memory
+    map: no copy and no decode, repeated passes become page cache reads.
+
+    One process writes to a cache (the GUI or batch mode), any number of processes can read it, e.g. the export
+    workers or a training data loader:
+        cache = DecodedCache('/data/cache', readonly=True)
+        array = cache.get('/data/images/img_001.jpg', (512, 512))  # numpy array (height, width, 3), uint8
+    The cache only grows (up to max_bytes), outdated entries are skipped and clear() empties it.
+    """
+
+    def __init__(self, location, max_bytes=None, readonly=False):
+        """
+        :param location: folder of the cache (created if needed).
+        :param max_bytes: (Optional) maximum size of the pixel data, images are no longer added once it is reached.
+        :param readonly: True to only read (images that are not in the cache are decoded but not added).
+        """
+        if not readonly and not os.path.exists(location):
+            os.makedirs(location)
+        self.location = location
+        self.max_bytes = max_bytes
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.entries = {}  # (path, reduction): (modification time, file size, offset, width, height)
+        self.data = None  # numpy memmap of data.bin
+        self.index_position = 0  # part of index.jsonl that has been read
+        self.hits, self.misses = 0, 0
+        self.read_index()
+
+    @property
+    def data_location(self):
+        return self.location + '/data.bin'
+
+    @property
+    def index_location(self):
+        return self.location + '/index.jsonl'
+
+    def read_index(self):
+        """This function reads the entries added to the index since it was last read (e.g. by another process)."""
+        if not os.path.exists(self.index_location) or os.path.getsize(self.index_location) < self.index_position:
+            self.entries, self.index_position, self.data = {}, 0, None  # the cache has been cleared
+        if not os.path.exists(self.index_location):
+            return
+        with open(self.index_location, 'r') as handle:
+            handle.seek(self.index_position)
+            for line in handle:
+                if not line.endswith('\n'):  # partly written
+                    break
+                entry = json.loads(line)
+                self.entries[(entry['path'], entry['reduction'])] = (entry['mtime'], entry['file_size'],
+                                                                    entry['offset'], entry['width'], entry['height'])
+                self.index_position += len(line.encode('utf-8'))
+
+    @staticmethod
+    def reduction(size, min_size):
+        """
+        Returns the largest reduction of an image of size that is still at least min_size (both sides).
+        :param size: (width, height) of the image file.
+        :param min_size: (width, height) needed, None for the full size.
+        """
+        if min_size is None:
+            return 1
+        for reduction in REDUCTIONS:
+            if math.ceil(size[0] / reduction) >= min_size[0] and math.ceil(size[1] / reduction) >= min_size[1]:
+                return reduction
+        return 1
+
+    def lookup(self, path, min_size=None, stat=None):
+        """
+        This function returns the cached array of an image of at least min_size, or None.
+        :param path: absolute path of the image file.
+        :param min_size: (width, height) needed, None for the full size.
+        :param stat: (Optional) os.stat result of the file.
+        :return: numpy array (height, width, 3) or None.
+        """
+        stat = stat if stat is not None else os.stat(path)
+        for reduction in REDUCTIONS:
+            entry = self.entries.get((path, reduction))
+            if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+                continue
+            if min_size is None and reduction > 1:
+                continue
+            if reduction > 1 and (entry[3] < min_size[0] or entry[4] < min_size[1]):
+                continue  # (the full size is the largest there is, also for an image smaller than min_size)
+            return self.view(entry[2], entry[3], entry[4])
+        return None
+
+    def view(self, offset, width, height):
+        """Returns a read-only view of an array in the memory map."""
+        end = offset + width * height * 3
+        if self.data is None or len(self.data) < end:
+            self.data = np.memmap(self.data_location, dtype=np.uint8, mode='r')
+        return self.data[offset:end].reshape(height, width, 3)
+
+    def cached(self, path, min_size=None):
+        """
+        This function returns an image from the cache as an RGB array of at least min_size, without decoding it.
+        :param path: absolute path of the image file.
+        :param min_size: (width, height) needed, None for the full size.
+        :return: numpy array (height, width, 3) of uint8, or None if the image is not in the cache.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            array = self.lookup(path, min_size, stat)
+            if array is None and self.readonly:
+                self.read_index()  # added by another process meanwhile?
+                array = self.lookup(path, min_size, stat)
+            if array is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return array
+
+    def get(self, path, min_size=None):
+        """
+        This function returns an image as an RGB array of at least min_size, from the cache or decoded (and added).
+        :param path: absolute path of the image file.
+        :param min_size: (width, height) needed, None for the full size.
+        :return: numpy array (height, width, 3) of uint8.
+        """
+        array = self.cached(path, min_size)
+        if array is not None:
+            return array
+        array, reduction = decode(path, min_size)  # not holding the lock, other images can be read meanwhile
+        return array if self.readonly else self.store(path, reduction, array)
+
+    def store(self, path, reduction, array):
+        """
+        This function adds a decoded image to the cache (if there is room). An image another thread has stored
+        meanwhile (both decoded it after a miss) is not added again, its view in the cache is returned instead.
+        :param path: path of the image file.
+        :param reduction: 1, 2, 4 or 8.
+        :param array: numpy array (height, width, 3) of uint8.
+        :return: the view of the array in the cache (or array itself if it was not added).
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get((path, reduction))
+            if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                return self.view(entry[2], entry[3], entry[4])
+            if not self.has_room(array.nbytes):
+                return array
+            return self.add(path, stat, reduction, array)
+
+    def fill(self, paths, min_size=None, workers=None, progress=None):
+        """
+        This function adds images to the cache that are not in it yet, decoding them on a process pool.
+        :param paths: list of absolute paths of image files.
+        :param min_size: (width, height) the images should at least be cached at, None for the full size.
+        :param workers: number of worker processes (default: number of cpu's).
+        :param progress: (Optional) function called as progress(done, total).
+        :return: number of images added.
+        """
+        missing = [path for path in paths if self.lookup(os.path.abspath(path), min_size) is None]
+        added = 0
+        with BoundedPool(workers) as pool:
+            for done, (path, (array, reduction)) in enumerate(zip(missing, pool.map(decode_image, (
+                    (path, min_size) for path in missing))), 1):
+                if self.store(path, reduction, array) is not array:
+                    added += 1
+                if progress is not None:
+                    progress(done, len(missing))
+        return added
+
+    def has_room(self, nbytes):
+        """Checks whether nbytes can be added without exceeding max_bytes."""
+        if self.max_bytes is None:
+            return True
+        size = os.path.getsize(self.data_location) if os.path.exists(self.data_location) else 0
+        return size + nbytes <= self.max_bytes
+
+    def add(self, path, stat, reduction, array):
+        """Appends an array to the pixel data and its entry to the index, returns its view in the memory map."""
+        height, width = array.shape[:2]
+        with open(self.data_location, 'ab') as handle:
+            offset = handle.tell()
+            handle.write(np.ascontiguousarray(array).tobytes())
+        entry = {'path': path, 'mtime': stat.st_mtime_ns, 'file_size': stat.st_size, 'reduction': reduction,
+                 'offset': offset, 'width': width, 'height': height}
+        with open(self.index_location, 'a') as handle:
+            handle.write(json.dumps(entry) + '\n')  # after the pixels, so readers never see an incomplete entry
+        self.read_index()
+        return self.view(offset, width, height)
+
+    def image(self, path, min_size=None):
+        """Returns an image from the cache (or decoded and added) as a PIL image of at least min_size."""
+        return PilImage.fromarray(self.get(path, min_size))
+
+    def clear(self):
+        """Removes all images from the cache."""
+        with self.lock:
+            self.data = None
+            self.entries = {}
+            self.index_position = 0
+            for location in (self.index_location, self.data_location):
+                if os.path.exists(location):
+                    os.remove(location)
+
+    def close(self):
+        self.data = None
+
+
+def cached_image(cache_location, path, min_size=None):
+    """
+    This function returns an image from the cache at cache_location as a PIL image, for the export workers: the cache
+    is opened read-only, once per process.
+    :param cache_location: folder of a DecodedCache, or None.
+    :param path: absolute path of the image file.
+    :param min_size: (width, height) needed, None for the full size.
+    :return: PIL image (RGB) or None if there is no cache or the image is not in it.
+    """
+    if cache_location is None or not os.path.exists(cache_location):
+        return None
+    if cache_location not in readers:
+        readers[cache_location] = DecodedCache(cache_location, readonly=True)
+    array = readers[cache_location].cached(path, min_size)
+    return PilImage.fromarray(array) if array is not None else None
+
+
+def decode_image(item):
+    """Decodes (path, min_size), see decode. It runs in the worker processes."""
+    return decode(*item)
+
+
+def decode(path, min_size=None):
+    """
+    This function decodes an image as an RGB array at the largest reduction (1/2, 1/4, 1/8) that is still at least
+    min_size. JPEG files are decoded directly at the reduced scale.
+    :return: numpy array (height, width, 3) of uint8 and the reduction.
+    """
+    with PilImage.open(path) as pil_image:
+        reduction = DecodedCache.reduction(pil_image.size, min_size)
+        size = math.ceil(pil_image.size[0] / reduction), math.ceil(pil_image.size[1] / reduction)
+        pil_image.draft('RGB', size)
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+        if pil_image.size != size:  # not a JPEG file
+            pil_image = pil_image.resize(size, PilImage.LANCZOS, reducing_gap=2.0)
+        return np.asarray(pil_image), reduction
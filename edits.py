@@ -0,0 +1,230 @@
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from PIL import Image as PilImage
+from PIL import JpegImagePlugin
+
+# jpegtran (libjpeg / libjpeg-turbo) rotates and crops JPEG files losslessly, it is used when it is installed:
+JPEGTRAN = shutil.which('jpegtran')
+# Number of 90 degree turns to the left: PIL transpose method and the (clockwise) jpegtran -rotate angle:
+TRANSPOSE = {1: PilImage.Transpose.ROTATE_90, 2: PilImage.Transpose.ROTATE_180, 3: PilImage.Transpose.ROTATE_270}
+JPEGTRAN_ANGLE = {1: '270', 2: '180', 3: '90'}
+EXIF_ORIENTATION = 0x0112
+
+
+def rotate_box(box, size, direction):
+    """
+    This function rotates a bounding box together with its image by 90 degrees.
+    :param box: [xmin, ymin, xmax, ymax]
+    :param size: (width, height) of the image before rotating.
+    :param direction: 'left' (counter-clockwise) or 'right' (clockwise).
+    :return: rotated box [xmin, ymin, xmax, ymax]
+    """
+    width, height = size
+    if direction == 'left':
+        return [box[1], width - box[2], box[3], width - box[0]]
+    return [height - box[3], box[0], height - box[1], box[2]]
+
+
+def crop_box(box, crop):
+    """
+    This function moves a bounding box into the coordinates of a cropped image, clipped to the cropped area.
+    :param box: [xmin, ymin, xmax, ymax]
+    :param crop: the part of the image that is kept [xmin, ymin, xmax, ymax]
+    :return: box in the cropped image, or None if it falls outside the cropped area.
+    """
+    width, height = crop[2] - crop[0], crop[3] - crop[1]
+    box = [min(max(box[0] - crop[0], 0), width), min(max(box[1] - crop[1], 0), height),
+           min(max(box[2] - crop[0], 0), width), min(max(box[3] - crop[1], 0), height)]
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return None
+    return box
+
+
+class EditStack:
+    """
+    The rotations and crops of an image that have not been written to its file yet. Only the operations are recorded,
+    no pixels: any sequence of them is kept as a number of turns of the complete image followed by a single crop (in
+    the coordinates of the turned image), so it can be applied in one step, both to a (reduced) preview and to the
+    file.
+    """
+
+    def __init__(self, file_size):
+        self.file_size = tuple(file_size)  # size of the image file on disk
+        self.turns = 0  # number of 90 degree turns to the left
+        self.crop_area = [0, 0, file_size[0], file_size[1]]  # kept part of the turned image
+        self.operations = []  # ('rotate', direction) and ('crop', [xmin, ymin, xmax, ymax]) in the order given
+
+    @property
+    def turned_size(self):
+        return self.file_size if self.turns % 2 == 0 else (self.file_size[1], self.file_size[0])
+
+    @property
+    def size(self):
+        """Size of the image with the edits applied."""
+        return self.crop_area[2] - self.crop_area[0], self.crop_area[3] - self.crop_area[1]
+
+    @property
+    def cropped(self):
+        return self.crop_area != [0, 0, self.turned_size[0], self.turned_size[1]]
+
+    def rotate(self, direction):
+        """Records a rotation of 90 degrees ('left' or 'right') of the edited image."""
+        self.crop_area = rotate_box(self.crop_area, self.turned_size, direction)
+        self.turns = (self.turns + (1 if direction == 'left' else 3)) % 4
+        self.operations.append(('rotate', direction))
+
+    def crop(self, crop_coordinates):
+        """
+        Records a crop of the edited image.
+        :param crop_coordinates: part of the edited image to keep [xmin, ymin, xmax, ymax].
+        :return: the crop clipped to the edited image.
+        """
+        width, height = self.size
+        crop = [max(crop_coordinates[0], 0), max(crop_coordinates[1], 0), min(crop_coordinates[2], width),
+                min(crop_coordinates[3], height)]
+        self.crop_area = [self.crop_area[0] + crop[0], self.crop_area[1] + crop[1], self.crop_area[0] + crop[2],
+                          self.crop_area[1] + crop[3]]
+        self.operations.append(('crop', crop))
+        return crop
+
+    def replayed(self, file_size):
+        """Returns a new EditStack with the same edits for a file of file_size (crops are clipped to the image)."""
+        edits = EditStack(file_size)
+        for operation, argument in self.operations:
+            if operation == 'rotate':
+                edits.rotate(argument)
+            else:
+                edits.crop(argument)
+        return edits
+
+    def render(self, pil_image):
+        """
+        This function applies the edits to a PIL image of the file, which may have been decoded at a reduced size
+        (e.g. with draft for a preview), the crop is scaled accordingly.
+        :return: edited PIL image.
+        """
+        scale_x, scale_y = pil_image.size[0] / self.file_size[0], pil_image.size[1] / self.file_size[1]
+        if self.turns > 0:
+            pil_image = pil_image.transpose(TRANSPOSE[self.turns])
+            if self.turns % 2 == 1:
+                scale_x, scale_y = scale_y, scale_x
+        if self.cropped:
+            pil_image = pil_image.crop((round(self.crop_area[0] * scale_x), round(self.crop_area[1] * scale_y),
+                                        round(self.crop_area[2] * scale_x), round(self.crop_area[3] * scale_y)))
+        return pil_image
+
+
+def write_edited_file(source, destination, edits):
+    """
+    This function writes the edited image to destination (which may be the source itself). JPEG files are turned and
+    cropped losslessly with jpegtran when it is installed: the crop then starts at the nearest MCU (block of 8 or 16
+    pixels) boundary to the upper left, so the written image can be a few pixels larger than the requested crop.
+    Otherwise the image is decoded, edited and encoded again (JPEG files with their original quantization tables and
+    chroma subsampling). The EXIF orientation of the written file is set to normal, so other viewers show it as picture
+    tools does.
+    :param source: absolute path of the image file.
+    :param destination: absolute path to write the edited image to.
+    :param edits: EditStack.
+    :return: (dx, dy) offset of the requested crop in the written image ((0, 0) unless the crop was MCU aligned).
+    """
+    with PilImage.open(source) as pil_image:
+        image_format = pil_image.format
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(destination) or '.',
+                                         suffix=os.path.splitext(destination)[1])
+    os.close(handle)
+    try:
+        offset = None
+        if image_format == 'JPEG' and JPEGTRAN is not None:
+            try:
+                offset = lossless_jpeg_edit(source, temporary, edits)
+            except (OSError, subprocess.CalledProcessError):  # e.g. a turn of an image that is not MCU aligned
+                offset = None
+        if offset is None:
+            offset = reencode(source, temporary, edits)
+        os.replace(temporary, destination)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+    return offset
+
+
+def lossless_jpeg_edit(source, destination, edits):
+    """Turns (-perfect: fails instead of dropping partial edge blocks) and crops a JPEG file with jpegtran."""
+    if edits.turns > 0:
+        subprocess.run([JPEGTRAN, '-copy', 'all', '-perfect', '-rotate', JPEGTRAN_ANGLE[edits.turns], '-outfile',
+                        destination, source], check=True, capture_output=True)
+        source = destination
+    if edits.cropped:
+        width, height = edits.size
+        crop = '{0}x{1}+{2}+{3}'.format(width, height, edits.crop_area[0], edits.crop_area[1])
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(destination), suffix='.jpg', delete=False) as output:
+            cropped = output.name
+        try:
+            subprocess.run([JPEGTRAN, '-copy', 'all', '-crop', crop, '-outfile', cropped, source], check=True,
+                           capture_output=True)
+            os.replace(cropped, destination)
+        finally:
+            if os.path.exists(cropped):
+                os.remove(cropped)
+    elif edits.turns == 0:
+        shutil.copyfile(source, destination)
+    reset_exif_orientation(destination)
+    # The right and bottom edges are exact, the upper left corner may have moved to an MCU boundary:
+    with PilImage.open(destination) as pil_image:
+        return pil_image.size[0] - edits.size[0], pil_image.size[1] - edits.size[1]
+
+
+def reencode(source, destination, edits):
+    """Decodes, edits and encodes the image again (keeping the JPEG quantization tables and EXIF data)."""
+    with PilImage.open(source) as pil_image:
+        options = {}
+        if pil_image.format == 'JPEG':
+            options['qtables'] = pil_image.quantization
+            sampling = JpegImagePlugin.get_sampling(pil_image)
+            if sampling != -1:
+                options['subsampling'] = sampling
+        if 'icc_profile' in pil_image.info:
+            options['icc_profile'] = pil_image.info['icc_profile']
+        exif = pil_image.getexif()
+        if len(exif) > 0 and pil_image.format in ('JPEG', 'PNG', 'WEBP', 'TIFF'):
+            exif[EXIF_ORIENTATION] = 1
+            options['exif'] = exif.tobytes()
+        image_format = pil_image.format
+        edits.render(pil_image).save(destination, format=image_format, **options)
+
+    return 0, 0
+
+
+def reset_exif_orientation(location):
+    """
+    This function sets the EXIF orientation of a JPEG file to 1 (normal) by overwriting the two bytes of its value in
+    place, the rest of the file is not touched.
+    :return: True if the orientation was changed.
+    """
+    with open(location, 'r+b') as handle:
+        data = handle.read(65536 + 4)  # the EXIF segment (APP1) is at most 64 kB and comes first
+        position = 2
+        while position + 4 <= len(data) and data[position] == 0xFF:
+            marker, length = data[position + 1], struct.unpack('>H', data[position + 2:position + 4])[0]
+            if marker == 0xE1 and data[position + 4:position + 10] == b'Exif\0\0':
+                tiff = position + 10
+                endian = '<' if data[tiff:tiff + 2] == b'II' else '>'
+                ifd = tiff + struct.unpack(endian + 'I', data[tiff + 4:tiff + 8])[0]
+                for entry in range(struct.unpack(endian + 'H', data[ifd:ifd + 2])[0]):
+                    entry_position = ifd + 2 + entry * 12
+                    tag, value = struct.unpack(endian + 'H6xH2x', data[entry_position:entry_position + 12])
+                    if tag == EXIF_ORIENTATION:
+                        if value == 1:
+                            return False
+                        handle.seek(entry_position + 8)
+                        handle.write(struct.pack(endian + 'H', 1))
+                        return True
+                return False
+            if marker in (0xD9, 0xDA):  # end of image or start of the image data: no EXIF segment
+                return False
+            position += 2 + length
+    return False
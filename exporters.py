@@ -0,0 +1,277 @@
+import json
+import os
+import shutil
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+# Picture tools modules:
+from crops import CropExport
+from data_access import FileAccess
+from parallel import BoundedPool
+from tfrecord import LabelMap, TFRecordExport
+
+# One image as it is handed to the exporters. boxes is a list of (tag_category, [xmin, ymin, xmax, ymax]).
+ExportRecord = namedtuple('ExportRecord', ['file_path', 'file_name', 'width', 'height', 'boxes'])
+
+
+def unique_file_name(file_name, source_name, used):
+    """
+    This function returns file_name, or a unique name if it has been used already in the same folder (e.g. the
+    copies of a.jpg and a.png are both written as a.jpg): the extension of source_name is added to the stem (a_png.jpg),
+    numbered if that is in use as well. The name returned is added to used.
+    :param file_name: name of the file to write.
+    :param source_name: file_name of the image the file is written for.
+    :param used: set of the names written to the folder so far.
+    :return: unique file name.
+    """
+    stem, extension = os.path.splitext(file_name)
+    if file_name in used:
+        stem = '{0}_{1}'.format(stem, os.path.splitext(source_name)[1].lstrip('.') or 'copy')
+        file_name = stem + extension
+    number = 1
+    while file_name in used:
+        file_name = '{0}_{1}{2}'.format(stem, number, extension)
+        number += 1
+    used.add(file_name)
+    return file_name
+
+
+class StreamingExporter:
+    """
+    Base class for annotation exporters. The catalog is traversed once and every ExportRecord is handed to
+    write_image() of every requested exporter, so an exporter should write records out as they arrive instead of
+    collecting them. close() finishes the output.
+    """
+
+    default_name = None  # file or folder name used when exporting to a folder
+
+    def __init__(self, save_location, **options):
+        self.save_location = save_location
+        self.options = options
+        self.images_written, self.boxes_written = 0, 0
+
+    def write_image(self, record):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def summary(self):
+        """Returns a dictionary with the number of images and boxes written."""
+        return {'images': self.images_written, 'boxes': self.boxes_written}
+
+
+class CsvExporter(StreamingExporter):
+    """Writes the tensorflow-friendly csv (filename,width,height,class,xmin,ymin,xmax,ymax,difficult)."""
+
+    default_name = 'exported_tags.csv'
+    header = "filename,width,height,class,xmin,ymin,xmax,ymax,difficult\n"
+
+    def __init__(self, save_location, **options):
+        super().__init__(save_location, **options)
+        self.writer = FileAccess.open_csv(save_location)
+        self.writer.write(self.header)
+
+    def write_image(self, record):
+        lines = ["{0},{1},{2},{3},{4},{5},{6},{7},0\n".format(record.file_name, record.width, record.height,
+                                                              tag_category, coords[0], coords[1], coords[2], coords[3])
+                 for tag_category, coords in record.boxes]
+        self.writer.write_lines(lines)
+        if len(lines) > 0:
+            self.images_written += 1
+            self.boxes_written += len(lines)
+
+    def close(self):
+        self.writer.close()
+
+
+class CocoExporter(StreamingExporter):
+    """
+    Writes a COCO detection json incrementally. Image entries are written to the output file directly, annotation
+    entries are spooled to a temporary file next to it and appended when the export is closed, so only the category
+    list is kept in memory. If a label_map_location (.pbtxt) is given, its ids are used as category_id's.
+    """
+
+    default_name = 'annotations.json'
+
+    def __init__(self, save_location, **options):
+        super().__init__(save_location, **options)
+        self.category_ids = {}
+        label_map_location = options.get('label_map_location')
+        if label_map_location is not None:
+            self.category_ids = dict(LabelMap(label_map_location).ids)
+        self.spool_location = save_location + '.part'
+        self.handle = open(save_location, 'w', buffering=1024 * 1024)
+        self.spool = open(self.spool_location, 'w', buffering=1024 * 1024)
+        self.handle.write('{"info": {"description": "Exported by picture tools"}, "licenses": [], "images": [')
+        self.annotation_id = 0
+
+    def category_id(self, tag_category):
+        if tag_category not in self.category_ids:
+            self.category_ids[tag_category] = max(self.category_ids.values(), default=0) + 1
+        return self.category_ids[tag_category]
+
+    def write_image(self, record):
+        if len(record.boxes) == 0:
+            return
+        self.images_written += 1
+        image_id = self.images_written
+        separator = ', ' if image_id > 1 else ''
+        self.handle.write(separator + json.dumps({'id': image_id, 'file_name': record.file_name,
+                                                  'width': record.width, 'height': record.height}))
+        for tag_category, coords in record.boxes:
+            self.annotation_id += 1
+            width, height = coords[2] - coords[0], coords[3] - coords[1]
+            separator = ', ' if self.annotation_id > 1 else ''
+            self.spool.write(separator + json.dumps({'id': self.annotation_id, 'image_id': image_id,
+                                                     'category_id': self.category_id(tag_category),
+                                                     'bbox': [coords[0], coords[1], width, height],
+                                                     'area': width * height, 'iscrowd': 0}))
+        self.boxes_written += len(record.boxes)
+
+    def close(self):
+        self.spool.close()
+        self.handle.write('], "annotations": [')
+        with open(self.spool_location, 'r') as spool:
+            shutil.copyfileobj(spool, self.handle, 1024 * 1024)
+        os.remove(self.spool_location)
+        categories = [{'id': category_id, 'name': name, 'supercategory': 'none'} for name, category_id in
+                      sorted(self.category_ids.items(), key=lambda item: item[1])]
+        self.handle.write('], "categories": ' + json.dumps(categories) + '}')
+        self.handle.close()
+
+
+def write_voc_annotation(filename, record):
+    """
+    This function writes a Pascal VOC xml file for a single image. It runs on the thread pool of the VocExporter.
+    :param filename: Absolute path of the xml file to write.
+    :param record: ExportRecord
+    """
+    annotation = ElementTree.Element('annotation')
+    ElementTree.SubElement(annotation, 'folder').text = os.path.basename(record.file_path)
+    ElementTree.SubElement(annotation, 'filename').text = record.file_name
+    ElementTree.SubElement(annotation, 'path').text = record.file_path + '/' + record.file_name
+    size = ElementTree.SubElement(annotation, 'size')
+    ElementTree.SubElement(size, 'width').text = str(record.width)
+    ElementTree.SubElement(size, 'height').text = str(record.height)
+    ElementTree.SubElement(size, 'depth').text = '3'
+    ElementTree.SubElement(annotation, 'segmented').text = '0'
+    for tag_category, coords in record.boxes:
+        tag = ElementTree.SubElement(annotation, 'object')
+        ElementTree.SubElement(tag, 'name').text = tag_category
+        ElementTree.SubElement(tag, 'pose').text = 'Unspecified'
+        ElementTree.SubElement(tag, 'truncated').text = '0'
+        ElementTree.SubElement(tag, 'difficult').text = '0'
+        box = ElementTree.SubElement(tag, 'bndbox')
+        for name, value in zip(['xmin', 'ymin', 'xmax', 'ymax'], coords):
+            ElementTree.SubElement(box, name).text = str(value)
+    ElementTree.ElementTree(annotation).write(filename)
+
+
+class VocExporter(StreamingExporter):
+    """
+    Writes one Pascal VOC xml file per image into the save_location folder using a thread pool. The xml file is named
+    after the image (a.jpg: a.xml), images with the same stem get a unique name (a.png: a_png.xml, see
+    unique_file_name); the <filename> in the file is the name of the image.
+    """
+
+    default_name = 'Annotations'
+
+    def __init__(self, save_location, **options):
+        super().__init__(save_location, **options)
+        if not os.path.exists(save_location):
+            os.mkdir(save_location)
+        self.pool = BoundedPool(options.get('workers'), processes=False)
+        self.names = set()  # names of the xml files written
+
+    def write_image(self, record):
+        if len(record.boxes) == 0:
+            return
+        stem = '.'.join(record.file_name.split('.')[:-1]) or record.file_name
+        filename = self.save_location + '/' + unique_file_name(stem + '.xml', record.file_name, self.names)
+        self.pool.submit(write_voc_annotation, filename, record)
+        self.images_written += 1
+        self.boxes_written += len(record.boxes)
+
+    def close(self):
+        try:
+            self.pool.drain()
+        finally:
+            self.pool.close()
+
+
+class TFRecordExporter(StreamingExporter):
+    """Writes sharded TFRecord files (see tfrecord.TFRecordExport), requires a label_map_location option."""
+
+    default_name = 'tfrecord'
+
+    def __init__(self, save_location, **options):
+        super().__init__(save_location, **options)
+        self.export = TFRecordExport(save_location, options['label_map_location'], options.get('num_shards', 10),
+                                     options.get('workers'))
+
+    def write_image(self, record):
+        boxes_written = self.export.boxes_written
+        self.export.write_image(record.file_path, record.file_name, record.width, record.height, record.boxes)
+        if self.export.boxes_written > boxes_written:
+            self.images_written += 1
+            self.boxes_written = self.export.boxes_written
+
+    def close(self):
+        self.export.close()
+
+    def summary(self):
+        summary = super().summary()
+        summary['skipped'] = self.export.boxes_skipped
+        return summary
+
+
+class CropExporter(StreamingExporter):
+    """
+    Writes every box as a separate image into a folder per tag_category, with a manifest.csv (see crops.CropExport).
+    Options: padding, square, min_side, crop_size, quality, workers and cache_location.
+    """
+
+    default_name = 'crops'
+
+    def __init__(self, save_location, **options):
+        super().__init__(save_location, **options)
+        self.export = CropExport(save_location, options.get('padding', 0.0), options.get('square', False),
+                                 options.get('min_side', 0), options.get('crop_size'), options.get('quality', 95),
+                                 options.get('workers'), options.get('cache_location'))
+
+    def write_image(self, record):
+        crops = self.export.write_image(record.file_path, record.file_name, record.width, record.height,
+                                        record.boxes)
+        if crops > 0:
+            self.images_written += 1
+            self.boxes_written += crops
+
+    def close(self):
+        self.export.close()
+
+    def summary(self):
+        summary = super().summary()
+        summary['skipped'] = self.export.crops_skipped
+        return summary
+
+
+EXPORTERS = {'csv': CsvExporter, 'coco': CocoExporter, 'voc': VocExporter, 'tfrecord': TFRecordExporter,
+             'crops': CropExporter}
+
+
+def register_exporter(name, exporter_class):
+    """
+    This function makes an exporter available under name, so it can be requested from
+    ImageCatalog.export_annotations.
+    :param name: format name (string)
+    :param exporter_class: subclass of StreamingExporter
+    """
+    EXPORTERS[name] = exporter_class
+
+
+def create_exporter(name, save_location, **options):
+    """Returns a new exporter for the format name writing to save_location."""
+    if name not in EXPORTERS:
+        raise ValueError('Unknown export format: {0}'.format(name))
+    return EXPORTERS[name](save_location, **options)
@@ -0,0 +1,91 @@
+import hashlib
+import os
+
+# Picture tools modules:
+from data_access import ImageAccess
+from parallel import BoundedPool
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def fingerprint(location):
+    """
+    This function returns the content fingerprint of a file: its size and a 128 bit BLAKE2b hash of its bytes, as
+    '<size>:<hash>'. It does not depend on the name or folder of the file, so a moved or renamed image can be found
+    again, and the size allows to only hash the files of the same size when searching for it.
+    :param location: absolute path of the file.
+    :return: fingerprint string.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(location, 'rb') as handle:
+        size = os.fstat(handle.fileno()).st_size
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return '{0}:{1}'.format(size, digest.hexdigest())
+
+
+def fingerprint_size(file_fingerprint):
+    """Returns the file size stored in a fingerprint."""
+    return int(file_fingerprint.split(':', 1)[0])
+
+
+def fingerprint_file(location):
+    """Returns (location, fingerprint), or (location, None) if the file cannot be read. It runs in the workers."""
+    try:
+        return location, fingerprint(location)
+    except OSError:
+        return location, None
+
+
+def compute_fingerprints(locations, workers=None, progress=None):
+    """
+    This function computes the fingerprints of files on a process pool (hashing is bound by disk reads and CPU,
+    both of which the workers spread).
+    :param locations: list of absolute paths.
+    :param workers: number of worker processes (default: number of cpu's).
+    :param progress: (Optional) function called as progress(done, total).
+    :return: generator of (location, fingerprint or None) in the order of locations.
+    """
+    with BoundedPool(workers) as pool:
+        for done, result in enumerate(pool.map(fingerprint_file, locations), 1):
+            if progress is not None:
+                progress(done, len(locations))
+            yield result
+
+
+def find_files(fingerprints, search_roots, workers=None, progress=None):
+    """
+    This function searches the image files under search_roots (recursively) for files with one of the fingerprints.
+    Only the files with the size of one of the fingerprints are hashed.
+    :param fingerprints: iterable of fingerprint strings.
+    :param search_roots: list of absolute folder paths.
+    :param workers: number of worker processes (default: number of cpu's).
+    :param progress: (Optional) function called as progress(done, None) after every file hashed.
+    :return: dictionary {fingerprint: absolute path} of the fingerprints found (the first file found if there are
+    several copies).
+    """
+    wanted = set(fingerprints)
+    sizes = {fingerprint_size(i) for i in wanted}
+
+    def candidates():
+        image_access = ImageAccess()
+        for root in search_roots:
+            for batch in image_access.scan_images(root, recursive=True):
+                for relative_path in batch:
+                    location = root + '/' + relative_path
+                    try:
+                        if os.stat(location).st_size in sizes:
+                            yield location
+                    except OSError:  # removed meanwhile
+                        continue
+
+    found = {}
+    if len(wanted) == 0:
+        return found
+    with BoundedPool(workers) as pool:
+        for done, (location, file_fingerprint) in enumerate(pool.map(fingerprint_file, candidates()), 1):
+            if file_fingerprint in wanted and file_fingerprint not in found:
+                found[file_fingerprint] = location
+            if progress is not None:
+                progress(done, None)
+    return found
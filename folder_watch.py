@@ -0,0 +1,162 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# inotify constants (linux/inotify.h):
+IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x008, 0x040, 0x080
+IN_CREATE, IN_DELETE, IN_DELETE_SELF, IN_IGNORED, IN_ISDIR = 0x100, 0x200, 0x400, 0x8000, 0x40000000
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len (followed by the name)
+
+
+class FolderWatcher:
+    """
+    Watches the imported folders for new, changed and removed files. On Linux inotify is used (through ctypes, no
+    extra packages needed): a background thread collects the folders in which something changed. Elsewhere, or when
+    inotify is not available (e.g. the maximum number of watches has been reached), it falls back to polling: every
+    poll_interval seconds all folders are reported as possibly changed, the catalog rescan then finds the changes
+    cheaply using the folder modification times.
+    The owner calls poll_changes() regularly (e.g. with Tk's `after`) and rescans the catalog when it returns something.
+    Example:
+        watcher = FolderWatcher(catalog.import_roots)
+        watcher.start()
+        changes = watcher.poll_changes()
+        if changes is not None:
+            catalog.rescan(changed_folders=changes or None)
+    """
+
+    def __init__(self, roots, poll_interval=5.0, settle_time=0.5, use_inotify=True):
+        """
+        :param roots: dictionary {folder_location: {'recursive': True/False, ...}} (ImageCatalog.import_roots).
+        :param poll_interval: seconds between two rescans when polling.
+        :param settle_time: seconds without new events before inotify changes are reported (files are often written
+        in several steps).
+        :param use_inotify: False to always poll.
+        """
+        self.roots = {root: options['recursive'] for root, options in roots.items()}
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.use_inotify = use_inotify and sys.platform.startswith('linux')
+        self.lock = threading.Lock()
+        self.changed_folders = set()
+        self.last_event = None
+        self.last_poll = time.monotonic()
+        self.running = False
+        self.backend = None  # 'inotify' or 'polling'
+        self.libc, self.fd, self.watches, self.thread = None, None, {}, None
+
+    def start(self):
+        """Starts watching, with inotify if possible and polling otherwise."""
+        self.running = True
+        self.backend = 'polling'
+        if self.use_inotify:
+            try:
+                self.start_inotify()
+                self.backend = 'inotify'
+            except (OSError, AttributeError):  # AttributeError: the c library has no inotify functions
+                self.stop_inotify()
+
+        return self.backend
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.stop_inotify()
+
+    def add_root(self, root, recursive=False):
+        """Starts watching a newly imported folder."""
+        self.roots[root] = recursive
+        if self.backend == 'inotify':
+            try:
+                self.add_watches(root, recursive)
+            except OSError:  # no more watches available: poll instead
+                self.backend = 'polling'
+
+    def poll_changes(self):
+        """
+        This function returns the folders that changed since the previous call. With inotify, changes are reported
+        once no new events arrived for settle_time seconds. When polling, an empty set is returned every
+        poll_interval seconds (meaning: rescan everything).
+        :return: set of absolute folder paths, or None if there is nothing to rescan (yet).
+        """
+        now = time.monotonic()
+        if self.backend == 'inotify':
+            with self.lock:
+                if len(self.changed_folders) == 0 or now - self.last_event < self.settle_time:
+                    return None
+                changed, self.changed_folders = self.changed_folders, set()
+            return changed
+        if self.running and now - self.last_poll >= self.poll_interval:
+            self.last_poll = now
+            return set()
+        return None
+
+    def start_inotify(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        for root, recursive in self.roots.items():
+            self.add_watches(root, recursive)
+        self.thread = threading.Thread(target=self.read_events, name='picture_tools_folder_watch', daemon=True)
+        self.thread.start()
+
+    def stop_inotify(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches = {}
+
+    def add_watches(self, folder, recursive):
+        """Adds an inotify watch for folder (and all its sub-folders if recursive)."""
+        folders = [folder]
+        while folders:
+            folder = folders.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed for {0}'.format(folder))
+            self.watches[wd] = (folder, recursive)
+            if recursive:
+                try:
+                    with os.scandir(folder) as entries:
+                        folders.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+                except OSError:
+                    pass
+
+    def read_events(self):
+        """Reads inotify events on the background thread and collects the folders in which something changed."""
+        while self.running:
+            readable, _, _ = select.select([self.fd], [], [], 0.2)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if wd not in self.watches:
+                    continue
+                folder, recursive = self.watches[wd]
+                if mask & IN_IGNORED:  # the folder has been removed
+                    del self.watches[wd]
+                    continue
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and recursive:
+                    try:
+                        self.add_watches(folder + '/' + os.fsdecode(name), recursive)
+                    except OSError:
+                        self.backend = 'polling'
+                with self.lock:
+                    self.changed_folders.add(folder)
+                    self.last_event = time.monotonic()
@@ -1,38 +1,143 @@
+import math
+import sys
 from PIL import Image as PilImage
 
 # Picture tools modules:
+from edits import EditStack, rotate_box, crop_box
 from tags import Tags
 
 
 class Image:
+    """
+    An image of the catalog. Catalogs can hold millions of images, so an Image is kept small: it has no attribute
+    dictionary (__slots__), the folder string is shared by all images in a folder (interned), date_string is derived
+    from date_taken when asked for, and the file is only opened (IMG) when its pixels are needed, e.g. to show it.
+    """
 
-    def __init__(self, tag_categories, file_path, file_name, date_taken):
-        self.file_location = file_path
+    __slots__ = ('file_location', 'file_name', 'date_taken', 'size', 'tags', 'edits', 'pil_image', 'fingerprint',
+                 'perceptual_hash', 'quality')
+
+    def __init__(self, tag_categories, file_path, file_name, date_taken, size=None):
+        """
+        :param tag_categories: TagCategories of the catalog.
+        :param file_path: Absolute path to the folder containing the image.
+        :param file_name: name of the image file.
+        :param date_taken: date object for the image.
+        :param size: (Optional) (width, height) of the image if it is known, otherwise the header of the file is read.
+        """
+        self.file_location = sys.intern(file_path)
         self.file_name = file_name
-        self.IMG = PilImage.open(self.file_location + '/' + self.file_name)
         self.date_taken = date_taken
-        self.date_string = self.date_taken.strftime('%Y:%m:%d %H:%M:%S')
-        self.size = self.IMG.size
+        self.pil_image = None  # PIL image of the file, opened when the pixels are needed
+        if size is None:
+            with PilImage.open(self.file_location + '/' + self.file_name) as pil_image:  # only reads the header
+                size = pil_image.size
+        self.size = tuple(size)
         self.tags = Tags(tag_categories, self.size)  # create a Tags object to save the tags for this image
+        self.edits = None  # EditStack with the rotations and crops not yet written to the file
+        self.fingerprint = None  # content fingerprint of the file (see fingerprints.py), if it has been computed
+        self.perceptual_hash = None  # 64 bit pHash of the pixels (see near_duplicates.py), if it has been computed
+        self.quality = None  # QualityScores (see quality.py), if they have been computed
+
+    @property
+    def IMG(self):
+        """The PIL image of the file, opened on first use and kept (with its decoded pixels) until close()."""
+        if self.pil_image is None:
+            self.pil_image = PilImage.open(self.file_location + '/' + self.file_name)
+        return self.pil_image
+
+    @property
+    def date_string(self):
+        return self.date_taken.strftime('%Y:%m:%d %H:%M:%S')
+
+    def close(self):
+        """Closes the file of the image (if it was opened) and frees its decoded pixels."""
+        if self.pil_image is not None:
+            self.pil_image.close()
+            self.pil_image = None
+
+    def reload(self, date_taken=None):
+        """
+        This function reads the image file again after it has been changed on disk. The tags are kept, and so are the
+        edits that had not been written to the file yet (they are applied to the new file), because the tags have been
+        moved along with them already.
+        :param date_taken: (Optional) new date object for the image.
+        :return: size has been updated.
+        """
+        self.fingerprint, self.perceptual_hash, self.quality = None, None, None  # the content has changed
+        self.close()
+        with PilImage.open(self.file_location + '/' + self.file_name) as pil_image:
+            self.size = pil_image.size
+        if self.edits is not None:
+            self.edits = self.edits.replayed(self.size)
+            self.size = self.edits.size
+        self.tags.full_image_coordinates = (0, 0, self.size[0], self.size[1])
+        if date_taken is not None:
+            self.date_taken = date_taken
 
     def crop(self, crop_coordinates):
         """
         This function crops the image using crop_coordinates, where crop_coordinates represent the part of the image
-        to be kept.
+        to be kept. The crop is only recorded (the file is changed when the image is saved), the tags are moved into
+        the cropped image right away and tags outside of it are removed.
         :param crop_coordinates: list of coordinates [xmin, ymin, xmax, ymax]
         :return: image has been cropped.
         """
-        crop_section = (crop_coordinates[0], crop_coordinates[1], crop_coordinates[2], crop_coordinates[3])
-        self.IMG = self.IMG.crop(crop_section)
+        if self.edits is None:
+            self.edits = EditStack(self.size)  # without edits, size is the size of the file
+        crop = self.edits.crop(crop_coordinates)
+        self.size = self.edits.size
+        self.tags.transform(lambda coordinates: crop_box(coordinates, crop), self.size)
 
     def rotate(self, direction):
         """
         This function rotates the image 90 degrees to the left or right.
-        Image is not saved automatically! Call save_image from the image_catalog to save the rotated image.
+        The rotation is only recorded, call save_image from the image_catalog to write it to the file. The tags are
+        rotated right away.
         :param direction: 'left' or 'right'
         :return: rotated image
         """
-        if direction == 'left':
-            self.IMG = self.IMG.rotate(90, expand=1)
-        if direction == 'right':
-            self.IMG = self.IMG.rotate(-90, expand=1)
+        if direction not in ('left', 'right'):
+            return
+        if self.edits is None:
+            self.edits = EditStack(self.size)  # without edits, size is the size of the file
+        size = self.size
+        self.edits.rotate(direction)
+        self.size = self.edits.size
+        self.tags.transform(lambda coordinates: rotate_box(coordinates, size, direction), self.size)
+
+    def preview(self, resolution):
+        """
+        This function returns a PIL image of the (edited) image of at least resolution, to be resized for display.
+        Without edits, this is the decoded image itself. With edits, the file is decoded at the smallest size that is
+        still large enough (JPEG files are decoded at 1/2, 1/4 or 1/8 scale if possible) and the edits are applied to
+        that, so no edited image at full resolution is kept in memory.
+        :param resolution: (width, height) the image will be shown at.
+        :return: PIL image
+        """
+        if self.edits is None:
+            self.IMG.load()  # only decodes the first time, PIL keeps the decoded image
+            return self.IMG
+        with PilImage.open(self.file_location + '/' + self.file_name) as pil_image:
+            scale = min(1, max(resolution[0] / self.size[0], resolution[1] / self.size[1]))
+            pil_image.draft(pil_image.mode, (math.ceil(pil_image.size[0] * scale),
+                                             math.ceil(pil_image.size[1] * scale)))
+            edited = self.edits.render(pil_image)
+            # (the edited image has to outlive the file, e.g. after four turns it is the decoded file itself)
+            return edited.copy() if edited is pil_image else edited
+
+    def edits_saved(self, offset=(0, 0)):
+        """
+        This function is called after the edits have been written to the file: the file is opened again and, if the
+        written image starts a few pixels before the requested crop (lossless JPEG crops), the tags are moved by
+        offset.
+        :param offset: (dx, dy) returned by edits.write_edited_file.
+        """
+        full_image_coordinates = (0, 0, self.size[0], self.size[1])
+        self.edits = None  # (written to the file)
+        self.reload()
+        if offset != (0, 0):
+            full_image = [0, 0, self.size[0], self.size[1]]
+            self.tags.transform(lambda coordinates: full_image if coordinates == full_image_coordinates else
+                                [coordinates[0] + offset[0], coordinates[1] + offset[1], coordinates[2] + offset[0],
+                                 coordinates[3] + offset[1]], self.size)
@@ -1,14 +1,52 @@
 import exifread
+import math
 import os
 import subprocess
+import threading
+from collections import deque
+from contextlib import nullcontext
 from datetime import datetime
 from natsort import natsorted
+import numpy as np
+from PIL import Image as PilImage
 
 # Picture tools modules:
+from annotation_lint import CHECKS, REPAIRED, LintOptions, lint_boxes, repair_boxes
+from annotator_merge import MAX_ANNOTATORS, MergeOptions, annotator_names, preferred_annotator, resolve, split_tags
 from data_access import ImageAccess
 from data_access import FileAccess
+from dataset_statistics import collect_boxes, compute_statistics
 from tag_categories import TagCategories
 from image import Image
+from exporters import ExportRecord, create_exporter
+from fingerprints import compute_fingerprints, find_files
+from near_duplicates import NearDuplicateIndex, compute_hashes
+from parallel import BoundedPool
+from quality import QualityScores, compute_quality, worst_threshold
+from importers import create_importer
+from instrumentation import instrument
+from query import CatalogIndex
+from tiling import ChipStage
+from transcode import TranscodeStage
+
+
+def read_image_file(location):
+    """
+    This function reads what importing an image needs from its file: the date it was taken (from the EXIF data, or the
+    date it was modified if there is none) and its size (from the header). It runs in the workers of open_folder.
+    :param location: absolute path of the image file.
+    :return: (date_string 'yyyy:mm:dd HH:MM:SS', (width, height))
+    """
+    with open(location, 'rb') as f:
+        tags = exifread.process_file(f, details=False, stop_tag='DateTimeOriginal')
+    if 'EXIF DateTimeOriginal' in tags:
+        date_string = str(tags['EXIF DateTimeOriginal'])
+    else:
+        date_string = datetime.utcfromtimestamp(os.path.getmtime(location)).strftime('%Y:%m:%d %H:%M:%S')
+    with PilImage.open(location) as pil_image:  # only reads the header
+        size = pil_image.size
+
+    return date_string, size
 
 
 class ImageCatalog:
@@ -20,29 +58,51 @@ class ImageCatalog:
         self.images = {}  # catalog to save the image_objects in
         self.image_id = 0
         self.start_date, self.end_date = None, None  # used for date selection if applicable
-        self.file_names = []  # list to make sure no duplicate filenames are entered into the catalog
-        #subprocess.check_output("ulimit -n 4096", shell=True)  # increase ulimit
-        #self.ulimit = eval(subprocess.check_output("ulimit -n", shell=True)[0:-1])  # check limit number of open files
-        #self.ulimit = int(round(0.99 * self.ulimit))
-        self.ulimit = 50000
-        print(self.ulimit)
+        self.file_names = set()  # set to make sure no duplicate filenames are entered into the catalog
+        # Imported folders, used for incremental rescans:
+        # {folder_location: {'recursive', 'include', 'exclude', 'folders': {relative_folder: (mtime, files, folders)}}}
+        self.import_roots = {}
+        # Images of a loaded savefile whose file was not found (and could not be re-linked, see relink_images), kept
+        # so they are written to the savefile again: {file_name: savefile line (list of fields)}
+        self.missing_images = {}
+        # Lock for catalog changes, so background jobs and the GUI can use the catalog at the same time:
+        self.lock = threading.RLock()
+        # Incremented when images are added, removed, renamed or reloaded (tag changes are tracked by
+        # Tags.global_revision):
+        self.revision = 0
+        self.index = CatalogIndex(self)  # indexes for query(), updated lazily
+        # Maximum number of images in the catalog (images do not keep their file open, see Image.IMG, so this is not
+        # bound by the limit on open files):
+        self.ulimit = 5000000
         self.images_loaded = 0
 
-    def add_image(self, file_path, file_name, date_object):
+    def add_image(self, file_path, file_name, date_object, size=None):
         """
         This function adds an Image object to the image dictionary.
         :param file_path: Absolute path to folder containing the image.
         :param file_name: name of image file.
         :param date_object: date object for the image stating when it was taking (or file was created).
+        :param size: (Optional) (width, height) of the image if it is known (the file is not opened then).
         :return: Adds Image object to the image dictionary.
         """
-        if self.image_id <= self.ulimit:  # only add images if ulimit has not been reached
-            self.file_names.append(file_name)
-            image_object = Image(self.tag_categories, file_path, file_name, date_object)
-            self.images[self.image_id] = image_object
-            self.image_id += 1
-            self.images_loaded += 1
-        
+        with self.lock:
+            if self.image_id <= self.ulimit:  # only add images if ulimit has not been reached
+                self.file_names.add(file_name)
+                image_object = Image(self.tag_categories, file_path, file_name, date_object, size)
+                self.images[self.image_id] = image_object
+                self.image_id += 1
+                self.images_loaded += 1
+                self.revision += 1
+                instrument.count('images_added')
+
+    def snapshot(self):
+        """
+        This function returns a list of (image_id, image_object) tuples of the images currently in the catalog, which
+        can be iterated over while other threads add or delete images.
+        """
+        with self.lock:
+            return list(self.images.items())
+
     def save_image(self, image_id, fileloc=None):
         """
         This function saves the image. It saves the image to fileloc if given, otherwise it will overwrite the
@@ -53,17 +113,46 @@ class ImageCatalog:
         """
         image_object = self.images[image_id]
         if fileloc is None:
-            return self.image_access.save_image(image_object)
+            # The file is overwritten:
+            image_object.fingerprint, image_object.perceptual_hash, image_object.quality = None, None, None
+            if image_object.edits is None:
+                return self.image_access.save_image(image_object)
+            with self.lock:  # the edits are written to the file and the tags are updated in one step
+                offset = self.image_access.save_image(image_object)
+                image_object.edits_saved(offset)
+                self.revision += 1
+            return offset
         else:
             return self.image_access.save_image(image_object, fileloc)
 
+    def apply_edits(self, image_ids=None, progress=None):
+        """
+        This function writes the recorded edits (rotations, crops) of the images to their files, see save_image.
+        :param image_ids: (Optional) the image_id's to write the edits of, default all images.
+        :param progress: (Optional) function called as progress(done, total) after every edited image.
+        :return: number of images written.
+        """
+        if image_ids is None:
+            images = self.snapshot()
+        else:
+            with self.lock:
+                images = [(i, self.images[i]) for i in image_ids if i in self.images]
+        edited = [image_id for image_id, image in images if image.edits is not None]
+        for done, image_id in enumerate(edited, 1):
+            with instrument.span('catalog.apply_edits'):
+                self.save_image(image_id)
+            if progress is not None:
+                progress(done, len(edited))
+
+        return len(edited)
+
     def close_all_images(self):
         """
         This function loops through all images in the image catalog and closes them. This can be used to free up
         resources again if files are no longer needed.
         """
         for key, value in self.images.items():
-            value.IMG.close()
+            value.close()
 
     def extract_date(self, file_location):
         """
@@ -72,8 +161,9 @@ class ImageCatalog:
         :param file_location: Absolute file location.
         :return: datetime object and date_string.
         """
-        f = open(file_location, 'rb')
-        tags = exifread.process_file(f)
+        with instrument.span('exif_parse'):
+            with open(file_location, 'rb') as f:
+                tags = exifread.process_file(f, details=False, stop_tag='DateTimeOriginal')
         if 'EXIF DateTimeOriginal' in tags:
             date_string = tags['EXIF DateTimeOriginal']
         else:  # If no EXIF data available, get date it was modified instead
@@ -127,25 +217,414 @@ class ImageCatalog:
         except ValueError:
             return False
 
-    def open_folder(self, folder_location):
+    def open_folder(self, folder_location, progress=None, recursive=False, include=None, exclude=None, workers=1):
         """
-        This function imports all image files from a folder to a list. It then creates image objects for all images
-        in the list that fall within the defined period if the start and end date have been set, and for all if no
-        period has been set. It adds all created object to the images dictionary.
+        This function imports the image files from a folder (and its sub-folders if recursive=True). The folder is
+        walked in batches, for every batch it creates image objects for all images that fall within the defined period
+        if the start and end date have been set, and for all if no period has been set. Images are added while the
+        folder is still being walked, so they can be used before the import has finished.
         :param folder_location: The location of the folder to import images from.
-        :return: fills the images dictionary with the images present in the chosen folder.
+        :param progress: (Optional) function called as progress(done, None) after every image.
+        :param recursive: True to also import the images in sub-folders.
+        :param include: (Optional) list of glob patterns, only images matching one of them are imported.
+        :param exclude: (Optional) list of glob patterns for images (and sub-folders) to skip.
+        :param workers: number of worker processes reading the dates and sizes of the images (1: in this thread,
+        None: number of cpu's).
+        :return: dictionary with the number of images added and the (relative paths of the) files skipped because an
+        image with the same file_name from another folder is in the catalog already (images are known by their
+        file_name, e.g. a/IMG_0001.jpg and b/IMG_0001.jpg cannot both be imported).
         """
-        images = self.image_access.import_images(folder_location)
-        images = natsorted(images)  # sort filelist so that they are loaded as they would be sorted naturally
-        for entry in images:
+        # Remember the folder, so it can be rescanned for new, changed and removed images later:
+        if folder_location not in self.import_roots:
+            self.import_roots[folder_location] = {'recursive': recursive, 'include': include, 'exclude': exclude,
+                                                  'folders': {}}
+        summary = {'added': 0, 'skipped': []}
+        locations = None  # {file_name: file_location}, only created when a file_name is in the catalog already
+
+        def known(relative_path, file_path, entry):
+            """Returns True if entry is in the catalog already (and reports it if it is from another folder)."""
+            nonlocal locations
             if entry not in self.file_names:
-                # get the date the image was taken (or created if exif data is missing)
-                date_object, date_string = self.extract_date(folder_location + '/' + entry)
-                if self.start_date is not None and self.end_date is not None:
-                    if self.date_in_range(self.start_date, self.end_date, date_string):
-                        self.add_image(folder_location, entry, date_object)
-                else:  # no date selection
-                    self.add_image(folder_location, entry, date_object)
+                return False
+            if locations is None:
+                with self.lock:
+                    locations = {image.file_name: image.file_location for image in self.images.values()}
+            if locations.get(entry, file_path) != file_path:  # (not the same file imported again)
+                summary['skipped'].append(relative_path)
+            return True
+
+        done = 0
+        with BoundedPool(workers) as pool:
+            for batch in self.image_access.scan_images(folder_location, recursive, include, exclude):
+                # sort the batch so that the images are loaded as they would be sorted naturally:
+                new = []
+                for relative_path in natsorted(batch):
+                    file_path, _, entry = (folder_location + '/' + relative_path).rpartition('/')
+                    if known(relative_path, file_path, entry):
+                        done += 1
+                        if progress is not None:
+                            progress(done, None)
+                    else:
+                        new.append((relative_path, file_path, entry))
+                # the files of the batch are read on the pool, the images are added in order:
+                headers = pool.map(read_image_file, [file_path + '/' + entry for _, file_path, entry in new])
+                for (relative_path, file_path, entry), (date_string, size) in zip(new, headers):
+                    done += 1
+                    if progress is not None:
+                        progress(done, None)
+                    if known(relative_path, file_path, entry):  # (the same file_name twice in the batch)
+                        continue
+                    if self.import_image_file(file_path, entry, date_string, size):
+                        summary['added'] += 1
+                        if locations is not None:
+                            locations[entry] = file_path
+
+        return summary
+
+    def import_image_file(self, file_path, file_name, date_string=None, size=None):
+        """
+        This function adds an image file to the catalog, unless its file_name is already present or the date it was
+        taken falls outside the date range (if set).
+        :param date_string: (Optional) date the image was taken ('yyyy:mm:dd HH:MM:SS') if it has been read already.
+        :param size: (Optional) (width, height) of the image if it has been read already.
+        :return: True if the image has been added.
+        """
+        if file_name in self.file_names:
+            return False
+        # get the date the image was taken (or created if exif data is missing)
+        if date_string is None:
+            date_object, date_string = self.extract_date(file_path + '/' + file_name)
+        else:
+            date_object, date_string = self.datestring_to_dateobject(date_string)
+        if self.start_date is not None and self.end_date is not None and \
+                not self.date_in_range(self.start_date, self.end_date, date_string):
+            return False
+        image_id = self.image_id
+        self.add_image(file_path, file_name, date_object, size)
+
+        return image_id in self.images
+
+    def rescan(self, progress=None, full=False, changed_folders=None):
+        """
+        This function rescans the imported folders and only processes the differences with the catalog: new images
+        are added, images that have been changed on disk are reloaded (their tags are kept) and images that have been
+        removed from disk are removed from the catalog. A folder is only listed again if its modification time has
+        changed since the previous rescan, so rescanning a large unchanged tree only costs one stat per folder.
+        The first rescan of a folder lists it and remembers the size and modification time of its images, changed
+        images are detected from the next rescan on. Overwriting a file does not change the modification time of its
+        folder, use full=True (or pass the folder in changed_folders) to detect those changes.
+        :param progress: (Optional) function called as progress(done, None) after every folder.
+        :param full: True to list all folders, also the unchanged ones.
+        :param changed_folders: (Optional) set of absolute folder paths to list (e.g. reported by a FolderWatcher).
+        :return: dictionary with the number of images added, changed and removed and folders listed and skipped.
+        """
+        summary = {'added': 0, 'changed': 0, 'removed': 0, 'folders_listed': 0, 'folders_skipped': 0}
+        catalog_folders = None  # {file_location: {file_name: image_id}}, only created when a folder has changed
+        done = 0
+        for root, options in list(self.import_roots.items()):
+            folders = options['folders']  # {relative_folder: (mtime, {file_name: (size, mtime)}, [sub_folders])}
+            seen = set()
+            pending = ['']
+            while pending:
+                relative_folder = pending.pop()
+                folder_path = root + '/' + relative_folder[:-1] if relative_folder != '' else root
+                try:
+                    folder_mtime = os.stat(folder_path).st_mtime_ns
+                except OSError:  # folder removed, its images are removed below
+                    continue
+                seen.add(relative_folder)
+                done += 1
+                if progress is not None:
+                    progress(done, None)
+                previous = folders.get(relative_folder)
+                if previous is not None and previous[0] == folder_mtime and not full and \
+                        (changed_folders is None or folder_path not in changed_folders):  # no files added or removed
+                    summary['folders_skipped'] += 1
+                    pending.extend(previous[2])
+                    continue
+                summary['folders_listed'] += 1
+                files, sub_folders = self.image_access.scan_folder(root, relative_folder, options['recursive'],
+                                                                   options['include'], options['exclude'])
+                pending.extend(sub_folders)
+                if catalog_folders is None:
+                    catalog_folders = self.images_per_folder()
+                catalog_files = catalog_folders.get(folder_path, {})
+                previous_files = previous[1] if previous is not None else {}
+                for file_name, file_stat in files.items():
+                    if file_name not in catalog_files:
+                        if self.import_image_file(folder_path, file_name):
+                            summary['added'] += 1
+                    elif file_name in previous_files and previous_files[file_name] != file_stat:
+                        self.reload_image(catalog_files[file_name])
+                        summary['changed'] += 1
+                for file_name, image_id in catalog_files.items():
+                    if file_name not in files:
+                        self.delete_image_from_catalog(image_id)
+                        summary['removed'] += 1
+                folders[relative_folder] = (folder_mtime, files, sub_folders)
+            # Folders that have been removed (or are no longer reachable):
+            for relative_folder in set(folders) - seen:
+                folder_path = root + '/' + relative_folder[:-1] if relative_folder != '' else root
+                if catalog_folders is None:
+                    catalog_folders = self.images_per_folder()
+                for image_id in catalog_folders.get(folder_path, {}).values():
+                    self.delete_image_from_catalog(image_id)
+                    summary['removed'] += 1
+                del folders[relative_folder]
+
+        return summary
+
+    @staticmethod
+    def restore_image_data(image, line):
+        """
+        Sets the fingerprint, perceptual hash and quality scores of an image from its savefile line (if they were
+        saved).
+        """
+        if len(line) > 4 and line[4] != '':
+            image.fingerprint = line[4]
+        if len(line) > 5 and line[5] != '':
+            image.perceptual_hash = int(line[5], 16)
+        if len(line) > 6 and line[6] != '':
+            image.quality = QualityScores.from_string(line[6])
+
+    def compute_fingerprints(self, image_ids=None, workers=None, progress=None):
+        """
+        This function computes the content fingerprints (see fingerprints.py) of the images that do not have one yet on
+        a process pool. They are saved in the savefile, so moved or renamed images can be found again when it is
+        loaded (see relink_images).
+        :param image_ids: (Optional) the image_id's to compute the fingerprints of, default all images.
+        :param workers: number of worker processes (default: number of cpu's).
+        :param progress: (Optional) function called as progress(done, total).
+        :return: number of fingerprints computed.
+        """
+        if image_ids is None:
+            images = self.snapshot()
+        else:
+            with self.lock:
+                images = [(i, self.images[i]) for i in image_ids if i in self.images]
+        images = [image for image_id, image in images if image.fingerprint is None]
+        locations = [image.file_location + '/' + image.file_name for image in images]
+        computed = 0
+        with instrument.span('catalog.compute_fingerprints'):
+            for image, (location, file_fingerprint) in zip(images, compute_fingerprints(locations, workers, progress)):
+                if file_fingerprint is not None:
+                    image.fingerprint = file_fingerprint
+                    computed += 1
+
+        return computed
+
+    def relink_images(self, search_roots=None, workers=None, progress=None):
+        """
+        This function searches the images in missing_images by their content fingerprint: the image files under
+        search_roots with the same size are hashed on a process pool and the images that are found are added to the
+        catalog at their new location, with their tags. Images without a fingerprint cannot be found.
+        :param search_roots: (Optional) list of folders to search (recursively), default the imported folders and the
+        folders the missing images were in.
+        :param workers: number of worker processes (default: number of cpu's).
+        :param progress: (Optional) function called as progress(done, None) after every file hashed.
+        :return: dictionary with the number of images relinked and still missing.
+        """
+        missing = {line[4]: file_name for file_name, line in self.missing_images.items()
+                   if len(line) > 4 and line[4] != ''}
+        if search_roots is None:
+            search_roots = list(self.import_roots) + sorted({line[1] for line in self.missing_images.values()})
+        search_roots = [root for root in dict.fromkeys(search_roots) if os.path.isdir(root)]
+        with instrument.span('catalog.relink_images'):
+            found = find_files(missing, search_roots, workers, progress)
+        relinked = 0
+        for file_fingerprint, location in found.items():
+            file_path, _, file_name = location.rpartition('/')
+            line = self.missing_images[missing[file_fingerprint]]
+            if file_name in self.file_names:  # (e.g. found in the catalog already)
+                continue
+            date_object, date_string = self.datestring_to_dateobject(line[2])
+            with self.lock:
+                image_id = self.image_id
+                self.add_image(file_path, file_name, date_object)
+                if image_id in self.images:
+                    self.images[image_id].tags.add_tags(eval(line[3]))
+                    self.restore_image_data(self.images[image_id], line)
+                    del self.missing_images[missing[file_fingerprint]]
+                    relinked += 1
+
+        return {'relinked': relinked, 'missing': len(self.missing_images)}
+
+    def compute_perceptual_hashes(self, image_ids=None, workers=None, progress=None):
+        """
+        This function computes the perceptual hashes (pHash, see near_duplicates.py) of the images that do not have one
+        yet on a process pool, from images decoded at a reduced size. They are saved in the savefile.
+        :param image_ids: (Optional) the image_id's to compute the hashes of, default all images.
+        :param workers: number of worker processes (default: number of cpu's).
+        :param progress: (Optional) function called as progress(done, total).
+        :return: number of hashes computed.
+        """
+        if image_ids is None:
+            images = self.snapshot()
+        else:
+            with self.lock:
+                images = [(i, self.images[i]) for i in image_ids if i in self.images]
+        images = [image for image_id, image in images if image.perceptual_hash is None]
+        locations = [image.file_location + '/' + image.file_name for image in images]
+        computed = 0
+        with instrument.span('catalog.compute_perceptual_hashes'):
+            for image, (location, perceptual_hash) in zip(images, compute_hashes(locations, 'phash', workers,
+                                                                                 progress)):
+                if perceptual_hash is not None:
+                    image.perceptual_hash = perceptual_hash
+                    computed += 1
+
+        return computed
+
+    def near_duplicates(self, max_distance=6, image_ids=None):
+        """
+        This function groups the images with a perceptual hash into clusters of near-duplicates (e.g. the frames of a
+        dashcam standing still, or a burst of photos), see NearDuplicateIndex.
+        :param max_distance: maximum number of bits the hashes of near-duplicates differ.
+        :param image_ids: (Optional) the image_id's to consider, default all images.
+        :return: list of clusters (lists of image_id's sorted on date taken), largest first.
+        """
+        if image_ids is None:
+            images = self.snapshot()
+        else:
+            with self.lock:
+                images = [(i, self.images[i]) for i in image_ids if i in self.images]
+        index = NearDuplicateIndex(max_distance)
+        with instrument.span('catalog.near_duplicates'):
+            for image_id, image in sorted(images, key=lambda item: (item[1].date_taken, item[0])):
+                if image.perceptual_hash is not None:
+                    index.add(image_id, image.perceptual_hash)
+            return index.clusters()
+
+    def dataset_statistics(self, image_ids=None, anchors=9, anchor_input_size=None):
+        """
+        This function computes the statistics of the tags used before training: the number of boxes and their size and
+        aspect ratio distributions per tag_category, boxes per image, co-occurrence of the tag_categories and suggested
+        anchor boxes (see dataset_statistics.py). The tags are copied into numpy arrays once, so this takes less than a
+        second for a million tags.
+        :param image_ids: (Optional) the image_id's to include (e.g. the result of query), default all images.
+        :param anchors: number of anchor boxes to suggest (0: none).
+        :param anchor_input_size: (Optional) size of the (square) detector input the anchors are computed for.
+        :return: dictionary (json serializable), see dataset_statistics.format_report to print it.
+        """
+        with instrument.span('catalog.dataset_statistics'):
+            with self.lock:
+                if image_ids is None:
+                    images = list(self.images.values())  # (no tuples: allocating a million triggers the gc)
+                else:
+                    images = [self.images[i] for i in image_ids if i in self.images]
+                box_arrays = collect_boxes(images)
+            return compute_statistics(box_arrays, self.tag_categories.name, anchors, anchor_input_size)
+
+    def lint_tags(self, image_ids=None, options=LintOptions()):
+        """
+        This function checks all tags in a single vectorized pass for boxes without area, inverted corners, boxes
+        outside their image, tag_categories that are not in the registry, exact duplicates and near-duplicates (see
+        annotation_lint.py), and fixes the checks in options.fix: inverted boxes get their corners swapped,
+        out_of_bounds boxes are clipped to the image (both are checked again afterwards) and the boxes failing the
+        other checks are removed.
+        :param image_ids: (Optional) the image_id's to check (e.g. the result of query), default all images.
+        :param options: LintOptions.
+        :return: dictionary with the number of images and boxes checked, the number of boxes failing every check
+        before fixing ('issues'), fixed per check ('fixed') and removed, 'problems': list of (file_name,
+        tag_category, coordinates, list of checks) of the boxes that still fail a check, 'excluded': set of
+        (image_id, tag_id) of the boxes failing a check in options.skip (left out of exports) and 'skipped': its
+        size.
+        """
+        with instrument.span('catalog.lint_tags'), self.lock:
+            if image_ids is None:
+                image_ids, images = list(self.images.keys()), list(self.images.values())
+            else:
+                image_ids = [i for i in image_ids if i in self.images]
+                images = [self.images[i] for i in image_ids]
+            box_arrays = collect_boxes(images)
+            if options.categories is None:
+                known = list(self.tag_categories.ids.values())
+            else:
+                known = [self.tag_categories.category_id(category) for category in options.categories]
+            known = np.array([category_id for category_id in known if category_id is not None], np.int64)
+            issues = remaining = lint_boxes(box_arrays, known, options.iou_threshold)
+            fixed, changed = {}, set()
+            if any(check in REPAIRED for check in options.fix):
+                repaired = repair_boxes(box_arrays, options.fix)
+                for box in np.flatnonzero((repaired != box_arrays.boxes).any(axis=1)):
+                    image_number = box_arrays.image_index[box]
+                    tag = images[image_number].tags.tag_dict[box_arrays.tag_ids[box]]
+                    tag.coordinates = tuple(int(value) if value.is_integer() else value
+                                            for value in repaired[box].tolist())
+                    changed.add(image_number)
+                box_arrays = box_arrays._replace(boxes=repaired)
+                remaining = lint_boxes(box_arrays, known, options.iou_threshold)
+                fixed.update((check, int(np.count_nonzero(issues[check] & ~remaining[check])))
+                             for check in REPAIRED if check in options.fix)
+            remove = np.zeros(len(box_arrays.boxes), bool)
+            for check in options.fix:
+                if check not in REPAIRED:
+                    fixed[check] = int(np.count_nonzero(remaining[check]))
+                    remove |= remaining[check]
+            for box in np.flatnonzero(remove):  # (Tags.changed() is called once per image below)
+                del images[box_arrays.image_index[box]].tags.tag_dict[int(box_arrays.tag_ids[box])]
+                changed.add(box_arrays.image_index[box])
+            for image_number in changed:
+                images[image_number].tags.changed()
+            failed = np.column_stack([remaining[check] for check in CHECKS]) & ~remove[:, None]
+            problems = []
+            for box in np.flatnonzero(failed.any(axis=1)):
+                image_number = box_arrays.image_index[box]
+                tag = images[image_number].tags.tag_dict[box_arrays.tag_ids[box]]
+                problems.append((images[image_number].file_name, tag.tag_category, tag.coordinates,
+                                 [check for check, fails in zip(CHECKS, failed[box]) if fails]))
+            skip = failed[:, [CHECKS.index(check) for check in options.skip]].any(axis=1)
+            excluded = {(image_ids[box_arrays.image_index[box]], int(box_arrays.tag_ids[box]))
+                        for box in np.flatnonzero(skip)}
+
+        return {'images': len(images), 'boxes': len(box_arrays.boxes),
+                'issues': {check: int(np.count_nonzero(issues[check])) for check in CHECKS}, 'fixed': fixed,
+                'removed': int(np.count_nonzero(remove)), 'problems': problems, 'excluded': excluded,
+                'skipped': len(excluded)}
+
+    def copy_tags(self, source_image_id, image_ids):
+        """
+        This function copies the tags of an image to other images of the same size (e.g. its near-duplicates).
+        :param source_image_id: image_id of the image to copy the tags of.
+        :param image_ids: image_id's of the images to copy the tags to (images of another size are skipped).
+        :return: number of tags added.
+        """
+        with self.lock:
+            source = self.images[source_image_id]
+            tags = [(tag.tag_category, tag.coordinates) for tag in source.tags.tag_dict.values()]
+            added = 0
+            for image_id in image_ids:
+                if image_id != source_image_id and image_id in self.images and \
+                        self.images[image_id].size == source.size:
+                    added += self.images[image_id].tags.add_tags(tags)
+
+        return added
+
+    def images_per_folder(self):
+        """Returns a dictionary {file_location: {file_name: image_id}} of the images in the catalog."""
+        catalog_folders = {}
+        for image_id, image in self.snapshot():
+            catalog_folders.setdefault(image.file_location, {})[image.file_name] = image_id
+        return catalog_folders
+
+    def reload_image(self, image_id):
+        """This function reloads an image that has been changed on disk (the tags are kept)."""
+        image = self.images[image_id]
+        date_object, date_string = self.extract_date(image.file_location + '/' + image.file_name)
+        with self.lock:
+            image.reload(date_object)
+            self.revision += 1
+
+    def images_added_since(self, image_id):
+        """
+        This function returns the images that have been added since image_id was the next free image_id (also while
+        another thread is still adding images).
+        :param image_id: value of self.image_id at a previous call.
+        :return: list of (image_id, image_object) tuples and the current self.image_id.
+        """
+        with self.lock:
+            added = [(i, self.images[i]) for i in range(image_id, self.image_id) if i in self.images]
+            return added, self.image_id
 
     @staticmethod
     def date_in_range(start, end, date):
@@ -194,14 +673,17 @@ class ImageCatalog:
         :param delete_from_disk: if True, it deletes the image from disk.
         :return: deleted the image object from the image catalog (and optionally from disk).
         """
-        # remove from the self.file_names list (so it can be added again if needed)
-        file_name = self.images[image_id].file_name
-        self.file_names = [i for i in self.file_names if i != file_name]
-        if delete_from_disk:
-            file_location = self.images[image_id].file_location
-            self.file_access.delete_file_from_disk(file_location + '/' + file_name)
-        del self.images[image_id]  # delete from image catalog
-        self.images_loaded -= 1  # lower number of open images
+        with self.lock:
+            # remove from the self.file_names set (so it can be added again if needed)
+            file_name = self.images[image_id].file_name
+            self.file_names.discard(file_name)
+            self.images[image_id].close()
+            if delete_from_disk:
+                file_location = self.images[image_id].file_location
+                self.file_access.delete_file_from_disk(file_location + '/' + file_name)
+            del self.images[image_id]  # delete from image catalog
+            self.images_loaded -= 1  # lower number of open images
+            self.revision += 1
 
     def save_progress(self, save_location, settings):
         """
@@ -213,42 +695,62 @@ class ImageCatalog:
         etc.
         :return: Save file and settings file have been written.
         """
-        # Write all data to a list of strings, which will then be exported to csv.
-        output_list = ['Image;Path;Date_time;Tags\n']  # create the list with an header
-        for image_id in self.images:
-            image = self.images[image_id]
-            tags = image.tags.tag_dict
-            tag_list = [(tags[i].tag_category, tags[i].coordinates) for i in tags]
-            output_list.append('{0};{1};{2};{3}\n'.format(image.file_name, image.file_location, image.date_string,
-                                                          tag_list))
+        # Write pending edits to the image files first, so the saved tags match the files:
+        self.apply_edits()
         # Create a file location with '_settings' appended to contain the tag_categories etc.
         settings_save_location = '.'.join(save_location.split('.')[:-1]) + '_settings.csv'
+        # Write all data line by line to the save file (buffered, so the whole file is not built in memory first):
+        with self.file_access.open_csv(save_location) as writer:
+            writer.write('Image;Path;Date_time;Tags;Fingerprint;Perceptual_hash;Quality\n')  # header
+            for image_id, image in self.snapshot():
+                with self.lock:
+                    tags = image.tags.tag_dict
+                    tag_list = [(tags[i].tag_category, list(tags[i].coordinates)) for i in tags]
+                perceptual_hash = '{0:016x}'.format(image.perceptual_hash) if image.perceptual_hash is not None else ''
+                quality = image.quality.to_string() if image.quality is not None else ''
+                writer.write('{0};{1};{2};{3};{4};{5};{6}\n'.format(image.file_name, image.file_location,
+                                                                    image.date_string, tag_list,
+                                                                    image.fingerprint or '', perceptual_hash, quality))
+            # Images that could not be found when the savefile was loaded are kept as they were:
+            for line in self.missing_images.values():
+                writer.write(';'.join(line) + '\n')
+        # Write the imported folders (used for rescans):
+        for root, options in self.import_roots.items():
+            settings.append('ImportRoot;{0};{1};{2};{3}\n'.format(root, options['recursive'],
+                                                               ','.join(options['include'] or []),
+                                                               ','.join(options['exclude'] or [])))
         # Write all tag_categories created to the end of the save_file:
-        for tag_category in self.tag_categories.tag_categories:
-            color = self.tag_categories.tag_categories[tag_category]
+        for tag_category in self.tag_categories:
+            color = self.tag_categories.color(tag_category)
             settings.append('TagCategory;{0};{1}\n'.format(tag_category, color))
-        # Write the output_list to csv:
-        self.file_access.write_to_csv(save_location, output_list)
         # Write the settings to csv:
         self.file_access.write_to_csv(settings_save_location, settings)
 
-    def load_savefile(self, savefile_location):
+    def load_savefile(self, savefile_location, progress=None, search_roots=None, workers=None):
         """
         This function loads a previously saved image catalog from a savefile.
-        It restores the images and their labels and loads the created TagCategories.
+        It restores the images and their labels and loads the created TagCategories. Images whose file has been moved
+        or renamed are searched for by their content fingerprint (if it was computed) in search_roots, see
+        relink_images, images that are not found are kept in missing_images.
         :param savefile_location: Absolute path to the savefile.
+        :param progress: (Optional) function called as progress(done, None) after every image.
+        :param search_roots: (Optional) list of folders to search missing images in (default: the imported folders and
+        the folders the missing images were in).
+        :param workers: number of worker processes to hash the files found with (default: number of cpu's).
         :return: loads image catalog from file
         """
         settings_save_location = '.'.join(savefile_location.split('.')[:-1]) + '_settings.csv'
-        savefile_data = self.file_access.read_csv(savefile_location, ';')
-        settings_data = self.file_access.read_csv(settings_save_location, ';')
+        # Both files are read line by line:
+        savefile_data = self.file_access.iter_csv(savefile_location, ';')
+        settings_data = self.file_access.iter_csv(settings_save_location, ';')
         # First import the settings (and the tag_categories):
         selected_image, taglinewidth, savefile_location, min_tagsize, sorting_method = None, 3, None, 0, 'file_name'
         for line in settings_data:
             if line[0] == 'TagCategory':  # restore tag_categories
                 tag_category = line[1]
                 color = line[2]
-                self.tag_categories.add_tag_category(tag_category, color)
+                with self.lock:
+                    self.tag_categories.add_tag_category(tag_category, color)
             if line[0] == 'selected_image':
                 selected_image = line[1]
             if line[0] == 'taglinewidth':
@@ -259,21 +761,35 @@ class ImageCatalog:
                 min_tagsize = int(line[1])
             if line[0] == 'sorting_method':
                 sorting_method = line[1]
+            if line[0] == 'ImportRoot' and line[1] not in self.import_roots:
+                self.import_roots[line[1]] = {'recursive': line[2] == 'True',
+                                              'include': line[3].split(',') if line[3] != '' else None,
+                                              'exclude': line[4].split(',') if line[4] != '' else None,
+                                              'folders': {}}
         # Next, import the images and their tags:
-        for line in savefile_data:
+        for done, line in enumerate(savefile_data):
             if line[0] != 'Image':  # not the header
                 file_name, file_path, date_string, tags = line[0], line[1], line[2], eval(line[3])
+                if not os.path.exists(file_path + '/' + file_name):  # moved, renamed or removed
+                    self.missing_images[file_name] = line
+                    continue
                 date_object, date_string = self.datestring_to_dateobject(date_string)
-                image_id = self.image_id
-                if file_name not in self.file_names:
-                    self.add_image(file_path, file_name, date_object)
-                    if image_id in self.images:  # check whether image object has been created
-                        for tag in tags:
-                            self.images[image_id].tags.add_tag(tag[0], tag[1])
+                with self.lock:
+                    image_id = self.image_id
+                    if file_name not in self.file_names:
+                        self.add_image(file_path, file_name, date_object)
+                        if image_id in self.images:  # check whether image object has been created
+                            self.images[image_id].tags.add_tags(tags)
+                            self.restore_image_data(self.images[image_id], line)
+            if progress is not None:
+                progress(done, None)
+        if len(self.missing_images) > 0:
+            self.relink_images(search_roots, workers)
 
         return selected_image, taglinewidth, savefile_location, min_tagsize, sorting_method
 
-    def export_tagged_images(self, save_location, tag_categories=None, remove_original=False, rename=False, csv=True):
+    def export_tagged_images(self, save_location, tag_categories=None, remove_original=False, rename=False, csv=True,
+                             progress=None, transcode=None, workers=None, lint=LintOptions()):
         """
         This function exports tagged images to the save_location.
 
@@ -295,15 +811,29 @@ class ImageCatalog:
 
         If remove_original = True, the original image file is deleted after it has been copied to a new location.
 
+        If transcode options are given, the images are written resized and/or in another format (e.g. 1024 pixels,
+        JPEG quality 90) on a process pool, with the tags rescaled accordingly, instead of being copied. The catalog
+        keeps pointing to the originals (its tags are not rescaled), so they cannot be removed (remove_original).
+
         :param save_location: The absolute path to the folder where the images should be saved (does not need to exist)
         :param tag_categories: list of tag_categories to export (optional)
         :param remove_original: True or False (default = False)
         :param rename: True or False (default = False)
         :param csv: True or False (default = True)
+        :param progress: (Optional) function called as progress(done, total) after every exported image.
+        :param transcode: (Optional) TranscodeOptions.
+        :param workers: number of worker processes used for transcoding (default: number of cpu's).
+        :param lint: LintOptions, the tags are checked (and fixed) with lint_tags before they are exported and the
+        tags failing the checks in lint.skip are left out of the csv files (None: no checks).
+        :return: dictionary with the number of images exported, and the report of lint_tags under 'lint'.
         """
+        if remove_original and transcode is not None:
+            raise ValueError('The original images cannot be removed when the export transcodes them')
         header = "filename,width,height,class,xmin,ymin,xmax,ymax\n"
         # Create the output folder (if it already exists it will skip this step):
         self.file_access.create_folder(save_location)
+        self.apply_edits()  # the image files are copied, so they have to contain the edits
+        lint_report = self.lint_tags(None, lint) if lint is not None else None
         # Loop through all images and their tags to check whether certain tag_categories contain full_image coordinates:
         tag_categories_images = self.check_for_full_image_tags()
         if tag_categories is not None:
@@ -311,6 +841,26 @@ class ImageCatalog:
                 if key not in tag_categories:  # category not in export list:
                     del tag_categories_images[key]
         # Now, all entries in tag_categories_images contain a list of image_id's that should be copied to them.
+        total, exported = sum(len(image_list) for image_list in tag_categories_images.values()), [0]
+
+        def image_exported():
+            exported[0] += 1
+            if progress is not None:
+                progress(exported[0], total)
+        with TranscodeStage(transcode, workers) if transcode is not None else nullcontext() as transcoder:
+            self.export_image_lists(tag_categories_images, save_location, header, rename, remove_original, csv,
+                                    image_exported, transcoder,
+                                    lint_report['excluded'] if lint_report is not None else None)
+
+        summary = {'images': exported[0]}
+        if lint_report is not None:
+            summary['lint'] = lint_report
+
+        return summary
+
+    def export_image_lists(self, tag_categories_images, save_location, header, rename, remove_original, csv,
+                           image_exported, transcoder, excluded=None):
+        """This function exports the images of export_tagged_images to the folder of every tag_category."""
         for tag_category in tag_categories_images:
             image_list = tag_categories_images[tag_category]
             if len(image_list) > 0:
@@ -324,7 +874,7 @@ class ImageCatalog:
                     if rename:
                         image_number = self.check_for_previously_exported(export_folder)
                     self.process_image_export_list(image_list, csv_loc, export_folder, image_number, rename,
-                                                   remove_original, csv)
+                                                   remove_original, csv, image_exported, transcoder, excluded)
                 else:  # images without full_sized tags (but with smaller tags)
                     csv_loc = save_location + '/tags.csv'
                     export_folder = save_location
@@ -333,9 +883,10 @@ class ImageCatalog:
                     if rename:
                         image_number = self.check_for_previously_exported(save_location)
                     self.process_image_export_list(image_list, csv_loc, export_folder, image_number, rename,
-                                                   remove_original, csv)
+                                                   remove_original, csv, image_exported, transcoder, excluded)
 
-    def process_image_export_list(self, image_list, csv_loc, export_folder, image_number, rename, remove_original, csv):
+    def process_image_export_list(self, image_list, csv_loc, export_folder, image_number, rename, remove_original, csv,
+                                  image_exported=None, transcoder=None, excluded=None):
         """
         This function processes an image_list (containing image_id's) which need to be exported to the same folder.
         For these images, all images are copied to that folder and their tags are appended to the tags.csv file.
@@ -347,45 +898,67 @@ class ImageCatalog:
         :param rename: True or False (rename images or not)
         :param remove_original: True or False (remove original image or not)
         :param csv: True or False (write csv or not)
+        :param image_exported: (Optional) function called without arguments after every image.
+        :param transcoder: (Optional) TranscodeStage, the images are written resized / re-encoded on its process pool
+        instead of copied (the catalog keeps pointing to the originals) and the tags in the csv are rescaled.
+        :param excluded: (Optional) set of (image_id, tag_id) of tags to leave out of the csv (see lint_tags).
         :return: files have been exported.
         """
-        for image_id in image_list:
-            image = self.images[image_id]
-            absolute_path = image.file_location + '/' + image.file_name
-            if rename and image_number is not None:
-                file_extension = image.file_name.split('.')[-1]
-                file_name = str(image_number) + '.' + file_extension
-                export_path = export_folder + '/' + file_name
-                # Update the image_catalog for this image:
-                image.file_location = export_folder
-                image.file_name = file_name
-                self.images[image_id] = image
-                # Increment image number:
-                image_number += 1
-            else:
-                export_path = export_folder + '/' + image.file_name
-                file_name = image.file_name
-            # copy the file to the proper location:
-            self.file_access.copy_file(absolute_path, export_path)
+        csv_writer = self.file_access.open_csv(csv_loc, 'a') if csv else None
+
+        def image_written(record, absolute_path):
             if remove_original:
                 self.file_access.delete_file_from_disk(absolute_path)
             if csv:
-                # Get all the tags for the image to export to csv:
-                tags_to_csv = []
-                tags = [(image.tags.tag_dict[i].tag_category, image.tags.tag_dict[i].coordinates) for i in
-                        image.tags.tag_dict]
-                for tag in tags:
-                    tag_category = tag[0]
-                    tag_coords = tag[1]
-                    full_image_coords = [0, 0, image.size[0], image.size[1]]
-                    if tag_coords != full_image_coords:  # don't export full image tags
-                        csv_string = "{0},{1},{2},{3},{4},{5},{6},{7}\n".format(file_name, image.size[0], image.size[1],
-                                                                                tag_category, tag_coords[0],
-                                                                                tag_coords[1], tag_coords[2],
-                                                                                tag_coords[3])
-                        tags_to_csv.append(csv_string)
-                # append them to the csv file:
-                self.file_access.write_to_csv(csv_loc, tags_to_csv, 'a')
+                # append the tags to the csv file:
+                csv_writer.write_lines(["{0},{1},{2},{3},{4},{5},{6},{7}\n".format(
+                    record.file_name, record.width, record.height, tag_category, tag_coords[0], tag_coords[1],
+                    tag_coords[2], tag_coords[3]) for tag_category, tag_coords in record.boxes])
+            if image_exported is not None:
+                image_exported()
+
+        try:
+            originals = deque()  # absolute paths of the images queued on the transcoder
+            for image_id in image_list:
+                image = self.images[image_id]
+                absolute_path = image.file_location + '/' + image.file_name
+                # Get all the tags for the image to export to csv (full image tags are not exported):
+                full_image_coords = (0, 0, image.size[0], image.size[1])
+                with self.lock:
+                    tags = [(tag.tag_category, list(tag.coordinates)) for tag_id, tag in image.tags.tag_dict.items()
+                            if tag.coordinates != full_image_coords and
+                            not (excluded and (image_id, tag_id) in excluded)]
+                record = ExportRecord(image.file_location, image.file_name, image.size[0], image.size[1], tags)
+                if rename and image_number is not None:
+                    file_extension = image.file_name.split('.')[-1]
+                    file_name = str(image_number) + '.' + file_extension
+                    # Increment image number:
+                    image_number += 1
+                else:
+                    file_name = image.file_name
+                if transcoder is not None:
+                    originals.append(absolute_path)
+                    for written in transcoder.submit(record, export_folder, file_name):
+                        image_written(written, originals.popleft())
+                    continue
+                export_path = export_folder + '/' + file_name
+                if file_name != image.file_name:
+                    # Update the image_catalog for this image:
+                    with self.lock:
+                        self.file_names.discard(image.file_name)
+                        self.file_names.add(file_name)
+                        image.file_location = export_folder
+                        image.file_name = file_name
+                        self.revision += 1
+                # copy the file to the proper location:
+                self.file_access.copy_file(absolute_path, export_path)
+                image_written(record._replace(file_name=file_name), absolute_path)
+            if transcoder is not None:
+                for written in transcoder.drain():
+                    image_written(written, originals.popleft())
+        finally:
+            if csv_writer is not None:
+                csv_writer.close()
 
     def check_for_previously_exported(self, location):
         """
@@ -413,19 +986,18 @@ class ImageCatalog:
         """
         tag_categories_images = {}  # dictionary to save whether tag_categories are full_sized or not
         # First, set an empty list for all tag_categories:
-        for tag_category in self.tag_categories.tag_categories:
-            tag_categories_images[tag_category] = []
+        with self.lock:  # (the categories can be changed on another thread meanwhile)
+            for tag_category in self.tag_categories:
+                tag_categories_images[tag_category] = []
         # Add a no_full_size category to store the image_id's of the images that do have tags but no full_size tags:
         tag_categories_images['no_full_size'] = []
         # Next, loop through the images and add their image_id to the list of the tag_category if it has that
-        # tag_category full_size tag:
-        for image_id in self.images:
-            image = self.images[image_id]
-            full_size_list = self.extract_full_image_tags(image)
+        # tag_category full_size tag (categories added since are added to the dictionary as well):
+        for image_id, image in self.snapshot():
+            with self.lock:
+                full_size_list = self.extract_full_image_tags(image)
             for category in full_size_list:
-                image_list = tag_categories_images[category]
-                image_list.append(image_id)
-                tag_categories_images[category] = image_list
+                tag_categories_images.setdefault(category, []).append(image_id)
 
         return tag_categories_images
 
@@ -441,7 +1013,7 @@ class ImageCatalog:
         if len(tags) > 0:
             full_sized = False
             for tag in tags:
-                if tag[1] == [0, 0, image.size[0], image.size[1]]:
+                if tag[1] == (0, 0, image.size[0], image.size[1]):
                     full_image_tags.append(tag[0])
                     full_sized = True
             if not full_sized:  # tags are present but no full_sized ones
@@ -470,6 +1042,417 @@ class ImageCatalog:
                     if delete:
                         self.images[image_id].tags.remove_tag(tag[0])  # remove the tag
                     elif replace and replace_category is not None:
-                        self.images[image_id].tags.tag_dict[tag[0]].tag_category = replace_category  # replace category
+                        self.images[image_id].tags.modify_tag(tag[0], replace_category)  # replace category
         if not delete:
             return count
+
+    def rename_tag_category(self, tag_category, new_tag_category):
+        """
+        This function renames a tag_category. The category keeps its id, so the tags themselves are not changed (and
+        the indexes stay valid). If new_tag_category exists already, the tags of tag_category are moved to it and
+        tag_category is removed.
+        :param tag_category: tag_category to rename.
+        :param new_tag_category: its new name.
+        :return: number of tags of tag_category.
+        """
+        with self.lock:  # (exports and imports read the categories on their worker threads)
+            if new_tag_category == tag_category:  # (nothing to rename, and not a merge into itself)
+                return self.extract_entries_for_tag_category(tag_category)
+            if new_tag_category in self.tag_categories:
+                count = self.extract_entries_for_tag_category(tag_category, False, True, new_tag_category)
+                self.tag_categories.remove_tag_category(tag_category)
+                return count
+            count = self.extract_entries_for_tag_category(tag_category)
+            self.tag_categories.rename_tag_category(tag_category, new_tag_category)
+            return count
+
+    def query(self, min_quality=None, exclude_worst_quality=None, **criteria):
+        """
+        This function selects the images matching the criteria using the catalog indexes (see CatalogIndex.query for
+        the criteria), e.g. catalog.query(categories=['cat'], start='2019:01:01', box_smaller_than=32 * 32).
+        Images can also be selected on their quality score (see compute_quality), images that have not been analysed
+        are kept:
+        :param min_quality: (Optional) images with a quality score of at least this (0-1).
+        :param exclude_worst_quality: (Optional) fraction of the analysed images with the lowest quality scores to
+        leave out, e.g. 0.1 for the worst 10% of the catalog.
+        :return: list of image_id's sorted on the date taken.
+        """
+        with instrument.span('catalog.query'):
+            image_ids = self.index.query(**criteria)
+            if min_quality is None and exclude_worst_quality is None:
+                return image_ids
+            threshold = min_quality if min_quality is not None else -math.inf
+            if exclude_worst_quality is not None:
+                scores = [image.quality.score for image_id, image in self.snapshot() if image.quality is not None]
+                threshold = max(threshold, worst_threshold(scores, exclude_worst_quality))
+            images = self.images
+            return [image_id for image_id in image_ids if image_id in images and
+                    (images[image_id].quality is None or images[image_id].quality.score >= threshold)]
+
+    def compute_quality(self, image_ids=None, workers=None, progress=None):
+        """
+        This function computes the QualityScores (sharpness, exposure, entropy, see quality.py) of the images that do
+        not have them yet on a process pool, from images decoded at a reduced size. They are saved in the savefile.
+        :param image_ids: (Optional) the image_id's to analyse, default all images.
+        :param workers: number of worker processes (default: number of cpu's).
+        :param progress: (Optional) function called as progress(done, total).
+        :return: number of images analysed.
+        """
+        if image_ids is None:
+            images = self.snapshot()
+        else:
+            with self.lock:
+                images = [(i, self.images[i]) for i in image_ids if i in self.images]
+        images = [image for image_id, image in images if image.quality is None]
+        locations = [image.file_location + '/' + image.file_name for image in images]
+        computed = 0
+        with instrument.span('catalog.compute_quality'):
+            for image, (location, scores) in zip(images, compute_quality(locations, workers, progress)):
+                if scores is not None:
+                    image.quality = scores
+                    computed += 1
+
+        return computed
+
+    def iterate_export_records(self, min_tagsize=0, image_ids=None, excluded=None):
+        """
+        This function loops once through the image catalog and yields an ExportRecord for every image, containing
+        the tags with an area larger than min_tagsize.
+        :param min_tagsize: minimum area of a tag to be exported.
+        :param image_ids: (Optional) the image_id's to export (e.g. the result of query), default all images.
+        :param excluded: (Optional) set of (image_id, tag_id) of tags to leave out (see lint_tags).
+        :return: generator of ExportRecord's.
+        """
+        if image_ids is None:
+            images = self.snapshot()
+        else:
+            with self.lock:
+                images = [(i, self.images[i]) for i in image_ids if i in self.images]
+        for image_id, image in images:
+            boxes = []
+            with self.lock:
+                for tag_id, tag in image.tags.tag_dict.items():
+                    if excluded and (image_id, tag_id) in excluded:
+                        continue
+                    tag_coords = tag.coordinates
+                    tagsize = (tag_coords[2] - tag_coords[0]) * (tag_coords[3] - tag_coords[1])
+                    if tagsize > min_tagsize:  # tag area is larger than minimum size
+                        boxes.append((tag.tag_category, tag_coords))
+            yield ExportRecord(image.file_location, image.file_name, image.size[0], image.size[1], boxes)
+
+    def merge_savefiles(self, savefile_locations, progress=None):
+        """
+        This function merges the images and tags of one or more savefiles into the catalog. Images are matched on
+        their file_name: tags of images that are already present are added to the existing image (tags that are
+        already present are not added twice), other images are added to the catalog. The tag_categories (and their
+        colors) of the savefiles are added as well.
+        :param savefile_locations: list of absolute paths to savefiles.
+        :param progress: (Optional) function called as progress(done, None) after every image.
+        :return: dictionary with the number of images added, tags added and tags skipped.
+        """
+        for savefile_location in savefile_locations:
+            settings_save_location = '.'.join(savefile_location.split('.')[:-1]) + '_settings.csv'
+            for line in self.file_access.iter_csv(settings_save_location, ';'):
+                if line[0] == 'TagCategory':
+                    with self.lock:
+                        self.tag_categories.add_tag_category(line[1], line[2])
+        summary = {'images_added': 0, 'tags_added': 0, 'tags_skipped': 0}
+        image_ids = {image.file_name: image_id for image_id, image in self.snapshot()}
+        done = 0
+        for savefile_location in savefile_locations:
+            for line in self.file_access.iter_csv(savefile_location, ';'):
+                if line[0] == 'Image':  # header
+                    continue
+                file_name, file_path, date_string, tags = line[0], line[1], line[2], eval(line[3])
+                if file_name not in image_ids and self.file_access.file_exists(file_path + '/' + file_name) and \
+                        self.image_id <= self.ulimit:
+                    date_object, date_string = self.datestring_to_dateobject(date_string)
+                    with self.lock:
+                        image_ids[file_name] = self.image_id
+                        self.add_image(file_path, file_name, date_object)
+                        if image_ids[file_name] in self.images:
+                            self.restore_image_data(self.images[image_ids[file_name]], line)
+                    summary['images_added'] += 1
+                if file_name in image_ids:
+                    with self.lock:
+                        summary['tags_added'] += self.images[image_ids[file_name]].tags.add_tags(tags)
+                else:
+                    summary['tags_skipped'] += len(tags)
+                done += 1
+                if progress is not None:
+                    progress(done, None)
+
+        return summary
+
+    def merge_annotators(self, savefile_locations, options=MergeOptions(), progress=None):
+        """
+        This function merges the savefiles of several annotators of the same images. The images are joined on their
+        file_name, the boxes of the annotators of an image are matched on their IoU (boxes of the same tag_category)
+        and merged by the rule of options (see annotator_merge.RULES). The objects the annotators disagree on (not
+        tagged by every annotator of the image) are reported for review. The merged tags are added to the catalog as
+        merge_savefiles does: images that are not in the catalog yet are added (if their file exists).
+        :param savefile_locations: list of absolute paths to savefiles, one per annotator (named after the savefile,
+        see annotator_merge.annotator_names).
+        :param options: MergeOptions.
+        :param progress: (Optional) function called as progress(done, None) after every image of a savefile.
+        :return: dictionary with the numbers of images, tags, objects, disagreements, images and tags added, and the
+        disagreements as a list of (file_name, tag_category, coordinates, annotators, kept) tuples under 'review'.
+        """
+        annotators = annotator_names(savefile_locations)
+        if len(annotators) > MAX_ANNOTATORS:
+            raise ValueError('At most {0} savefiles can be merged at once'.format(MAX_ANNOTATORS))
+        preferred = 0
+        if options.rule == 'prefer':
+            preferred = preferred_annotator(annotators, savefile_locations, options.prefer)
+        for savefile_location in savefile_locations:
+            settings_save_location = '.'.join(savefile_location.split('.')[:-1]) + '_settings.csv'
+            for line in self.file_access.iter_csv(settings_save_location, ';'):
+                if line[0] == 'TagCategory':
+                    with self.lock:
+                        self.tag_categories.add_tag_category(line[1], line[2])
+        with self.lock:
+            image_ids = {image.file_name: image_id for image_id, image in self.images.items()}
+        # Hash join of the images on their file_name, the tags of all savefiles are collected in flat lists:
+        joined, lines = {}, []  # {file_name: index}, the savefile line of every image of which the file is found
+        line_images, line_annotators, tag_counts, tag_categories, coordinates = [], [], [], [], []
+        done = 0
+        for annotator, savefile_location in enumerate(savefile_locations):
+            for line in self.file_access.iter_csv(savefile_location, ';'):
+                if line[0] == 'Image':  # header
+                    continue
+                index = joined.setdefault(line[0], len(lines))
+                if index == len(lines):
+                    lines.append(None)
+                if lines[index] is None and (line[0] in image_ids or
+                                             self.file_access.file_exists(line[1] + '/' + line[0])):
+                    lines[index] = line
+                line_categories, line_coordinates = split_tags(line[3])
+                line_images.append(index)
+                line_annotators.append(annotator)
+                tag_counts.append(len(line_categories))
+                tag_categories.extend(line_categories)
+                coordinates.extend(line_coordinates)
+                done += 1
+                if progress is not None:
+                    progress(done, None)
+        file_names = list(joined)
+        presence = np.zeros((len(lines), len(annotators)), bool)
+        presence[line_images, line_annotators] = True
+        category_names = sorted(set(tag_categories))
+        codes = {tag_category: code for code, tag_category in enumerate(category_names)}
+        category_ids = np.fromiter(map(codes.__getitem__, tag_categories), np.int64, len(tag_categories))
+        image_index = np.repeat(np.array(line_images, np.int64), tag_counts)
+        annotator_index = np.repeat(np.array(line_annotators, np.int64), tag_counts)
+        boxes = np.array(coordinates, dtype=float).reshape(-1, 4)
+        # The tags of images of which the file is not found are skipped:
+        found = np.array([line is not None for line in lines], bool)
+        keep = found[image_index]
+        merged = resolve(image_index[keep], annotator_index[keep], category_ids[keep], boxes[keep], presence,
+                         options, preferred)
+        summary = {'rule': options.rule, 'annotators': annotators, 'images': int(found.sum()), 'boxes': int(keep.sum()),
+                   'objects': len(merged['kept']), 'disagreements': int(merged['disagree'].sum()), 'images_added': 0,
+                   'tags_added': 0, 'objects_dropped': int((~merged['kept']).sum()),
+                   'tags_skipped': int((~keep).sum())}
+        for line in lines:
+            if line is not None and line[0] not in image_ids and self.image_id <= self.ulimit:
+                date_object, date_string = self.datestring_to_dateobject(line[2])
+                with self.lock:
+                    image_ids[line[0]] = self.image_id
+                    self.add_image(line[1], line[0], date_object)
+                    if image_ids[line[0]] in self.images:
+                        self.restore_image_data(self.images[image_ids[line[0]]], line)
+                summary['images_added'] += 1
+        # Add the kept objects image by image:
+        kept = np.flatnonzero(merged['kept'])
+        kept = kept[np.argsort(merged['images'][kept], kind='stable')]
+        kept_images = merged['images'][kept]
+        kept_categories = [category_names[code] for code in merged['category_ids'][kept].tolist()]
+        kept_boxes = merged['boxes'][kept].tolist()
+        starts = np.flatnonzero(np.diff(kept_images, prepend=-1)).tolist() + [len(kept)]
+        for start, end in zip(starts[:-1], starts[1:]):
+            image_id = image_ids.get(file_names[kept_images[start]])
+            if image_id is None or image_id not in self.images:  # (the ulimit has been reached)
+                summary['tags_skipped'] += end - start
+                continue
+            with self.lock:
+                summary['tags_added'] += self.images[image_id].tags.add_tags(
+                    list(zip(kept_categories[start:end], kept_boxes[start:end])))
+        # The disagreements, ordered by image:
+        disagree = np.flatnonzero(merged['disagree'])
+        disagree = disagree[np.argsort(merged['images'][disagree], kind='stable')]
+        summary['review_images'] = len(np.unique(merged['images'][disagree]))
+        summary['review'] = [(file_names[image], category_names[code], tuple(box),
+                              [name for bit, name in enumerate(annotators) if bits >> bit & 1], is_kept)
+                             for image, code, box, bits, is_kept in zip(merged['images'][disagree].tolist(),
+                                                                        merged['category_ids'][disagree].tolist(),
+                                                                        merged['boxes'][disagree].tolist(),
+                                                                        merged['annotators'][disagree].tolist(),
+                                                                        merged['kept'][disagree].tolist())]
+
+        return summary
+
+    def export_annotations(self, exports, min_tagsize=0, progress=None, image_ids=None, transcode=None,
+                           images_location=None, workers=None, chips=None, decoded_cache=None, lint=LintOptions()):
+        """
+        This function exports the tags to one or more annotation formats in a single pass over the catalog.
+        Every image is handed to all exporters before moving on to the next one, so the formats are written
+        simultaneously with bounded memory. Images without (large enough) tags are not exported.
+        :param exports: list of (format, save_location, options) tuples, e.g.
+        [('csv', '/data/tags.csv', {}), ('coco', '/data/annotations.json', {}), ('voc', '/data/Annotations', {}),
+         ('tfrecord', '/data/tfrecord', {'label_map_location': '/data/labels.pbtxt', 'num_shards': 10})]
+        Available formats are listed in exporters.EXPORTERS.
+        :param min_tagsize: minimum area of a tag to be exported.
+        :param progress: (Optional) function called as progress(done, total) after every image.
+        :param image_ids: (Optional) the image_id's to export (e.g. the result of query), default all images.
+        :param transcode: (Optional) TranscodeOptions, the tagged images are written resized / re-encoded to
+        images_location on a process pool and the annotations refer to these copies (with rescaled boxes).
+        :param images_location: folder to write the transcoded images or chips to (required with transcode or chips).
+        :param workers: number of worker processes used for transcoding or chipping (default: number of cpu's).
+        :param chips: (Optional) ChipOptions, the images are cut into overlapping chips of a fixed size (large TIFF
+        files region by region) written to images_location, and the annotations refer to the chips (with the boxes
+        clipped to them). Cannot be combined with transcode.
+        :param decoded_cache: (Optional) folder of a DecodedCache, images in it are read from the cache instead of
+        decoded when transcoding, chipping or cropping.
+        :param lint: LintOptions, the tags are checked (and fixed) with lint_tags before they are exported and the
+        tags failing the checks in lint.skip are left out (None: no checks).
+        :return: dictionary {format: summary dictionary} with the number of images and boxes written per format, and
+        the report of lint_tags under 'lint'.
+        """
+        if (transcode is not None or chips is not None) and images_location is None:
+            raise ValueError('images_location is required to transcode or chip the images')
+        if transcode is not None and chips is not None:
+            raise ValueError('Images cannot be transcoded and chipped in the same export')
+        total = len(self.images) if image_ids is None else len(image_ids)
+        self.apply_edits(image_ids)  # exporters read the image files
+        lint_report = self.lint_tags(image_ids, lint) if lint is not None else None
+        exporters = []
+        transcoder = TranscodeStage(transcode, workers, cache_location=decoded_cache) if transcode is not None else None
+        chipper = ChipStage(chips, workers, cache_location=decoded_cache) if chips is not None else None
+        try:
+            for export_format, save_location, options in exports:
+                if decoded_cache is not None:
+                    options = dict(options, cache_location=decoded_cache)
+                exporters.append((export_format, create_exporter(export_format, save_location, **options)))
+            records = self.iterate_export_records(min_tagsize, image_ids,
+                                                  lint_report['excluded'] if lint_report is not None else None)
+            if transcoder is not None:
+                records = transcoder.map(records, images_location)
+            if chipper is not None:
+                batches = chipper.map(records, images_location)  # the chips of every image
+            else:
+                batches = ([record] for record in records)
+            for done, batch in enumerate(batches, 1):
+                for record in batch:
+                    for _, exporter in exporters:
+                        exporter.write_image(record)
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            if transcoder is not None:
+                transcoder.close()
+            if chipper is not None:
+                chipper.close()
+            for _, exporter in exporters:
+                exporter.close()
+
+        summary = {export_format: exporter.summary() for export_format, exporter in exporters}
+        if lint_report is not None:
+            summary['lint'] = lint_report
+
+        return summary
+
+    def export_tfrecord(self, save_location, label_map_location, num_shards=10, min_tagsize=0, workers=None,
+                        image_ids=None, lint=LintOptions()):
+        """
+        This function exports all images with tags and their bounding boxes in a single pass to num_shards TFRecord
+        files (tf.train.Example, tensorflow object detection layout) in save_location. The tag_categories are mapped to
+        ids using the label map (.pbtxt). Tags with an area <= min_tagsize or a tag_category not present in the label
+        map are skipped. The Examples are encoded in parallel on worker processes.
+        :param save_location: The absolute path to the folder to write the shards to (does not need to exist).
+        :param label_map_location: Absolute path to the .pbtxt label map.
+        :param num_shards: number of TFRecord files to spread the Examples over.
+        :param min_tagsize: minimum area of a tag to be exported.
+        :param workers: number of worker processes (default: number of cpu's).
+        :param image_ids: (Optional) the image_id's to export, default all images.
+        :param lint: LintOptions, the tags are checked (and fixed) before they are exported and the tags failing the
+        checks in lint.skip are left out (None: no checks), see export_annotations.
+        :return: (number of boxes written, number of boxes skipped because their tag_category is not in the label map)
+        """
+        options = {'label_map_location': label_map_location, 'num_shards': num_shards, 'workers': workers}
+        summary = self.export_annotations([('tfrecord', save_location, options)], min_tagsize,
+                                          image_ids=image_ids, lint=lint)['tfrecord']
+
+        return summary['boxes'], summary['skipped']
+
+    def bulk_insert(self, records, image_folder=None, progress=None):
+        """
+        This function adds the tags of a stream of ImportRecord's to the images in the catalog. The link between
+        file_name and image_id is created once, and the keys of the tags of an image are kept between records, so the
+        duplicate check stays a single set lookup per box and large annotation sets can be inserted quickly. Records
+        for images that are not in the catalog are added as new images if image_folder is given and the image file is
+        present there (or if the record contains the encoded image, in which case it is written to image_folder
+        first, in the sub-folders of its file_name if it has them). Otherwise their tags are skipped, as are the tags of
+        records with a file_name outside image_folder. Images are known by their file_name without folders (e.g. the
+        tags of sub/a.jpg are added to the image a.jpg of the catalog, wherever it is).
+        :param records: iterable of ImportRecord's.
+        :param image_folder: Absolute path to the folder containing the images (optional).
+        :param progress: (Optional) function called as progress(done, None) after every record.
+        :return: dictionary with the number of images added, tags added and tags skipped.
+        """
+        summary = {'images_added': 0, 'tags_added': 0, 'tags_skipped': 0}
+        image_ids = {image.file_name: image_id for image_id, image in self.snapshot()}
+        # The keys of the tags of the images inserted into, with the revision of their tags they are valid for (the
+        # importers can yield one box per record, the keys are not built again for every box):
+        present = {}
+        for done, record in enumerate(records, 1):
+            if progress is not None:
+                progress(done, None)
+            file_name = record.file_name
+            image_id = image_ids.get(os.path.basename(file_name))
+            # (file names that would leave image_folder, e.g. '../x.jpg' or absolute paths, are not used)
+            relative_name = os.path.normpath(file_name)
+            if image_id is None and image_folder is not None and not os.path.isabs(relative_name) and \
+                    relative_name.split(os.sep)[0] != '..':
+                file_location = os.path.join(image_folder, relative_name)
+                if not self.file_access.file_exists(file_location) and record.image_data is not None:
+                    os.makedirs(os.path.dirname(file_location), exist_ok=True)
+                    with open(file_location, 'wb') as handle:
+                        handle.write(record.image_data)
+                if self.file_access.file_exists(file_location):
+                    file_path = os.path.dirname(file_location)
+                    date_object, date_string = self.extract_date(file_location)
+                    with self.lock:
+                        # (not when an image with the same file_name has been added meanwhile, e.g. by another thread)
+                        if self.image_id <= self.ulimit and os.path.basename(file_location) not in self.file_names:
+                            image_id = self.image_id
+                            self.add_image(file_path, os.path.basename(file_location), date_object)
+                            image_ids[os.path.basename(file_location)] = image_id
+                            summary['images_added'] += 1
+            if image_id is None:
+                summary['tags_skipped'] += len(record.boxes)
+            else:
+                with self.lock:
+                    tags = self.images[image_id].tags
+                    revision, keys = present.get(image_id, (None, None))
+                    if revision != tags.revision:  # (first insert, or the tags have been changed in between)
+                        keys = tags.keys()
+                    summary['tags_added'] += tags.add_tags(record.boxes, keys)
+                    present[image_id] = (tags.revision, keys)
+
+        return summary
+
+    def import_annotations(self, import_format, location, image_folder=None, progress=None, **options):
+        """
+        This function imports annotations from a csv tag file, a COCO json file, a folder of Pascal VOC xml files or
+        TFRecord files (see importers.IMPORTERS) and streams them into the catalog using bulk_insert.
+        :param import_format: 'csv', 'coco', 'voc' or 'tfrecord'
+        :param location: Absolute path to the annotation file (or folder for voc/tfrecord).
+        :param image_folder: Absolute path to the folder with the images, used to add images that are not yet in the
+        catalog (optional).
+        :param progress: (Optional) function called as progress(done, None) after every record.
+        :param options: importer specific options (e.g. workers).
+        :return: dictionary with the number of images added, tags added and tags skipped.
+        """
+        importer = create_importer(import_format, location, **options)
+
+        return self.bulk_insert(importer.records(), image_folder, progress)
@@ -0,0 +1,205 @@
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+# Picture tools modules:
+from data_access import FileAccess
+from parallel import BoundedPool
+from tfrecord import ExampleCodec, read_tfrecord
+
+# One image (or part of the tags of one image) as it is produced by the importers. boxes is a list of
+# (tag_category, [xmin, ymin, xmax, ymax]). width/height are None if the source does not provide them. image_data can
+# hold the encoded image if the annotation source embeds it (TFRecord).
+ImportRecord = namedtuple('ImportRecord', ['file_name', 'width', 'height', 'boxes', 'image_data'])
+
+
+def iter_json_arrays(filename, keys, chunk_size=1024 * 1024):
+    """
+    This function parses a json file that contains a single object iteratively and yields the items of the top-level
+    arrays named in keys one at a time, as (key, item). Other top-level values are skipped; arrays are skipped item by
+    item, so memory use is bounded by the largest single item instead of by the file size.
+    :param filename: Absolute path to the json file.
+    :param keys: collection of top-level keys of which the array items should be returned.
+    :param chunk_size: number of characters to read at a time.
+    :return: generator of (key, item) tuples.
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, 'r') as handle:
+        state = {'buffer': '', 'pos': 0, 'eof': False}
+
+        def fill():
+            if state['pos'] > chunk_size:  # drop the consumed part of the buffer
+                state['buffer'] = state['buffer'][state['pos']:]
+                state['pos'] = 0
+            chunk = handle.read(chunk_size)
+            state['eof'] = chunk == ''
+            state['buffer'] += chunk
+            return not state['eof']
+
+        def peek():
+            while True:
+                buffer, pos = state['buffer'], state['pos']
+                while pos < len(buffer) and buffer[pos] in ' \t\n\r':
+                    pos += 1
+                state['pos'] = pos
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not fill():
+                    raise ValueError('Unexpected end of json file: {0}'.format(filename))
+
+        def expect(character):
+            if peek() != character:
+                raise ValueError('Expected "{0}" in json file: {1}'.format(character, filename))
+            state['pos'] += 1
+
+        def decode():
+            peek()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(state['buffer'], state['pos'])
+                    if end < len(state['buffer']) or state['eof']:  # a number could continue in the next chunk
+                        state['pos'] = end
+                        return value
+                except json.JSONDecodeError:
+                    if state['eof']:
+                        raise
+                fill()
+
+        expect('{')
+        while peek() != '}':
+            key = decode()
+            expect(':')
+            if peek() == '[':
+                state['pos'] += 1
+                while peek() != ']':
+                    item = decode()
+                    if key in keys:
+                        yield key, item
+                    if peek() == ',':
+                        state['pos'] += 1
+                state['pos'] += 1
+            else:
+                decode()
+            if peek() == ',':
+                state['pos'] += 1
+
+
+class CsvImporter:
+    """Reads the comma-delimited tag file written by export_tags (filename,width,height,class,xmin,ymin,xmax,ymax)."""
+
+    def __init__(self, location, **options):
+        self.location = location
+        self.options = options
+
+    def records(self):
+        for line in FileAccess.iter_csv(self.location, ','):
+            if len(line) >= 8 and line[0] != 'filename':
+                coords = [int(line[4]), int(line[5]), int(line[6]), int(line[7])]
+                yield ImportRecord(line[0], int(line[1]), int(line[2]), [(line[3], coords)], None)
+
+
+class CocoImporter:
+    """
+    Reads a COCO detection json in two streaming passes: the first collects the categories and images, the second
+    yields the annotations one at a time, so the annotation list is never held in memory.
+    """
+
+    def __init__(self, location, **options):
+        self.location = location
+        self.options = options
+
+    def records(self):
+        categories, images = {}, {}
+        for key, item in iter_json_arrays(self.location, ('categories', 'images')):
+            if key == 'categories':
+                categories[item['id']] = item['name']
+            else:
+                images[item['id']] = (item['file_name'], item.get('width'), item.get('height'))
+        for _, item in iter_json_arrays(self.location, ('annotations',)):
+            if item['image_id'] in images and item['category_id'] in categories:
+                file_name, width, height = images[item['image_id']]
+                x, y, w, h = item['bbox']
+                coords = [int(round(x)), int(round(y)), int(round(x + w)), int(round(y + h))]
+                yield ImportRecord(file_name, width, height, [(categories[item['category_id']], coords)], None)
+
+
+def parse_voc_annotation(filename):
+    """
+    This function parses a single Pascal VOC xml file. It runs in the worker processes of the VocImporter.
+    :param filename: Absolute path to the xml file.
+    :return: ImportRecord
+    """
+    root = ElementTree.parse(filename).getroot()
+    width, height = None, None
+    if root.find('size') is not None:
+        width, height = int(float(root.findtext('size/width'))), int(float(root.findtext('size/height')))
+    boxes = []
+    for tag in root.iter('object'):
+        box = tag.find('bndbox')
+        coords = [int(round(float(box.findtext(name)))) for name in ['xmin', 'ymin', 'xmax', 'ymax']]
+        boxes.append((tag.findtext('name'), coords))
+    return ImportRecord(root.findtext('filename'), width, height, boxes, None)
+
+
+class VocImporter:
+    """Reads a folder of Pascal VOC xml files, parsing them in parallel on a process pool."""
+
+    def __init__(self, location, **options):
+        self.location = location
+        self.options = options
+
+    def records(self):
+        filenames = (entry.path for entry in os.scandir(self.location)
+                     if entry.is_file() and entry.name.lower().endswith('.xml'))
+        with BoundedPool(self.options.get('workers')) as pool:
+            for record in pool.map(parse_voc_annotation, filenames):
+                yield record
+
+
+class TFRecordImporter:
+    """
+    Reads tf.train.Example records in the tensorflow object detection layout from a .tfrecord file or from all
+    .tfrecord files in a folder. The encoded image is passed along so it can be written to disk if it is missing.
+    """
+
+    def __init__(self, location, **options):
+        self.location = location
+        self.options = options
+
+    def records(self):
+        if os.path.isdir(self.location):
+            filenames = sorted(entry.path for entry in os.scandir(self.location) if '.tfrecord' in entry.name)
+        else:
+            filenames = [self.location]
+        for filename in filenames:
+            for record in read_tfrecord(filename):
+                features = ExampleCodec.decode_example(record)
+                width, height = features['image/width'][0], features['image/height'][0]
+                boxes = []
+                for i, tag_category in enumerate(features.get('image/object/class/text', [])):
+                    coords = [int(round(features['image/object/bbox/xmin'][i] * width)),
+                              int(round(features['image/object/bbox/ymin'][i] * height)),
+                              int(round(features['image/object/bbox/xmax'][i] * width)),
+                              int(round(features['image/object/bbox/ymax'][i] * height))]
+                    boxes.append((tag_category.decode('utf-8'), coords))
+                image_data = features.get('image/encoded', [None])[0]
+                yield ImportRecord(features['image/filename'][0].decode('utf-8'), width, height, boxes, image_data)
+
+
+IMPORTERS = {'csv': CsvImporter, 'coco': CocoImporter, 'voc': VocImporter, 'tfrecord': TFRecordImporter}
+
+
+def register_importer(name, importer_class):
+    """
+    This function makes an importer available under name, so it can be requested from
+    ImageCatalog.import_annotations. An importer is constructed with (location, **options) and provides records().
+    """
+    IMPORTERS[name] = importer_class
+
+
+def create_importer(name, location, **options):
+    """Returns a new importer for the format name reading from location."""
+    if name not in IMPORTERS:
+        raise ValueError('Unknown import format: {0}'.format(name))
+    return IMPORTERS[name](location, **options)
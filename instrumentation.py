@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+class _NoSpan:
+    """Context manager that does nothing, returned by Instrumentation.span() while instrumentation is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+
+    __slots__ = ('instrumentation', 'name', 'start')
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.instrumentation.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """
+    Lightweight timing spans and counters for the hot paths of picture tools. While disabled (the default), span()
+    returns a shared no-op context manager and count() returns immediately, so the instrumentation can stay in the
+    code permanently. The durations of the last `window` calls of every span are kept for rolling statistics.
+    Usage:
+        with instrument.span('decode'):
+            pil_image.load()
+        instrument.count('images_added')
+    """
+
+    def __init__(self, window=500):
+        self.enabled = False
+        self.window = window
+        self.lock = threading.Lock()
+        self.durations = {}  # span name: deque with the last `window` durations (seconds)
+        self.totals = {}  # span name: [number of calls, total duration]
+        self.counters = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.durations, self.totals, self.counters = {}, {}, {}
+
+    def span(self, name):
+        """Returns a context manager that records the time spent in the with-block under name."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def record(self, name, duration):
+        """Records a duration (seconds) for the span name."""
+        with self.lock:
+            if name not in self.durations:
+                self.durations[name] = deque(maxlen=self.window)
+                self.totals[name] = [0, 0.0]
+            self.durations[name].append(duration)
+            self.totals[name][0] += 1
+            self.totals[name][1] += duration
+
+    def count(self, name, amount=1):
+        """Increments the counter name by amount."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def stats(self):
+        """
+        This function summarizes the spans and counters.
+        :return: dictionary {'spans': {name: {count, total, mean, last, p50, p95, max}}, 'counters': {name: value}},
+        where last, p50, p95 and max are taken over the rolling window (durations in milliseconds).
+        """
+        with self.lock:
+            spans = {}
+            for name, durations in self.durations.items():
+                ordered = sorted(durations)
+                count, total = self.totals[name]
+                spans[name] = {'count': count, 'total': total * 1000, 'mean': total / count * 1000,
+                               'last': durations[-1] * 1000, 'p50': ordered[len(ordered) // 2] * 1000,
+                               'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                               'max': ordered[-1] * 1000}
+            return {'spans': spans, 'counters': dict(self.counters)}
+
+    def format_stats(self):
+        """Returns the statistics as a text table (used by the statistics panel in the GUI)."""
+        stats = self.stats()
+        lines = ['{0:32s} {1:>8s} {2:>10s} {3:>10s} {4:>10s} {5:>10s}'.format('span (ms)', 'count', 'last', 'p50',
+                                                                             'p95', 'max')]
+        for name in sorted(stats['spans']):
+            span = stats['spans'][name]
+            lines.append('{0:32s} {1:8d} {2:10.1f} {3:10.1f} {4:10.1f} {5:10.1f}'.format(
+                name, span['count'], span['last'], span['p50'], span['p95'], span['max']))
+        lines.append('')
+        for name in sorted(stats['counters']):
+            lines.append('{0:32s} {1:8d}'.format(name, stats['counters'][name]))
+        return '\n'.join(lines)
+
+    def dump_json(self, filename):
+        """Writes the statistics to a json file."""
+        with open(filename, 'w') as handle:
+            json.dump(self.stats(), handle, indent=2)
+
+
+# Shared instance used by all picture tools modules:
+instrument = Instrumentation()
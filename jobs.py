@@ -0,0 +1,193 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (from its progress callback) when the job has been cancelled."""
+    pass
+
+
+class Job:
+    """
+    A long running operation executed by the JobRunner. The function is called on a worker thread as
+    function(*args, progress=job.progress, **kwargs), the progress callback raises JobCancelled once the job has been
+    cancelled, so functions that report progress regularly can be cancelled between two work items.
+    """
+
+    def __init__(self, runner, name, function, args, kwargs, callbacks):
+        self.runner = runner
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.callbacks = callbacks  # {'progress', 'done', 'error', 'cancelled'}: functions called on the Tk thread
+        self.state = 'pending'  # pending, running, done, failed or cancelled
+        self.result, self.error = None, None
+        self.done, self.total = 0, None
+        self.cancel_event = threading.Event()
+        self.completed = threading.Event()  # set on the worker thread once the outcome has been posted
+
+    def cancel(self):
+        """Requests cancellation, the job stops at its next progress call."""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def progress(self, done, total):
+        """Progress callback handed to the function (called on the worker thread)."""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.name)
+        self.runner.post(self, 'progress', (done, total))
+
+    def run(self):
+        """Executes the function (on the worker thread) and posts the outcome to the runner."""
+        try:
+            if self.cancel_event.is_set():
+                self.runner.post(self, 'cancelled', None)
+                return
+            self.state = 'running'
+            try:
+                result = self.function(*self.args, progress=self.progress, **self.kwargs)
+            except JobCancelled:
+                self.runner.post(self, 'cancelled', None)
+            except Exception as error:
+                self.runner.post(self, 'error', error)
+            else:
+                self.runner.post(self, 'done', result)
+        finally:
+            self.completed.set()
+
+    def wait(self, timeout=None):
+        """
+        Waits until the function has finished on the worker thread (its callbacks are called by the next poll).
+        Returns False on a timeout.
+        """
+        return self.completed.wait(timeout)
+
+
+class JobRunner:
+    """
+    Runs catalog operations in the background so the GUI stays responsive. Jobs are executed on worker threads (one by
+    default, so catalog operations run in the order they were submitted), their progress and outcome are put on a
+    queue, which is polled from the Tk thread with `after`. All callbacks therefore run on the Tk thread and may update
+    widgets. Without a master, poll() has to be called by the owner (e.g. in batch mode or in tests).
+    Example:
+        jobs = JobRunner(root, on_status=lambda text: root.title(text or 'Picture Tools'))
+        jobs.submit('Importing images', controller.open_folder, folder, on_done=lambda result: refresh())
+    """
+
+    def __init__(self, master=None, poll_ms=100, workers=1, on_status=None):
+        self.master = master
+        self.poll_ms = poll_ms
+        self.on_status = on_status  # called with a status text (None when no job is running) on the Tk thread
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='picture_tools_job')
+        self.queue = queue.Queue()
+        self.jobs = []  # jobs that have not finished yet
+        self.polling = False
+
+    def submit(self, name, function, *args, on_progress=None, on_done=None, on_error=None, on_cancelled=None,
+               **kwargs):
+        """
+        This function schedules function(*args, progress=..., **kwargs) on a worker thread.
+        :param name: description of the job shown in the status (e.g. 'Importing images').
+        :param on_progress: (Optional) called as on_progress(done, total) on the Tk thread.
+        :param on_done: (Optional) called as on_done(result) on the Tk thread.
+        :param on_error: (Optional) called as on_error(exception) on the Tk thread, if not given the exception is
+        raised from poll().
+        :param on_cancelled: (Optional) called without arguments on the Tk thread.
+        :return: Job object.
+        """
+        callbacks = {'progress': on_progress, 'done': on_done, 'error': on_error, 'cancelled': on_cancelled}
+        job = Job(self, name, function, args, kwargs, callbacks)
+        self.jobs.append(job)
+        self.executor.submit(job.run)
+        self.update_status()
+        if self.master is not None and not self.polling:
+            self.polling = True
+            self.master.after(self.poll_ms, self.poll)
+
+        return job
+
+    def post(self, job, kind, value):
+        """Puts a message for the Tk thread on the queue (called from the worker threads)."""
+        self.queue.put((job, kind, value))
+
+    def poll(self):
+        """
+        This function handles the messages posted by the jobs since the last poll (on the Tk thread). Only the latest
+        progress message of a job is handed to its callback. It reschedules itself while jobs are running.
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        latest_progress = {}
+        for job, kind, value in messages:
+            if kind == 'progress':
+                job.done, job.total = value
+                latest_progress[job] = value
+        for job, value in latest_progress.items():
+            if job.callbacks['progress'] is not None and job in self.jobs:
+                job.callbacks['progress'](*value)
+        unhandled_error = None
+        for job, kind, value in messages:
+            if kind != 'progress':
+                error = self.finish(job, kind, value)
+                unhandled_error = unhandled_error if unhandled_error is not None else error
+        self.update_status()
+        self.polling = self.master is not None and len(self.jobs) > 0
+        if self.polling:
+            self.master.after(self.poll_ms, self.poll)
+        if unhandled_error is not None:
+            raise unhandled_error
+
+    def finish(self, job, kind, value):
+        """Hands the outcome of a job to its callback, returns the exception of a failed job without on_error."""
+        self.jobs.remove(job)
+        if kind == 'done':
+            job.state, job.result = 'done', value
+            if job.callbacks['done'] is not None:
+                job.callbacks['done'](value)
+        elif kind == 'cancelled':
+            job.state = 'cancelled'
+            if job.callbacks['cancelled'] is not None:
+                job.callbacks['cancelled']()
+        else:
+            job.state, job.error = 'failed', value
+            if job.callbacks['error'] is None:
+                return value
+            job.callbacks['error'](value)
+
+        return None
+
+    def status_text(self):
+        """Returns a description of the running jobs, e.g. 'Importing images: 120/5000' (None if nothing runs)."""
+        texts = []
+        for job in self.jobs:
+            if job.total is not None:
+                texts.append('{0}: {1}/{2}'.format(job.name, job.done, job.total))
+            else:
+                texts.append('{0}: {1}'.format(job.name, job.done))
+        return ', '.join(texts) if len(texts) > 0 else None
+
+    def update_status(self):
+        if self.on_status is not None:
+            self.on_status(self.status_text())
+
+    def busy(self):
+        return len(self.jobs) > 0
+
+    def cancel_all(self):
+        """Requests cancellation of all running and pending jobs."""
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self, wait=True):
+        """Cancels all jobs and stops the worker threads."""
+        self.cancel_all()
+        self.executor.shutdown(wait=wait)
@@ -1,8 +1,17 @@
-from view import Application
-import tkinter as tk
+import argparse
+import cProfile
+import sys
 
+# Picture tools modules:
+from instrumentation import instrument
+from mainloop_watchdog import watchdog
+
+
+def main(watch_mainloop=False):
+    # Picture tools GUI modules are imported here, so the batch mode does not need tkinter:
+    from view import Application
+    import tkinter as tk
 
-def main():
     width, height = 1280, 720
     root = tk.Tk()
     root.configure(bg='white')
@@ -10,8 +19,53 @@ def main():
     root.geometry("{0}x{1}".format(width, height))
     root.update()  # to get the correct dimensions when calling winfo_width and winfo_height
     Application(root)
+    if watch_mainloop:
+        watchdog.start(root)
     root.mainloop()
+    watchdog.stop()
+
+
+def run(argv):
+    """
+    Starts the GUI, or the batch mode if a command is given (python main.py --help for the batch mode commands).
+    --profile FILE writes cProfile statistics of the session (readable with pstats) to FILE, --instrument FILE writes
+    the timing spans and counters of the session as json to FILE and --watchdog FILE writes the main loop latency
+    histograms and stall stack samples of the GUI session as json to FILE. --display-cache FOLDER shows the images
+    from a decoded image cache (see decoded_cache), images that are not in it yet are added when shown.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--profile', help='write cProfile/pstats statistics of the session to this file')
+    parser.add_argument('--instrument', help='write timing spans and counters of the session as json to this file')
+    parser.add_argument('--watchdog', help='write main loop latencies and stalls of the GUI session to this file')
+    parser.add_argument('--display-cache', help='folder of a decoded image cache to show the images from (and add to)')
+    parser.add_argument('--stall-threshold', type=int, default=250,
+                        help='main loop blocking time (ms) after which the watchdog samples the stack (default: 250)')
+    options, remaining = parser.parse_known_args(argv)
+    if options.instrument is not None:
+        instrument.enable()
+    if options.display_cache is not None:
+        from controller import Controller
+        from decoded_cache import DecodedCache
+        Controller.decoded_cache = DecodedCache(options.display_cache)
+    profile = cProfile.Profile() if options.profile is not None else None
+    if profile is not None:
+        profile.enable()
+    try:
+        if len(remaining) > 0:  # arguments given: run the batch mode
+            from cli import main as batch_main
+            return batch_main(remaining)
+        watchdog.stall_threshold = options.stall_threshold / 1000
+        main(watch_mainloop=options.watchdog is not None)
+        return 0
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(options.profile)
+        if options.instrument is not None:
+            instrument.dump_json(options.instrument)
+        if options.watchdog is not None:
+            watchdog.dump_json(options.watchdog)
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(run(sys.argv[1:]))
@@ -0,0 +1,217 @@
+import json
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+# Upper bounds (ms) of the latency histogram buckets, the last bucket holds everything slower:
+BUCKET_BOUNDS = (8, 16, 33, 50, 100, 250, 500, 1000, 2000, 5000)
+
+
+class LatencyHistogram:
+    """Histogram of latencies with fixed bucket bounds (ms), cheap enough to update on every frame."""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        milliseconds = seconds * 1000
+        index = 0
+        while index < len(self.bounds) and milliseconds > self.bounds[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, fraction):
+        """Returns the upper bound (ms) of the bucket containing the given fraction of the samples (None if empty)."""
+        if self.count == 0:
+            return None
+        threshold, seen = fraction * self.count, 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= threshold:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        labels = ['<={0}'.format(bound) for bound in self.bounds] + ['>{0}'.format(self.bounds[-1])]
+        return {'count': self.count, 'mean': self.total / self.count if self.count > 0 else None, 'max': self.max,
+                'p50': self.percentile(0.5), 'p95': self.percentile(0.95),
+                'buckets': dict(zip(labels, self.buckets))}
+
+
+class _NoAction:
+    """Context manager that does nothing, returned by MainLoopWatchdog.action() while the watchdog is not running."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NO_ACTION = _NoAction()
+
+
+class _Action:
+
+    __slots__ = ('watchdog', 'name', 'start', 'previous_action')
+
+    def __init__(self, watchdog, name):
+        self.watchdog = watchdog
+        self.name = name
+        self.start = None
+        self.previous_action = None
+
+    def __enter__(self):
+        self.previous_action = self.watchdog.current_action
+        self.watchdog.current_action = self.name
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.watchdog.current_action = self.previous_action
+        # The latency of an action lasts until Tk is idle again (i.e. until the result has been drawn):
+        start, name = self.start, self.name
+        self.watchdog.master.after_idle(lambda: self.watchdog.record_action(name, time.perf_counter() - start))
+        return False
+
+
+class MainLoopWatchdog:
+    """
+    Measures the responsiveness of the Tk main loop. A heartbeat is scheduled every interval_ms with `after`, the
+    lateness of every heartbeat goes into the 'heartbeat' histogram. User actions are wrapped in action(name), their
+    latency (until Tk is idle again) goes into a histogram per action. A background thread checks the heartbeat and
+    takes a stack sample of the main thread when the main loop has been blocked for longer than stall_threshold
+    seconds, so it shows which code path blocks the GUI.
+    Usage:
+        watchdog.start(root)
+        with watchdog.action('zoom'):
+            self.show_image()
+    """
+
+    def __init__(self, interval_ms=50, stall_threshold=0.25, max_stalls=50):
+        self.interval_ms = interval_ms
+        self.stall_threshold = stall_threshold
+        self.master = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.heartbeat = LatencyHistogram()
+        self.actions = {}  # action name: LatencyHistogram
+        self.stalls = deque(maxlen=max_stalls)  # last max_stalls stalls: {action, duration, stack}
+        self.current_action = None
+        self.main_thread_id = None
+        self.last_beat = None
+        self.current_stall = None
+        self.monitor_thread = None
+
+    def start(self, master):
+        """Starts the heartbeat on master (call it from the Tk thread) and the stall monitor thread."""
+        if self.running:
+            return
+        self.master = master
+        self.main_thread_id = threading.get_ident()
+        self.running = True
+        self.last_beat = time.perf_counter()
+        self.master.after(self.interval_ms, self.beat)
+        self.monitor_thread = threading.Thread(target=self.monitor, name='picture_tools_watchdog', daemon=True)
+        self.monitor_thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def reset(self):
+        with self.lock:
+            self.heartbeat = LatencyHistogram()
+            self.actions = {}
+            self.stalls.clear()
+
+    def action(self, name):
+        """Returns a context manager that records the latency of the user action name."""
+        if not self.running:
+            return _NO_ACTION
+        return _Action(self, name)
+
+    def record_action(self, name, seconds):
+        with self.lock:
+            if name not in self.actions:
+                self.actions[name] = LatencyHistogram()
+            self.actions[name].add(seconds)
+
+    def beat(self):
+        """Heartbeat, runs on the Tk thread."""
+        now = time.perf_counter()
+        lateness = max(0.0, now - self.last_beat - self.interval_ms / 1000)
+        with self.lock:
+            self.heartbeat.add(lateness)
+            if self.current_stall is not None:  # the main loop is responsive again, the stall has ended
+                self.current_stall['duration'] = (now - self.last_beat) * 1000
+                self.current_stall = None
+        self.last_beat = now
+        if self.running:
+            self.master.after(self.interval_ms, self.beat)
+
+    def monitor(self):
+        """Stall monitor, runs on a background thread."""
+        while self.running:
+            time.sleep(self.stall_threshold / 4)
+            self.check_for_stall()
+
+    def check_for_stall(self):
+        """Takes a stack sample of the main thread if the heartbeat is late by more than stall_threshold."""
+        blocked = time.perf_counter() - self.last_beat - self.interval_ms / 1000
+        if blocked <= self.stall_threshold or self.current_stall is not None:
+            return None
+        frame = sys._current_frames().get(self.main_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        stall = {'action': self.current_action, 'detected_after': blocked * 1000, 'duration': None,
+                 'stack': [line.rstrip() for line in stack]}
+        with self.lock:
+            self.stalls.append(stall)
+            self.current_stall = stall
+        return stall
+
+    def report(self):
+        """
+        This function summarizes the measurements.
+        :return: dictionary {'heartbeat': histogram, 'actions': {name: histogram}, 'stalls': [stall]}, where a
+        histogram is {count, mean, max, p50, p95, buckets} (in milliseconds).
+        """
+        with self.lock:
+            return {'heartbeat': self.heartbeat.to_dict(),
+                    'actions': {name: histogram.to_dict() for name, histogram in self.actions.items()},
+                    'stalls': [dict(stall) for stall in self.stalls]}
+
+    def format_report(self):
+        """Returns the report as text (used by the statistics panel in the GUI)."""
+        report = self.report()
+        lines = ['{0:32s} {1:>8s} {2:>10s} {3:>10s} {4:>10s}'.format('latency (ms)', 'count', 'p50', 'p95', 'max')]
+        histograms = [('heartbeat lateness', report['heartbeat'])] + sorted(report['actions'].items())
+        for name, histogram in histograms:
+            if histogram['count'] > 0:
+                lines.append('{0:32s} {1:8d} {2:10.0f} {3:10.0f} {4:10.1f}'.format(
+                    name, histogram['count'], histogram['p50'], histogram['p95'], histogram['max']))
+        for stall in report['stalls'][-3:]:
+            duration = 'ongoing' if stall['duration'] is None else '{0:.0f} ms'.format(stall['duration'])
+            lines.append('')
+            lines.append('Stall during {0} ({1}):'.format(stall['action'], duration))
+            lines.extend(stall['stack'][-6:])
+        return '\n'.join(lines)
+
+    def dump_json(self, filename):
+        """Writes the report to a json file."""
+        with open(filename, 'w') as handle:
+            json.dump(self.report(), handle, indent=2)
+
+
+# Shared instance used by the GUI:
+watchdog = MainLoopWatchdog()
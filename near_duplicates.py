@@ -0,0 +1,201 @@
+import numpy as np
+from PIL import Image as PilImage
+
+# Picture tools modules:
+from parallel import BoundedPool
+
+HASH_BITS = 64
+DCT_SIZE = 32  # pHash: the image is reduced to 32 x 32 pixels, of which the lowest 8 x 8 frequencies are kept
+
+# DCT-II matrix, the 2D DCT of an image X is DCT_MATRIX @ X @ DCT_MATRIX.T:
+_k, _n = np.meshgrid(np.arange(DCT_SIZE), np.arange(DCT_SIZE), indexing='ij')
+DCT_MATRIX = np.cos(np.pi * (2 * _n + 1) * _k / (2 * DCT_SIZE)) * np.sqrt(2 / DCT_SIZE)
+DCT_MATRIX[0] /= np.sqrt(2)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    """Returns the number of bits set in every element of a uint64 array."""
+    if hasattr(np, 'bitwise_count'):  # numpy >= 2.0
+        return np.bitwise_count(values)
+    return _POPCOUNT[values.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.uint8).reshape(values.shape)
+
+
+def bits_to_int(bits):
+    """Packs a boolean array of 64 values into an integer (first value is the highest bit)."""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def dhash(pil_image):
+    """
+    Difference hash: the image is reduced to 9 x 8 gray pixels and every bit tells whether a pixel is brighter than
+    its left neighbour. Fast, and robust against scaling, re-compression and brightness changes.
+    :return: 64 bit integer.
+    """
+    pixels = np.asarray(pil_image.convert('L').resize((9, 8), PilImage.BOX), dtype=np.int16)
+    return bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(pil_image):
+    """
+    Perceptual hash: the image is reduced to 32 x 32 gray pixels, of which the lowest 8 x 8 frequencies of the
+    discrete cosine transform are compared to their median (leaving out the average, the first one). Somewhat slower
+    than dhash, but also robust against small crops, blur and noise.
+    :return: 64 bit integer.
+    """
+    pixels = np.asarray(pil_image.convert('L').resize((DCT_SIZE, DCT_SIZE), PilImage.BOX), dtype=np.float64)
+    low = (DCT_MATRIX @ pixels @ DCT_MATRIX.T)[:8, :8].ravel()
+    return bits_to_int(low > np.median(low[1:]))
+
+
+HASH_FUNCTIONS = {'dhash': dhash, 'phash': phash}
+
+
+def hash_file(item):
+    """
+    Computes the perceptual hash of an image file, decoding JPEG files at 1/8 of their size (the hashes only use 32 x
+    32 pixels). It runs in the worker processes.
+    :param item: (absolute path, method) where method is 'phash' or 'dhash'.
+    :return: (absolute path, hash) or (absolute path, None) if the file could not be read.
+    """
+    location, method = item
+    try:
+        with PilImage.open(location) as pil_image:
+            pil_image.draft('L', (DCT_SIZE * 2, DCT_SIZE * 2))
+            return location, HASH_FUNCTIONS[method](pil_image)
+    except (OSError, ValueError):
+        return location, None
+
+
+def compute_hashes(locations, method='phash', workers=None, progress=None):
+    """
+    This function computes the perceptual hashes of image files on a process pool.
+    :param locations: list of absolute paths.
+    :param method: 'phash' or 'dhash'.
+    :param workers: number of worker processes (default: number of cpu's).
+    :param progress: (Optional) function called as progress(done, total).
+    :return: generator of (location, hash or None) in the order of locations.
+    """
+    with BoundedPool(workers, max_in_flight=max(1, workers or 1) * 64) as pool:
+        for done, result in enumerate(pool.map(hash_file, ((location, method) for location in locations)), 1):
+            if progress is not None:
+                progress(done, len(locations))
+            yield result
+
+
+def distance(hash1, hash2):
+    """Returns the Hamming distance (number of different bits) of two hashes."""
+    return bin(hash1 ^ hash2).count('1')
+
+
+class NearDuplicateIndex:
+    """
+    A multi-index hash table of 64 bit perceptual hashes to find the hashes within a Hamming distance of max_distance
+    without comparing every pair. The hashes are split into max_distance + 1 bands of bits and every band has its own
+    table {band value: hashes}: two hashes that differ in at most max_distance bits are identical in at least one band
+    (pigeonhole principle), so only the hashes sharing a band value have to be compared. Identical hashes (e.g. black
+    frames) are stored once, with all their keys. Comparisons are done in bulk with numpy, so clustering hundreds of
+    thousands of images takes seconds.
+    """
+
+    def __init__(self, max_distance=6):
+        if not 0 <= max_distance < HASH_BITS // 2:
+            raise ValueError('max_distance should be between 0 and {0}'.format(HASH_BITS // 2 - 1))
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        self.bands = [(band * HASH_BITS // bands, (band + 1) * HASH_BITS // bands) for band in range(bands)]
+        self.tables = [{} for _ in self.bands]  # per band {band value: set of hashes}
+        self.keys = {}  # hash: list of keys with that hash
+        self.hashes = {}  # key: hash
+
+    def band_values(self, image_hash):
+        return [(image_hash >> start) & ((1 << (end - start)) - 1) for start, end in self.bands]
+
+    def add(self, key, image_hash):
+        """Adds (or replaces) the hash of key (e.g. an image_id)."""
+        if key in self.hashes:
+            self.remove(key)
+        self.hashes[key] = image_hash
+        if image_hash not in self.keys:
+            self.keys[image_hash] = []
+            for table, value in zip(self.tables, self.band_values(image_hash)):
+                table.setdefault(value, set()).add(image_hash)
+        self.keys[image_hash].append(key)
+
+    def remove(self, key):
+        image_hash = self.hashes.pop(key)
+        self.keys[image_hash].remove(key)
+        if len(self.keys[image_hash]) == 0:
+            del self.keys[image_hash]
+            for table, value in zip(self.tables, self.band_values(image_hash)):
+                table[value].discard(image_hash)
+                if len(table[value]) == 0:
+                    del table[value]
+
+    def query(self, image_hash, max_distance=None):
+        """
+        This function returns the keys of the hashes within max_distance of image_hash.
+        :param max_distance: (Optional) at most the max_distance of the index.
+        :return: list of (distance, key) sorted on distance.
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        candidates = set()
+        for table, value in zip(self.tables, self.band_values(image_hash)):
+            candidates.update(table.get(value, ()))
+        found = []
+        for candidate in candidates:
+            candidate_distance = distance(image_hash, candidate)
+            if candidate_distance <= max_distance:
+                found.extend((candidate_distance, key) for key in self.keys[candidate])
+        return sorted(found)
+
+    def pairs(self, max_distance=None, block_size=256):
+        """
+        This function returns the pairs of different hashes within max_distance of each other.
+        :param block_size: number of hashes of a bucket compared to the others at once (bounds the memory used).
+        :return: generator of (hash1, hash2), a pair can be returned more than once (once per band it shares).
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        for table in self.tables:
+            for bucket in table.values():
+                if len(bucket) < 2:
+                    continue
+                hashes = np.array(sorted(bucket), dtype=np.uint64)
+                for start in range(0, len(hashes) - 1, block_size):
+                    block = hashes[start:start + block_size]
+                    others = hashes[start + 1:]  # every pair is compared once: only with the hashes after it
+                    close = popcount(block[:, None] ^ others[None, :]) <= max_distance
+                    close &= np.arange(len(others))[None, :] >= np.arange(len(block))[:, None]
+                    for row, column in zip(*np.nonzero(close)):
+                        yield int(block[row]), int(others[column])
+
+    def clusters(self, max_distance=None):
+        """
+        This function groups the keys into clusters of near-duplicates: keys whose hashes are within max_distance of
+        each other are in the same cluster (also via other keys, e.g. the frames of a slowly changing scene).
+        :return: list of clusters (lists of keys, in the order they were added) with at least two keys, largest first.
+        """
+        parents = {}
+
+        def find(image_hash):
+            root = image_hash
+            while parents.get(root, root) != root:
+                root = parents[root]
+            while parents.get(image_hash, image_hash) != root:  # path compression
+                parents[image_hash], image_hash = root, parents[image_hash]
+            return root
+
+        paired = set()
+        for hash1, hash2 in self.pairs(max_distance):
+            paired.update((hash1, hash2))
+            root1, root2 = find(hash1), find(hash2)
+            if root1 != root2:
+                parents[root2] = root1
+        groups = {}
+        for image_hash, keys in self.keys.items():
+            if len(keys) > 1 or image_hash in paired:
+                groups.setdefault(find(image_hash), []).extend(keys)
+        order = {key: number for number, key in enumerate(self.hashes)}
+        clusters = [sorted(keys, key=order.get) for keys in groups.values()]
+        clusters.sort(key=lambda keys: (-len(keys), order[keys[0]]))
+        return clusters
@@ -0,0 +1,79 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class BoundedPool:
+    """
+    Runs a function over many work items on a pool of worker processes (or threads) while keeping at most
+    max_in_flight items queued or running. Results are returned in submission order, so a caller can stream a catalog
+    through the pool without materializing all work items (or all results) in memory.
+    With workers <= 1 the work is done inline in the calling process.
+    """
+
+    def __init__(self, workers=None, max_in_flight=None, processes=True):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.max_in_flight = max_in_flight if max_in_flight is not None else max(1, workers) * 4
+        self.executor = None
+        if workers > 1:
+            if processes:
+                self.executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = deque()
+
+    def submit(self, function, *args):
+        """
+        This function submits one work item. It returns a (possibly empty) list of finished results, which are the
+        results of the oldest items that had to be collected to keep the number of items in flight bounded.
+        :param function: module-level function to call (must be picklable when processes are used).
+        :param args: arguments for the function.
+        :return: list of results in submission order.
+        """
+        if self.executor is None:
+            return [function(*args)]
+        self.pending.append(self.executor.submit(function, *args))
+        results = []
+        while len(self.pending) > self.max_in_flight:
+            results.append(self.pending.popleft().result())
+        return results
+
+    def drain(self):
+        """
+        This function waits for all items still in flight and returns their results in submission order.
+        :return: list of results.
+        """
+        results = []
+        while self.pending:
+            results.append(self.pending.popleft().result())
+        return results
+
+    def map(self, function, iterable):
+        """
+        This function lazily applies function to every item of iterable and yields the results in order.
+        :param function: module-level function taking a single item.
+        :param iterable: iterable of work items (consumed lazily).
+        :return: generator of results.
+        """
+        for item in iterable:
+            for result in self.submit(function, item):
+                yield result
+        for result in self.drain():
+            yield result
+
+    def close(self):
+        """Cancels work that has not started yet and shuts the pool down."""
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
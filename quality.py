@@ -0,0 +1,108 @@
+import math
+from collections import namedtuple
+import numpy as np
+from PIL import Image as PilImage
+
+# Picture tools modules:
+from parallel import BoundedPool
+
+ANALYSIS_SIZE = 512  # the images are analysed with their longest side reduced to this, so the scores are comparable
+SHARPNESS_REFERENCE = 1000.0  # Laplacian variance of a sharp image at ANALYSIS_SIZE
+ENTROPY_REFERENCE = 6.0  # entropy (bits) of a well exposed image with detail
+CLIP_LOW, CLIP_HIGH = 5, 250  # gray values counted as under- and overexposed
+
+
+class QualityScores(namedtuple('QualityScores', ['sharpness', 'brightness', 'overexposed', 'underexposed',
+                                                 'entropy'])):
+    """
+    Image quality measures, to find blurred, over- or underexposed and black frames before they are annotated:
+        sharpness: variance of the Laplacian of the gray image (low: blurred or flat),
+        brightness: mean gray value (0-1),
+        overexposed / underexposed: fraction of the pixels that are (almost) white / black,
+        entropy: entropy of the gray value histogram in bits (0-8, low: little information, e.g. a black frame).
+    score combines them into a single number between 0 (useless) and 1, used to sort and filter the images.
+    """
+
+    __slots__ = ()
+
+    @property
+    def score(self):
+        sharp = min(1.0, math.log1p(self.sharpness) / math.log1p(SHARPNESS_REFERENCE))
+        exposed = 1.0 - min(1.0, self.overexposed + self.underexposed)
+        information = min(1.0, self.entropy / ENTROPY_REFERENCE)
+        return sharp * exposed * information
+
+    def to_string(self):
+        """Returns the scores as comma separated values (as saved in the savefile)."""
+        return ','.join('{0:.6g}'.format(value) for value in self)
+
+    @classmethod
+    def from_string(cls, text):
+        return cls(*(float(value) for value in text.split(',')))
+
+
+def measure(pil_image):
+    """
+    This function computes the QualityScores of an image with numpy.
+    :param pil_image: PIL image (any mode), preferably reduced to ANALYSIS_SIZE (see analyse_file).
+    :return: QualityScores
+    """
+    gray = np.asarray(pil_image.convert('L'))
+    pixels = gray.astype(np.float32)
+    if min(gray.shape) >= 3:
+        laplacian = pixels[1:-1, :-2] + pixels[1:-1, 2:] + pixels[:-2, 1:-1] + pixels[2:, 1:-1] - 4 * pixels[1:-1, 1:-1]
+        sharpness = float(laplacian.var())
+    else:
+        sharpness = 0.0
+    histogram = np.bincount(gray.ravel(), minlength=256) / gray.size
+    present = histogram[histogram > 0]
+    entropy = float(-(present * np.log2(present)).sum())
+    return QualityScores(sharpness, float(pixels.mean()) / 255, float(histogram[CLIP_HIGH:].sum()),
+                         float(histogram[:CLIP_LOW + 1].sum()), entropy)
+
+
+def analyse_file(location):
+    """
+    Computes the QualityScores of an image file, decoded at about ANALYSIS_SIZE (JPEG files are decoded at a reduced
+    scale directly). It runs in the worker processes.
+    :return: (location, QualityScores) or (location, None) if the file could not be read.
+    """
+    try:
+        with PilImage.open(location) as pil_image:
+            pil_image.draft('L', (ANALYSIS_SIZE, ANALYSIS_SIZE))
+            pil_image = pil_image.convert('L')
+            scale = ANALYSIS_SIZE / max(pil_image.size)
+            if scale < 1:
+                pil_image = pil_image.resize((max(1, round(pil_image.size[0] * scale)),
+                                              max(1, round(pil_image.size[1] * scale))), PilImage.BILINEAR)
+            return location, measure(pil_image)
+    except (OSError, ValueError):
+        return location, None
+
+
+def compute_quality(locations, workers=None, progress=None):
+    """
+    This function computes the QualityScores of image files on a process pool.
+    :param locations: list of absolute paths.
+    :param workers: number of worker processes (default: number of cpu's).
+    :param progress: (Optional) function called as progress(done, total).
+    :return: generator of (location, QualityScores or None) in the order of locations.
+    """
+    with BoundedPool(workers) as pool:
+        for done, result in enumerate(pool.map(analyse_file, locations), 1):
+            if progress is not None:
+                progress(done, len(locations))
+            yield result
+
+
+def worst_threshold(scores, fraction):
+    """
+    Returns the score below which the worst fraction of scores lies.
+    :param scores: list of scores.
+    :param fraction: e.g. 0.1 for the worst 10%.
+    """
+    if len(scores) == 0 or fraction <= 0:
+        return -math.inf
+    scores = np.sort(np.asarray(scores, dtype=np.float64))
+    count = int(round(len(scores) * min(fraction, 1.0)))
+    return scores[count] if count < len(scores) else math.inf
@@ -0,0 +1,199 @@
+import bisect
+from datetime import datetime, timedelta
+
+# Picture tools modules:
+from tags import Tags
+
+# Number of changed images above which the indexes are rebuilt instead of updated one image at a time:
+REBUILD_THRESHOLD = 1000
+
+
+class CatalogIndex:
+    """
+    Indexes of an ImageCatalog to select images on their tags, tag sizes and dates without looping through the
+    catalog:
+        - the dates the images were taken, sorted (range queries with bisect),
+        - an inverted index category_id -> image_id's (the integer ids of the TagCategories of the catalog, so
+          renaming a category does not change the index),
+        - a tagged / untagged bitmap (indexed by image_id),
+        - the smallest and largest tag area per image, sorted (size queries with bisect).
+    The indexes are kept up to date lazily: before every query, the revision of the catalog (images added, removed or
+    reloaded) and the global Tags revision (tags added, removed or modified) are compared to the ones the indexes were
+    built for. Only the images whose tags changed are re-indexed, unless many images changed, then all indexes are
+    rebuilt at once.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.synced = None  # (catalog revision, Tags revision) the indexes are up to date with
+        self.entries = {}  # image_id: (date_taken, set of category_id's, min tag area, max tag area, tags revision)
+        self.dates = []  # sorted list of (date_taken, image_id)
+        self.min_areas = []  # sorted list of (smallest tag area, image_id) of the tagged images
+        self.max_areas = []  # sorted list of (largest tag area, image_id) of the tagged images
+        self.categories = {}  # category_id: set of image_id's with at least one tag of that category
+        self.tagged = bytearray()  # tagged[image_id] == 1 if the image has tags
+        self.tagged_count = 0
+
+    def describe(self, image):
+        """Returns the index entry of an image object."""
+        with self.catalog.lock:
+            tags = list(image.tags.tag_dict.values())
+            revision = image.tags.revision
+        areas = [(tag.coordinates[2] - tag.coordinates[0]) * (tag.coordinates[3] - tag.coordinates[1]) for tag in tags]
+        if len(areas) == 0:
+            return image.date_taken, frozenset(), None, None, revision
+        return image.date_taken, frozenset(tag.category.category_id for tag in tags), min(areas), max(areas), revision
+
+    def sync(self):
+        """Brings the indexes up to date with the catalog (does nothing if nothing changed since the last query)."""
+        revisions = (self.catalog.revision, Tags.global_revision)
+        if revisions == self.synced:
+            return
+        current, changed = set(), []
+        for image_id, image in self.catalog.snapshot():
+            current.add(image_id)
+            entry = self.entries.get(image_id)
+            if entry is None or entry[4] != image.tags.revision or entry[0] != image.date_taken:
+                changed.append((image_id, image))
+        removed = [image_id for image_id in self.entries if image_id not in current]
+        if len(changed) + len(removed) > REBUILD_THRESHOLD:
+            self.rebuild(changed)
+        else:
+            for image_id in removed:
+                self.remove(image_id)
+            for image_id, image in changed:
+                if image_id in self.entries:
+                    self.remove(image_id)
+                self.add(image_id, self.describe(image))
+        self.synced = revisions
+
+    def rebuild(self, changed):
+        """Rebuilds all indexes, re-using the entries of the images that did not change."""
+        entries = {image_id: entry for image_id, entry in self.entries.items() if image_id in self.catalog.images}
+        for image_id, image in changed:
+            entries[image_id] = self.describe(image)
+        self.entries = entries
+        self.dates = sorted((entry[0], image_id) for image_id, entry in entries.items())
+        self.min_areas = sorted((entry[2], image_id) for image_id, entry in entries.items() if entry[2] is not None)
+        self.max_areas = sorted((entry[3], image_id) for image_id, entry in entries.items() if entry[3] is not None)
+        self.categories = {}
+        self.tagged = bytearray(max(entries, default=-1) + 1)
+        self.tagged_count = 0
+        for image_id, entry in entries.items():
+            for category_id in entry[1]:
+                self.categories.setdefault(category_id, set()).add(image_id)
+            if entry[2] is not None:
+                self.tagged[image_id] = 1
+                self.tagged_count += 1
+
+    def add(self, image_id, entry):
+        self.entries[image_id] = entry
+        bisect.insort(self.dates, (entry[0], image_id))
+        for category_id in entry[1]:
+            self.categories.setdefault(category_id, set()).add(image_id)
+        if image_id >= len(self.tagged):
+            self.tagged.extend(bytes(image_id + 1 - len(self.tagged)))
+        if entry[2] is not None:
+            bisect.insort(self.min_areas, (entry[2], image_id))
+            bisect.insort(self.max_areas, (entry[3], image_id))
+            self.tagged[image_id] = 1
+            self.tagged_count += 1
+
+    def remove(self, image_id):
+        entry = self.entries.pop(image_id)
+        del self.dates[bisect.bisect_left(self.dates, (entry[0], image_id))]
+        for category_id in entry[1]:
+            self.categories[category_id].discard(image_id)
+        if entry[2] is not None:
+            del self.min_areas[bisect.bisect_left(self.min_areas, (entry[2], image_id))]
+            del self.max_areas[bisect.bisect_left(self.max_areas, (entry[3], image_id))]
+            self.tagged[image_id] = 0
+            self.tagged_count -= 1
+
+    def category_ids(self, categories):
+        """Returns the set of category_id's of a list of tag_categories (names that are not in use are left out)."""
+        if categories is None:
+            return None
+        category_ids = (self.catalog.tag_categories.category_id(tag_category) for tag_category in categories)
+        return frozenset(category_id for category_id in category_ids if category_id is not None)
+
+    @staticmethod
+    def parse_date(date, end=False):
+        """
+        Converts 'yyyy:mm:dd' or 'yyyy:mm:dd HH:MM:SS' to a datetime (a datetime is returned as is). A date without a
+        time includes the whole day if it is the end of a range.
+        """
+        if date is None or isinstance(date, datetime):
+            return date
+        if ' ' in date:
+            return datetime.strptime(date, '%Y:%m:%d %H:%M:%S')
+        date = datetime.strptime(date, '%Y:%m:%d')
+        return date + timedelta(days=1) - timedelta(microseconds=1) if end else date
+
+    def query(self, tagged=None, categories=None, exclude_categories=None, start=None, end=None,
+              box_smaller_than=None, box_larger_than=None):
+        """
+        This function selects the images that match all given criteria. The smallest candidate set of the indexes
+        involved is taken as a starting point, which is then filtered with the other criteria, so the time taken
+        depends on the number of matching images rather than on the size of the catalog.
+        :param tagged: True for images with tags, False for images without tags (None: both).
+        :param categories: list of tag_categories, images with at least one tag of one of them.
+        :param exclude_categories: list of tag_categories, images without tags of any of them.
+        :param start: images taken on or after this date (datetime or 'yyyy:mm:dd').
+        :param end: images taken on or before this date (datetime or 'yyyy:mm:dd', including that day).
+        :param box_smaller_than: images with at least one tag with an area (pixels) smaller than this.
+        :param box_larger_than: images with at least one tag with an area (pixels) larger than this.
+        :return: list of image_id's sorted on the date taken.
+        """
+        self.sync()
+        start, end = self.parse_date(start), self.parse_date(end, True)
+        categories = self.category_ids(categories)
+        exclude_categories = self.category_ids(exclude_categories)
+        # Candidate sets from the indexes, with their size, the smallest one is used:
+        low = bisect.bisect_left(self.dates, (start,)) if start is not None else 0
+        high = bisect.bisect_right(self.dates, (end, float('inf'))) if end is not None else len(self.dates)
+        candidates = [(max(0, high - low), 'dates')]
+        if categories is not None:
+            candidates.append((sum(len(self.categories.get(i, ())) for i in categories), 'categories'))
+        if box_smaller_than is not None:
+            candidates.append((bisect.bisect_left(self.min_areas, (box_smaller_than,)), 'box_smaller_than'))
+        if box_larger_than is not None:
+            first = bisect.bisect_right(self.max_areas, (box_larger_than, float('inf')))
+            candidates.append((len(self.max_areas) - first, 'box_larger_than'))
+        if tagged:
+            candidates.append((self.tagged_count, 'tagged'))
+        size, source = min(candidates)
+        if source == 'dates':
+            image_ids = [image_id for _, image_id in self.dates[low:high]]
+        elif source == 'categories':
+            image_ids = set()
+            for category_id in categories:
+                image_ids.update(self.categories.get(category_id, ()))
+        elif source == 'box_smaller_than':
+            image_ids = [image_id for _, image_id in self.min_areas[:size]]
+        elif source == 'box_larger_than':
+            image_ids = [image_id for _, image_id in self.max_areas[len(self.max_areas) - size:]]
+        else:
+            image_ids = [image_id for image_id, value in enumerate(self.tagged) if value]
+        # Filter the candidates with the other criteria:
+        entries, bitmap = self.entries, self.tagged
+        result = []
+        for image_id in image_ids:
+            entry = entries[image_id]
+            if tagged is not None and bool(bitmap[image_id]) != tagged:
+                continue
+            if categories is not None and not entry[1] & categories:
+                continue
+            if exclude_categories is not None and entry[1] & exclude_categories:
+                continue
+            if (start is not None and entry[0] < start) or (end is not None and entry[0] > end):
+                continue
+            if box_smaller_than is not None and (entry[2] is None or entry[2] >= box_smaller_than):
+                continue
+            if box_larger_than is not None and (entry[3] is None or entry[3] <= box_larger_than):
+                continue
+            result.append(image_id)
+        if source != 'dates':
+            result.sort(key=lambda image_id: (entries[image_id][0], image_id))
+
+        return result
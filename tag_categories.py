@@ -1,91 +1,179 @@
 import random
+import sys
+
+
+class TagCategory:
+    """
+    A tag category of a catalog: its integer id (dense, in the order the categories were added), name and color. The
+    tags of the category refer to this object, so renaming it (or changing its color) does not touch the tags.
+    """
+
+    __slots__ = ('category_id', 'name', 'color')
+
+    def __init__(self, category_id, name, color):
+        self.category_id = category_id
+        self.name = sys.intern(name)
+        self.color = color
 
 
 class TagCategories:
+    """
+    The registry of the tag categories of one catalog, mapping the category names to TagCategory objects with integer
+    ids. Every catalog has its own registry, so several catalogs can be used in one process (e.g. in batch jobs).
+    Colors are handed out from a shuffled list of free colors, so selecting and freeing a color takes constant time.
+    """
 
     colors = ['#ffdab9', '#8b7765', '#ffe4e1', '#000000', '#2f4f4f', '#696969', '#708090', '#191970', '#6495ed',
               '#483d8b', '#6a5acd', '#0000cd', '#00bfff', '#00ced1', '#00ffff', '#006400', '#556b2f', '#8fbc8f',
               '#3cb371', '#98fb98', '#7cfc00', '#32cd32', '#ffff00', '#ffd700', '#daa520', '#bc8f8f', '#8b4513',
               '#cd853f', '#a52a2a', '#fa8072', '#ffa500', '#ff8c00', '#f08080', '#ff0000', '#ff69b4', '#ff1493',
               '#b03060', '#d02090', '#ba55d3', '#a020f0']
-    colors_used = []
-
-    tag_categories = {}
+    palette = frozenset(colors)
 
     def __init__(self):
-        pass
+        self.categories = []  # TagCategory objects, indexed by category_id
+        self.ids = {}  # name: category_id of the current categories
+        self.removed = {}  # name: category_id of removed categories (re-used when the name is added again)
+        self.color_counts = {}  # color: number of categories using it
+        self.free_colors = []  # shuffled, may contain colors that have been taken meanwhile (not in free_set)
+        self.free_set = set()
+        self.reset_colors()
+
+    def __contains__(self, category):
+        return category in self.ids
+
+    def __iter__(self):
+        """Iterates over the names of the categories, in the order they were added."""
+        return iter(sorted(self.ids, key=self.ids.get))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def tag_categories(self):
+        """Returns a dictionary {name: color} of the categories (a copy, use the methods below to change them)."""
+        return {name: self.categories[self.ids[name]].color for name in self}
+
+    def get(self, category):
+        """Returns the TagCategory of the name category, or None."""
+        category_id = self.ids.get(category)
+        return self.categories[category_id] if category_id is not None else None
+
+    def category_id(self, category):
+        """
+        Returns the integer id of the name category, or None. Removed categories still have their id (their tags may not
+        have been removed).
+        """
+        category_id = self.ids.get(category)
+        return category_id if category_id is not None else self.removed.get(category)
+
+    def name(self, category_id):
+        """Returns the name of the category with category_id."""
+        return self.categories[category_id].name
+
+    def color(self, category):
+        """Returns the color of the name category."""
+        return self.categories[self.ids[category]].color
 
     def add_tag_category(self, category, col=None):
         """
-        This function adds a new tag category to the tag categories dictionary.
-        It updates the tag_categories dictionary.
+        This function adds a new tag category to the registry (a category that is present already is not changed).
         :param category: new tag category to be added (string)
         :param col: color string (optional)
-        :return: Updates tag_categories dictionary.
+        :return: the TagCategory.
         """
-        if category not in self.tag_categories:
-            if col is None:
-                col = self.select_color()
-            self.tag_categories[category] = col
+        if category in self.ids:
+            return self.categories[self.ids[category]]
+        col = col if col is not None else self.select_color()
+        if category in self.removed:  # the tags it may still have keep their category
+            tag_category = self.categories[self.removed.pop(category)]
+            tag_category.color = col
+        else:
+            tag_category = TagCategory(len(self.categories), category, col)
+            self.categories.append(tag_category)
+        self.ids[tag_category.name] = tag_category.category_id
+        self.take_color(col)
+        return tag_category
 
     def remove_tag_category(self, category):
         """
         This function removes an existing category from the tag categories. It also frees the color used for that
-        category. It updates the tag_categories dictionary.
+        category.
         :param category: the tag category to be removed (string)
-        :return: Updates tag_categories dictionary.
+        :return: Updates the registry.
         """
-        if category in self.tag_categories:
+        if category in self.ids:
             self.free_color(category)
-            del self.tag_categories[category]
+            self.removed[category] = self.ids.pop(category)
 
     def change_tag_color(self, category, color):
         """
-        This function replaces the color used currently for the category with the one provided in this function.
-        It adds the supplied color to the colors_used list if not already present and removes the previously used
-        color from this list (freeing it for subsequent use).
+        This function replaces the color used currently for the category with the one provided in this function,
+        freeing the previously used color for subsequent use.
         :param category: the tag category for which the color should be replaced (string)
         :param color: the color which is to be used (string)
-        :return: Updates the tag_categories dictionary.
+        :return: Updates the registry.
         """
-        if category in self.tag_categories:
+        if category in self.ids:
             self.free_color(category)
-            self.tag_categories[category] = color
-            if color not in self.colors_used:
-                self.colors_used.append(color)
+            self.categories[self.ids[category]].color = color
+            self.take_color(color)
 
     def rename_tag_category(self, old_category, new_category):
         """
-        This function replaces an old category name with a new one.
+        This function replaces an old category name with a new one. The category keeps its id, so its tags are renamed
+        along with it. The new name should not be in use (see ImageCatalog.rename_tag_category to merge categories).
         :param old_category: the old tag category to be replaced (string)
         :param new_category: the new tag category to replace it with (string)
-        :return: Updates the tag_categories dictionary.
+        :return: Updates the registry.
         """
-        if old_category in self.tag_categories:
-            col = self.tag_categories[old_category]
-            del self.tag_categories[old_category]
-            self.tag_categories[new_category] = col
+        if old_category in self.ids and new_category not in self.ids:
+            category_id = self.ids.pop(old_category)
+            self.categories[category_id].name = sys.intern(new_category)
+            self.ids[self.categories[category_id].name] = category_id
+            self.removed.pop(new_category, None)
+
+    def take_color(self, color):
+        """Marks color as used by one more category."""
+        self.color_counts[color] = self.color_counts.get(color, 0) + 1
+        self.free_set.discard(color)
 
     def free_color(self, category):
         """
-        This function extract the color for a category and frees it for subsequent use again
-        (if category is removed for example).
+        This function frees the color of a category for subsequent use again (if category is removed for example),
+        unless another category uses it as well.
         :param category: the tag category for which the color should be freed again (string)
-        :return: Updates the colors_used list.
+        :return: Updates the free colors.
         """
-        if category in self.tag_categories:
-            col = self.tag_categories[category]  # get used color
-            self.colors_used = [i for i in self.colors_used if i != col]  # removes the color from the used colors
+        if category not in self.ids:
+            return
+        color = self.categories[self.ids[category]].color
+        self.color_counts[color] = self.color_counts.get(color, 1) - 1
+        if self.color_counts[color] <= 0:
+            del self.color_counts[color]
+            if color not in self.free_set and color in self.palette:
+                # Insert at a random position (swapping with the color there), so the order stays random:
+                self.free_colors.append(color)
+                position = random.randrange(len(self.free_colors))
+                self.free_colors[position], self.free_colors[-1] = self.free_colors[-1], self.free_colors[position]
+                self.free_set.add(color)
+
+    def reset_colors(self):
+        """Makes all colors available again (in a random order)."""
+        self.free_colors = list(self.colors)
+        random.shuffle(self.free_colors)
+        self.free_set = set(self.colors)
 
     def select_color(self):
         """
-        This function selects a random color from the colors list if that color has not been used already.
-        If all colors have been used once, it resets the colors_used list, re-using any previously used colors again.
+        This function selects a random color from the colors that are not in use. If all colors are in use, all colors
+        are made available again, re-using previously used colors.
         :return: A random unused color.
         """
-        if len(self.colors_used) == len(self.colors):
-            self.colors_used = []  # all colors have been used, reset colors_used.
-        available_colors = [i for i in self.colors if i not in self.colors_used]
-        col = random.choice(available_colors)
-        self.colors_used.append(col)
-        return col
+        while True:
+            if len(self.free_set) == 0:
+                self.reset_colors()
+            color = self.free_colors.pop()
+            if color in self.free_set:  # (otherwise it has been taken by change_tag_color meanwhile)
+                self.free_set.discard(color)
+                return color
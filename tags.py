@@ -1,12 +1,19 @@
 class Tags:
 
+    # Incremented on every change to the tags of any image, so indexes over the tags (query.CatalogIndex) can tell
+    # cheaply whether they have to be updated. The revision of the individual Tags object tells which images changed.
+    global_revision = 0
+
+    __slots__ = ('tag_dict', 'tag_id', 'revision', 'tag_categories', 'full_image_coordinates')
+
     def __init__(self, tag_categories, image_size):
         self.tag_dict = {}
         self.tag_id = 0
+        self.revision = 0
         self.tag_categories = tag_categories
-        # use the image_size to set a full_image_coordinates list to use when no coordinates have been provided to
+        # use the image_size to set the full_image_coordinates to use when no coordinates have been provided to
         # create a tag (complete image is tagged):
-        self.full_image_coordinates = [0, 0, image_size[0], image_size[1]]
+        self.full_image_coordinates = (0, 0, image_size[0], image_size[1])
 
     def add_tag(self, tag_category, coordinates=None):
         """
@@ -20,13 +27,37 @@ class Tags:
         """
         if coordinates is None:
             coordinates = self.full_image_coordinates
-        # Check whether tag_category already exists, if not, add:
-        if tag_category not in self.tag_categories.tag_categories:
-            self.tag_categories.add_tag_category(tag_category)
-        tags = [(i.tag_category, i.coordinates) for i in self.tag_dict.values()]
-        if (tag_category, coordinates) not in tags:  # only add when not already present
-            self.tag_dict[self.tag_id] = Tag(tag_category, coordinates)
-            self.tag_id += 1  # increment the id to keep them unique
+        self.add_tags([(tag_category, coordinates)])
+
+    def keys(self):
+        """Returns the set of (category_id, coordinates) of the tags present, used to skip duplicates (see add_tags)."""
+        return {(i.category.category_id, i.coordinates) for i in self.tag_dict.values()}
+
+    def add_tags(self, tag_list, present=None):
+        """
+        This function adds several Tag objects at once. The tags already present are put in a set once, so that
+        adding many tags to an image does not check every new tag against all existing tags one by one.
+        Tags that are already present are not added again.
+        :param tag_list: list of (tag_category, [xmin, ymin, xmax, ymax]) tuples.
+        :param present: (Optional) the set returned by keys(), which is updated with the tags added. Callers that add
+        the tags of an image in many calls (e.g. one box per record) pass it, so it is not built on every call.
+        :return: number of tags that have been added.
+        """
+        if present is None:
+            present = self.keys()
+        added = 0
+        for tag_category, coordinates in tag_list:
+            category = self.tag_categories.add_tag_category(tag_category)  # (added if it does not exist yet)
+            key = (category.category_id, tuple(coordinates))
+            if key not in present:  # only add when not already present
+                present.add(key)
+                self.tag_dict[self.tag_id] = Tag(category, key[1])
+                self.tag_id += 1  # increment the id to keep them unique
+                added += 1
+        if added > 0:
+            self.changed()
+
+        return added
 
     def remove_tag(self, tag_id):
         """
@@ -35,6 +66,7 @@ class Tags:
         :return: Deleted the tag_id from the tag_dict.
         """
         del self.tag_dict[tag_id]
+        self.changed()
 
     def modify_tag(self, tag_id, tag_category):
         """
@@ -43,13 +75,50 @@ class Tags:
         :param tag_category: new tag_category with which to replace the old one
         :return: Modified the tag_category.
         """
-        tag_object = self.tag_dict[tag_id]
-        tag_object.tag_category = tag_category
-        self.tag_dict[tag_id] = tag_object
+        self.tag_dict[tag_id].category = self.tag_categories.add_tag_category(tag_category)
+        self.changed()
+
+    def transform(self, transformation, image_size):
+        """
+        This function moves the tags along with an edit of their image (e.g. a rotation or crop).
+        :param transformation: function mapping [xmin, ymin, xmax, ymax] to the new coordinates, or to None for tags
+        that no longer fall within the image (these are removed).
+        :param image_size: (width, height) of the edited image.
+        :return: Transformed the coordinates of all tags.
+        """
+        for tag_id in list(self.tag_dict):
+            coordinates = transformation(self.tag_dict[tag_id].coordinates)
+            if coordinates is None:
+                del self.tag_dict[tag_id]
+            else:
+                self.tag_dict[tag_id].coordinates = tuple(coordinates)
+        self.full_image_coordinates = (0, 0, image_size[0], image_size[1])
+        self.changed()
+
+    def changed(self):
+        """Marks the tags of this image as changed (see revision)."""
+        self.revision += 1
+        Tags.global_revision += 1
 
 
 class Tag:
+    """
+    A bounding box of a tag_category. There can be many millions of them, so a Tag has no attribute dictionary, it
+    refers to the TagCategory of its catalog (shared by all tags of the category, see tag_categories.py) and its
+    coordinates are a tuple (xmin, ymin, xmax, ymax).
+    """
+
+    __slots__ = ('category', 'coordinates')
+
+    def __init__(self, category, coordinates):
+        self.category = category
+        self.coordinates = tuple(coordinates)
+
+    @property
+    def tag_category(self):
+        """The name of the tag category."""
+        return self.category.name
 
-    def __init__(self, tag_category, coordinates):
-        self.tag_category = tag_category
-        self.coordinates = coordinates
+    @property
+    def category_id(self):
+        return self.category.category_id
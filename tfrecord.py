@@ -0,0 +1,340 @@
+import os
+import re
+import struct
+
+try:  # optional C implementation of crc32c, the pure-Python fallback below is much slower for large images
+    from crc32c import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+# Picture tools modules:
+from parallel import BoundedPool
+
+
+def _make_crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = _make_crc32c_table()
+
+
+def crc32c(data):
+    """
+    This function calculates the CRC-32C (Castagnoli) checksum used by the TFRecord format.
+    :param data: bytes
+    :return: checksum as an unsigned 32-bit integer.
+    """
+    if _crc32c is not None:
+        return _crc32c(data)
+    crc = 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def masked_crc32c(data):
+    """Returns the masked CRC-32C of data as stored in TFRecord files."""
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+class ExampleCodec:
+    """
+    Pure-Python encoder/decoder for tf.train.Example protocol buffers. Only the subset of the protobuf wire format
+    used by tf.train.Example (Features map with BytesList, FloatList and Int64List values) is implemented.
+    """
+
+    BYTES, FLOAT, INT64 = 1, 2, 3  # field numbers of the Feature oneof
+
+    @staticmethod
+    def _varint(value):
+        if value < 0:
+            value += 1 << 64  # negative int64 values are encoded as 10-byte two's complement
+        out = bytearray()
+        while value > 0x7F:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+        return bytes(out)
+
+    @staticmethod
+    def _read_varint(data, pos):
+        result, shift = 0, 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result, pos
+            shift += 7
+
+    @classmethod
+    def _length_delimited(cls, field_number, payload):
+        return cls._varint((field_number << 3) | 2) + cls._varint(len(payload)) + payload
+
+    @classmethod
+    def encode_feature(cls, kind, values):
+        """
+        This function encodes a single tf.train.Feature.
+        :param kind: ExampleCodec.BYTES, ExampleCodec.FLOAT or ExampleCodec.INT64
+        :param values: list of values (bytes/str, floats or ints)
+        :return: serialized Feature message.
+        """
+        if kind == cls.BYTES:
+            values = [v.encode('utf-8') if isinstance(v, str) else v for v in values]
+            inner = b''.join(cls._length_delimited(1, v) for v in values)
+        elif kind == cls.FLOAT:
+            inner = cls._length_delimited(1, struct.pack('<{0}f'.format(len(values)), *values)) if values else b''
+        else:
+            inner = cls._length_delimited(1, b''.join(cls._varint(int(v)) for v in values)) if values else b''
+        return cls._length_delimited(kind, inner)
+
+    @classmethod
+    def encode_example(cls, features):
+        """
+        This function serializes a tf.train.Example.
+        :param features: dictionary {feature_name: (kind, [values])}
+        :return: serialized Example message (bytes).
+        """
+        entries = []
+        for name in sorted(features):
+            kind, values = features[name]
+            entry = cls._length_delimited(1, name.encode('utf-8')) + cls._length_delimited(2, cls.encode_feature(
+                kind, values))
+            entries.append(cls._length_delimited(1, entry))
+        return cls._length_delimited(1, b''.join(entries))
+
+    @classmethod
+    def _fields(cls, data):
+        """Yields (field_number, wire_type, value) for each field of a serialized message."""
+        pos = 0
+        while pos < len(data):
+            key, pos = cls._read_varint(data, pos)
+            field_number, wire_type = key >> 3, key & 7
+            if wire_type == 0:
+                value, pos = cls._read_varint(data, pos)
+            elif wire_type == 2:
+                length, pos = cls._read_varint(data, pos)
+                value = data[pos:pos + length]
+                pos += length
+            elif wire_type == 5:
+                value = data[pos:pos + 4]
+                pos += 4
+            elif wire_type == 1:
+                value = data[pos:pos + 8]
+                pos += 8
+            else:
+                raise ValueError('Unsupported protobuf wire type {0}'.format(wire_type))
+            yield field_number, wire_type, value
+
+    @classmethod
+    def decode_example(cls, data):
+        """
+        This function parses a serialized tf.train.Example.
+        :param data: serialized Example message (bytes).
+        :return: dictionary {feature_name: [values]}, bytes values are returned as bytes.
+        """
+        features = {}
+        for field_number, _, features_message in cls._fields(data):
+            if field_number != 1:
+                continue
+            for _, _, entry in cls._fields(features_message):
+                name, feature = None, b''
+                for entry_field, _, value in cls._fields(entry):
+                    if entry_field == 1:
+                        name = bytes(value).decode('utf-8')
+                    elif entry_field == 2:
+                        feature = value
+                features[name] = cls._decode_feature(feature)
+        return features
+
+    @classmethod
+    def _decode_feature(cls, feature):
+        values = []
+        for kind, _, inner in cls._fields(feature):
+            for _, wire_type, value in cls._fields(inner):
+                if kind == cls.BYTES:
+                    values.append(bytes(value))
+                elif kind == cls.FLOAT:
+                    if wire_type == 2:  # packed
+                        values.extend(struct.unpack('<{0}f'.format(len(value) // 4), value))
+                    else:
+                        values.append(struct.unpack('<f', value)[0])
+                else:
+                    if wire_type == 2:  # packed
+                        pos = 0
+                        while pos < len(value):
+                            number, pos = cls._read_varint(value, pos)
+                            values.append(number - (1 << 64) if number >= 1 << 63 else number)
+                    else:
+                        values.append(value - (1 << 64) if value >= 1 << 63 else value)
+        return values
+
+
+class TFRecordWriter:
+    """Writes records to a single TFRecord file (length, masked crc of length, data, masked crc of data)."""
+
+    def __init__(self, filename):
+        self.handle = open(filename, 'wb', buffering=1024 * 1024)
+
+    def write(self, record):
+        length = struct.pack('<Q', len(record))
+        self.handle.write(length)
+        self.handle.write(struct.pack('<I', masked_crc32c(length)))
+        self.handle.write(record)
+        self.handle.write(struct.pack('<I', masked_crc32c(record)))
+
+    def close(self):
+        self.handle.close()
+
+
+class ShardedTFRecordWriter:
+    """
+    Distributes records round-robin over num_shards TFRecord files named
+    <prefix>-00000-of-0000N.tfrecord in the save_location.
+    """
+
+    def __init__(self, save_location, num_shards, prefix='train'):
+        self.num_shards = max(1, int(num_shards))
+        self.filenames = ['{0}/{1}-{2:05d}-of-{3:05d}.tfrecord'.format(save_location, prefix, i, self.num_shards)
+                          for i in range(self.num_shards)]
+        self.writers = [TFRecordWriter(filename) for filename in self.filenames]
+        self.records_written = 0
+
+    def write(self, record):
+        self.writers[self.records_written % self.num_shards].write(record)
+        self.records_written += 1
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+def read_tfrecord(filename, check_crc=False):
+    """
+    This function reads a TFRecord file and yields the raw records one by one.
+    :param filename: Absolute path to the .tfrecord file.
+    :param check_crc: verify the data checksum of every record (slow without the crc32c module).
+    :return: generator of records (bytes).
+    """
+    with open(filename, 'rb') as handle:
+        while True:
+            header = handle.read(12)
+            if len(header) < 12:
+                return
+            length = struct.unpack('<Q', header[:8])[0]
+            record = handle.read(length)
+            footer = handle.read(4)
+            if len(record) < length or len(footer) < 4:
+                raise ValueError('Truncated TFRecord file: {0}'.format(filename))
+            if check_crc and struct.unpack('<I', footer)[0] != masked_crc32c(record):
+                raise ValueError('Corrupt record in TFRecord file: {0}'.format(filename))
+            yield record
+
+
+class LabelMap:
+    """Maps tag_categories to the integer ids defined in a tensorflow object-detection .pbtxt label map."""
+
+    def __init__(self, label_map_location=None):
+        self.ids = {}
+        if label_map_location is not None:
+            self.ids = self.read(label_map_location)
+
+    @staticmethod
+    def read(label_map_location):
+        """
+        This function parses the item {id: .. name: ..} entries of a .pbtxt label map.
+        :param label_map_location: Absolute path to the .pbtxt file.
+        :return: dictionary {name: id}
+        """
+        with open(label_map_location, 'r') as handle:
+            content = handle.read()
+        ids = {}
+        for item in re.findall(r'item\s*{([^}]*)}', content):
+            label_id = re.search(r'\bid\s*:\s*(\d+)', item)
+            name = re.search(r'\bname\s*:\s*[\'"]([^\'"]*)[\'"]', item)
+            if label_id is not None and name is not None:
+                ids[name.group(1)] = int(label_id.group(1))
+        return ids
+
+    def label_id(self, tag_category):
+        """Returns the id for tag_category or None if the tag_category is not part of the label map."""
+        return self.ids.get(tag_category)
+
+
+IMAGE_FORMATS = {'jpg': 'jpeg', 'jpeg': 'jpeg', 'png': 'png', 'tif': 'tiff', 'tiff': 'tiff', 'webp': 'webp'}
+
+
+def encode_image_record(record):
+    """
+    This function reads the image file for an export record and serializes it together with its bounding boxes into
+    a tf.train.Example in the layout expected by the tensorflow object detection API. It runs in worker processes.
+    :param record: tuple (file_path, file_name, width, height, boxes) where boxes is a list of
+    (tag_category, label_id, [xmin, ymin, xmax, ymax]) in image coordinates.
+    :return: serialized Example (bytes).
+    """
+    file_path, file_name, width, height, boxes = record
+    with open(file_path + '/' + file_name, 'rb') as handle:
+        encoded = handle.read()
+    image_format = IMAGE_FORMATS.get(file_name.split('.')[-1].lower(), 'jpeg')
+    features = {
+        'image/height': (ExampleCodec.INT64, [height]),
+        'image/width': (ExampleCodec.INT64, [width]),
+        'image/filename': (ExampleCodec.BYTES, [file_name]),
+        'image/source_id': (ExampleCodec.BYTES, [file_name]),
+        'image/encoded': (ExampleCodec.BYTES, [encoded]),
+        'image/format': (ExampleCodec.BYTES, [image_format]),
+        'image/object/bbox/xmin': (ExampleCodec.FLOAT, [box[2][0] / width for box in boxes]),
+        'image/object/bbox/ymin': (ExampleCodec.FLOAT, [box[2][1] / height for box in boxes]),
+        'image/object/bbox/xmax': (ExampleCodec.FLOAT, [box[2][2] / width for box in boxes]),
+        'image/object/bbox/ymax': (ExampleCodec.FLOAT, [box[2][3] / height for box in boxes]),
+        'image/object/class/text': (ExampleCodec.BYTES, [box[0] for box in boxes]),
+        'image/object/class/label': (ExampleCodec.INT64, [box[1] for box in boxes]),
+    }
+    return ExampleCodec.encode_example(features)
+
+
+class TFRecordExport:
+    """Streams image records into sharded TFRecord files, encoding the Examples on a process pool."""
+
+    def __init__(self, save_location, label_map_location, num_shards=10, workers=None):
+        if not os.path.exists(save_location):
+            os.mkdir(save_location)
+        self.label_map = LabelMap(label_map_location)
+        self.writer = ShardedTFRecordWriter(save_location, num_shards)
+        self.pool = BoundedPool(workers)
+        self.boxes_written, self.boxes_skipped = 0, 0
+
+    def write_image(self, file_path, file_name, width, height, boxes):
+        """
+        This function queues one image for encoding. Boxes whose tag_category is not in the label map are skipped,
+        images without any remaining boxes are not written.
+        :param boxes: list of (tag_category, [xmin, ymin, xmax, ymax])
+        """
+        labelled = []
+        for tag_category, coordinates in boxes:
+            label_id = self.label_map.label_id(tag_category)
+            if label_id is None:
+                self.boxes_skipped += 1
+            else:
+                labelled.append((tag_category, label_id, list(coordinates)))
+        if len(labelled) > 0:
+            self.boxes_written += len(labelled)
+            for example in self.pool.submit(encode_image_record, (file_path, file_name, width, height, labelled)):
+                self.writer.write(example)
+
+    def close(self):
+        """Waits for the remaining Examples, writes them and closes the shards."""
+        try:
+            for example in self.pool.drain():
+                self.writer.write(example)
+        finally:
+            self.pool.close()
+            self.writer.close()
@@ -0,0 +1,252 @@
+import os
+from collections import namedtuple
+from PIL import Image as PilImage
+
+# Picture tools modules:
+from decoded_cache import cached_image
+from edits import crop_box
+from exporters import ExportRecord
+from parallel import BoundedPool
+from transcode import IMAGE_FORMATS
+
+# Aerial and scanned images are often larger than the decompression bomb limit of PIL (about 179 megapixels). They
+# are only opened lazily by the catalog and read region by region when chipped, so images up to 2 gigapixels are
+# allowed:
+PilImage.MAX_IMAGE_PIXELS = max(PilImage.MAX_IMAGE_PIXELS or 0, 2 ** 30)
+
+
+class ChipOptions(namedtuple('ChipOptions', ['size', 'overlap', 'min_visible', 'skip_empty', 'image_format',
+                                             'quality'])):
+    """
+    How large images are cut into chips for a detector:
+        size: width and height of the chips in pixels (images smaller than this give a single, smaller chip),
+        overlap: number of pixels neighbouring chips overlap, so objects on a chip border are whole in one of them,
+        min_visible: a box is kept (clipped to the chip) when at least this fraction of its area lies on the chip,
+        skip_empty: True to leave out chips without boxes,
+        image_format: 'jpeg', 'webp' or 'png',
+        quality: JPEG / WebP quality (1-100).
+    Example: ChipOptions(size=1024, overlap=128)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, size=1024, overlap=128, min_visible=0.5, skip_empty=True, image_format='jpeg', quality=95):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError('Unknown image format: {0} (choose from {1})'.format(image_format,
+                                                                                 ', '.join(sorted(IMAGE_FORMATS))))
+        if size < 1 or not 0 <= overlap < size:
+            raise ValueError('size should be positive and overlap between 0 and size')
+        if not 0 < min_visible <= 1:
+            raise ValueError('min_visible should be a fraction larger than 0')
+        return super().__new__(cls, size, overlap, min_visible, skip_empty, image_format, quality)
+
+
+def chip_starts(length, size, overlap):
+    """
+    This function returns the start positions of chips of size along a side of length. The last chip is moved back
+    to end at the edge of the image, so all chips have the full size.
+    """
+    if length <= size:
+        return [0]
+    starts = list(range(0, length - size, size - overlap))
+    starts.append(length - size)
+    return starts
+
+
+def chip_boxes(boxes, chip, min_visible):
+    """
+    This function returns the boxes on a chip, in the coordinates of the chip.
+    :param boxes: list of (tag_category, [xmin, ymin, xmax, ymax]) in the image.
+    :param chip: [xmin, ymin, xmax, ymax] of the chip in the image.
+    :param min_visible: fraction of the area of a box that has to be on the chip.
+    :return: list of (tag_category, [xmin, ymin, xmax, ymax]) clipped to the chip.
+    """
+    kept = []
+    for tag_category, coordinates in boxes:
+        clipped = crop_box(coordinates, chip)
+        if clipped is None:
+            continue
+        area = (coordinates[2] - coordinates[0]) * (coordinates[3] - coordinates[1])
+        if (clipped[2] - clipped[0]) * (clipped[3] - clipped[1]) >= min_visible * area:
+            kept.append((tag_category, clipped))
+    return kept
+
+
+def plan_chips(record, options):
+    """
+    This function lays out the chips of an image.
+    :param record: ExportRecord of the image.
+    :param options: ChipOptions
+    :return: list of rows, every row a list of ([xmin, ymin, xmax, ymax], boxes) for the chips to be written.
+    """
+    rows = []
+    for y in chip_starts(record.height, options.size, options.overlap):
+        row = []
+        for x in chip_starts(record.width, options.size, options.overlap):
+            chip = [x, y, min(x + options.size, record.width), min(y + options.size, record.height)]
+            boxes = chip_boxes(record.boxes, chip, options.min_visible)
+            if len(boxes) > 0 or not options.skip_empty:
+                row.append((chip, boxes))
+        if len(row) > 0:
+            rows.append(row)
+    return rows
+
+
+def region_readable(pil_image):
+    """
+    Checks whether parts of an (opened, not yet loaded) image can be decoded on their own: uncompressed TIFF files
+    (tiled or in strips). Other files (JPEG, PNG, compressed TIFF which PIL decodes with libtiff as a whole) have to be
+    decoded completely.
+    """
+    return pil_image.format == 'TIFF' and not getattr(pil_image, 'use_load_libtiff', True)
+
+
+def replace_tile(tile, extents, offset):
+    """Returns a PIL tile descriptor (decoder, extents, offset, args) with other extents and offset."""
+    if hasattr(tile, '_replace'):  # a namedtuple in recent PIL versions
+        return tile._replace(extents=extents, offset=offset)
+    return tile[0], extents, offset, tile[3]
+
+
+def read_region(location, region):
+    """
+    This function decodes only the part of an uncompressed TIFF file needed for region: the tiles that overlap it, or
+    the rows of the region of the strips, instead of the whole image.
+    :param location: absolute path of an image for which region_readable is True.
+    :param region: [xmin, ymin, xmax, ymax]
+    :return: PIL image of the region.
+    """
+    with PilImage.open(location) as pil_image:
+        row_bytes = None  # bytes per row of a strip (of which rows can be skipped)
+        if pil_image.tag_v2.get(284, 1) == 1:  # planar configuration: samples stored together
+            bits = pil_image.tag_v2.get(258, (1,))
+            bits = bits if isinstance(bits, tuple) else (bits,)
+            if len(bits) == 1:
+                bits = bits * pil_image.tag_v2.get(277, 1)
+            row_bytes = (pil_image.size[0] * sum(bits) + 7) // 8
+        tiles = []
+        for tile in pil_image.tile:
+            extents, offset = tile[1], tile[2]
+            if extents[0] >= region[2] or extents[2] <= region[0] or extents[1] >= region[3] or \
+                    extents[3] <= region[1]:
+                continue
+            if row_bytes is not None and extents[0] == 0 and extents[2] == pil_image.size[0]:  # strip
+                top, bottom = max(extents[1], region[1]), min(extents[3], region[3])
+                offset += (top - extents[1]) * row_bytes
+                extents = (0, top, extents[2], bottom)
+            tiles.append(replace_tile(tile, extents, offset))
+        left, top = min(tile[1][0] for tile in tiles), min(tile[1][1] for tile in tiles)
+        right, bottom = max(tile[1][2] for tile in tiles), max(tile[1][3] for tile in tiles)
+        # Decode the tiles into an image of just their extent:
+        pil_image.tile = [replace_tile(tile, (tile[1][0] - left, tile[1][1] - top, tile[1][2] - left,
+                                              tile[1][3] - top), tile[2]) for tile in tiles]
+        pil_image._size = (right - left, bottom - top)
+        pil_image.load()
+        return pil_image.crop((region[0] - left, region[1] - top, region[2] - left, region[3] - top))
+
+
+def write_chips(location, chips, destination_folder, stem, options, cache_location=None):
+    """
+    This function writes chips of an image. Uncompressed TIFF files are read chip by chip, so a large image is never
+    decoded completely, other files are decoded once (or read from the decoded image cache at full size). It runs in
+    the worker processes.
+    :param location: absolute path of the image.
+    :param chips: list of ([xmin, ymin, xmax, ymax], boxes) (see plan_chips).
+    :param destination_folder: folder to write the chips to.
+    :param stem: file_name of the image without extension and the number of the image in the export, the chips are
+    named <stem>_<x>_<y>.<extension> (e.g. IMG_0001_12_0_896.jpg for image 12, so the chips of IMG_0001.jpg and
+    IMG_0001.png do not overwrite each other).
+    :param options: ChipOptions
+    :param cache_location: (Optional) folder of a DecodedCache.
+    :return: list of ExportRecord's of the chips.
+    """
+    image_format, extension = IMAGE_FORMATS[options.image_format]
+    save_options = {'quality': options.quality} if image_format in ('JPEG', 'WEBP') else {}
+    records = []
+    pil_image = PilImage.open(location)
+    by_region = region_readable(pil_image)
+    cached = cached_image(cache_location, location) if not by_region else None
+    if cached is not None:
+        pil_image.close()
+        pil_image = cached
+    with pil_image:
+        for chip, boxes in chips:
+            chip_image = read_region(location, chip) if by_region else pil_image.crop(chip)
+            if image_format == 'JPEG' and chip_image.mode not in ('RGB', 'L'):
+                chip_image = chip_image.convert('RGB')
+            file_name = '{0}_{1}_{2}.{3}'.format(stem, chip[0], chip[1], extension)
+            chip_image.save(destination_folder + '/' + file_name, format=image_format, **save_options)
+            records.append(ExportRecord(destination_folder, file_name, chip[2] - chip[0], chip[3] - chip[1], boxes))
+    return records
+
+
+def no_chips():
+    """Returns no chips (for images of which no chip has to be written)."""
+    return []
+
+
+class ChipStage:
+    """
+    Cuts exported images into overlapping chips of a fixed size on a process pool, for detectors that cannot take
+    very large images. Every row of chips of an uncompressed TIFF file is a separate work item, so a single large image
+    is spread over all workers (other images are one work item, as they have to be decoded completely). At most
+    max_in_flight work items are queued or being written at a time.
+    """
+
+    def __init__(self, options, workers=None, max_in_flight=None, cache_location=None):
+        self.options = options
+        self.pool = BoundedPool(workers, max_in_flight)
+        self.cache_location = cache_location  # (Optional) folder of a DecodedCache to read the images from
+
+    def map(self, records, destination_folder):
+        """
+        This function writes the chips of every record to destination_folder.
+        :param records: iterable of ExportRecord's.
+        :return: generator yielding, for every record in order, the list of ExportRecord's of its chips.
+        """
+        if not os.path.exists(destination_folder):
+            os.makedirs(destination_folder)
+        current, chips = 0, []
+
+        def collect(results):
+            # The results are (image number, chips) in submission order, the chips of an image are yielded once the
+            # first result of the next image arrives:
+            nonlocal current, chips
+            for number, result in results:
+                while number > current:
+                    yield chips
+                    current, chips = current + 1, []
+                chips.extend(result)
+
+        count = 0
+        for number, record in enumerate(records):
+            count = number + 1
+            rows = plan_chips(record, self.options)
+            if len(rows) == 0:
+                yield from collect(self.pool.submit(numbered, number, no_chips))
+                continue
+            location = record.file_path + '/' + record.file_name
+            with PilImage.open(location) as pil_image:  # only reads the header
+                if not region_readable(pil_image):  # the image is decoded completely, so only once
+                    rows = [[chip for row in rows for chip in row]]
+            stem = '{0}_{1}'.format('.'.join(record.file_name.split('.')[:-1]) or record.file_name, number)
+            for row in rows:
+                yield from collect(self.pool.submit(numbered, number, write_chips, location, row, destination_folder,
+                                                    stem, self.options, self.cache_location))
+        yield from collect(self.pool.drain())
+        if count > 0:
+            yield chips
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def numbered(number, function, *args):
+    """Calls function(*args) and returns (number, result), so results can be grouped per image."""
+    return number, function(*args)
@@ -0,0 +1,160 @@
+import os
+from collections import namedtuple
+from PIL import Image as PilImage
+
+# Picture tools modules:
+from decoded_cache import cached_image
+from exporters import ExportRecord, unique_file_name
+from parallel import BoundedPool
+
+# Output formats: PIL format name and file extension.
+IMAGE_FORMATS = {'jpeg': ('JPEG', 'jpg'), 'webp': ('WEBP', 'webp'), 'png': ('PNG', 'png')}
+
+
+class TranscodeOptions(namedtuple('TranscodeOptions', ['max_side', 'scale', 'image_format', 'quality'])):
+    """
+    How exported images are resized and encoded:
+        max_side: the longest side is reduced to at most this number of pixels (images are not enlarged),
+        scale: a fixed factor for both sides (e.g. 0.25), combined with max_side the smallest result is used,
+        image_format: 'jpeg', 'webp' or 'png' (None: the format of the original file),
+        quality: JPEG / WebP quality (1-100).
+    Example: TranscodeOptions(max_side=1024, image_format='jpeg', quality=90)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, max_side=None, scale=None, image_format=None, quality=90):
+        if image_format is not None and image_format not in IMAGE_FORMATS:
+            raise ValueError('Unknown image format: {0} (choose from {1})'.format(image_format,
+                                                                                 ', '.join(sorted(IMAGE_FORMATS))))
+        if (max_side is not None and max_side < 1) or (scale is not None and scale <= 0):
+            raise ValueError('max_side and scale should be positive')
+        return super().__new__(cls, max_side, scale, image_format, quality)
+
+    def target_size(self, width, height):
+        """Returns the (width, height) an image of width x height is written at."""
+        factor = self.scale if self.scale is not None else 1.0
+        if self.max_side is not None:
+            factor = min(factor, self.max_side / max(width, height))
+        return max(1, round(width * factor)), max(1, round(height * factor))
+
+    def file_name(self, file_name):
+        """Returns the file_name with the extension of the output format."""
+        if self.image_format is None:
+            return file_name
+        return '.'.join(file_name.split('.')[:-1]) + '.' + IMAGE_FORMATS[self.image_format][1]
+
+
+def scale_boxes(boxes, size, target_size):
+    """
+    This function rescales bounding boxes from an image of size to the same image resized to target_size.
+    :param boxes: list of (tag_category, [xmin, ymin, xmax, ymax])
+    :return: list of (tag_category, [xmin, ymin, xmax, ymax]) with whole pixel coordinates.
+    """
+    scale_x, scale_y = target_size[0] / size[0], target_size[1] / size[1]
+    return [(tag_category, [round(coordinates[0] * scale_x), round(coordinates[1] * scale_y),
+                            round(coordinates[2] * scale_x), round(coordinates[3] * scale_y)])
+            for tag_category, coordinates in boxes]
+
+
+def transcode_file(source, destination, size, options, cache_location=None):
+    """
+    This function writes a resized (and possibly re-encoded) copy of an image. JPEG files are decoded directly at a
+    reduced scale (DCT scaling) when the target size allows it, so a 24MP photo is never decoded at full resolution
+    for a 1024 pixel copy. It runs in the worker processes.
+    :param source: absolute path of the image file.
+    :param destination: absolute path to write to.
+    :param size: (width, height) to write the image at.
+    :param options: TranscodeOptions
+    :param cache_location: (Optional) folder of a DecodedCache, images in it are not decoded.
+    """
+    pil_image = cached_image(cache_location, source, size)
+    if pil_image is None:
+        pil_image = PilImage.open(source)
+        file_format = pil_image.format
+        pil_image.draft(pil_image.mode, size)
+    else:
+        with PilImage.open(source) as original:  # only reads the header
+            file_format = original.format
+    image_format = IMAGE_FORMATS[options.image_format][0] if options.image_format is not None else file_format
+    with pil_image:
+        if image_format == 'JPEG' and pil_image.mode not in ('RGB', 'L'):
+            pil_image = pil_image.convert('RGB')
+        if pil_image.size != tuple(size):
+            pil_image = pil_image.resize(size, PilImage.LANCZOS, reducing_gap=3.0)
+        save_options = {'quality': options.quality} if image_format in ('JPEG', 'WEBP') else {}
+        pil_image.save(destination, format=image_format, **save_options)
+
+
+def transcode_record(record, destination_folder, file_name, options, cache_location=None):
+    """
+    This function writes the resized copy of the image of an ExportRecord to destination_folder/file_name and returns
+    the ExportRecord of the copy (with its size and rescaled boxes). It runs in the worker processes.
+    """
+    target_size = options.target_size(record.width, record.height)
+    transcode_file(record.file_path + '/' + record.file_name, destination_folder + '/' + file_name, target_size,
+                   options, cache_location)
+    return ExportRecord(destination_folder, file_name, target_size[0], target_size[1],
+                        scale_boxes(record.boxes, (record.width, record.height), target_size))
+
+
+def keep_record(record):
+    """Returns the record as it is (for images that do not need to be written)."""
+    return record
+
+
+class TranscodeStage:
+    """
+    Resizes and re-encodes exported images on a process pool. At most max_in_flight images are queued or being
+    converted at a time, so memory stays bounded by a few decoded images per worker, whatever the size of the export.
+    The ExportRecord's of the written copies are returned in the order the images were submitted. Copies that would
+    get the same name in a folder (a.jpg and a.png written as JPEG) are named apart, see unique_file_name.
+    """
+
+    def __init__(self, options, workers=None, max_in_flight=None, cache_location=None):
+        self.options = options
+        self.pool = BoundedPool(workers, max_in_flight)
+        self.cache_location = cache_location  # (Optional) folder of a DecodedCache to read the images from
+        self.names = {}  # destination_folder: set of the file names written to it
+
+    def submit(self, record, destination_folder, file_name=None):
+        """
+        This function queues an image to be written to destination_folder (with the extension of the output format,
+        and a unique name in the folder).
+        :param record: ExportRecord of the original image.
+        :param file_name: (Optional) file_name of the copy (e.g. when renaming), default the original file_name.
+        :return: list of ExportRecord's of the images finished so far (in submission order).
+        """
+        file_name = unique_file_name(self.options.file_name(file_name if file_name is not None else record.file_name),
+                                     record.file_name, self.names.setdefault(destination_folder, set()))
+        return self.pool.submit(transcode_record, record, destination_folder, file_name, self.options,
+                                self.cache_location)
+
+    def map(self, records, destination_folder):
+        """
+        This function writes the images of records with boxes to destination_folder and yields the ExportRecord's of
+        the copies, records without boxes are yielded as they are (exporters skip them anyway).
+        """
+        if not os.path.exists(destination_folder):
+            os.makedirs(destination_folder)
+        for record in records:
+            if len(record.boxes) > 0:
+                results = self.submit(record, destination_folder)
+            else:
+                results = self.pool.submit(keep_record, record)
+            for result in results:
+                yield result
+        for result in self.pool.drain():
+            yield result
+
+    def drain(self):
+        return self.pool.drain()
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
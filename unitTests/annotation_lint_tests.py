@@ -0,0 +1,108 @@
+import tempfile
+import unittest
+from datetime import datetime
+import numpy as np
+from PIL import Image
+
+# Own modules (to be tested)
+import annotation_lint
+from annotation_lint import LintOptions
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_catalog(folder):
+        """Creates a catalog with two images of 100 x 50 pixels and tags with every kind of problem."""
+        catalog = ImageCatalog()
+        for i in range(2):
+            Image.new('RGB', (100, 50)).save('{0}/image{1}.png'.format(folder, i))
+            catalog.add_image(folder, 'image{0}.png'.format(i), datetime(2019, 1, 1 + i))
+        catalog.images[0].tags.add_tags([('car', [10, 10, 30, 30]),  # 0: fine
+                                         ('car', [5, 5, 5, 20]),  # 1: zero_area
+                                         ('car', [60, 30, 40, 10]),  # 2: inverted
+                                         ('person', [90, 30, 120, 60]),  # 3: out_of_bounds
+                                         ('car', [11, 10, 30, 30]),  # 4: overlap with 0
+                                         ('person', [10, 10, 30, 30]),  # 5: fine (other tag_category)
+                                         ('car', [70, 0, 80, 10]),  # 6: duplicate (made below)
+                                         ('sign', [0, 0, 10, 10])])  # 7: unknown_category (removed below)
+        catalog.images[0].tags.tag_dict[6].coordinates = (10, 10, 30, 30)
+        catalog.tag_categories.remove_tag_category('sign')
+        catalog.images[1].tags.add_tags([('car', [11, 10, 30, 30]), ('person', [0, 0, 100, 50])])  # fine
+        return catalog
+
+    def test_overlapping_pairs(self):
+        """The batched comparison finds the same pairs as comparing every pair of boxes of a group."""
+        randomizer = np.random.default_rng(0)
+        groups = np.sort(randomizer.integers(0, 20, 300))
+        corners = randomizer.integers(0, 50, (300, 2))
+        boxes = np.concatenate([corners, corners + randomizer.integers(5, 15, (300, 2))], axis=1).astype(float)
+        first, second = annotation_lint.overlapping_pairs(groups, boxes, 0.5)
+        expected = sorted((i, j) for i in range(300) for j in range(i + 1, 300) if groups[i] == groups[j] and
+                          annotation_lint.iou(boxes[i:i + 1], boxes[j:j + 1])[0] >= 0.5)
+        self.assertEqual(expected, sorted(zip(first.tolist(), second.tolist())))
+        self.assertEqual(0, len(annotation_lint.overlapping_pairs(groups[:1], boxes[:1], 0.5)[0]))
+        with self.assertRaises(ValueError):
+            LintOptions(fix=['negative'])
+
+    def test_lint_tags(self):
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = self.create_catalog(folder)
+            report = catalog.lint_tags()
+            self.assertEqual((2, 10), (report['images'], report['boxes']))
+            self.assertEqual({'zero_area': 1, 'inverted': 1, 'out_of_bounds': 1, 'unknown_category': 1,
+                              'duplicate': 1, 'overlap': 1}, report['issues'])
+            self.assertEqual({(0, 1), (0, 2), (0, 6), (0, 7)}, report['excluded'])  # (the default skip)
+            self.assertIn(('image0.png', 'person', (90, 30, 120, 60), ['out_of_bounds']), report['problems'])
+            self.assertIn('out_of_bounds: 1', annotation_lint.format_lint_report(report))
+            # The export leaves out the excluded tags and reports the problems:
+            summary = catalog.export_annotations([('csv', folder + '/tags.csv', {})])
+            self.assertEqual({'images': 2, 'boxes': 6}, summary['csv'])
+            self.assertEqual(4, summary['lint']['skipped'])
+            self.assertEqual(10, catalog.export_annotations([('csv', folder + '/tags.csv', {})], lint=None,
+                                                            min_tagsize=-10000)['csv']['boxes'])
+            # Fix everything:
+            report = catalog.lint_tags(options=LintOptions(fix=annotation_lint.CHECKS))
+            self.assertEqual({'inverted': 1, 'out_of_bounds': 1, 'zero_area': 1, 'unknown_category': 1,
+                              'duplicate': 1, 'overlap': 1}, report['fixed'])
+            self.assertEqual((4, [], 0), (report['removed'], report['problems'], report['skipped']))
+            self.assertEqual({0: (10, 10, 30, 30), 2: (40, 10, 60, 30), 3: (90, 30, 100, 50), 5: (10, 10, 30, 30)},
+                             {tag_id: tag.coordinates for tag_id, tag in catalog.images[0].tags.tag_dict.items()})
+            self.assertEqual([0], catalog.query(box_smaller_than=201))  # (the clipped box, the index is updated)
+            report = catalog.lint_tags()
+            self.assertEqual(0, sum(report['issues'].values()))
+            catalog.close_all_images()
+
+    def test_export_tagged_images(self):
+        """The tags failing the checks are left out of the tags.csv files of the exported images as well."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = self.create_catalog(folder)
+            summary = catalog.export_tagged_images(folder + '/checked')
+            self.assertEqual((2, 4), (summary['images'], summary['lint']['skipped']))
+            rows = []
+            for csv_location in [folder + '/checked/tags.csv', folder + '/checked/person/tags.csv']:
+                with open(csv_location) as handle:
+                    rows += handle.readlines()[1:]
+            self.assertEqual(5, len(rows))  # 4 of image0 and the car of image1 (the full image person is not written)
+            self.assertNotIn('image0.png,100,50,car,60,30,40,10\n', rows)
+            self.assertNotIn('lint', catalog.export_tagged_images(folder + '/unchecked', lint=None))
+            with open(folder + '/unchecked/tags.csv') as handle:
+                self.assertEqual(8, len(handle.readlines()[1:]))
+            catalog.close_all_images()
+
+    def test_export_tfrecord(self):
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = self.create_catalog(folder)
+            with open(folder + '/labels.pbtxt', 'w') as handle:
+                handle.write("item {\n  id: 1\n  name: 'car'\n}\nitem {\n  id: 2\n  name: 'person'\n}\n")
+            # (without the checks, the box without area is left out for min_tagsize and the sign by the label map)
+            self.assertEqual((8, 1), catalog.export_tfrecord(folder + '/unchecked', folder + '/labels.pbtxt', 1,
+                                                             workers=1, lint=None))
+            self.assertEqual((6, 0), catalog.export_tfrecord(folder + '/checked', folder + '/labels.pbtxt', 1,
+                                                             workers=1))
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+# Own modules (to be tested)
+import annotator_merge
+from annotator_merge import MergeOptions
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_savefiles(folder):
+        """
+        Creates two images and the savefiles of three annotators: all of them tagged the car of image0 (a bit
+        differently), two of them the person and one of them a sign. Annotator c did not get image1.
+        """
+        for i in range(2):
+            Image.new('RGB', (100, 50)).save('{0}/image{1}.png'.format(folder, i))
+        annotations = {'a': {'image0.png': [('car', [10, 10, 30, 30]), ('person', [50, 0, 60, 40])],
+                             'image1.png': [('car', [0, 0, 20, 20])]},
+                       'b': {'image0.png': [('car', [12, 10, 30, 30]), ('person', [51, 0, 60, 40]),
+                                            ('sign', [80, 0, 90, 10])],
+                             'image1.png': []},
+                       'c': {'image0.png': [('car', [11, 10, 31, 30]), ('car', [10, 12, 30, 30])]}}
+        locations = []
+        for annotator, images in annotations.items():
+            locations.append('{0}/{1}.csv'.format(folder, annotator))
+            with open(locations[-1], 'w') as savefile:
+                savefile.write('Image;Path;Date_time;Tags;Fingerprint;Perceptual_hash;Quality\n')
+                for file_name, tags in images.items():
+                    savefile.write('{0};{1};2019:01:01 00:00:00;{2};;;\n'.format(file_name, folder, tags))
+        return locations
+
+    def test_greedy_matching(self):
+        """Matching the mutual best pairs at once gives the same pairs as going through them highest score first."""
+        randomizer = np.random.default_rng(0)
+        firsts, seconds = randomizer.integers(0, 30, 200), randomizer.integers(0, 30, 200)
+        scores = randomizer.random(200)
+        expected, used_firsts, used_seconds = [], set(), set()
+        for pair in np.argsort(-scores):
+            if firsts[pair] not in used_firsts and seconds[pair] not in used_seconds:
+                expected.append(pair)
+                used_firsts.add(firsts[pair])
+                used_seconds.add(seconds[pair])
+        self.assertEqual(sorted(expected), sorted(annotator_merge.greedy_matching(firsts, seconds, scores).tolist()))
+        self.assertEqual(0, len(annotator_merge.greedy_matching(np.zeros(0, int), np.zeros(0, int), np.zeros(0))))
+        with self.assertRaises(ValueError):
+            MergeOptions('prefer')
+        self.assertEqual((['car', "it's"], [(10, 10, 30, 30), (1.5, 2, 3, 4)]),
+                         annotator_merge.split_tags(str([('car', [10, 10, 30, 30]), ("it's", [1.5, 2, 3, 4])])))
+
+    def test_merge_annotators(self):
+        with tempfile.TemporaryDirectory() as folder:
+            locations = self.create_savefiles(folder)
+            catalog = ImageCatalog()
+            report = catalog.merge_annotators(locations)
+            self.assertEqual((['a', 'b', 'c'], 2, 8), (report['annotators'], report['images'], report['boxes']))
+            self.assertEqual((5, 2, 5), (report['objects'], report['images_added'], report['tags_added']))
+            tags = {(tag.tag_category, tag.coordinates) for tag in catalog.images[0].tags.tag_dict.values()}
+            self.assertEqual({('car', (11, 10, 30, 30)), ('person', (50, 0, 60, 40)), ('sign', (80, 0, 90, 10)),
+                              ('car', (10, 12, 30, 30))}, tags)
+            # The person (no c), the sign and the second car of c, and the car of image1 (not tagged by b):
+            self.assertEqual(4, report['disagreements'])
+            self.assertIn(('image0.png', 'sign', (80, 0, 90, 10), ['b'], True), report['review'])
+            self.assertIn('disagreed: 4 (2 images to review)', annotator_merge.format_merge_report(report))
+            catalog.close_all_images()
+            # Consensus keeps the objects tagged by most annotators of the image:
+            catalog = ImageCatalog()
+            report = catalog.merge_annotators(locations, MergeOptions('consensus'))
+            self.assertEqual(3, report['objects_dropped'])
+            tags = {(tag.tag_category, tag.coordinates) for tag in catalog.images[0].tags.tag_dict.values()}
+            self.assertEqual({('car', (11, 10, 30, 30)), ('person', (50, 0, 60, 40))}, tags)
+            self.assertEqual({}, catalog.images[1].tags.tag_dict)  # (one of the two annotators of image1)
+            catalog.close_all_images()
+            # Prefer keeps the boxes of b in the images b annotated:
+            catalog = ImageCatalog()
+            report = catalog.merge_annotators(locations, MergeOptions('prefer', prefer=locations[1]))
+            tags = {(tag.tag_category, tag.coordinates) for tag in catalog.images[0].tags.tag_dict.values()}
+            self.assertEqual({('car', (12, 10, 30, 30)), ('person', (51, 0, 60, 40)), ('sign', (80, 0, 90, 10))},
+                             tags)
+            self.assertEqual((2, {}), (report['objects_dropped'], catalog.images[1].tags.tag_dict))
+            with self.assertRaises(ValueError):
+                catalog.merge_annotators(locations, MergeOptions('prefer', prefer='d'))
+            catalog.close_all_images()
+
+    def test_annotator_names(self):
+        """Savefiles with the same name in different folders are named after their relative path."""
+        self.assertEqual(['alice', 'bob'], annotator_merge.annotator_names(['/data/alice.csv', '/data/bob.csv']))
+        self.assertEqual(['alice/project', 'bob/project'],
+                         annotator_merge.annotator_names(['/data/alice/project.csv', '/data/bob/project.csv']))
+        self.assertEqual(['project.csv', 'project.txt'],
+                         annotator_merge.annotator_names(['/data/project.csv', '/data/project.txt']))
+        with self.assertRaises(ValueError):
+            annotator_merge.annotator_names(['/data/alice.csv', '/data/./alice.csv'])
+        with tempfile.TemporaryDirectory() as folder:
+            locations = self.create_savefiles(folder)
+            for annotator in ('alice', 'bob'):
+                os.makedirs(folder + '/' + annotator)
+            os.rename(locations[0], folder + '/alice/project.csv')
+            os.rename(locations[1], folder + '/bob/project.csv')
+            locations = [folder + '/alice/project.csv', folder + '/bob/project.csv']
+            catalog = ImageCatalog()
+            report = catalog.merge_annotators(locations, MergeOptions('prefer', prefer='bob/project'))
+            self.assertEqual(['alice/project', 'bob/project'], report['annotators'])
+            tags = {(tag.tag_category, tag.coordinates) for tag in catalog.images[0].tags.tag_dict.values()}
+            self.assertEqual({('car', (12, 10, 30, 30)), ('person', (51, 0, 60, 40)), ('sign', (80, 0, 90, 10))},
+                             tags)
+            with self.assertRaises(ValueError):
+                catalog.merge_annotators(locations, MergeOptions('prefer', prefer='project'))
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
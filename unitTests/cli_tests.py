@@ -0,0 +1,124 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from PIL import Image, ImageDraw
+
+# Own modules (to be tested)
+import cli
+from cli import BatchMode
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_images(folder):
+        """
+        Creates a folder with an image, a resized copy of it in a sub-folder, another image and an image in a sub-folder
+        with the same file name as the first one.
+        """
+        randomizer = random.Random(0)
+        pil_image = Image.new('RGB', (320, 240), (128, 128, 128))
+        draw = ImageDraw.Draw(pil_image)
+        for _ in range(12):
+            x, y = randomizer.randrange(320), randomizer.randrange(240)
+            draw.rectangle([x, y, x + randomizer.randint(20, 120), y + randomizer.randint(20, 120)],
+                           fill=tuple(randomizer.randrange(256) for _ in range(3)))
+        os.makedirs(folder + '/sub')
+        os.makedirs(folder + '/other')
+        pil_image.save(folder + '/a.png')
+        pil_image.resize((160, 120)).save(folder + '/sub/copy.jpg', quality=70)
+        Image.new('RGB', (320, 240), (200, 30, 30)).save(folder + '/b.png')
+        Image.new('RGB', (100, 100)).save(folder + '/other/a.png')
+
+    @staticmethod
+    def run_command(argv):
+        """Runs a command of the batch mode on a new BatchMode and returns (exit code, output, batch mode)."""
+        stream = io.StringIO()
+        batch_mode = BatchMode(stream)
+        args = cli.parse_arguments(argv)
+        return getattr(batch_mode, args.command)(args), stream.getvalue(), batch_mode
+
+    def test_ingest(self):
+        """Ingests a folder recursively on a pool of workers and again (nothing new), and reports the skipped file."""
+        with tempfile.TemporaryDirectory() as folder, tempfile.TemporaryDirectory() as output:
+            self.create_images(folder + '/images')
+            savefile = output + '/savefile.csv'
+            code, text, batch_mode = self.run_command(['ingest', savefile, folder + '/images', '--recursive',
+                                                       '--workers', '2'])
+            self.assertEqual(0, code)
+            self.assertIn('Added 3 images from', text)
+            self.assertIn('Skipped 1 images', text)
+            self.assertIn('other/a.png', text)
+            images = {image.file_name: image for image in batch_mode.controller.catalog.images.values()}
+            self.assertEqual({'a.png': (320, 240), 'b.png': (320, 240), 'copy.jpg': (160, 120)},
+                             {file_name: image.size for file_name, image in images.items()})
+            self.assertEqual(os.path.abspath(folder + '/images/sub'), images['copy.jpg'].file_location)
+            batch_mode.controller.catalog.close_all_images()
+            code, text, batch_mode = self.run_command(['ingest', savefile, folder + '/images', '--recursive'])
+            self.assertIn('Added 0 images from', text)
+            self.assertEqual(3, len(batch_mode.controller.catalog.images))
+            batch_mode.controller.catalog.close_all_images()
+
+    def test_export(self):
+        """Exports the tags of an ingested savefile to csv and copies the tagged images."""
+        with tempfile.TemporaryDirectory() as folder, tempfile.TemporaryDirectory() as output:
+            self.create_images(folder + '/images')
+            savefile = output + '/savefile.csv'
+            _, _, batch_mode = self.run_command(['ingest', savefile, folder + '/images'])
+            catalog = batch_mode.controller.catalog
+            image_ids = {image.file_name: image_id for image_id, image in catalog.images.items()}
+            catalog.images[image_ids['a.png']].tags.add_tags([('car', [10, 10, 50, 40]), ('sign', [60, 0, 70, 20])])
+            batch_mode.save(savefile)
+            catalog.close_all_images()
+            code, text, batch_mode = self.run_command(['export', savefile, output + '/export', '--images'])
+            self.assertEqual(0, code)
+            self.assertIn('csv: ', text)
+            with open(output + '/export/exported_tags.csv') as handle:
+                rows = [line for line in handle.read().splitlines() if 'a.png' in line]
+            self.assertEqual(2, len(rows))
+            self.assertEqual(['a.png', 'tags.csv'], sorted(os.listdir(output + '/export/images')))
+            batch_mode.controller.catalog.close_all_images()
+            # The images copied are selected by --image-categories, the annotations by --categories:
+            code, text, batch_mode = self.run_command(['export', savefile, output + '/selected', '--images',
+                                                       '--categories', 'sign', '--image-categories', 'truck'])
+            self.assertEqual(0, code)
+            self.assertIn('csv: 1 images', text)
+            self.assertFalse(os.path.exists(output + '/selected/images/a.png'))
+            self.assertEqual(2, self.run_command(['export', savefile, output + '/export', '--formats', 'tfrecord'])[0])
+            batch_mode.controller.catalog.close_all_images()
+
+    def test_duplicates(self):
+        """Finds the resized copy of an image as its near-duplicate and copies the tags to it."""
+        with tempfile.TemporaryDirectory() as folder, tempfile.TemporaryDirectory() as output:
+            self.create_images(folder + '/images')
+            savefile = output + '/savefile.csv'
+            _, _, batch_mode = self.run_command(['ingest', savefile, folder + '/images', '--recursive'])
+            catalog = batch_mode.controller.catalog
+            image_ids = {image.file_name: image_id for image_id, image in catalog.images.items()}
+            catalog.images[image_ids['a.png']].tags.add_tags([('car', [10, 10, 50, 40])])
+            batch_mode.save(savefile)
+            catalog.close_all_images()
+            code, text, batch_mode = self.run_command(['duplicates', savefile, '--workers', '1'])
+            self.assertEqual(0, code)
+            self.assertIn('2 images in 1 clusters of near-duplicates.', text)
+            self.assertIn(os.path.abspath(folder + '/images/sub') + '/copy.jpg', text)
+            self.assertEqual({}, batch_mode.controller.catalog.images[image_ids['copy.jpg']].tags.tag_dict)
+            self.assertIn('Saved 3 images', text)  # (with the hashes)
+            batch_mode.controller.catalog.close_all_images()
+            # The resized copy has another size, so its tags are not copied, and the hashes are in the savefile:
+            modified = os.path.getmtime(savefile)
+            code, text, batch_mode = self.run_command(['duplicates', savefile, '--copy-tags'])
+            self.assertIn('Copied 0 tags.', text)
+            self.assertIn('2 images in 1 clusters of near-duplicates.', text)
+            self.assertNotIn('Saved', text)
+            self.assertEqual(modified, os.path.getmtime(savefile))
+            batch_mode.controller.catalog.close_all_images()
+            code, text, batch_mode = self.run_command(['duplicates', savefile, '--save'])
+            self.assertIn('Saved 3 images', text)
+            batch_mode.controller.catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
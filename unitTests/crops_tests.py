@@ -0,0 +1,72 @@
+import csv
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image
+
+# Own modules (to be tested)
+from crops import crop_region
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_crop_region(self):
+        self.assertEqual([10, 20, 30, 60], crop_region([10, 20, 30, 60], (100, 100)))
+        self.assertEqual([8, 16, 32, 64], crop_region([10, 20, 30, 60], (100, 100), padding=0.1))
+        self.assertEqual([0, 20, 40, 60], crop_region([10, 20, 30, 60], (100, 100), square=True))
+        # Moved inside the image at the right edge, clipped when the image is too small:
+        self.assertEqual([60, 0, 100, 40], crop_region([80, 0, 100, 40], (100, 100), square=True))
+        self.assertEqual([0, 0, 30, 20], crop_region([0, 0, 30, 10], (30, 20), square=True))
+
+    def test_export(self):
+        """Exports the boxes of two images as crops in a folder per tag_category."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ImageCatalog()
+            for i in range(2):
+                pil_image = Image.new('RGB', (400, 300), (0, 0, 0))
+                pil_image.paste((255, 0, 0), (100, 100, 200, 150))
+                pil_image.save('{0}/image{1}.jpg'.format(folder, i))
+                catalog.add_image(folder, 'image{0}.jpg'.format(i), datetime(2019, 1, 1 + i))
+            catalog.images[0].tags.add_tags([('c_car', [100, 100, 200, 150]), ('c_bike', [10, 10, 13, 300])])
+            catalog.images[1].tags.add_tag('c_car', [0, 0, 400, 300])
+            summary = catalog.export_annotations([('crops', folder + '/crops', {'square': True, 'min_side': 5,
+                                                                                'crop_size': 64, 'workers': 2})])
+            self.assertEqual({'images': 2, 'boxes': 2, 'skipped': 1}, summary['crops'])
+            self.assertEqual(['c_car', 'manifest.csv'], sorted(os.listdir(folder + '/crops')))
+            self.assertEqual(['image0_0_0.jpg', 'image1_1_0.jpg'], sorted(os.listdir(folder + '/crops/c_car')))
+            with Image.open(folder + '/crops/c_car/image0_0_0.jpg') as pil_image:
+                self.assertEqual((64, 64), pil_image.size)
+                red = pil_image.getpixel((32, 32))
+                self.assertTrue(red[0] > 200 and red[1] < 50)
+            with open(folder + '/crops/manifest.csv') as handle:
+                rows = list(csv.reader(handle))
+            self.assertEqual(['crop', 'class', 'source', 'xmin', 'ymin', 'xmax', 'ymax'], rows[0])
+            self.assertEqual(['c_car/image0_0_0.jpg', 'c_car', folder + '/image0.jpg', '100', '75', '200', '175'],
+                             rows[1])
+            self.assertEqual(['0', '0', '400', '300'], rows[2][3:])
+            catalog.close_all_images()
+
+    def test_same_stem(self):
+        """Images with the same stem get crops with different names, a source with a comma is quoted."""
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(folder + '/day 1, car')
+            catalog = ImageCatalog()
+            for i, file_name in enumerate(['image.jpg', 'image.png']):
+                Image.new('RGB', (100, 100), (50 * i, 0, 0)).save(folder + '/day 1, car/' + file_name)
+                catalog.add_image(folder + '/day 1, car', file_name, datetime(2019, 1, 1 + i))
+                catalog.images[i].tags.add_tag('c_car', [10, 10, 50, 50])
+            summary = catalog.export_annotations([('crops', folder + '/crops', {'workers': 1})])
+            self.assertEqual({'images': 2, 'boxes': 2, 'skipped': 0}, summary['crops'])
+            self.assertEqual(['image_0_0.jpg', 'image_1_0.jpg'], sorted(os.listdir(folder + '/crops/c_car')))
+            with open(folder + '/crops/manifest.csv') as handle:
+                rows = list(csv.reader(handle))
+            self.assertEqual([folder + '/day 1, car/image.jpg', folder + '/day 1, car/image.png'],
+                             sorted(row[2] for row in rows[1:]))
+            self.assertEqual(['10', '10', '50', '50'], rows[1][3:])
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
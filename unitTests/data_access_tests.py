@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image
+
+# Own modules (to be tested)
+from data_access import FileAccess, ImageAccess
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_csv_writer_and_reader(self):
+        """Writes a file in small batches, appends to it and reads it back line by line."""
+        with tempfile.TemporaryDirectory() as folder:
+            filename = folder + '/data.csv'
+            with FileAccess.open_csv(filename, batch_size=2) as writer:
+                writer.write('a;b\n')
+                writer.write_lines(['1;2\n', '3;4\n', '5;6\n'])
+            FileAccess.append_to_csv(filename, ['7;8\n'])
+            rows = FileAccess.iter_csv(filename, ';')
+            self.assertEqual(['a', 'b'], next(rows))  # generator, lines are read one by one
+            self.assertEqual([['1', '2'], ['3', '4'], ['5', '6'], ['7', '8']], list(rows))
+            self.assertEqual([], FileAccess.read_csv(folder + '/missing.csv', ';'))
+
+    def test_save_and_load_progress(self):
+        """Saves a catalog with tags and settings and loads it into a new catalog."""
+        with tempfile.TemporaryDirectory() as folder:
+            Image.new('RGB', (200, 100)).save(folder + '/file1.jpg')
+            catalog = ImageCatalog()
+            catalog.add_image(folder, 'file1.jpg', datetime(2020, 1, 2, 3, 4, 5))
+            catalog.images[0].tags.add_tag('da_car', [0, 0, 100, 50])
+            catalog.save_progress(folder + '/save.csv', ['taglinewidth;5\n', 'min_tagsize;10\n'])
+            catalog.close_all_images()
+            self.assertTrue(os.path.exists(folder + '/save_settings.csv'))
+
+            new_catalog = ImageCatalog()
+            selected_image, taglinewidth, _, min_tagsize, _ = new_catalog.load_savefile(folder + '/save.csv')
+            self.assertEqual(('5', 10), (taglinewidth, min_tagsize))
+            self.assertEqual(datetime(2020, 1, 2, 3, 4, 5), new_catalog.images[0].date_taken)
+            self.assertEqual([('da_car', (0, 0, 100, 50))], [(t.tag_category, t.coordinates) for t in
+                                                             new_catalog.images[0].tags.tag_dict.values()])
+            new_catalog.close_all_images()
+        catalog.tag_categories.remove_tag_category('da_car')
+
+    def test_scan_images(self):
+        """Walks a folder tree in batches with case-insensitive extensions and include / exclude patterns."""
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(folder + '/day1/cam2')
+            os.makedirs(folder + '/thumbnails')
+            for file_name in ['a.JPG', 'b.jpeg', 'notes.txt', 'day1/c.png', 'day1/cam2/d.TIF', 'thumbnails/e.jpg']:
+                open(folder + '/' + file_name, 'w').close()
+            image_access = ImageAccess()
+            self.assertEqual(['a.JPG', 'b.jpeg'], sorted(image_access.import_images(folder)))
+            batches = list(image_access.scan_images(folder, batch_size=2))
+            self.assertTrue(all(len(batch) <= 2 for batch in batches))
+            self.assertEqual(['a.JPG', 'b.jpeg', 'day1/c.png', 'day1/cam2/d.TIF', 'thumbnails/e.jpg'],
+                             sorted(file_name for batch in batches for file_name in batch))
+            found = [file_name for batch in image_access.scan_images(folder, include=['*.png', '*.tif', '*.jpg'],
+                                                                     exclude=['thumbnails', 'day1/cam2/*'])
+                     for file_name in batch]
+            self.assertEqual(['a.JPG', 'day1/c.png'], sorted(found))
+
+    def test_open_folder_recursive(self):
+        """Imports a folder tree, images in sub-folders keep their own file_location."""
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(folder + '/sub')
+            Image.new('RGB', (20, 10)).save(folder + '/file1.jpg')
+            Image.new('RGB', (20, 10)).save(folder + '/sub/file2.jpg')
+            catalog = ImageCatalog()
+            progress = []
+            catalog.open_folder(folder, lambda done, total: progress.append(done), recursive=True)
+            locations = {image.file_name: image.file_location for image in catalog.images.values()}
+            self.assertEqual({'file1.jpg': folder, 'file2.jpg': folder + '/sub'}, locations)
+            self.assertEqual([1, 2], progress)
+            added, next_image_id = catalog.images_added_since(1)
+            self.assertEqual(([1], 2), ([image_id for image_id, image in added], next_image_id))
+            catalog.close_all_images()
+
+    def test_open_folder_same_file_names(self):
+        """Files with the file_name of an image from another folder are skipped and reported."""
+        with tempfile.TemporaryDirectory() as folder:
+            for sub_folder in ['a', 'b']:
+                os.makedirs(folder + '/' + sub_folder)
+                Image.new('RGB', (20, 10)).save(folder + '/' + sub_folder + '/IMG_0001.jpg')
+            Image.new('RGB', (20, 10)).save(folder + '/b/IMG_0002.jpg')
+            catalog = ImageCatalog()
+            summary = catalog.open_folder(folder, recursive=True)
+            self.assertEqual(2, summary['added'])
+            self.assertEqual(1, len(summary['skipped']))
+            self.assertIn(summary['skipped'][0], ['a/IMG_0001.jpg', 'b/IMG_0001.jpg'])
+            # Importing the same folder again does not report the images that were imported already:
+            self.assertEqual({'added': 0, 'skipped': summary['skipped']}, catalog.open_folder(folder, recursive=True))
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
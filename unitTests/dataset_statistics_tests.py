@@ -0,0 +1,69 @@
+import json
+import unittest
+from datetime import datetime
+import numpy as np
+
+# Own modules (to be tested)
+import dataset_statistics
+from controller import Controller
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_catalog():
+        """Creates a catalog (without image files) with cars, persons and a sign."""
+        controller = Controller()
+        catalog = controller.catalog
+        for i in range(4):
+            catalog.add_image('/data', 'image{0}.jpg'.format(i), datetime(2019, 1, 1 + i), (1000, 500))
+        catalog.images[0].tags.add_tags([('car', [0, 0, 100, 50]), ('car', [200, 0, 300, 50]),
+                                         ('person', [0, 0, 20, 60])])
+        catalog.images[1].tags.add_tags([('car', [0, 0, 120, 60]), ('sign', [10, 10, 40, 40])])
+        catalog.images[2].tags.add_tags([('person', [0, 0, 30, 90])])
+        return controller
+
+    def test_describe(self):
+        values = np.random.default_rng(0).random(1001) * 100
+        description = dataset_statistics.describe(values)
+        self.assertEqual(1001, description['count'])
+        for q in dataset_statistics.PERCENTILES:
+            self.assertAlmostEqual(np.percentile(values, q), description['p{0}'.format(q)])
+        self.assertEqual((values.min(), values.max()), (description['min'], description['max']))
+        self.assertEqual({'count': 0}, dataset_statistics.describe(np.zeros(0)))
+
+    def test_statistics(self):
+        controller = self.create_catalog()
+        report = controller.dataset_statistics(anchors=2)
+        self.assertEqual((4, 3, 6), (report['images'], report['tagged_images'], report['boxes']))
+        self.assertEqual({0: 1, 1: 1, 2: 1, 3: 1}, report['boxes_per_image']['histogram'])
+        self.assertEqual((3, 2), (report['categories']['car']['boxes'], report['categories']['car']['images']))
+        self.assertEqual(100, report['categories']['car']['width']['p50'])
+        self.assertEqual(1 / 3, report['categories']['person']['aspect_ratio']['max'])
+        self.assertEqual({'small': 0, 'medium': 2, 'large': 0}, report['categories']['person']['sizes'])
+        self.assertEqual({'small': 1, 'medium': 0, 'large': 0}, report['categories']['sign']['sizes'])
+        self.assertEqual({'person': 1, 'sign': 1}, report['cooccurrence']['car'])
+        self.assertEqual({'car': 1}, report['cooccurrence']['sign'])
+        self.assertEqual(2, len(report['anchors']))  # a wide (cars) and a tall (persons, sign) anchor
+        self.assertGreater(report['anchors'][1][0], report['anchors'][1][1])
+        json.dumps(report)  # (can be written to a json file)
+        self.assertIn('Suggested anchors', dataset_statistics.format_report(report))
+        report = controller.dataset_statistics({'categories': ['person']}, anchors=0)
+        self.assertEqual((2, 4), (report['images'], report['boxes']))  # (all tags of the images with persons)
+        self.assertNotIn('anchors', report)
+        controller.catalog.rename_tag_category('sign', 'car')
+        self.assertEqual(4, controller.dataset_statistics()['categories']['car']['boxes'])
+
+    def test_anchors(self):
+        """Two clear clusters of box sizes give two anchors at their median size."""
+        randomizer = np.random.default_rng(1)
+        sizes = np.concatenate([randomizer.normal((20, 40), 1, (500, 2)), randomizer.normal((200, 100), 5, (500, 2))])
+        anchors, mean_iou = dataset_statistics.kmeans_anchors(sizes, 2)
+        np.testing.assert_allclose([[20, 40], [200, 100]], anchors, rtol=0.05)
+        self.assertGreater(mean_iou, 0.9)
+        anchors, mean_iou = dataset_statistics.kmeans_anchors(np.array([[10.0, 10.0], [10.0, 10.0]]), 9)
+        self.assertEqual(([[10.0, 10.0]], 1.0), (anchors.tolist(), mean_iou))
+
+
+if __name__ == '__main__':
+    unittest.main()
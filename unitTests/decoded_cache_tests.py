@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+import numpy as np
+from PIL import Image
+
+# Own modules (to be tested)
+import decoded_cache
+from decoded_cache import DecodedCache
+from image_catalog import ImageCatalog
+from transcode import TranscodeOptions
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_reduction(self):
+        self.assertEqual(8, DecodedCache.reduction((4000, 3000), (400, 300)))
+        self.assertEqual(4, DecodedCache.reduction((4000, 3000), (640, 480)))
+        self.assertEqual(1, DecodedCache.reduction((4000, 3000), (3000, 3000)))
+        self.assertEqual(1, DecodedCache.reduction((4000, 3000), None))
+
+    def test_get(self):
+        """Decodes an image once, later reads (also from another cache object) are views of the memory map."""
+        with tempfile.TemporaryDirectory() as folder:
+            Image.new('RGB', (400, 200), (200, 10, 10)).save(folder + '/image.jpg')
+            Image.new('L', (50, 40), 128).save(folder + '/small.png')
+            cache = DecodedCache(folder + '/cache')
+            array = cache.get(folder + '/image.jpg', (90, 40))
+            self.assertEqual((50, 100, 3), array.shape)  # decoded at 1/4
+            self.assertIsInstance(array.base, np.memmap)
+            self.assertIs(array.base, cache.get(folder + '/image.jpg', (100, 50)).base)
+            self.assertEqual((1, 1), (cache.hits, cache.misses))
+            self.assertEqual((200, 400, 3), cache.get(folder + '/image.jpg').shape)  # full size: another entry
+            self.assertEqual((40, 50, 3), cache.get(folder + '/small.png', (80, 80)).shape)  # not enlarged
+            self.assertEqual((40, 50, 3), cache.get(folder + '/small.png', (80, 80)).shape)
+            self.assertEqual((2, 3), (cache.hits, cache.misses))
+            reader = DecodedCache(folder + '/cache', readonly=True)
+            self.assertTrue(np.array_equal(array, reader.cached(folder + '/image.jpg', (90, 40))))
+            self.assertEqual((200, 400, 3), reader.cached(folder + '/image.jpg', (300, 200)).shape)
+            # A changed file is decoded again:
+            Image.new('RGB', (400, 200), (10, 10, 200)).save(folder + '/image.jpg')
+            os.utime(folder + '/image.jpg', ns=(1, 1))
+            self.assertIsNone(reader.cached(folder + '/image.jpg', (90, 40)))
+            self.assertTrue(cache.image(folder + '/image.jpg', (90, 40)).getpixel((5, 5))[2] > 150)
+            cache.clear()
+            self.assertEqual([], os.listdir(folder + '/cache'))
+
+    def test_store_twice(self):
+        """An image decoded by two threads after a miss is stored once, both get the same view."""
+        with tempfile.TemporaryDirectory() as folder:
+            Image.new('RGB', (400, 200), (200, 10, 10)).save(folder + '/image.jpg')
+            cache = DecodedCache(folder + '/cache')
+            decoded = [decoded_cache.decode(folder + '/image.jpg', (90, 40)) for _ in range(2)]
+            views = [cache.store(folder + '/image.jpg', reduction, array) for array, reduction in decoded]
+            self.assertIs(views[0].base, views[1].base)
+            self.assertEqual(100 * 50 * 3, os.path.getsize(folder + '/cache/data.bin'))
+            with open(folder + '/cache/index.jsonl') as handle:
+                self.assertEqual(1, len(handle.readlines()))
+
+    def test_fill(self):
+        """Fills a cache with a maximum size on a process pool, the export workers read the images from it."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ImageCatalog()
+            for i in range(3):
+                Image.new('RGB', (160, 120), (i * 100, 0, 0)).save('{0}/image{1}.jpg'.format(folder, i))
+                catalog.add_image(folder, 'image{0}.jpg'.format(i), datetime(2019, 1, 1 + i))
+                catalog.images[i].tags.add_tag('t_car', [10, 10, 60, 60])
+            paths = ['{0}/image{1}.jpg'.format(folder, i) for i in range(3)]
+            progress = []
+            cache = DecodedCache(folder + '/cache', max_bytes=2 * 80 * 60 * 3)
+            self.assertEqual(2, cache.fill(paths, (80, 60), workers=2, progress=lambda *p: progress.append(p)))
+            self.assertEqual([(1, 3), (2, 3), (3, 3)], progress)
+            self.assertEqual(2 * 80 * 60 * 3, os.path.getsize(folder + '/cache/data.bin'))
+            summary = catalog.export_annotations([('csv', folder + '/tags.csv', {})],
+                                                 transcode=TranscodeOptions(max_side=80),
+                                                 images_location=folder + '/images', workers=1,
+                                                 decoded_cache=folder + '/cache')
+            self.assertEqual({'images': 3, 'boxes': 3}, summary['csv'])
+            self.assertEqual((2, 1), (decoded_cache.readers[folder + '/cache'].hits,
+                                      decoded_cache.readers[folder + '/cache'].misses))
+            with Image.open(folder + '/images/image1.jpg') as pil_image:
+                self.assertEqual((80, 60), pil_image.size)
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
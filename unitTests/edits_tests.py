@@ -0,0 +1,118 @@
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image, ImageChops
+
+# Own modules (to be tested)
+import edits
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_image(location, size=(64, 48)):
+        """Creates an image with a different color in every quadrant (so rotations can be told apart)."""
+        pil_image = Image.new('RGB', size, (255, 0, 0))
+        pil_image.paste((0, 255, 0), (size[0] // 2, 0, size[0], size[1] // 2))
+        pil_image.paste((0, 0, 255), (0, size[1] // 2, size[0] // 2, size[1]))
+        pil_image.save(location)
+        return pil_image
+
+    def test_boxes(self):
+        """Checks that boxes follow rotations and crops."""
+        box, size = [10, 5, 20, 15], (64, 48)
+        self.assertEqual([5, 44, 15, 54], edits.rotate_box(box, size, 'left'))
+        self.assertEqual(box, edits.rotate_box(edits.rotate_box(box, size, 'left'), (48, 64), 'right'))
+        rotated = box
+        for turn in range(4):
+            rotated = edits.rotate_box(rotated, size if turn % 2 == 0 else (48, 64), 'right')
+        self.assertEqual(box, rotated)
+        self.assertEqual([0, 0, 5, 10], edits.crop_box(box, [15, 5, 40, 40]))
+        self.assertIsNone(edits.crop_box(box, [30, 30, 40, 40]))
+
+    def test_edit_stack(self):
+        """Records edits on an image, checks the preview and writes them to the file."""
+        with tempfile.TemporaryDirectory() as folder:
+            original = self.create_image(folder + '/image.png')
+            catalog = ImageCatalog()
+            catalog.add_image(folder, 'image.png', datetime(2019, 1, 1))
+            image = catalog.images[0]
+            image.tags.add_tags([('e_car', [4, 4, 20, 12]), ('e_bike', [40, 30, 60, 44])])
+            image.tags.add_tag('e_scene')  # full image tag
+            image.rotate('right')
+            image.crop([0, 0, 48, 40])  # removes the bike
+            image.rotate('left')
+            self.assertEqual((40, 48), image.size)
+            self.assertEqual({'e_car': (4, 4, 20, 12), 'e_scene': (0, 0, 40, 48)},
+                             {tag.tag_category: tag.coordinates for tag in image.tags.tag_dict.values()})
+            with Image.open(folder + '/image.png') as pil_image:
+                self.assertEqual((64, 48), pil_image.size)  # the file has not been changed yet
+            expected = original.crop((0, 0, 40, 48))
+            self.assertIsNone(ImageChops.difference(expected, image.preview((40, 48)).convert('RGB')).getbbox())
+            self.assertEqual(1, catalog.apply_edits())
+            self.assertIsNone(image.edits)
+            self.assertEqual((40, 48), image.size)
+            with Image.open(folder + '/image.png') as pil_image:
+                self.assertIsNone(ImageChops.difference(expected, pil_image.convert('RGB')).getbbox())
+            self.assertEqual(0, catalog.apply_edits())
+
+    def test_reload(self):
+        """Reloading an image keeps the edits that have not been written yet, so its tags still match."""
+        with tempfile.TemporaryDirectory() as folder:
+            original = self.create_image(folder + '/image.png')
+            catalog = ImageCatalog()
+            catalog.add_image(folder, 'image.png', datetime(2019, 1, 1))
+            image = catalog.images[0]
+            image.tags.add_tags([('e_car', [4, 4, 20, 12])])
+            image.rotate('right')
+            tags = {tag.tag_category: tag.coordinates for tag in image.tags.tag_dict.values()}
+            catalog.reload_image(0)
+            self.assertIsNotNone(image.edits)
+            self.assertEqual((48, 64), image.size)
+            self.assertEqual(tags, {tag.tag_category: tag.coordinates for tag in image.tags.tag_dict.values()})
+            expected = original.transpose(Image.Transpose.ROTATE_270)
+            self.assertIsNone(ImageChops.difference(expected, image.preview((48, 64)).convert('RGB')).getbbox())
+            self.assertEqual(1, catalog.apply_edits())
+            self.assertEqual(tags, {tag.tag_category: tag.coordinates for tag in image.tags.tag_dict.values()})
+            catalog.close_all_images()
+
+    def test_jpeg(self):
+        """Checks that edited JPEG files keep their quantization tables and get a normal EXIF orientation."""
+        with tempfile.TemporaryDirectory() as folder:
+            pil_image = self.create_image(folder + '/image.jpg', (64, 32))
+            exif = Image.Exif()
+            exif[edits.EXIF_ORIENTATION] = 6
+            pil_image.save(folder + '/image.jpg', quality=70, exif=exif.tobytes())
+            with Image.open(folder + '/image.jpg') as written:
+                quantization = written.quantization
+            catalog = ImageCatalog()
+            catalog.add_image(folder, 'image.jpg', datetime(2019, 1, 1))
+            catalog.images[0].rotate('right')
+            offset = catalog.save_image(0)
+            with Image.open(folder + '/image.jpg') as written:
+                self.assertEqual((32 + offset[0], 64 + offset[1]), written.size)
+                self.assertEqual(1, written.getexif()[edits.EXIF_ORIENTATION])
+                if edits.JPEGTRAN is None:
+                    self.assertEqual(quantization, written.quantization)
+            catalog.close_all_images()
+
+    def test_reset_exif_orientation(self):
+        with tempfile.TemporaryDirectory() as folder:
+            exif = Image.Exif()
+            exif[edits.EXIF_ORIENTATION] = 8
+            Image.new('RGB', (16, 16)).save(folder + '/image.jpg', exif=exif.tobytes())
+            with open(folder + '/image.jpg', 'rb') as handle:
+                data = handle.read()
+            self.assertTrue(edits.reset_exif_orientation(folder + '/image.jpg'))
+            self.assertFalse(edits.reset_exif_orientation(folder + '/image.jpg'))
+            with open(folder + '/image.jpg', 'rb') as handle:
+                changed = handle.read()
+            self.assertEqual(len(data), len(changed))
+            self.assertEqual(1, sum(1 for a, b in zip(data, changed) if a != b))  # only the orientation value changed
+            Image.new('RGB', (16, 16)).save(folder + '/plain.jpg')
+            self.assertFalse(edits.reset_exif_orientation(folder + '/plain.jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+from datetime import datetime
+from PIL import Image
+
+# Own modules (to be tested)
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_export_annotations(self):
+        """
+        Exports a catalog with two tagged images and one untagged image to csv, COCO and VOC in a single pass and
+        checks the content of the written files.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ['file1.jpg', 'file2.png', 'file3.jpg']:
+                Image.new('RGB', (200, 100)).save(folder + '/' + name)
+            catalog = ImageCatalog()
+            for name in ['file1.jpg', 'file2.png', 'file3.jpg']:
+                catalog.add_image(folder, name, datetime(2020, 1, 1))
+            catalog.images[0].tags.add_tag('exp_car', [0, 0, 100, 50])
+            catalog.images[0].tags.add_tag('exp_sign', [10, 10, 12, 12])  # too small, filtered by min_tagsize
+            catalog.images[1].tags.add_tag('exp_sign', [50, 25, 200, 100])
+            exports = [('csv', folder + '/tags.csv', {}), ('coco', folder + '/annotations.json', {}),
+                       ('voc', folder + '/Annotations', {'workers': 2})]
+            summary = catalog.export_annotations(exports, min_tagsize=10)
+            catalog.close_all_images()
+
+            self.assertEqual({'images': 2, 'boxes': 2}, summary['coco'])
+            with open(folder + '/tags.csv') as handle:
+                lines = handle.read().splitlines()
+            self.assertEqual(['filename,width,height,class,xmin,ymin,xmax,ymax,difficult',
+                              'file1.jpg,200,100,exp_car,0,0,100,50,0', 'file2.png,200,100,exp_sign,50,25,200,100,0'],
+                             lines)
+            with open(folder + '/annotations.json') as handle:
+                coco = json.load(handle)
+            self.assertEqual(['file1.jpg', 'file2.png'], [i['file_name'] for i in coco['images']])
+            self.assertEqual([50, 25, 150, 75], coco['annotations'][1]['bbox'])
+            self.assertEqual(['exp_car', 'exp_sign'], [c['name'] for c in coco['categories']])
+            self.assertFalse(os.path.exists(folder + '/annotations.json.part'))
+            self.assertEqual(['file1.xml', 'file2.xml'], sorted(os.listdir(folder + '/Annotations')))
+            root = ElementTree.parse(folder + '/Annotations/file2.xml').getroot()
+            self.assertEqual('exp_sign', root.find('object/name').text)
+            self.assertEqual('200', root.find('object/bndbox/xmax').text)
+        for tag_category in ['exp_car', 'exp_sign']:
+            catalog.tag_categories.remove_tag_category(tag_category)
+
+    def test_voc_same_stem(self):
+        """Images with the same stem get an xml file each, read back with the VOC importer."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ImageCatalog()
+            for i, name in enumerate(['a.jpg', 'a.png']):
+                catalog.add_image(folder, name, datetime(2020, 1, 1), (200, 100))
+                catalog.images[i].tags.add_tag('exp_car', [0, 0, 100 + i, 50])
+            summary = catalog.export_annotations([('voc', folder + '/Annotations', {'workers': 1})])
+            self.assertEqual({'images': 2, 'boxes': 2}, summary['voc'])
+            self.assertEqual(['a.xml', 'a_png.xml'], sorted(os.listdir(folder + '/Annotations')))
+            root = ElementTree.parse(folder + '/Annotations/a_png.xml').getroot()
+            self.assertEqual(('a.png', '101'), (root.findtext('filename'), root.findtext('object/bndbox/xmax')))
+        catalog.tag_categories.remove_tag_category('exp_car')
+
+
+if __name__ == '__main__':
+    unittest.main()
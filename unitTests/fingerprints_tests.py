@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image
+
+# Own modules (to be tested)
+import fingerprints
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_fingerprint(self):
+        with tempfile.TemporaryDirectory() as folder:
+            for name, color in (('a.png', 10), ('b.png', 10), ('c.png', 200)):
+                Image.new('L', (30, 20), color).save(folder + '/' + name)
+            a, b, c = (fingerprints.fingerprint(folder + '/' + i) for i in ('a.png', 'b.png', 'c.png'))
+            self.assertEqual(a, b)  # same content, other name
+            self.assertNotEqual(a, c)
+            self.assertEqual(os.path.getsize(folder + '/a.png'), fingerprints.fingerprint_size(a))
+            os.mkdir(folder + '/sub')
+            os.rename(folder + '/c.png', folder + '/sub/renamed.png')
+            self.assertEqual({c: folder + '/sub/renamed.png'},
+                             fingerprints.find_files([c, '1:00'], [folder], workers=2))
+
+    def test_relink(self):
+        """Images moved and renamed after saving are found again on load, with their tags."""
+        with tempfile.TemporaryDirectory() as folder:
+            os.mkdir(folder + '/images')
+            catalog = ImageCatalog()
+            for i in range(3):
+                Image.new('RGB', (40, 30), (i * 80, 0, 0)).save('{0}/images/image{1}.png'.format(folder, i))
+                catalog.add_image(folder + '/images', 'image{0}.png'.format(i), datetime(2019, 1, 1 + i))
+                catalog.images[i].tags.add_tag('fp_car', [1, 2, 10 + i, 20])
+            progress = []
+            self.assertEqual(2, catalog.compute_fingerprints([0, 1], workers=2,
+                                                             progress=lambda *p: progress.append(p)))
+            self.assertEqual([(1, 2), (2, 2)], progress)
+            catalog.save_progress(folder + '/save.csv', [])
+            # Reorganize: image0 moved and renamed, image1 renamed, image2 (without fingerprint) moved:
+            os.mkdir(folder + '/reorganized')
+            os.rename(folder + '/images/image0.png', folder + '/reorganized/first.png')
+            os.rename(folder + '/images/image1.png', folder + '/images/second.png')
+            os.rename(folder + '/images/image2.png', folder + '/reorganized/image2.png')
+            loaded = ImageCatalog()
+            loaded.load_savefile(folder + '/save.csv', search_roots=[folder + '/reorganized', folder + '/images'],
+                                 workers=1)
+            locations = {image.file_location + '/' + image.file_name: [(tag.tag_category, tag.coordinates) for tag
+                                                                       in image.tags.tag_dict.values()]
+                         for image in loaded.images.values()}
+            self.assertEqual({folder + '/reorganized/first.png': [('fp_car', (1, 2, 10, 20))],
+                              folder + '/images/second.png': [('fp_car', (1, 2, 11, 20))]}, locations)
+            self.assertEqual(['image2.png'], list(loaded.missing_images))
+            # The missing image and its tags are kept in the savefile:
+            loaded.save_progress(folder + '/save2.csv', [])
+            with open(folder + '/save2.csv') as handle:
+                lines = handle.read().splitlines()
+            self.assertEqual(4, len(lines))
+            self.assertTrue(lines[-1].startswith('image2.png;{0}/images;'.format(folder)))
+            loaded.close_all_images()
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
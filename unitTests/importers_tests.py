@@ -0,0 +1,117 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+from PIL import Image
+
+# Own modules (to be tested)
+from importers import ImportRecord, iter_json_arrays
+from image_catalog import ImageCatalog
+from tags import Tags
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_iter_json_arrays(self):
+        """Parses a json file with a tiny chunk size so that items and numbers are split over chunks."""
+        data = {'info': {'year': 2020}, 'images': [{'id': i, 'file_name': 'f{0}.jpg'.format(i)} for i in range(5)],
+                'annotations': [{'id': 1, 'bbox': [1.5, 22222, 3, 4]}], 'value': 123456789}
+        with tempfile.TemporaryDirectory() as folder:
+            with open(folder + '/data.json', 'w') as handle:
+                json.dump(data, handle)
+            items = list(iter_json_arrays(folder + '/data.json', ('images', 'annotations'), chunk_size=3))
+        self.assertEqual([('images', i) for i in data['images']] + [('annotations', data['annotations'][0])], items)
+
+    def test_import_roundtrip(self):
+        """Exports tags to COCO, VOC and TFRecord and imports each of them into an empty catalog again."""
+        with tempfile.TemporaryDirectory() as folder:
+            Image.new('RGB', (200, 100)).save(folder + '/file1.jpg')
+            with open(folder + '/labels.pbtxt', 'w') as handle:
+                handle.write("item {\n  id: 1\n  name: 'imp_car'\n}\n")
+            catalog = ImageCatalog()
+            catalog.add_image(folder, 'file1.jpg', datetime(2020, 1, 1))
+            catalog.images[0].tags.add_tag('imp_car', [10, 20, 110, 70])
+            catalog.export_annotations([('coco', folder + '/annotations.json', {}),
+                                        ('voc', folder + '/Annotations', {}),
+                                        ('tfrecord', folder + '/tfrecord', {'label_map_location':
+                                                                            folder + '/labels.pbtxt',
+                                                                            'num_shards': 1, 'workers': 1})])
+            catalog.close_all_images()
+            os.rename(folder + '/file1.jpg', folder + '/original.jpg')
+            for import_format, location in [('coco', folder + '/annotations.json'), ('voc', folder + '/Annotations'),
+                                            ('tfrecord', folder + '/tfrecord')]:
+                new_catalog = ImageCatalog()
+                summary = new_catalog.import_annotations(import_format, location, None, workers=1)
+                self.assertEqual({'images_added': 0, 'tags_added': 0, 'tags_skipped': 1}, summary)
+                if import_format != 'tfrecord':  # the tfrecord contains the image, the other formats need the file
+                    os.link(folder + '/original.jpg', folder + '/file1.jpg')
+                summary = new_catalog.import_annotations(import_format, location, folder, workers=1)
+                self.assertEqual({'images_added': 1, 'tags_added': 1, 'tags_skipped': 0}, summary)
+                tags = new_catalog.images[0].tags.tag_dict
+                self.assertEqual([('imp_car', (10, 20, 110, 70))], [(t.tag_category, t.coordinates)
+                                                                    for t in tags.values()])
+                # importing again does not create duplicate tags:
+                self.assertEqual(0, new_catalog.import_annotations(import_format, location, folder,
+                                                                   workers=1)['tags_added'])
+                new_catalog.close_all_images()
+                os.remove(folder + '/file1.jpg')
+        catalog.tag_categories.remove_tag_category('imp_car')
+
+    def test_embedded_image_names(self):
+        """Embedded images are written in sub-folders of the image folder, but never outside of it."""
+        with tempfile.TemporaryDirectory() as folder:
+            encoded = io.BytesIO()
+            Image.new('RGB', (20, 10)).save(encoded, 'JPEG')
+            image_data = encoded.getvalue()
+            os.makedirs(folder + '/images')
+            boxes = [('car', [0, 0, 5, 5])]
+            records = [ImportRecord('sub/dir/a.jpg', 20, 10, boxes, image_data),
+                       ImportRecord('../outside.jpg', 20, 10, boxes, image_data),
+                       ImportRecord(folder + '/absolute.jpg', 20, 10, boxes, image_data)]
+            catalog = ImageCatalog()
+            summary = catalog.bulk_insert(records, folder + '/images')
+            self.assertEqual({'images_added': 1, 'tags_added': 1, 'tags_skipped': 2}, summary)
+            self.assertEqual((folder + '/images/sub/dir', 'a.jpg'),
+                             (catalog.images[0].file_location, catalog.images[0].file_name))
+            self.assertEqual(['images'], os.listdir(folder))
+            # The file_name of a record in another sub-folder refers to the same image, it is not added again:
+            summary = catalog.bulk_insert([ImportRecord('other/a.jpg', 20, 10, [('car', [1, 1, 5, 5])], image_data)],
+                                          folder + '/images')
+            self.assertEqual({'images_added': 0, 'tags_added': 1, 'tags_skipped': 0}, summary)
+            self.assertEqual((1, 2), (len(catalog.images), len(catalog.images[0].tags.tag_dict)))
+            self.assertFalse(os.path.exists(folder + '/images/other'))
+            # An image with the same file_name added in between (here: directly) is not added twice either:
+            catalog.file_names.add('b.jpg')
+            summary = catalog.bulk_insert([ImportRecord('b.jpg', 20, 10, boxes, image_data)], folder + '/images')
+            self.assertEqual({'images_added': 0, 'tags_added': 0, 'tags_skipped': 1}, summary)
+            self.assertEqual(1, len(catalog.images))
+            catalog.close_all_images()
+
+    def test_many_boxes_per_image(self):
+        """A csv file has one box per record: the keys of the tags of the image are built once, not for every box."""
+        with tempfile.TemporaryDirectory() as folder:
+            Image.new('RGB', (200, 100)).save(folder + '/file1.jpg')
+            with open(folder + '/tags.csv', 'w') as handle:
+                handle.write('filename,width,height,class,xmin,ymin,xmax,ymax\n')
+                for i in range(3000):
+                    handle.write('file1.jpg,200,100,car,{0},0,{1},10\n'.format(i, i + 5))
+                handle.write('file1.jpg,200,100,car,0,0,5,10\n')  # (a duplicate)
+            catalog = ImageCatalog()
+            catalog.add_image(folder, 'file1.jpg', datetime(2020, 1, 1))
+            catalog.images[0].tags.add_tag('car', [0, 0, 5, 10])
+            with mock.patch.object(Tags, 'keys', autospec=True, side_effect=Tags.keys) as keys:
+                summary = catalog.import_annotations('csv', folder + '/tags.csv')
+            self.assertEqual({'images_added': 0, 'tags_added': 2999, 'tags_skipped': 0}, summary)
+            self.assertEqual(1, keys.call_count)
+            self.assertEqual(3000, len(catalog.images[0].tags.tag_dict))
+            # Tags changed in between (e.g. in the GUI during an import) are taken into account:
+            catalog.images[0].tags.add_tag('car', [1, 1, 2, 2])
+            self.assertEqual(0, catalog.import_annotations('csv', folder + '/tags.csv')['tags_added'])
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import json
+import os
+import tempfile
+import unittest
+
+# Own modules (to be tested)
+from instrumentation import Instrumentation
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_disabled_instrumentation_records_nothing(self):
+        instrumentation = Instrumentation()
+        with instrumentation.span('decode'):
+            pass
+        instrumentation.count('images_added')
+        self.assertEqual({'spans': {}, 'counters': {}}, instrumentation.stats())
+
+    def test_spans_and_counters(self):
+        """Records spans and counters, checks the rolling window and writes the statistics to json."""
+        instrumentation = Instrumentation(window=3)
+        instrumentation.enable()
+        for duration in [0.004, 0.001, 0.002, 0.003]:
+            instrumentation.record('resize', duration)
+        with instrumentation.span('decode'):
+            pass
+        instrumentation.count('images_added', 5)
+        stats = instrumentation.stats()
+        self.assertEqual(4, stats['spans']['resize']['count'])  # count and total are taken over all calls
+        self.assertAlmostEqual(10, stats['spans']['resize']['total'])
+        self.assertAlmostEqual(3, stats['spans']['resize']['max'])  # the first duration left the window
+        self.assertAlmostEqual(2, stats['spans']['resize']['p50'])
+        self.assertEqual(1, stats['spans']['decode']['count'])
+        self.assertEqual({'images_added': 5}, stats['counters'])
+        self.assertIn('resize', instrumentation.format_stats())
+        with tempfile.TemporaryDirectory() as folder:
+            instrumentation.dump_json(folder + '/stats.json')
+            with open(folder + '/stats.json') as handle:
+                self.assertEqual(4, json.load(handle)['spans']['resize']['count'])
+        instrumentation.reset()
+        self.assertEqual({'spans': {}, 'counters': {}}, instrumentation.stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
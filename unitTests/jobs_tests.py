@@ -0,0 +1,116 @@
+import tempfile
+import threading
+import unittest
+from PIL import Image
+
+# Own modules (to be tested)
+from controller import Controller
+from jobs import JobRunner
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_job_progress_and_result(self):
+        """Runs a job on a worker thread, its progress and result are handed to the callbacks by poll()."""
+        statuses, progress, results = [], [], []
+        runner = JobRunner(on_status=statuses.append)
+
+        def count(numbers, progress=None):
+            for done, _ in enumerate(numbers, 1):
+                progress(done, len(numbers))
+            return sum(numbers)
+        job = runner.submit('Counting', count, [1, 2, 3], on_progress=lambda done, total: progress.append(done),
+                            on_done=results.append)
+        self.assertTrue(job.wait(5))
+        self.assertEqual([], results)  # callbacks only run when polled (on the Tk thread)
+        runner.poll()
+        self.assertEqual([6], results)
+        self.assertEqual([3], progress)  # only the latest progress is handed to the callback
+        self.assertEqual('done', job.state)
+        self.assertEqual(['Counting: 0', None], statuses)
+        self.assertFalse(runner.busy())
+        runner.shutdown()
+
+    def test_cancel_and_error(self):
+        runner = JobRunner()
+        started, cancelled, errors = threading.Event(), [], []
+
+        def endless(progress=None):
+            done = 0
+            started.set()
+            while True:
+                done += 1
+                progress(done, None)
+
+        def failing(progress=None):
+            raise ValueError('broken savefile')
+        job = runner.submit('Endless', endless, on_cancelled=lambda: cancelled.append(True))
+        started.wait(5)
+        runner.cancel_all()
+        self.assertTrue(job.wait(5))
+        failed_job = runner.submit('Failing', failing, on_error=errors.append)
+        self.assertTrue(failed_job.wait(5))
+        runner.poll()
+        self.assertEqual([True], cancelled)
+        self.assertEqual('cancelled', job.state)
+        self.assertEqual('broken savefile', str(errors[0]))
+        unhandled_job = runner.submit('Failing', failing)
+        unhandled_job.wait(5)
+        self.assertRaises(ValueError, runner.poll)  # errors without on_error are raised on the Tk thread
+        runner.shutdown()
+
+    def test_import_folder_in_background(self):
+        """Imports a folder on a worker thread while images are tagged from the calling thread."""
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(20):
+                Image.new('RGB', (20, 10)).save(folder + '/file{0}.jpg'.format(i))
+            controller = Controller()
+            runner = JobRunner()
+            job = runner.submit('Importing images', controller.open_folder, folder)
+            while not job.wait(0.001):
+                for image_name in controller.retrieve_images_present_in_catalog(sort_images='file_name'):
+                    controller.add_tag(image_name, 'car', [0, 0, 5, 5])
+            runner.poll()
+            self.assertEqual('done', job.state)
+            self.assertEqual(20, len(controller.retrieve_images_present_in_catalog()))
+            controller.close_all_images()
+            controller.remove_tag_category('car')
+            runner.shutdown()
+
+    def test_export_while_renaming_categories(self):
+        """Exports (and renames) the tagged images on a worker thread while tag_categories are added and renamed."""
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(20):
+                Image.new('RGB', (20, 10)).save(folder + '/file{0}.jpg'.format(i))
+            controller = Controller()
+            controller.open_folder(folder)
+            for image_name in controller.retrieve_images_present_in_catalog(sort_images='file_name'):
+                controller.add_tag(image_name, 'j_scene', [0, 0, 20, 10])
+            runner = JobRunner()
+            job = runner.submit('Exporting images', controller.export_tagged_images, folder + '/export')
+            renames = 0
+            while not job.wait(0.001):
+                controller.add_tag_category('j_new{0}'.format(renames))
+                controller.rename_tag_category('j_new{0}'.format(renames), 'j_renamed{0}'.format(renames))
+                renames += 1
+            runner.poll()
+            self.assertEqual('done', job.state)
+            self.assertEqual(20, job.result['images'])
+            self.assertEqual(20, len([i for i in controller.retrieve_images_present_in_catalog()
+                                      if i.split('.')[0].isdigit()]))
+            # The categories are only changed while holding the lock of the catalog:
+            added = threading.Event()
+            with controller.catalog.lock:
+                thread = threading.Thread(target=lambda: (controller.add_tag_category('j_locked'), added.set()))
+                thread.start()
+                self.assertFalse(added.wait(0.05))
+            thread.join()
+            self.assertIn('j_locked', controller.catalog.tag_categories)
+            controller.close_all_images()
+            for tag_category in ['j_scene', 'j_locked'] + ['j_renamed{0}'.format(i) for i in range(renames)]:
+                controller.remove_tag_category(tag_category)
+            runner.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
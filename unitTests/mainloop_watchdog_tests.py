@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+# Own modules (to be tested)
+from mainloop_watchdog import LatencyHistogram, MainLoopWatchdog
+
+
+class FakeTk:
+    """Stands in for the Tk root: callbacks scheduled with after / after_idle are run by run_pending()."""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, function):
+        self.pending.append(function)
+
+    def after_idle(self, function):
+        self.pending.append(function)
+
+    def run_pending(self):
+        pending, self.pending = self.pending, []
+        for function in pending:
+            function()
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram(bounds=(10, 100))
+        for seconds in [0.001, 0.002, 0.05, 0.5]:
+            histogram.add(seconds)
+        result = histogram.to_dict()
+        self.assertEqual({'<=10': 2, '<=100': 1, '>100': 1}, result['buckets'])
+        self.assertEqual(10, result['p50'])
+        self.assertAlmostEqual(500, result['p95'])  # the slowest bucket reports the maximum
+        self.assertIsNone(LatencyHistogram().percentile(0.5))
+
+    def test_actions_and_stalls(self):
+        """Records an action latency and samples the stack of a blocked main loop."""
+        master = FakeTk()
+        watchdog = MainLoopWatchdog(interval_ms=10, stall_threshold=0.01)
+        watchdog.running = True  # no monitor thread, the stall check is called directly
+        watchdog.master, watchdog.main_thread_id = master, threading.get_ident()
+        watchdog.last_beat = time.perf_counter()
+        with watchdog.action('zoom'):
+            time.sleep(0.03)
+            stall = watchdog.check_for_stall()
+        self.assertEqual('zoom', stall['action'])
+        self.assertTrue(any('test_actions_and_stalls' in line for line in stall['stack']))
+        self.assertIsNone(watchdog.check_for_stall())  # one sample per stall
+        master.run_pending()  # Tk idle: records the zoom latency
+        watchdog.beat()  # the heartbeat ends the stall
+        report = watchdog.report()
+        self.assertEqual(1, report['actions']['zoom']['count'])
+        self.assertGreater(report['stalls'][0]['duration'], 30)
+        self.assertEqual(1, report['heartbeat']['count'])
+        self.assertIn('Stall during zoom', watchdog.format_report())
+        watchdog.stop()
+        self.assertEqual('_NoAction', type(watchdog.action('zoom')).__name__)
+
+
+if __name__ == '__main__':
+    unittest.main()
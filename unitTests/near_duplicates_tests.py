@@ -0,0 +1,95 @@
+import random
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image, ImageDraw
+
+# Own modules (to be tested)
+import near_duplicates
+from image_catalog import ImageCatalog
+from near_duplicates import NearDuplicateIndex
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_image(seed, size=(320, 240)):
+        """Creates an image of random rectangles, so images with another seed are different."""
+        randomizer = random.Random(seed)
+        pil_image = Image.new('RGB', size, (128, 128, 128))
+        draw = ImageDraw.Draw(pil_image)
+        for _ in range(12):
+            x, y = randomizer.randrange(size[0]), randomizer.randrange(size[1])
+            draw.rectangle([x, y, x + randomizer.randint(20, 120), y + randomizer.randint(20, 120)],
+                           fill=tuple(randomizer.randrange(256) for _ in range(3)))
+        return pil_image
+
+    def test_hashes(self):
+        """Re-compressed and resized copies have (almost) the same hash, other images do not."""
+        with tempfile.TemporaryDirectory() as folder:
+            original = self.create_image(1)
+            original.save(folder + '/original.png')
+            original.resize((160, 120)).save(folder + '/small.jpg', quality=70)
+            self.create_image(2).save(folder + '/other.png')
+            for method in ('phash', 'dhash'):
+                hashes = dict(near_duplicates.compute_hashes([folder + '/original.png', folder + '/small.jpg',
+                                                              folder + '/other.png', folder + '/none.png'], method))
+                self.assertLessEqual(near_duplicates.distance(hashes[folder + '/original.png'],
+                                                              hashes[folder + '/small.jpg']), 6)
+                self.assertGreater(near_duplicates.distance(hashes[folder + '/original.png'],
+                                                            hashes[folder + '/other.png']), 12)
+                self.assertIsNone(hashes[folder + '/none.png'])
+
+    def test_index(self):
+        """The multi-index hash table finds the same pairs as comparing all hashes."""
+        randomizer = random.Random(0)
+        hashes = [randomizer.getrandbits(64) for _ in range(200)]
+        for _ in range(100):  # near-duplicates of the first hashes, and some identical ones
+            image_hash = randomizer.choice(hashes)
+            for bit in randomizer.sample(range(64), randomizer.randint(0, 9)):
+                image_hash ^= 1 << bit
+            hashes.append(image_hash)
+        index = NearDuplicateIndex(max_distance=5)
+        for key, image_hash in enumerate(hashes):
+            index.add(key, image_hash)
+        for key in range(0, len(hashes), 7):
+            expected = sorted((near_duplicates.distance(hashes[key], image_hash), other)
+                              for other, image_hash in enumerate(hashes)
+                              if near_duplicates.distance(hashes[key], image_hash) <= 5)
+            self.assertEqual(expected, index.query(hashes[key]))
+        clusters = index.clusters()
+        cluster_of = {key: number for number, cluster in enumerate(clusters) for key in cluster}
+        for key1 in range(len(hashes)):
+            for key2 in range(key1 + 1, len(hashes)):
+                if near_duplicates.distance(hashes[key1], hashes[key2]) <= 5:
+                    self.assertEqual(cluster_of[key1], cluster_of[key2])
+        index.remove(0)
+        self.assertNotIn(0, [key for _, key in index.query(hashes[0])])
+
+    def test_catalog(self):
+        """Finds the near-duplicates in a catalog, copies tags within a cluster and saves the hashes."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ImageCatalog()
+            for i, seed in enumerate((1, 2, 1, 3, 2)):
+                pil_image = self.create_image(seed)
+                pil_image.putpixel((i, i), (255, 255, 255))
+                pil_image.save('{0}/frame{1}.png'.format(folder, i))
+                catalog.add_image(folder, 'frame{0}.png'.format(i), datetime(2019, 1, 1, 12, 0, i))
+            catalog.images[0].tags.add_tag('nd_car', [10, 10, 50, 50])
+            self.assertEqual(5, catalog.compute_perceptual_hashes(workers=2))
+            self.assertEqual([[0, 2], [1, 4]], catalog.near_duplicates())
+            self.assertEqual(1, catalog.copy_tags(0, [2]))
+            self.assertEqual([('nd_car', (10, 10, 50, 50))], [(tag.tag_category, tag.coordinates)
+                                                              for tag in catalog.images[2].tags.tag_dict.values()])
+            catalog.save_progress(folder + '/save.csv', [])
+            loaded = ImageCatalog()
+            loaded.load_savefile(folder + '/save.csv')
+            self.assertEqual([catalog.images[i].perceptual_hash for i in range(5)],
+                             [loaded.images[i].perceptual_hash for i in range(5)])
+            self.assertEqual(0, loaded.compute_perceptual_hashes())
+            catalog.close_all_images()
+            loaded.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
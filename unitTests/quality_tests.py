@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image, ImageDraw, ImageFilter
+
+# Own modules (to be tested)
+import quality
+from controller import Controller
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_image(size=(400, 300)):
+        """Creates an image with edges and a range of gray values."""
+        pil_image = Image.linear_gradient('L').resize(size).convert('RGB')
+        draw = ImageDraw.Draw(pil_image)
+        for x in range(0, size[0], 40):
+            draw.rectangle([x, 50, x + 15, 250], fill=(240, 30, 30))
+        return pil_image
+
+    def test_measure(self):
+        sharp = quality.measure(self.create_image())
+        blurred = quality.measure(self.create_image().filter(ImageFilter.GaussianBlur(4)))
+        black = quality.measure(Image.new('RGB', (400, 300)))
+        white = quality.measure(Image.new('RGB', (400, 300), (255, 255, 255)))
+        self.assertGreater(sharp.sharpness, 5 * blurred.sharpness)
+        self.assertGreater(sharp.score, blurred.score)
+        self.assertEqual((0.0, 1.0, 0.0), (black.brightness, black.underexposed, black.entropy))
+        self.assertEqual((1.0, 1.0), (white.brightness, white.overexposed))
+        self.assertEqual(0.0, black.score)
+        for value, restored in zip(sharp, quality.QualityScores.from_string(sharp.to_string())):
+            self.assertAlmostEqual(1.0, restored / value, 5)
+        self.assertEqual(float('-inf'), quality.worst_threshold([], 0.1))
+        self.assertEqual(0.3, quality.worst_threshold([0.5, 0.1, 0.3, 0.9], 0.25))
+
+    def test_catalog(self):
+        """Analyses the images of a catalog, sorts them on quality and leaves out the worst ones."""
+        with tempfile.TemporaryDirectory() as folder:
+            controller = Controller()
+            catalog = controller.catalog
+            images = [self.create_image(), self.create_image().filter(ImageFilter.GaussianBlur(4)),
+                      Image.new('RGB', (400, 300)), self.create_image()]
+            for i, pil_image in enumerate(images):
+                pil_image.save('{0}/image{1}.png'.format(folder, i))
+                catalog.add_image(folder, 'image{0}.png'.format(i), datetime(2019, 1, 1 + i))
+            progress = []
+            self.assertEqual(3, catalog.compute_quality([0, 1, 2], workers=2, progress=lambda *p: progress.append(p)))
+            self.assertEqual([(1, 3), (2, 3), (3, 3)], progress)
+            self.assertEqual(['image2.png', 'image1.png', 'image0.png', 'image3.png'],
+                             controller.retrieve_images_present_in_catalog('quality'))
+            self.assertEqual([0, 1, 3], catalog.query(exclude_worst_quality=0.3))  # image3 has not been analysed
+            self.assertEqual([0, 3], catalog.query(min_quality=catalog.images[0].quality.score))
+            catalog.save_progress(folder + '/save.csv', [])
+            loaded = ImageCatalog()
+            loaded.load_savefile(folder + '/save.csv')
+            self.assertAlmostEqual(catalog.images[1].quality.score, loaded.images[1].quality.score, 4)
+            self.assertIsNone(loaded.images[3].quality)
+            catalog.close_all_images()
+            loaded.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import random
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image
+
+# Own modules (to be tested)
+import query
+from controller import Controller
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_catalog(folder, number_of_images=30):
+        """Creates a controller with images taken on consecutive days (2019:01:01, 2019:01:02, ...)."""
+        controller = Controller()
+        for i in range(number_of_images):
+            Image.new('RGB', (100, 100)).save('{0}/image{1}.jpg'.format(folder, i))
+            controller.catalog.add_image(folder, 'image{0}.jpg'.format(i), datetime(2019, 1, 1 + i, 12))
+        return controller
+
+    @staticmethod
+    def brute_force(catalog, tagged=None, categories=None, start=None, end=None, box_smaller_than=None):
+        """Selects the images by looping through the catalog (to compare the indexed query with)."""
+        result = []
+        for image_id, image in sorted(catalog.images.items(), key=lambda item: (item[1].date_taken, item[0])):
+            tags = list(image.tags.tag_dict.values())
+            areas = [(i.coordinates[2] - i.coordinates[0]) * (i.coordinates[3] - i.coordinates[1]) for i in tags]
+            if tagged is not None and (len(tags) > 0) != tagged:
+                continue
+            if categories is not None and not any(i.tag_category in categories for i in tags):
+                continue
+            if start is not None and image.date_taken < start or end is not None and image.date_taken > end:
+                continue
+            if box_smaller_than is not None and not any(i < box_smaller_than for i in areas):
+                continue
+            result.append(image_id)
+        return result
+
+    def test_query(self):
+        """Checks the criteria of the indexed query and that the indexes follow changes to the catalog."""
+        with tempfile.TemporaryDirectory() as folder:
+            controller = self.create_catalog(folder)
+            catalog = controller.catalog
+            catalog.images[0].tags.add_tag('q_car', [0, 0, 10, 10])
+            catalog.images[1].tags.add_tag('q_bike', [0, 0, 50, 50])
+            catalog.images[2].tags.add_tags([('q_car', [0, 0, 40, 40]), ('q_bike', [0, 0, 5, 5])])
+            self.assertEqual([0, 1, 2], catalog.query(tagged=True))
+            self.assertEqual(27, len(catalog.query(tagged=False)))
+            self.assertEqual([0, 2], catalog.query(categories=['q_car']))
+            self.assertEqual([1], catalog.query(categories=['q_bike'], exclude_categories=['q_car']))
+            self.assertEqual([0, 2], catalog.query(box_smaller_than=101))
+            self.assertEqual([1, 2], catalog.query(box_larger_than=100))
+            self.assertEqual([1, 2, 3], catalog.query(start='2019:01:02', end='2019:01:04'))  # end day included
+            self.assertEqual([2], catalog.query(categories=['q_car'], start='2019:01:02'))
+            # Changes are picked up by the next query:
+            catalog.images[0].tags.modify_tag(0, 'q_bike')
+            catalog.images[5].tags.add_tag('q_car', [0, 0, 2, 2])
+            catalog.images[2].tags.remove_tag(0)
+            catalog.delete_image_from_catalog(1)
+            self.assertEqual([5], catalog.query(categories=['q_car']))
+            self.assertEqual([0, 2], catalog.query(categories=['q_bike']))
+            self.assertEqual([0, 2, 5], catalog.query(tagged=True))
+            controller.extract_entries_for_tag_category('q_bike', replace=True, replace_category='q_car')
+            self.assertEqual([0, 2, 5], catalog.query(categories=['q_car']))
+            # The image list and the exports use the same query:
+            self.assertEqual(['image0.jpg', 'image2.jpg', 'image5.jpg'], controller.retrieve_images_present_in_catalog(
+                sort_images='file_name', image_filter={'categories': ['q_car']}))
+            self.assertEqual(29, len(controller.image_dict))  # all images can still be selected
+            summary = controller.export_annotations([('csv', folder + '/tags.csv', {})],
+                                                    image_filter={'end': '2019:01:03'})
+            self.assertEqual(2, summary['csv']['images'])
+
+    def test_incremental_and_rebuild(self):
+        """Compares the indexed query with a loop over the catalog after random changes (both update paths)."""
+        randomizer = random.Random(3)
+        for threshold in (1000, 0):  # incremental updates and complete rebuilds
+            with tempfile.TemporaryDirectory() as folder:
+                catalog = self.create_catalog(folder, 25).catalog
+                original_threshold, query.REBUILD_THRESHOLD = query.REBUILD_THRESHOLD, threshold
+                try:
+                    for step in range(40):
+                        image_id = randomizer.choice(list(catalog.images))
+                        tags = catalog.images[image_id].tags
+                        if len(tags.tag_dict) > 0 and randomizer.random() < 0.3:
+                            tags.remove_tag(randomizer.choice(list(tags.tag_dict)))
+                        else:
+                            size = randomizer.randint(1, 60)
+                            tags.add_tag(randomizer.choice(['q_a', 'q_b', 'q_c']), [0, 0, size, size])
+                        if step == 20:
+                            catalog.delete_image_from_catalog(image_id)
+                        criteria = randomizer.choice([{'tagged': True}, {'tagged': False}, {'categories': ['q_a']},
+                                                      {'box_smaller_than': 400},
+                                                      {'categories': ['q_b', 'q_c'], 'tagged': True,
+                                                       'start': datetime(2019, 1, 5), 'end': datetime(2019, 1, 20)}])
+                        self.assertEqual(self.brute_force(catalog, **criteria), catalog.query(**criteria))
+                finally:
+                    query.REBUILD_THRESHOLD = original_threshold
+
+
+if __name__ == '__main__':
+    unittest.main()
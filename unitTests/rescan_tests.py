@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from PIL import Image
+
+# Own modules (to be tested)
+from folder_watch import FolderWatcher
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def file_names(catalog):
+        return sorted(image.file_name for image in catalog.images.values())
+
+    def test_rescan(self):
+        """Imports a folder tree, changes it on disk and checks that a rescan only processes the differences."""
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(folder + '/day1')
+            Image.new('RGB', (20, 10)).save(folder + '/file1.jpg')
+            Image.new('RGB', (20, 10)).save(folder + '/day1/file2.jpg')
+            catalog = ImageCatalog()
+            catalog.open_folder(folder, recursive=True)
+            image_ids = {image.file_name: image_id for image_id, image in catalog.images.items()}
+            catalog.images[image_ids['file1.jpg']].tags.add_tag('rs_car', [0, 0, 5, 5])
+            summary = catalog.rescan()  # first rescan: remembers the folders
+            self.assertEqual((0, 0, 0, 2), (summary['added'], summary['changed'], summary['removed'],
+                                            summary['folders_listed']))
+            self.assertEqual(2, catalog.rescan()['folders_skipped'])  # nothing changed: no folder is listed
+            # Add and remove images, add a folder and overwrite an image:
+            time.sleep(0.01)
+            os.makedirs(folder + '/day2')
+            Image.new('RGB', (20, 10)).save(folder + '/day2/file3.jpg')
+            Image.new('RGB', (20, 10)).save(folder + '/day1/file4.jpg')
+            os.remove(folder + '/day1/file2.jpg')
+            Image.new('RGB', (40, 30)).save(folder + '/file1.jpg')
+            summary = catalog.rescan(full=True)
+            self.assertEqual((2, 1, 1), (summary['added'], summary['changed'], summary['removed']))
+            self.assertEqual(['file1.jpg', 'file3.jpg', 'file4.jpg'], self.file_names(catalog))
+            self.assertEqual((40, 30), catalog.images[image_ids['file1.jpg']].size)
+            self.assertEqual(1, len(catalog.images[image_ids['file1.jpg']].tags.tag_dict))  # the tags are kept
+            # Remove a complete folder:
+            shutil.rmtree(folder + '/day2')
+            self.assertEqual(1, catalog.rescan()['removed'])
+            self.assertEqual(['file1.jpg', 'file4.jpg'], self.file_names(catalog))
+            # The imported folders are stored in the savefile:
+            catalog.save_progress(folder + '/savefile.csv', [])
+            restored = ImageCatalog()
+            restored.load_savefile(folder + '/savefile.csv')
+            self.assertTrue(restored.import_roots[folder]['recursive'])
+            catalog.close_all_images()
+            restored.close_all_images()
+            catalog.tag_categories.remove_tag_category('rs_car')
+
+    def test_folder_watcher(self):
+        """Reports the changed folders (inotify), or asks for a rescan every poll_interval (polling)."""
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(folder + '/sub')
+            roots = {folder: {'recursive': True}}
+            polling = FolderWatcher(roots, poll_interval=0, use_inotify=False)
+            self.assertEqual('polling', polling.start())
+            self.assertEqual(set(), polling.poll_changes())
+            polling.stop()
+            watcher = FolderWatcher(roots, settle_time=0)
+            if watcher.start() != 'inotify':
+                self.skipTest('inotify is not available')
+            open(folder + '/sub/new.jpg', 'w').close()
+            changes = None
+            for _ in range(50):
+                time.sleep(0.05)
+                changes = watcher.poll_changes()
+                if changes is not None:
+                    break
+            watcher.stop()
+            self.assertEqual({folder + '/sub'}, changes)
+
+
+if __name__ == '__main__':
+    unittest.main()
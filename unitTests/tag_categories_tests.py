@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime
+
+# Own modules (to be tested)
+from image_catalog import ImageCatalog
+from tag_categories import TagCategories
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_registry(self):
+        """Categories get dense ids, colors are unique until all are in use, removed names get their id back."""
+        registry = TagCategories()
+        for i in range(len(TagCategories.colors)):
+            registry.add_tag_category('c{0}'.format(i))
+        self.assertEqual(list(range(len(TagCategories.colors))), [registry.category_id(i) for i in registry])
+        self.assertEqual(set(TagCategories.colors), {registry.color(i) for i in registry})
+        color = registry.color('c3')
+        registry.remove_tag_category('c3')
+        self.assertNotIn('c3', registry)
+        self.assertEqual(color, registry.add_tag_category('new').color)  # the only free color
+        self.assertEqual(3, registry.add_tag_category('c3', '#123456').category_id)
+        self.assertIn(registry.add_tag_category('one_more').color, TagCategories.colors)  # all in use: re-used
+        registry.change_tag_color('new', '#abcdef')
+        self.assertEqual({'new': '#abcdef'}, {i: j for i, j in registry.tag_categories.items() if i == 'new'})
+        self.assertEqual(0, len(TagCategories().tag_categories))  # not shared between registries
+
+    def test_rename(self):
+        """Renaming keeps the category id, so the tags and the query index follow without being changed."""
+        catalog = ImageCatalog()
+        for i in range(3):
+            catalog.add_image('/data', 'image{0}.jpg'.format(i), datetime(2019, 1, 1 + i), (100, 100))
+            catalog.images[i].tags.add_tags([('car', [0, 0, 10, 10]), ('bus', [0, 0, 20, 20])])
+        catalog.images[2].tags.add_tag('truck', [5, 5, 30, 30])
+        self.assertEqual([0, 1, 2], catalog.query(categories=['car']))
+        tags_revision = [catalog.images[i].tags.revision for i in range(3)]
+        self.assertEqual(3, catalog.rename_tag_category('car', 'vehicle'))
+        self.assertEqual(tags_revision, [catalog.images[i].tags.revision for i in range(3)])
+        self.assertEqual(['vehicle', 'bus', 'truck'], list(catalog.tag_categories))
+        self.assertEqual({'vehicle', 'bus'}, {tag.tag_category for tag in catalog.images[0].tags.tag_dict.values()})
+        self.assertEqual([0, 1, 2], catalog.query(categories=['vehicle']))
+        self.assertEqual([], catalog.query(categories=['car']))
+        # Renaming to an existing category merges the tags into it:
+        self.assertEqual(1, catalog.rename_tag_category('truck', 'bus'))
+        self.assertNotIn('truck', catalog.tag_categories)
+        self.assertEqual([2], catalog.query(categories=['bus'], box_larger_than=600))
+        # Renaming a category to its own name keeps it (its tags are not unknown to lint_tags):
+        self.assertEqual(4, catalog.rename_tag_category('bus', 'bus'))
+        self.assertIn('bus', catalog.tag_categories)
+        self.assertEqual(0, len(catalog.lint_tags()['problems']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+from PIL import Image
+
+# Own modules (to be tested)
+import tfrecord
+from tfrecord import ExampleCodec, LabelMap, crc32c, read_tfrecord
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    def test_crc32c(self):
+        """Checks the pure-Python CRC-32C against the standard check value."""
+        with mock.patch('tfrecord._crc32c', None):
+            self.assertEqual(0xE3069283, crc32c(b'123456789'))
+
+    def test_example_roundtrip(self):
+        """Encodes an Example and checks that decoding returns the same features."""
+        features = {'image/height': (ExampleCodec.INT64, [1080, -1]),
+                    'image/filename': (ExampleCodec.BYTES, ['file1.jpg']),
+                    'image/object/bbox/xmin': (ExampleCodec.FLOAT, [0.25, 0.5])}
+        decoded = ExampleCodec.decode_example(ExampleCodec.encode_example(features))
+        self.assertEqual([1080, -1], decoded['image/height'])
+        self.assertEqual([b'file1.jpg'], decoded['image/filename'])
+        self.assertEqual([0.25, 0.5], decoded['image/object/bbox/xmin'])
+
+    def test_label_map(self):
+        """Reads the label map that is shipped with picture tools."""
+        label_map = LabelMap(os.path.join(os.path.dirname(__file__), '..', 'object-detection.pbtxt'))
+        self.assertEqual(1, label_map.label_id('01_prohibitory_sign'))
+        self.assertEqual(5, label_map.label_id('05_stop'))
+        self.assertIsNone(label_map.label_id('not_in_label_map'))
+
+    def test_export_tfrecord(self):
+        """Exports two tagged images to two shards and reads the Examples back."""
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ['file1.jpg', 'file2.jpg']:
+                Image.new('RGB', (200, 100)).save(folder + '/' + name)
+            with open(folder + '/labels.pbtxt', 'w') as handle:
+                handle.write("item {\n  id: 1\n  name: 'car'\n}\n")
+            catalog = ImageCatalog()
+            catalog.add_image(folder, 'file1.jpg', datetime(2020, 1, 1))
+            catalog.add_image(folder, 'file2.jpg', datetime(2020, 1, 1))
+            catalog.images[0].tags.add_tag('car', [0, 0, 100, 50])
+            catalog.images[0].tags.add_tag('tfrecord_unknown', [0, 0, 100, 50])
+            catalog.images[1].tags.add_tag('car', [50, 25, 200, 100])
+            written, skipped = catalog.export_tfrecord(folder + '/out', folder + '/labels.pbtxt', num_shards=2,
+                                                       workers=1)
+            self.assertEqual((2, 1), (written, skipped))
+            examples = []
+            for shard in sorted(os.listdir(folder + '/out')):
+                examples += [ExampleCodec.decode_example(r) for r in read_tfrecord(folder + '/out/' + shard, True)]
+            self.assertEqual(2, len(examples))
+            self.assertEqual([b'file1.jpg'], examples[0]['image/filename'])
+            self.assertEqual([0.5], examples[0]['image/object/bbox/xmax'])
+            self.assertEqual([1], examples[1]['image/object/class/label'])
+            catalog.close_all_images()
+        catalog.tag_categories.remove_tag_category('car')
+        catalog.tag_categories.remove_tag_category('tfrecord_unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import csv
+import os
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image, ImageChops
+
+# Own modules (to be tested)
+import tiling
+from image_catalog import ImageCatalog
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_image(size):
+        """Creates an image with a gradient, so every region is different."""
+        return Image.merge('RGB', [Image.linear_gradient('L').resize(size),
+                                   Image.linear_gradient('L').rotate(90).resize(size), Image.new('L', size, 128)])
+
+    @staticmethod
+    def write_tiled_tiff(location, pil_image, tile_size):
+        """Writes an uncompressed RGB TIFF file in tiles (PIL only writes strips)."""
+        width, height = pil_image.size
+        tiles = [pil_image.crop((x, y, x + tile_size, y + tile_size)).tobytes()  # edge tiles are padded
+                 for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+        data = b''.join(tiles)
+        offsets_position = 8 + len(data) + 6  # after the tile data and the BitsPerSample values
+        entries = [(256, 3, 1, width), (257, 3, 1, height), (258, 3, 3, 8 + len(data)), (259, 3, 1, 1),
+                   (262, 3, 1, 2), (277, 3, 1, 3), (284, 3, 1, 1), (322, 3, 1, tile_size), (323, 3, 1, tile_size),
+                   (324, 4, len(tiles), offsets_position), (325, 4, len(tiles), offsets_position + 4 * len(tiles))]
+        ifd_position = offsets_position + 8 * len(tiles)
+        with open(location, 'wb') as handle:
+            handle.write(b'II*\0' + struct.pack('<I', ifd_position) + data + struct.pack('<3H', 8, 8, 8))
+            handle.write(struct.pack('<{0}I'.format(len(tiles)), *[8 + i * len(tiles[0]) for i in range(len(tiles))]))
+            handle.write(struct.pack('<{0}I'.format(len(tiles)), *[len(tile) for tile in tiles]))
+            handle.write(struct.pack('<H', len(entries)))
+            for tag, field_type, count, value in entries:
+                handle.write(struct.pack('<HHI' + ('HH' if field_type == 3 and count == 1 else 'I'), tag, field_type,
+                                         count, value, *([0] if field_type == 3 and count == 1 else [])))
+            handle.write(struct.pack('<I', 0))
+
+    def test_layout(self):
+        self.assertEqual([0, 80, 160, 200], tiling.chip_starts(300, 100, 20))
+        self.assertEqual([0], tiling.chip_starts(80, 100, 20))
+        boxes = [('t_car', [90, 10, 130, 30]), ('t_bike', [10, 10, 20, 20])]
+        self.assertEqual([('t_car', [80, 10, 100, 30]), ('t_bike', [0, 10, 10, 20])],
+                         tiling.chip_boxes(boxes, [10, 0, 110, 100], 0.5))
+        self.assertEqual([('t_bike', [0, 10, 10, 20])], tiling.chip_boxes(boxes, [10, 0, 110, 100], 0.6))
+        with self.assertRaises(ValueError):
+            tiling.ChipOptions(size=100, overlap=100)
+
+    def test_read_region(self):
+        """Reads regions of tiled and striped TIFF files, only decoding the tiles / rows they overlap."""
+        with tempfile.TemporaryDirectory() as folder:
+            pil_image = self.create_image((300, 200))
+            self.write_tiled_tiff(folder + '/tiled.tif', pil_image, 64)
+            pil_image.save(folder + '/striped.tif', tiffinfo={278: 16})  # 16 rows per strip
+            pil_image.save(folder + '/single.tif')  # one strip
+            for name in ('tiled.tif', 'striped.tif', 'single.tif'):
+                with Image.open(folder + '/' + name) as opened:
+                    self.assertTrue(tiling.region_readable(opened))
+                    self.assertIsNone(ImageChops.difference(pil_image, opened).getbbox())
+                region = tiling.read_region(folder + '/' + name, [70, 50, 200, 190])
+                self.assertEqual((130, 140), region.size)
+                self.assertIsNone(ImageChops.difference(pil_image.crop((70, 50, 200, 190)), region).getbbox())
+            pil_image.save(folder + '/image.png')
+            with Image.open(folder + '/image.png') as opened:
+                self.assertFalse(tiling.region_readable(opened))
+
+    def test_export(self):
+        """Exports the chips of a striped TIFF and a PNG image to csv."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ImageCatalog()
+            self.create_image((250, 180)).save(folder + '/large.tif')  # uncompressed, in strips
+            self.create_image((90, 60)).save(folder + '/small.png')
+            catalog.add_image(folder, 'large.tif', datetime(2019, 1, 1))
+            catalog.add_image(folder, 'small.png', datetime(2019, 1, 2))
+            catalog.images[0].tags.add_tags([('t_car', [10, 10, 40, 30]), ('t_bike', [90, 90, 110, 130])])
+            catalog.images[1].tags.add_tag('t_car', [5, 5, 20, 20])
+            progress = []
+            summary = catalog.export_annotations([('csv', folder + '/tags.csv', {})], progress=lambda *p:
+                                                 progress.append(p), images_location=folder + '/chips', workers=2,
+                                                 chips=tiling.ChipOptions(size=100, overlap=20, image_format='png'))
+            self.assertEqual([(1, 2), (2, 2)], progress)
+            self.assertEqual(['large_0_0_0.png', 'large_0_0_80.png', 'large_0_80_80.png', 'small_1_0_0.png'],
+                             sorted(os.listdir(folder + '/chips')))  # chips without (half a) box are skipped
+            self.assertEqual({'images': 4, 'boxes': 4}, summary['csv'])
+            with open(folder + '/tags.csv') as handle:
+                rows = list(csv.reader(handle))[1:]
+            self.assertIn(['large_0_80_80.png', '100', '100', 't_bike', '10', '10', '30', '50', '0'], rows)
+            self.assertIn(['small_1_0_0.png', '90', '60', 't_car', '5', '5', '20', '20', '0'], rows)
+            with Image.open(folder + '/large.tif') as large, Image.open(folder + '/chips/large_0_80_80.png') as chip:
+                self.assertIsNone(ImageChops.difference(large.crop((80, 80, 180, 180)), chip).getbbox())
+            catalog.close_all_images()
+
+    def test_same_stem(self):
+        """The chips of images with the same stem do not overwrite each other."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ImageCatalog()
+            for i, file_name in enumerate(['a.jpg', 'a.png']):
+                Image.new('RGB', (60, 40), (i * 200, 0, 0)).save(folder + '/' + file_name)
+                catalog.add_image(folder, file_name, datetime(2019, 1, 1 + i))
+                catalog.images[i].tags.add_tag('t_car', [5, 5, 20, 20])
+            summary = catalog.export_annotations([('csv', folder + '/tags.csv', {})], images_location=folder + '/chips',
+                                                 workers=1, chips=tiling.ChipOptions(size=100, overlap=20,
+                                                                                     image_format='png'))
+            self.assertEqual({'images': 2, 'boxes': 2}, summary['csv'])
+            self.assertEqual(['a_0_0_0.png', 'a_1_0_0.png'], sorted(os.listdir(folder + '/chips')))
+            with Image.open(folder + '/chips/a_1_0_0.png') as chip:
+                self.assertEqual((200, 0, 0), chip.getpixel((30, 30)))
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import csv
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from PIL import Image
+
+# Own modules (to be tested)
+from image_catalog import ImageCatalog
+from transcode import TranscodeOptions, scale_boxes
+
+
+class TestFunctions(unittest.TestCase):
+
+    @staticmethod
+    def create_catalog(folder):
+        catalog = ImageCatalog()
+        for i, size in enumerate([(400, 200), (100, 300), (50, 50)]):
+            Image.new('RGB', size, (i * 80, 0, 0)).save('{0}/image{1}.jpg'.format(folder, i))
+            catalog.add_image(folder, 'image{0}.jpg'.format(i), datetime(2019, 1, 1 + i))
+        catalog.images[0].tags.add_tag('t_car', [40, 20, 200, 100])
+        catalog.images[1].tags.add_tag('t_bike', [10, 30, 50, 150])
+        return catalog
+
+    def test_options(self):
+        options = TranscodeOptions(max_side=100, image_format='webp')
+        self.assertEqual((100, 50), options.target_size(400, 200))
+        self.assertEqual((50, 50), options.target_size(50, 50))  # not enlarged
+        self.assertEqual((25, 15), TranscodeOptions(scale=0.25, max_side=1000).target_size(100, 60))
+        self.assertEqual('photo.2019.webp', options.file_name('photo.2019.jpg'))
+        self.assertEqual('photo.jpg', TranscodeOptions(max_side=10).file_name('photo.jpg'))
+        self.assertEqual([('t_car', [10, 5, 50, 25])], scale_boxes([('t_car', [40, 20, 200, 100])], (400, 200),
+                                                                  (100, 50)))
+        with self.assertRaises(ValueError):
+            TranscodeOptions(image_format='gif')
+
+    def test_export_annotations(self):
+        """Exports the tags with the images resized on a process pool."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = self.create_catalog(folder)
+            summary = catalog.export_annotations([('csv', folder + '/tags.csv', {})],
+                                                 transcode=TranscodeOptions(max_side=100, image_format='webp'),
+                                                 images_location=folder + '/images', workers=2)
+            self.assertEqual({'images': 2, 'boxes': 2}, summary['csv'])
+            self.assertEqual(['image0.webp', 'image1.webp'], sorted(os.listdir(folder + '/images')))
+            with Image.open(folder + '/images/image0.webp') as pil_image:
+                self.assertEqual(('WEBP', (100, 50)), (pil_image.format, pil_image.size))
+            with open(folder + '/tags.csv') as handle:
+                rows = list(csv.reader(handle))
+            self.assertEqual(['image0.webp', '100', '50', 't_car', '10', '5', '50', '25', '0'], rows[1])
+            self.assertEqual(['image1.webp', '33', '100', 't_bike', '3', '10', '16', '50', '0'], rows[2])
+            catalog.close_all_images()
+
+    def test_same_stem(self):
+        """Images with the same stem written in the same format get different names, the tags match their file."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = ImageCatalog()
+            for i, (file_name, size) in enumerate([('a.jpg', (400, 200)), ('a.png', (200, 400))]):
+                Image.new('RGB', size).save(folder + '/' + file_name)
+                catalog.add_image(folder, file_name, datetime(2019, 1, 1 + i))
+                catalog.images[i].tags.add_tag('t_car', [0, 0, 100, 100])
+            catalog.export_annotations([('csv', folder + '/tags.csv', {})], images_location=folder + '/images',
+                                       transcode=TranscodeOptions(scale=0.5, image_format='jpeg'), workers=1)
+            self.assertEqual(['a.jpg', 'a_png.jpg'], sorted(os.listdir(folder + '/images')))
+            with open(folder + '/tags.csv') as handle:
+                rows = list(csv.reader(handle))[1:]
+            self.assertEqual([['a.jpg', '200', '100'], ['a_png.jpg', '100', '200']], [row[:3] for row in rows])
+            with Image.open(folder + '/images/a_png.jpg') as pil_image:
+                self.assertEqual((100, 200), pil_image.size)
+            catalog.export_tagged_images(folder + '/export', transcode=TranscodeOptions(image_format='jpeg'),
+                                         workers=1, lint=None)
+            self.assertEqual(['a.jpg', 'a_png.jpg', 'tags.csv'], sorted(os.listdir(folder + '/export')))
+            with open(folder + '/export/tags.csv') as handle:
+                self.assertEqual(['a.jpg', 'a_png.jpg'], [row[0] for row in list(csv.reader(handle))[1:]])
+            catalog.close_all_images()
+
+    def test_export_tagged_images(self):
+        """Exports the tagged images resized, the catalog keeps pointing to the original images."""
+        with tempfile.TemporaryDirectory() as folder:
+            catalog = self.create_catalog(folder)
+            catalog.export_tagged_images(folder + '/export', rename=True,
+                                         transcode=TranscodeOptions(scale=0.5, quality=80), workers=1)
+            self.assertEqual(['0.jpg', '1.jpg', 'tags.csv'], sorted(os.listdir(folder + '/export')))
+            with Image.open(folder + '/export/0.jpg') as pil_image:
+                self.assertEqual((200, 100), pil_image.size)
+            with open(folder + '/export/tags.csv') as handle:
+                rows = list(csv.reader(handle))
+            self.assertEqual(['0.jpg', '200', '100', 't_car', '20', '10', '100', '50'], rows[1])
+            self.assertEqual(('image0.jpg', folder), (catalog.images[0].file_name, catalog.images[0].file_location))
+            # The catalog points to the originals, so they cannot be removed:
+            with self.assertRaises(ValueError):
+                catalog.export_tagged_images(folder + '/export2', remove_original=True,
+                                             transcode=TranscodeOptions(scale=0.5), workers=1)
+            self.assertTrue(os.path.exists(folder + '/image0.jpg'))
+            self.assertFalse(os.path.exists(folder + '/export2'))
+            catalog.close_all_images()
+
+
+if __name__ == '__main__':
+    unittest.main()
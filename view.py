@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 from tkinter import *
@@ -6,7 +7,14 @@ from tkfilebrowser import askopendirname, askopenfilename, asksaveasfilename
 import math
 
 # Picture tools modules:
+from annotation_lint import CHECKS, LintOptions, format_lint_report
 from controller import Controller
+from dataset_statistics import format_report
+from instrumentation import instrument
+from jobs import JobRunner
+from folder_watch import FolderWatcher
+from mainloop_watchdog import watchdog
+from transcode import TranscodeOptions
 
 
 class Application(Frame):
@@ -17,6 +25,7 @@ class Application(Frame):
     pil_image, origX, origY, zoomcycle, zoom_factor = None, None, None, 0, 1
     selected_image, win_w, win_h = None, None, None  # keep track of active image / window size to deal with resizing
     selected_tag, active_tag_id, active_tag_name = None, None, None
+    folder_watcher, rescan_job = None, None
     savefile_location = None
     min_tagsize = 0
     sorting_method = 'file_name'
@@ -30,8 +39,10 @@ class Application(Frame):
     def __init__(self, master=None):
         self.controller = Controller()
         Frame.__init__(self, master)
+        # Long running catalog operations run in the background, their progress is shown in the window title:
+        self.jobs = JobRunner(self.master, on_status=self.show_job_status)
         self.viewmethods = ViewMethods(self.master, self.controller)
-        self.importexport = ImportExportMethods(self.master, self.controller, self.viewmethods)
+        self.importexport = ImportExportMethods(self.master, self.controller, self.viewmethods, self.jobs)
         self.tagmethods = TagMethods(self.master, self.controller, self.viewmethods)
         self.master.rowconfigure(0, weight=3)
         self.master.rowconfigure(1, weight=1)
@@ -107,25 +118,58 @@ class Application(Frame):
 
         file_menu = Menu(menubar)
         file_menu.add_command(label='Open Image Folder', command=self.import_images_from_folder)
+        file_menu.add_command(label='Open Image Folder (including sub-folders)',
+                              command=lambda: self.import_images_from_folder(recursive=True))
         file_menu.add_command(label='Save Project (Ctrl + s)', command=self.save_progress)
         file_menu.add_command(label='Save Project As..', command=self.save_as)
         file_menu.add_command(label='Load Project (Ctrl + o)', command=self.load_savefile)
         file_menu.add_command(label='Export Settings', command=self.export_settings)
         file_menu.add_command(label='Import Settings', command=self.import_settings)
         file_menu.add_command(label='Export Tagged Images', command=self.export_tagged_images)
+        file_menu.add_command(label='Export Tagged Images (resized JPEG)',
+                              command=lambda: self.export_tagged_images(resize=True))
         file_menu.add_command(label='Export Images of Single Tag Category', command=self.export_images_one_tag_category)
         file_menu.add_command(label='Reset Picture Tools', command=self.reset_picture_tools)
-        file_menu.add_command(label='Quit', command=sys.exit)
+        file_menu.add_command(label='Quit', command=self.quit_picture_tools)
         menubar.add_cascade(label="File", menu=file_menu)
 
         options_menu = Menu(self.master)
         options_menu.add_command(label='Sort images on date', command=self.sort_images_on_date)
         options_menu.add_command(label='Sort images on filename', command=self.sort_images_on_filename)
+        options_menu.add_command(label='Sort images on quality (worst first)', command=self.sort_images_on_quality)
+        options_menu.add_command(label='Analyse image quality', command=self.analyse_quality)
         options_menu.add_command(label='Delete currently selected image (Ctrl + Del)', command=self.delete_single_image)
         options_menu.add_command(label='Delete currently selected image from disk (Ctrl + Shift + Del)',
                                  command=self.delete_single_image_from_disk)
+        options_menu.add_command(label='Rotate image left (Ctrl + Left)', command=lambda: self.rotate_image('left'))
+        options_menu.add_command(label='Rotate image right (Ctrl + Right)', command=lambda: self.rotate_image('right'))
+        options_menu.add_command(label='Rotate all listed images left', command=lambda: self.rotate_listed_images('left'))
+        options_menu.add_command(label='Rotate all listed images right',
+                                 command=lambda: self.rotate_listed_images('right'))
+        options_menu.add_command(label='Crop image to selected tag', command=self.crop_to_selected_tag)
+        options_menu.add_command(label='Write rotations and crops to the image files', command=self.save_image_edits)
+        options_menu.add_command(label='Show performance statistics', command=self.show_statistics)
+        options_menu.add_command(label='Cancel background jobs (Esc)', command=self.cancel_jobs)
+        options_menu.add_command(label='Rescan imported folders', command=self.rescan_folders)
+        self.watch_folders_variable = BooleanVar(value=False)
+        options_menu.add_checkbutton(label='Watch imported folders for new images', variable=self.watch_folders_variable,
+                                     command=self.toggle_folder_watching)
         menubar.add_cascade(label="Options", menu=options_menu)
 
+        filter_menu = Menu(self.master)
+        filter_menu.add_command(label='Show all images', command=lambda: self.filter_images({}))
+        filter_menu.add_command(label='Show tagged images', command=lambda: self.filter_images({'tagged': True}))
+        filter_menu.add_command(label='Show untagged images', command=lambda: self.filter_images({'tagged': False}))
+        filter_menu.add_command(label='Show images with Tag Category..', command=self.filter_on_tag_category)
+        filter_menu.add_command(label='Show images without Tag Category..',
+                                command=lambda: self.filter_on_tag_category(exclude=True))
+        filter_menu.add_command(label='Show images with tags smaller than..', command=self.filter_on_tag_size)
+        filter_menu.add_command(label='Show images taken between..', command=self.filter_on_date)
+        filter_menu.add_command(label='Hide the 10% images of lowest quality',
+                                command=lambda: self.filter_images(dict(self.viewmethods.image_filter,
+                                                                        exclude_worst_quality=0.1)))
+        menubar.add_cascade(label='Filter', menu=filter_menu)
+
         tags_menu = Menu(self.master)
         tags_menu.add_command(label='Add Tag Category', command=self.viewmethods.add_tag_category)
         tags_menu.add_command(label='Remove Tag Category', command=self.remove_tag_category)
@@ -133,8 +177,16 @@ class Application(Frame):
         tags_menu.add_command(label='Replace Tag Category name', command=self.rename_tag_category)
         tags_menu.add_command(label='Replace Tag Category color', command=self.change_tag_category_color)
         tags_menu.add_command(label='Change bounding box linewidth', command=self.alter_tag_line_width)
+        tags_menu.add_command(label='Show dataset statistics', command=self.show_dataset_statistics)
+        tags_menu.add_command(label='Check tags', command=lambda: self.lint_tags(fix=False))
+        tags_menu.add_command(label='Check tags and fix them', command=lambda: self.lint_tags(fix=True))
         tags_menu.add_command(label='Export tags', command=self.export_tags)
+        tags_menu.add_command(label='Export tags to TFRecord', command=self.export_tfrecord)
+        tags_menu.add_command(label='Export tags to COCO and Pascal VOC', command=self.export_coco_voc)
         tags_menu.add_command(label='Load tags', command=self.load_tags)
+        tags_menu.add_command(label='Import COCO annotations', command=lambda: self.import_annotations('coco'))
+        tags_menu.add_command(label='Import Pascal VOC annotations', command=lambda: self.import_annotations('voc'))
+        tags_menu.add_command(label='Import TFRecord annotations', command=lambda: self.import_annotations('tfrecord'))
         menubar.add_cascade(label='Tags', menu=tags_menu)
 
         keybindings_menu = Menu(self.master)
@@ -152,6 +204,8 @@ class Application(Frame):
         self.master.bind('r', lambda event: self.modify_tag_category())
         self.master.bind('<Control-Delete>', lambda event: self.delete_single_image())
         self.master.bind('<Control-Shift-Delete>', lambda event: self.delete_single_image_from_disk())
+        self.master.bind('<Control-Left>', lambda event: self.rotate_image('left'))
+        self.master.bind('<Control-Right>', lambda event: self.rotate_image('right'))
         self.master.bind('t', lambda event: self.add_full_image_tag())
         # Keybindings to scroll over an image:
         self.master.bind('w', lambda event: self.scroll_up())
@@ -159,15 +213,22 @@ class Application(Frame):
         self.master.bind('a', lambda event: self.scroll_left())
         self.master.bind('d', lambda event: self.scroll_right())
         self.master.bind('c', lambda event: self.recenter_canvas())
+        self.master.bind('<Escape>', lambda event: self.cancel_jobs())
 
     def reset_picture_tools(self):
         """This function resets picture tools (clears image-list etc.)"""
+        if self.jobs.busy():
+            ms.showinfo("Busy", "Please wait until the background jobs have finished (or cancel them with Esc).")
+            return
+        if self.folder_watcher is not None:
+            self.watch_folders_variable.set(False)
+            self.toggle_folder_watching()
         # Loop through the image list and close all previously opened images (otherwise the number of opened images will
         # stay high):
         self.controller.close_all_images()
         self.controller = Controller()
         self.viewmethods = ViewMethods(self.master, self.controller)
-        self.importexport = ImportExportMethods(self.master, self.controller, self.viewmethods)
+        self.importexport = ImportExportMethods(self.master, self.controller, self.viewmethods, self.jobs)
         self.tagmethods = TagMethods(self.master, self.controller, self.viewmethods)
         self.canvas.delete(ALL)
         self.image_list.delete(0, END)
@@ -175,11 +236,7 @@ class Application(Frame):
         self.selected_image = None
         self.selected_tag, self.active_tag_id = None, None
         self.savefile_location = None
-        self.pil_image = None
-        # Remove all tag_categories:
-        tag_categories = self.controller.retrieve_tag_categories()
-        for tag_category in tag_categories:
-            self.controller.remove_tag_category(tag_category)
+        self.pil_image = None  # (the new Controller has a new catalog with its own tag_categories)
         txt = 'Picture Tools'
         self.wt = self.canvas.create_text(self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2, text=txt,
                                           font=('', 30), fill='white')
@@ -192,16 +249,117 @@ class Application(Frame):
             gettag = self.gettag_popup()
             tag_category = gettag.value
             if tag_category is not None:
-                self.controller.add_tag(self.selected_image, tag_category)
-                if self.sorting_method == 'file_name':
-                    self.sort_images_on_filename()
-                else:
-                    self.sort_images_on_date()
-                self.show_image()
+                with watchdog.action('add_tag'):
+                    self.controller.add_tag(self.selected_image, tag_category)
+                    self.reset_image_list()
+                    self.show_image()
 
     def show_keybindings(self):
         KeyBindings(self.master)
 
+    def show_job_status(self, text):
+        """Shows the progress of the background jobs in the window title."""
+        self.master.title('Picture Tools' if text is None else 'Picture Tools - ' + text)
+
+    def cancel_jobs(self):
+        """Cancels the running background jobs (the work that has been done so far is kept)."""
+        self.jobs.cancel_all()
+
+    def rescan_folders(self, changed_folders=None):
+        """
+        Rescans the imported folders in the background: new images are added, changed images reloaded and removed
+        images are removed from the image_list.
+        """
+        if self.rescan_job is None:
+            self.rescan_job = self.jobs.submit('Rescanning folders', self.controller.rescan,
+                                               changed_folders=changed_folders, on_done=self.folders_rescanned,
+                                               on_cancelled=lambda: self.folders_rescanned(None),
+                                               on_error=self.importexport.job_failed)
+
+    def folders_rescanned(self, summary):
+        self.rescan_job = None
+        if summary is None or summary['added'] + summary['changed'] + summary['removed'] > 0:
+            self.reset_image_list()
+            if self.selected_image not in self.controller.image_dict:  # the selected image has been removed
+                self.selected_image = None
+                self.canvas.delete(ALL)
+                self.tag_list.delete(0, END)
+            elif summary is not None and summary['changed'] > 0:
+                self.show_image()
+            else:
+                self.highlight_active_image()
+
+    def toggle_folder_watching(self):
+        """Starts or stops watching the imported folders (inotify, or polling if inotify is not available)."""
+        if self.watch_folders_variable.get() and self.folder_watcher is None:
+            self.folder_watcher = FolderWatcher(self.controller.catalog.import_roots)
+            self.folder_watcher.start()
+            self.master.after(1000, self.check_folder_changes)
+        elif not self.watch_folders_variable.get() and self.folder_watcher is not None:
+            self.folder_watcher.stop()
+            self.folder_watcher = None
+
+    def check_folder_changes(self):
+        """Rescans the folders in which the folder_watcher noticed changes (every second while watching)."""
+        if self.folder_watcher is None:
+            return
+        # Start watching folders that have been imported since the watching started:
+        for root, options in list(self.controller.catalog.import_roots.items()):
+            if root not in self.folder_watcher.roots:
+                self.folder_watcher.add_root(root, options['recursive'])
+        if self.rescan_job is None:
+            changes = self.folder_watcher.poll_changes()
+            if changes is not None:
+                self.rescan_folders(changes or None)
+        self.master.after(1000, self.check_folder_changes)
+
+    def quit_picture_tools(self):
+        self.jobs.shutdown(wait=False)
+        sys.exit()
+
+    def check_limit(self):
+        """Warns the user if the maximum number of open images has been reached."""
+        if self.controller.check_limit():
+            ms.showinfo("Error", "System maximum number of open files has been reached, no new images can be added.")
+
+    def show_statistics(self):
+        """Shows the performance statistics panel (and starts recording statistics if that was not done yet)."""
+        instrument.enable()
+        watchdog.start(self.master)
+        StatisticsPanel(self.master)
+
+    def show_dataset_statistics(self):
+        """Computes the statistics of the tags of the listed images (in the background) and shows them in a window."""
+        self.jobs.submit('Computing dataset statistics', self.controller.dataset_statistics,
+                         self.viewmethods.image_filter,
+                         on_done=lambda report: ReportPanel(self.master, 'Dataset statistics', format_report(report),
+                                                            report),
+                         on_error=self.importexport.job_failed)
+
+    def lint_tags(self, fix=False):
+        """
+        Checks the tags of the listed images for boxes without area, inverted corners, boxes outside their image,
+        unknown tag_categories and (near-)duplicates, and shows the report. With fix=True (after confirmation) the
+        corners of inverted boxes are swapped, boxes are clipped to their image and the other boxes are removed.
+        """
+        options = LintOptions()
+        if fix:
+            confirm = UserConfirmation(self.master, 'Swap the corners of inverted tags, clip tags to their image and '
+                                                    'remove tags without area, of unknown tag_categories and '
+                                                    '(near-)duplicates?')
+            self.master.wait_window(confirm.top6)
+            if not confirm.value:
+                return
+            options = LintOptions(fix=CHECKS)
+
+        def checked(report):
+            ReportPanel(self.master, 'Tag checks', format_lint_report(report))
+            if report['removed'] + sum(report['fixed'].values()) > 0:
+                self.show_image()
+
+        self.jobs.submit('Checking tags', self.controller.lint_tags, self.viewmethods.image_filter, options,
+                         on_done=checked, on_error=self.importexport.job_failed)
+
     def select_tag(self, event):
         """
         This function selects the tag based on the mouse location on the canvas. If the mouse is in the area of a tag,
@@ -244,11 +402,34 @@ class Application(Frame):
             self.controller.delete_image(self.selected_image, True)
             self.reset_image_list()
 
-    def import_images_from_folder(self):
-        """ Import images."""
-        self.importexport.import_images_from_folder(self.image_list)
-        if self.controller.check_limit():
-            ms.showinfo("Error", "System maximum number of open files has been reached, no new images can be added.")
+    def rotate_image(self, direction):
+        """Rotates the selected image (and its tags) 90 degrees, the file is changed when the project is saved"""
+        if self.selected_image is not None:
+            self.controller.rotate_images([self.selected_image], direction)
+            self.show_image()
+
+    def rotate_listed_images(self, direction):
+        """Rotates all images in the image_list (e.g. the images selected with the Filter menu) 90 degrees"""
+        self.controller.rotate_images(self.image_list.get(0, END), direction)
+        self.show_image()
+
+    def crop_to_selected_tag(self):
+        """Crops the selected image to the bounding box of the selected tag"""
+        self.set_active_tag()
+        if self.selected_image is not None and self.active_tag_id is not None:
+            coordinates = self.controller.retrieve_tags(self.selected_image)[self.active_tag_id].coordinates
+            self.controller.crop_image(self.selected_image, coordinates)
+            self.active_tag_id = None
+            self.show_image()
+
+    def save_image_edits(self):
+        """Writes the rotations and crops to the image files (in the background)"""
+        self.jobs.submit('Writing image edits', self.controller.save_image_edits,
+                         on_done=lambda written: self.show_image(), on_error=self.importexport.job_failed)
+
+    def import_images_from_folder(self, recursive=False):
+        """ Import images (in the background)."""
+        self.importexport.import_images_from_folder(self.image_list, on_done=self.check_limit, recursive=recursive)
 
     def save_as(self):
         """ This function resets self.savefile_location in case a new savefile is requested. """
@@ -262,11 +443,13 @@ class Application(Frame):
 
     def load_savefile(self):
         """
-        This function loads a project from a savefile.
+        This function loads a project from a savefile (in the background).
         """
-        a, b, c, d, e, f = self.importexport.load_savefile(self.image_list)
-        if self.controller.check_limit():
-            ms.showinfo("Error", "System maximum number of open files has been reached, no new images can be added.")
+        self.importexport.load_savefile(self.image_list, self.savefile_loaded)
+
+    def savefile_loaded(self, a, b, c, d, e, f):
+        """ This function restores the settings and the active image once a savefile has been loaded."""
+        self.check_limit()
         if a is not None:
             self.selected_image, self.taglinewidth, self.savefile_location = a, b, c
             self.min_tagsize, self.image_list, self.sorting_method = d, e, f
@@ -284,19 +467,59 @@ class Application(Frame):
         """This function exports the tags to a tensorflow-friendly csv-file"""
         self.importexport.export_tags(self.min_tagsize)
 
+    def export_coco_voc(self):
+        """This function exports the tags to COCO json and Pascal VOC xml files"""
+        self.importexport.export_coco_voc(self.min_tagsize)
+
+    def export_tfrecord(self):
+        """This function exports the tagged images and their tags to sharded TFRecord files"""
+        self.importexport.export_tfrecord(self.min_tagsize)
+
     def load_tags(self):
         """This function loads tags from a csv-file"""
         self.importexport.load_tag_file()
         self.show_image()
 
-    def export_tagged_images(self):
-        """ This function export all images that have tags to a folder."""
+    def import_annotations(self, import_format):
+        """This function imports annotations in the COCO, Pascal VOC or TFRecord format"""
+        self.importexport.import_annotations(import_format)
+        self.reset_image_list()
+        self.show_image()
+
+    def export_tagged_images(self, resize=False):
+        """
+        This function export all images that have tags to a folder (in the background). With resize=True, the images
+        are written as JPEG files with a maximum width / height asked from the user (the tags are rescaled).
+        """
+        transcode = None
+        if resize:
+            userinput = UserInput(self.master, 'Please enter the maximum width / height in pixels (e.g. 1024)')
+            self.master.wait_window(userinput.top5)
+            try:
+                transcode = TranscodeOptions(max_side=int(userinput.value), image_format='jpeg')
+            except (TypeError, ValueError):
+                ms.showerror("Error", "Please enter a positive whole number.")
+                return
         save_location = self.viewmethods.ask_directory(self.master, txt='Please select folder to export the images to')
-        self.controller.export_tagged_images(save_location)
-        # Refill the image_list because images have been renamed:
+        self.jobs.submit('Exporting images', self.controller.export_tagged_images, save_location, transcode=transcode,
+                         on_done=self.tagged_images_exported, on_cancelled=self.tagged_images_exported,
+                         on_error=self.tagged_images_export_failed)
+
+    def tagged_images_exported(self, summary=None):
+        """
+        Refills the image_list after an export, because images have been renamed (also when the export has been
+        cancelled, the images exported until then have their new names).
+        """
         self.sort_images_on_filename()
         self.selected_image = self.image_list.get(0)
         self.activate_image()
+        if summary is not None:
+            self.importexport.exported(summary, 'Exported {0} images.'.format(summary['images']))
+
+    def tagged_images_export_failed(self, error):
+        """Refills the image_list with the names of the images exported before the export failed, shows the error."""
+        self.tagged_images_exported()
+        self.importexport.job_failed(error)
 
     def export_images_one_tag_category(self):
         """This function exports the images for one certain tag_category to a folder on the computer"""
@@ -305,11 +528,9 @@ class Application(Frame):
         tag_category = [gettag.value]  # as a list
         # Get save location:
         save_location = self.viewmethods.ask_directory(self.master, txt='Please select folder to export the images to')
-        self.controller.export_tagged_images(save_location, tag_categories=tag_category)
-        # Refill the image_list because images have been renamed:
-        self.sort_images_on_filename()
-        self.selected_image = self.image_list.get(0)
-        self.activate_image()
+        self.jobs.submit('Exporting images', self.controller.export_tagged_images, save_location,
+                         tag_categories=tag_category, on_done=self.tagged_images_exported,
+                         on_cancelled=self.tagged_images_exported, on_error=self.tagged_images_export_failed)
 
     def rename_tag_category(self):
         """This function replaces a tag_category name with a new one"""
@@ -320,9 +541,8 @@ class Application(Frame):
         userinput = UserInput(self.master, 'Please enter a new name for the tag category')
         self.master.wait_window(userinput.top5)
         new_tag_category = userinput.value
-        # Check whether there are any tags for this tag_category in the current catalog images and ifso replace:
-        count = self.controller.extract_entries_for_tag_category(tag_category, False, True, new_tag_category)
-        self.controller.rename_tag_category(tag_category, new_tag_category)  # replace in TagCategories
+        # Rename the tag_category (its tags follow, or are merged into new_tag_category if that exists already):
+        count = self.controller.rename_tag_category(tag_category, new_tag_category)
         # Print message how many were replaced:
         ms.showinfo("{0} tags of tag_category {1} were renamed to {2}.".format(count, tag_category, new_tag_category))
 
@@ -397,6 +617,10 @@ class Application(Frame):
         self.canvas.yview_scroll(-1, "units")
 
     def zoom(self, event):
+        with watchdog.action('zoom'):
+            self.zoom_image(event)
+
+    def zoom_image(self, event):
         if event.delta == 120:
             # zooming out
             if self.zoomcycle != 5:
@@ -440,12 +664,45 @@ class Application(Frame):
             self.tag_list.activate(index)  # sets this index as active (highlight it)
             self.tag_list.see(index)  # makes sure that the highlighted item is visible in the listbox
 
+    def filter_images(self, image_filter):
+        """
+        This function only shows the images matching image_filter in the image_list (an empty dictionary shows all
+        images). The exports use the same filter.
+        :param image_filter: dictionary with query criteria (see ImageCatalog.query).
+        """
+        self.viewmethods.image_filter = image_filter
+        self.reset_image_list()
+        self.master.title('Picture Tools ({0} images)'.format(self.image_list.size()) if image_filter else
+                          'Picture Tools')
+
+    def filter_on_tag_category(self, exclude=False):
+        """Shows the images with (or without) tags of a tag_category"""
+        gettag = self.gettag_popup()
+        if gettag.value is not None:
+            self.filter_images({'exclude_categories' if exclude else 'categories': [gettag.value]})
+
+    def filter_on_tag_size(self):
+        """Shows the images with at least one tag smaller than a given area (pixels)"""
+        userinput = UserInput(self.master, 'Please enter the tag area in pixels (e.g. 1024 for 32x32)')
+        self.master.wait_window(userinput.top5)
+        try:
+            self.filter_images({'box_smaller_than': int(userinput.value)})
+        except (TypeError, ValueError):
+            ms.showerror("Error", "Please enter a whole number.")
+
+    def filter_on_date(self):
+        """Shows the images taken in a date range (yyyy:mm:dd-yyyy:mm:dd, both days included)"""
+        userinput = UserInput(self.master, 'Please enter a date range (yyyy:mm:dd-yyyy:mm:dd)')
+        self.master.wait_window(userinput.top5)
+        dates = [i.strip() for i in (userinput.value or '').split('-')]
+        if len(dates) != 2 or not all(self.controller.catalog.validate_date(i) for i in dates):
+            ms.showerror("Error", "Please enter the dates as yyyy:mm:dd-yyyy:mm:dd.")
+            return
+        self.filter_images({'start': dates[0], 'end': dates[1]})
+
     def reset_image_list(self):
         """This function resets the image_list and sorts it. Call when changes to image_list have been made."""
-        if self.sorting_method == 'file_name':
-            self.sort_images_on_filename()
-        else:
-            self.sort_images_on_date()
+        self.image_list = self.viewmethods.sort_images(self.image_list, self.sorting_method)
 
     def sort_images_on_date(self):
         """ Sorts the image_list on the date taken. """
@@ -457,13 +714,25 @@ class Application(Frame):
         self.sorting_method = 'file_name'
         self.image_list = self.viewmethods.sort_images(self.image_list, self.sorting_method)
 
+    def sort_images_on_quality(self):
+        """ Sorts the image_list on the quality score, lowest first (see Analyse image quality). """
+        self.sorting_method = 'quality'
+        self.image_list = self.viewmethods.sort_images(self.image_list, self.sorting_method)
+
+    def analyse_quality(self):
+        """Computes the quality scores of the images (in the background) and sorts the image_list on them."""
+        self.jobs.submit('Analysing image quality', self.controller.compute_quality,
+                         on_done=lambda analysed: self.sort_images_on_quality(),
+                         on_error=self.importexport.job_failed)
+
     def set_active_image(self):
         """
         This function sets an image to active when selected_tag in the image_list (tag_categories_list).
         :return: active image
         """
-        self.selected_image = self.viewmethods.get_selected_item(self.image_list)
-        self.show_image()
+        with watchdog.action('next_image'):
+            self.selected_image = self.viewmethods.get_selected_item(self.image_list)
+            self.show_image()
 
     def set_active_tag(self):
         """ This function sets an tag to active when selected_tag in the tag_list (tag_categories_list). """
@@ -648,8 +917,9 @@ class Application(Frame):
                 gettag = self.gettag_popup()
                 tag = gettag.value
                 if tag is not None:
-                    self.controller.add_tag(self.selected_image, tag, image_coords)
-                    self.show_image()
+                    with watchdog.action('add_tag'):
+                        self.controller.add_tag(self.selected_image, tag, image_coords)
+                        self.show_image()
 
         # Set the drawing and control pressed to false again:
         self.drawing = False
@@ -688,31 +958,55 @@ class Application(Frame):
 
 class ImportExportMethods:
 
-    def __init__(self, master, controller, viewmethods):
+    def __init__(self, master, controller, viewmethods, jobs):
         self.master = master
         self.controller = controller
         self.viewmethods = viewmethods
+        self.jobs = jobs
 
-    def import_images_from_folder(self, image_list):
+    @staticmethod
+    def job_failed(error):
+        """Shows the error of a failed background job."""
+        ms.showerror("Error", str(error))
+
+    def import_images_from_folder(self, image_list, on_done=None, recursive=False):
         """
-        This function imports a folder into the image catalog and refreshes all images present in the image_list.
+        This function imports a folder into the image catalog in the background. Images are appended to the
+        image_list while they are imported, once the import is done (or cancelled) the image_list is sorted.
         :param image_list: listbox image_list
-        :return: Updated image_list.
+        :param on_done: (Optional) function called without arguments after the image_list has been refreshed.
+        :param recursive: True to also import the images in sub-folders.
         """
         # First, ask the user for a directory to import images from:
         folder_location = self.viewmethods.ask_directory(self.master,
                                                          txt='Please select a folder to import images from.')
+
+        def refresh_image_list(result=None):
+            if result is not None and len(result['skipped']) > 0:
+                ms.showwarning('Images skipped', '{0} images have the file name of an image from another folder and '
+                                                 'have not been imported, e.g.:\n{1}'.format(
+                                                     len(result['skipped']), '\n'.join(result['skipped'][:10])))
+            with watchdog.action('import'):
+                # Retrieve all images currently present in the tag_categories_list:
+                images = self.controller.retrieve_images_present_in_catalog(sort_images='file_name')
+                # Finally, empty the image_list tag_categories_list and refill with the returned images.
+                image_list.delete(0, END)  # clear the image_list
+                for image_name in images:
+                    image_list.insert(END, image_name)
+            if on_done is not None:
+                on_done()
+        next_image_id = [self.controller.catalog.image_id]
+
+        def add_new_images(done, total):
+            # Append the images imported since the previous progress update, so they can already be tagged:
+            image_names, next_image_id[0] = self.controller.retrieve_new_images(next_image_id[0])
+            for image_name in image_names:
+                image_list.insert(END, image_name)
         if folder_location != '':
             # Next, import these images into the image catalog:
-            self.controller.open_folder(folder_location)
-            # Retrieve all images currently present in the tag_categories_list:
-            images = self.controller.retrieve_images_present_in_catalog(sort_images='file_name')
-            # Finally, empty the image_list tag_categories_list and refill with the returned images.
-            image_list.delete(0, END)  # clear the image_list
-            for image_name in images:
-                image_list.insert(END, image_name)
-
-        return image_list
+            self.jobs.submit('Importing images', self.controller.open_folder, folder_location, recursive=recursive,
+                             on_progress=add_new_images, on_done=refresh_image_list,
+                             on_cancelled=refresh_image_list, on_error=self.job_failed)
 
     def save_progress(self, savefile_location, taglinewidth, selected_image, min_tagsize):
         """
@@ -732,20 +1026,22 @@ class ImportExportMethods:
 
         return savefile_location
 
-    def load_savefile(self, image_list):
+    def load_savefile(self, image_list, on_loaded):
         """
-        This function loads a project from a savefile.
+        This function loads a project from a savefile in the background. Once it has been loaded, on_loaded is called
+        as on_loaded(selected_image, taglinewidth, savefile_location, min_tagsize, image_list, sorting_method).
         """
         savefile_loc = askopenfilename(self.master, title='Please provide a .csv save file (savefile.csv)')
-        if savefile_loc != '':  # check that return value is not empty
-            selected_image, taglinewidth, savefile_location, min_tagsize, sorting_method = \
-                self.controller.load_savefile(savefile_loc)
+
+        def loaded(result):
+            selected_image, taglinewidth, savefile_location, min_tagsize, sorting_method = result
             # add images to the image_list and sort:
-            image_list = self.viewmethods.sort_images(image_list, sorting_method)
-        else:
-            selected_image, taglinewidth, savefile_location = None, None, None
-            min_tagsize, image_list, sorting_method = None, None, None
-        return selected_image, taglinewidth, savefile_location, min_tagsize, image_list, sorting_method
+            sorted_image_list = self.viewmethods.sort_images(image_list, sorting_method)
+            on_loaded(selected_image, taglinewidth, savefile_location, min_tagsize, sorted_image_list, sorting_method)
+        if savefile_loc != '':  # check that return value is not empty
+            self.jobs.submit('Loading savefile', self.controller.load_savefile, savefile_loc, on_done=loaded,
+                             on_cancelled=lambda: self.viewmethods.sort_images(image_list, 'file_name'),
+                             on_error=self.job_failed)
 
     def export_settings(self, taglinewidth, min_tagsize, sorting_method):
         """
@@ -758,9 +1054,9 @@ class ImportExportMethods:
             settings = ['taglinewidth;{0}\n'.format(taglinewidth),
                         'min_tagsize;{0}\n'.format(min_tagsize),
                         'sorting_method;{0}\n'.format(sorting_method)]
-            tag_categories = self.controller.catalog.tag_categories.tag_categories
+            tag_categories = self.controller.catalog.tag_categories
             for tag_category in tag_categories:
-                color = tag_categories[tag_category]
+                color = tag_categories.color(tag_category)
                 settings.append('TagCategory;{0};{1}\n'.format(tag_category, color))
             self.controller.write_to_csv(filename, settings)
 
@@ -771,7 +1067,7 @@ class ImportExportMethods:
         settings_location = askopenfilename(self.master, title='Please provide a .csv settings file')
         taglinewidth, min_tagsize = 3, 0
         if settings_location != '':  # check that return value is not empty
-            data = self.controller.read_csv(settings_location, ';')
+            data = self.controller.iter_csv(settings_location, ';')
             for line in data:
                 if line[0] == 'taglinewidth':
                     taglinewidth = line[1]
@@ -788,23 +1084,48 @@ class ImportExportMethods:
         csv_file_loc = asksaveasfilename(self.master, defaultext='.csv', initialfile='exported_tags.csv',
                                          title='Please provide a save file name in .csv format (exported_tags.csv)')
         if csv_file_loc != '':  # check that return value is not empty
-            data = ["filename,width,height,class,xmin,ymin,xmax,ymax,difficult\n"]
-            images = self.controller.catalog.images
-            for image_id in images:
-                image = images[image_id]
-                image_size = image.IMG.size
-                tags = image.tags.tag_dict
-                for key, value in tags.items():
-                    tag_description = value.tag_category
-                    tag_coords = value.coordinates
-                    tagsize = (tag_coords[2] - tag_coords[0]) * (tag_coords[3] - tag_coords[1])
-                    if tagsize > min_tagsize:  # tag area is larger than minimum size
-                        data.append("{0},{1},{2},{3},{4},{5},{6},{7},0\n".format(image.file_name, image_size[0],
-                                                                                 image_size[1], tag_description,
-                                                                                 tag_coords[0], tag_coords[1],
-                                                                                 tag_coords[2], tag_coords[3]))
-            self.controller.write_to_csv(csv_file_loc, data)
-            ms.showinfo("Done", "Exported tags.")
+            self.jobs.submit('Exporting tags', self.controller.export_annotations, [('csv', csv_file_loc, {})],
+                             min_tagsize, image_filter=self.viewmethods.image_filter,
+                             on_done=lambda summary: self.exported(summary, "Exported tags."),
+                             on_error=self.job_failed)
+
+    def export_coco_voc(self, min_tagsize):
+        """This function exports the tags as a COCO json file and as Pascal VOC xml files in one pass"""
+        save_location = self.viewmethods.ask_directory(self.master, txt='Please select folder to export the tags to')
+        if save_location != '':
+            exports = [('coco', save_location + '/annotations.json', {}),
+                       ('voc', save_location + '/Annotations', {})]
+            summary = self.controller.export_annotations(exports, min_tagsize,
+                                                         image_filter=self.viewmethods.image_filter)
+            self.exported(summary, "Exported {0} tags of {1} images.".format(summary['coco']['boxes'],
+                                                                            summary['coco']['images']))
+
+    def export_tfrecord(self, min_tagsize):
+        """This function exports the tagged images and their tags to sharded TFRecord files for tensorflow"""
+        save_location = self.viewmethods.ask_directory(self.master, txt='Please select folder to write the TFRecord '
+                                                                        'files to')
+        if save_location != '':
+            label_map_location = askopenfilename(self.master, title='Please provide a .pbtxt label map')
+            if label_map_location != '':
+                userinput = UserInput(self.master, 'Please enter the number of shards')
+                self.master.wait_window(userinput.top5)
+                try:
+                    num_shards = int(userinput.value)
+                except (TypeError, ValueError):
+                    num_shards = 10
+                written, skipped = self.controller.export_tfrecord(save_location, label_map_location, num_shards,
+                                                                   min_tagsize, self.viewmethods.image_filter)
+                ms.showinfo("Done", "Exported {0} tags, skipped {1} tags without a label map entry.".format(
+                    written, skipped))
+
+    def exported(self, summary, message):
+        """Shows that an export is done, and the tags that failed the checks run before it (see Check tags)."""
+        report = summary.get('lint')
+        if report is not None and len(report['problems']) > 0:
+            message += ' {0} tags with problems were found, of which {1} were left out.'.format(
+                len(report['problems']), report['skipped'])
+            ReportPanel(self.master, 'Tag checks', format_lint_report(report))
+        ms.showinfo("Done", message)
 
     def load_tag_file(self):
         """
@@ -814,14 +1135,34 @@ class ImportExportMethods:
         # First, ask for the location of the save file:
         tag_file_loc = askopenfilename(self.master, title='Please provide a .csv tag file.')
         if tag_file_loc != '':
-            tags = self.controller.read_csv(tag_file_loc, ',')
-            for line in tags:
-                    if line[0] != 'filename':
-                        image = line[0]
-                        tag = line[3]
-                        coords = [int(line[4]), int(line[5]), int(line[6]), int(line[7])]
-                        # check whether tag already present is performed in '.add_tag()'
-                        self.controller.add_tag(image, tag, coords)
+            # check whether tag already present is performed in the bulk insert:
+            self.controller.import_annotations('csv', tag_file_loc)
+            self.check_imported_tags()
+
+    def check_imported_tags(self):
+        """Checks the tags after an import (the coordinates in annotation files are not checked when reading them)."""
+        report = self.controller.lint_tags()
+        if len(report['problems']) > 0:
+            ReportPanel(self.master, 'Tag checks', format_lint_report(report))
+
+    def import_annotations(self, import_format):
+        """
+        This function imports annotations from a COCO json file, a folder of Pascal VOC xml files or a folder of
+        TFRecord files. Images that are not yet present in the image catalog are added from an image folder.
+        """
+        if import_format == 'coco':
+            location = askopenfilename(self.master, title='Please provide a COCO .json annotation file.')
+        else:
+            location = self.viewmethods.ask_directory(self.master, txt='Please select the folder with the annotations')
+        if location != '':
+            image_folder = self.viewmethods.ask_directory(self.master, txt='Please select the folder with the images '
+                                                                           '(cancel to only tag loaded images)')
+            if image_folder == '':
+                image_folder = None
+            summary = self.controller.import_annotations(import_format, location, image_folder)
+            ms.showinfo("Done", "Imported {0} tags, added {1} images, skipped {2} tags.".format(
+                summary['tags_added'], summary['images_added'], summary['tags_skipped']))
+            self.check_imported_tags()
 
 
 class AddTag:
@@ -987,6 +1328,7 @@ class ViewMethods:
     def __init__(self, master, controller):
         self.master = master
         self.controller = controller
+        self.image_filter = {}  # query criteria of the images shown in the image_list (empty: all images)
 
     @staticmethod
     def get_selected_item(listbox):
@@ -1027,7 +1369,8 @@ class ViewMethods:
         """
         Sorts the image_list on the filename.
         """
-        images = self.controller.retrieve_images_present_in_catalog(sort_images=sorting_method)
+        images = self.controller.retrieve_images_present_in_catalog(sort_images=sorting_method,
+                                                                    image_filter=self.image_filter)
         image_list = self.fill_image_list(images, image_list)
 
         return image_list
@@ -1087,6 +1430,7 @@ class KeyBindings:
         Ctrl + o\t\t\tLoad save file
         Ctrl + Del\t\t\tDelete current image from image list
         Ctrl + Shift + Del\t\tDelete current image from disk
+        Ctrl + Left / Right\t\tRotate current image (written to the file when saving)
         f\t\t\t\tJump to active image in image list
         Down arrow key\t\tNext image in the list (image list needs to be active, press f)
         Up arrow key\t\t\tPrevious image in the list (image list needs to be active, press f)
@@ -1130,6 +1474,60 @@ class KeyBindings:
         self.top4.destroy()
 
 
+class StatisticsPanel:
+    """
+    Window showing the rolling timing statistics of the instrumented code paths and the main loop latencies / stalls
+    measured by the watchdog, refreshed every second.
+    """
+
+    def __init__(self, master, refresh_ms=1000):
+        top = self.top7 = Toplevel(master)
+        top.title('Performance statistics')
+        self.refresh_ms = refresh_ms
+        self.text = Text(top, width=100, height=30, font=('Courier', 10))
+        self.text.pack(fill=BOTH, expand=1)
+        self.b1 = Button(top, text='Reset', command=self.reset)
+        self.b1.pack(side=LEFT)
+        self.b2 = Button(top, text='Close', command=self.top7.destroy)
+        self.b2.pack(side=RIGHT)
+        self.refresh()
+
+    def refresh(self):
+        if self.top7.winfo_exists():
+            self.text.delete('1.0', END)
+            self.text.insert(END, instrument.format_stats() + '\n\n' + watchdog.format_report())
+            self.top7.after(self.refresh_ms, self.refresh)
+
+    def reset(self):
+        instrument.reset()
+        watchdog.reset()
+        self.refresh()
+
+
+class ReportPanel:
+    """Window showing a text report (dataset statistics, tag checks), optionally with a button to save it as json."""
+
+    def __init__(self, master, title, text, json_report=None):
+        top = self.top8 = Toplevel(master)
+        top.title(title)
+        self.json_report = json_report
+        self.text = Text(top, width=110, height=40, font=('Courier', 10))
+        self.text.pack(fill=BOTH, expand=1)
+        self.text.insert(END, text)
+        if json_report is not None:
+            self.b1 = Button(top, text='Save as json', command=self.save_json)
+            self.b1.pack(side=LEFT)
+        self.b2 = Button(top, text='Close', command=self.top8.destroy)
+        self.b2.pack(side=RIGHT)
+
+    def save_json(self):
+        filename = asksaveasfilename(self.top8, defaultext='.json', initialfile='report.json',
+                                     filetypes=[('json', '*.json')])
+        if filename:
+            with open(filename, 'w') as handle:
+                json.dump(self.json_report, handle, indent=2)
+
+
 class UserInput:
     value = None
 